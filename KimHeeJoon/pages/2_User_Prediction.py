@@ -1,19 +1,73 @@
-# import streamlit as st
-# import numpy as np
+import sys
+import time
+from datetime import date
+from pathlib import Path
 
-# st.title("👤 개별 사용자 이탈 예측")
+import streamlit as st
 
-# with st.form("user_input_form"):
-#     tenure = st.number_input("가입 기간 (개월)", 0, 120, 12)
-#     activity = st.number_input("최근 30일 활동 횟수", 0, 100, 10)
-#     payment = st.number_input("최근 결제 금액", 0, 1_000_000, 30000)
-#     plan = st.selectbox("요금제", ["Basic", "Standard", "Premium"])
+# 프로젝트 루트 / 학습 모델 경로
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+MODEL_DIR = PROJECT_ROOT / "03_trained_model"
+sys.path.append(str(PROJECT_ROOT))
+sys.path.append(str(MODEL_DIR))
 
-#     submitted = st.form_submit_button("이탈 확률 예측")
+from src.preprocessing.feature_store import FEATURE_TABLE_PATH, get_user_features
+from src.preprocessing.user_event_index import EVENT_INDEX_DIR, compute_user_features
 
-# if submitted:
-#     churn_proba = np.random.rand()  # 실제 모델 예측으로 교체
-#     risk = "High" if churn_proba >= 0.7 else "Medium" if churn_proba >= 0.4 else "Low"
+st.title("👤 개별 사용자 이탈 예측")
+st.caption("msno 인덱스로 피처 테이블에서 해당 사용자 행만 읽어 모델에 입력합니다")
 
-#     st.success(f"이탈 확률: **{churn_proba:.2%}**")
-#     st.warning(f"위험 등급: **{risk}**")
+
+@st.cache_resource
+def load_models():
+    from model_inference import ModelInference
+
+    return {
+        "v4": ModelInference(model_dir=str(MODEL_DIR), model_version="v4"),
+        "v5.2": ModelInference(model_dir=str(MODEL_DIR), model_version="v5.2"),
+    }
+
+
+if not FEATURE_TABLE_PATH.exists():
+    st.error(f"피처 테이블을 찾을 수 없습니다: {FEATURE_TABLE_PATH}")
+    st.stop()
+
+with st.form("user_input_form"):
+    msno = st.text_input("사용자 ID (msno)")
+    # 원본 이벤트 인덱스가 있으면 로그/거래 피처를 기준 시점으로 즉시 재계산 (회원 정보는 피처 테이블 값 유지)
+    refresh, cutoff = False, None
+    if (EVENT_INDEX_DIR / "meta.json").exists():
+        refresh = st.checkbox("원본 이벤트로 로그/거래 피처 재계산")
+        cutoff = st.date_input("기준 시점", value=date(2017, 4, 1))
+    submitted = st.form_submit_button("이탈 확률 예측")
+
+if submitted and msno:
+    started = time.perf_counter()
+    try:
+        features = get_user_features(msno.strip())
+    except KeyError:
+        st.error("피처 테이블에 없는 사용자입니다.")
+        st.stop()
+    if refresh:
+        try:
+            fresh = compute_user_features(msno.strip(), cutoff)
+        except KeyError:
+            st.error("기준 시점 이전 로그/거래가 없는 사용자입니다.")
+            st.stop()
+        shared = [col for col in fresh.columns if col in features.columns and col != "msno"]
+        features[shared] = fresh[shared].to_numpy()
+    lookup_ms = (time.perf_counter() - started) * 1000
+
+    models = load_models()
+    scores = {name: float(model.predict(features)[0]) for name, model in models.items()}
+    churn_proba = max(scores.values())
+    risk = "High" if churn_proba >= 0.7 else "Medium" if churn_proba >= 0.4 else "Low"
+
+    col1, col2, col3 = st.columns(3)
+    col1.metric("V4 이탈 확률 (이력)", f"{scores['v4']:.2%}")
+    col2.metric("V5.2 이탈 확률 (행동)", f"{scores['v5.2']:.2%}")
+    col3.metric("위험 등급", risk)
+    st.caption(f"피처 {'재계산' if refresh else '조회'} {lookup_ms:.1f} ms")
+
+    with st.expander("입력 피처 보기"):
+        st.dataframe(features.T.rename(columns={0: "value"}), use_container_width=True)
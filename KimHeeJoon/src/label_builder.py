@@ -0,0 +1,181 @@
+"""
+다중 기준 시점 이탈 라벨 생성 (WSDM KKBox 정의)
+================================================
+
+목적: train_v2의 고정 is_churn(2017년 3월 만료자 1개월) 대신, transactions에서
+      기준 시점 목록마다 같은 정의로 라벨을 만들어 여러 학습 월을 확보
+      (backfill.py의 기준 시점별 피처 스냅샷과 (msno, cutoff)로 조인)
+
+이탈 정의 (기준 시점 C, 예: 2017-04-01 → 2017-03 만료자):
+- 대상: C - 1일 시점의 최신 거래(동률이면 원래 순서상 첫 행, create_state_features와 같은 행)의
+        membership_expire_date가 [C - 1개월, C - 1일]인 사용자
+- is_churn = 1: 만료일 후 LAPSE_DAYS(30)일 안에 새 유효 구독(is_cancel = 0이고
+               만료일 >= 거래일인 거래, 거래일 [C, 만료일 + 30])이 없음
+- 데이터 마지막 거래일이 만료일 + 30일보다 이르면 관측 불가 → 제외 (이탈로 잘못 표시하지 않음)
+
+계산: (msno, transaction_date) 정렬 1회 (segments.KeySegments) 후
+      - 기준 시점별 최신 거래 위치: latest_before() (키 × 기준 시점 searchsorted)
+      - 갱신 여부: 유효 거래 누적합의 [C, 만료일 + 30] 구간 차이
+      → 기준 시점 수와 무관하게 정렬 1회 + searchsorted, 사용자별 Python 루프 없음
+
+출력: {data_dir}/churn_labels.parquet (msno, cutoff, is_churn), cutoff / msno 오름차순
+
+사용법:
+    python KimHeeJoon/src/label_builder.py --cutoffs 2017-02-01 2017-03-01 2017-04-01
+    python KimHeeJoon/src/label_builder.py --source data/transactions.csv --cutoffs 2016-10-01 2016-11-01
+"""
+
+import argparse
+import sys
+import time
+import pandas as pd
+import numpy as np
+from pathlib import Path
+from typing import Iterable, Optional
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+from src.preprocessing.calendar_utils import NA_DAY, day_of, format_day, to_day
+from src.preprocessing.ingest import read_raw_table
+from src.preprocessing.msno_keys import decode_msno, load_msno_dictionary
+from src.preprocessing.segments import KeySegments
+
+# ============================================================
+# 설정
+# ============================================================
+DATA_DIR = PROJECT_ROOT / 'data'
+LABEL_PATH = DATA_DIR / 'churn_labels.parquet'
+LAPSE_DAYS = 30  # 만료 후 이 일수 안에 갱신하지 않으면 이탈
+LABEL_COLUMNS = ['msno', 'transaction_date', 'membership_expire_date', 'is_cancel']
+
+
+# ============================================================
+# 데이터 로드
+# ============================================================
+def load_label_transactions(data_dir: Path = DATA_DIR, source: Optional[Path] = None,
+                            msno_ids: bool = False) -> pd.DataFrame:
+    """
+    라벨 계산에 필요한 거래 컬럼 로드 (기준 시점 필터 없음 - 기준 시점 이후 갱신 거래가 필요)
+
+    source를 지정하면 해당 CSV(예: 전체 이력 transactions.csv)를, 아니면 transactions_v2를 읽습니다.
+    """
+    if source is not None:
+        df = pd.read_csv(source, usecols=LABEL_COLUMNS)
+    else:
+        df = read_raw_table(data_dir, 'transactions_v2', columns=LABEL_COLUMNS, msno_ids=msno_ids)
+    df['transaction_date'] = to_day(df['transaction_date'])
+    df['membership_expire_date'] = to_day(df['membership_expire_date'])
+    return df[df['transaction_date'] != NA_DAY]
+
+
+# ============================================================
+# 라벨 생성
+# ============================================================
+def build_churn_labels(transactions: pd.DataFrame, cutoffs: Iterable,
+                       lapse_days: int = LAPSE_DAYS,
+                       data_end: Optional[int] = None) -> pd.DataFrame:
+    """
+    기준 시점 목록의 이탈 라벨
+
+    Args:
+        transactions: msno, transaction_date / membership_expire_date (일자 서수), is_cancel
+        cutoffs: 기준 시점 목록 (C - 1개월 ~ C - 1일 만료자가 대상)
+        lapse_days: 만료 후 갱신 허용 일수
+        data_end: 관측 마지막 일자 서수 (None이면 최대 거래일)
+
+    Returns:
+        msno, cutoff, is_churn (uint8) - cutoff / msno 오름차순, 관측 불가 대상은 제외
+    """
+    cutoffs = sorted({pd.Timestamp(c) for c in cutoffs})
+    segments = KeySegments(transactions['msno'].to_numpy(), transactions['transaction_date'].to_numpy())
+    dates = segments.sorted_order_by
+    expires = segments.gather(transactions['membership_expire_date'].to_numpy().astype(np.int64))
+    if data_end is None:
+        data_end = int(dates.max()) if len(dates) else NA_DAY
+
+    # 유효 구독 거래 누적 개수 → 구간 [lo, hi) 안 개수 = valid_before[hi] - valid_before[lo]
+    valid = (segments.gather(transactions['is_cancel'].to_numpy()) == 0) & (expires >= dates)
+    valid_before = np.r_[0, np.cumsum(valid)]
+
+    cutoff_days = np.array([[day_of(c) for c in cutoffs]], dtype=np.int64)
+    month_start = np.array([[day_of(c - pd.DateOffset(months=1)) for c in cutoffs]], dtype=np.int64)
+
+    # C - 1일 시점 최신 거래의 만료일 (키 × 기준 시점)
+    latest = segments.latest_before(cutoff_days)
+    expire = np.where(latest >= 0, expires[np.maximum(latest, 0)], NA_DAY)
+    target = (latest >= 0) & (expire >= month_start) & (expire < cutoff_days)
+
+    # 갱신: 거래일 [C, 만료일 + lapse_days]의 유효 거래
+    horizon = np.where(target, expire + lapse_days, cutoff_days - 1)
+    lo = segments.lower_bounds(cutoff_days)
+    hi = segments.lower_bounds(horizon + 1)
+    renewed = valid_before[hi] - valid_before[lo] > 0
+
+    # 갱신 기한이 데이터 범위를 넘고 아직 갱신이 없으면 라벨을 알 수 없음
+    observed = renewed | (horizon <= data_end)
+    unobserved = (target & ~observed).sum(axis=0)
+    for cutoff, n in zip(cutoffs, unobserved):
+        if n:
+            print(f"  Warning: {cutoff.date()} - {n:,} users expire too close to data end "
+                  f"({format_day(data_end)}), dropped")
+
+    # (기준 시점, 키) 순서로 펼침
+    cutoff_idx, key_idx = np.nonzero((target & observed).T)
+    return pd.DataFrame({
+        'msno': segments.keys[key_idx],
+        'cutoff': pd.DatetimeIndex(cutoffs)[cutoff_idx],
+        'is_churn': (~renewed[key_idx, cutoff_idx]).astype(np.uint8),
+    })
+
+
+def run_label_builder(cutoffs: Iterable, data_dir: Path = DATA_DIR,
+                      source: Optional[Path] = None,
+                      out_path: Optional[Path] = LABEL_PATH,
+                      lapse_days: int = LAPSE_DAYS) -> pd.DataFrame:
+    """거래 로드 → 라벨 생성 → Parquet 저장 (out_path=None이면 저장 안 함)"""
+    print("=" * 60)
+    print("Churn Label Builder")
+    print("=" * 60)
+
+    started = time.perf_counter()
+    keys = load_msno_dictionary(data_dir) if source is None else None
+    transactions = load_label_transactions(data_dir, source, msno_ids=keys is not None)
+    print(f"[1/3] Loaded {len(transactions):,} transactions "
+          f"({time.perf_counter() - started:.1f}s)")
+
+    started = time.perf_counter()
+    labels = build_churn_labels(transactions, cutoffs, lapse_days)
+    if keys is not None:
+        labels = decode_msno(labels, keys)
+    print(f"[2/3] Built {len(labels):,} labels ({time.perf_counter() - started:.1f}s)")
+    summary = labels.groupby('cutoff')['is_churn'].agg(['size', 'mean'])
+    for cutoff, row in summary.iterrows():
+        print(f"  {cutoff.date()}: {int(row['size']):,} users, churn rate {row['mean']:.2%}")
+
+    if out_path is not None:
+        Path(out_path).parent.mkdir(parents=True, exist_ok=True)
+        labels.to_parquet(out_path, engine='pyarrow', index=False)
+        print(f"[3/3] Saved labels to: {out_path}")
+
+    return labels
+
+
+# ============================================================
+# 실행
+# ============================================================
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='WSDM churn labels for multiple cutoffs')
+    parser.add_argument('--cutoffs', nargs='+', required=True,
+                        help='기준 시점 목록 (예: 2017-03-01 2017-04-01 → 2월 / 3월 만료자)')
+    parser.add_argument('--data-dir', type=Path, default=DATA_DIR)
+    parser.add_argument('--source', type=Path, default=None,
+                        help='transactions CSV 경로 (기본 {data-dir}의 transactions_v2)')
+    parser.add_argument('--out', type=Path, default=None,
+                        help='출력 Parquet (기본 {data-dir}/churn_labels.parquet)')
+    parser.add_argument('--lapse-days', type=int, default=LAPSE_DAYS)
+    args = parser.parse_args()
+
+    run_label_builder(args.cutoffs, args.data_dir, args.source,
+                      args.out or args.data_dir / 'churn_labels.parquet', args.lapse_days)
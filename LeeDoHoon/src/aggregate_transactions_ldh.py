@@ -7,21 +7,51 @@ kkbox_aggregation_plan.md 기준으로 집계:
 - 상태 기반 피처 (마지막 거래 기준)
 - 누적 히스토리 피처 (전체 기간)
 - 제한적 Recency 집계 (30일, 90일)
+- 갱신 간격 규칙성 피처 (연속 결제 간격 평균/표준편차/최대 공백)
+- 구독 구간 피처 (거래 이력 병합 → 연속 구독 구간 수 / 공백 / 총 구독 일수)
 - 데이터 누수 방지: T = 2017-03-31 이전만 사용
 """
 
+import argparse
+import sys
 import pandas as pd
 import numpy as np
 from pathlib import Path
-from typing import Optional
+from typing import List, Optional
 import warnings
 
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+from src.preprocessing.calendar_utils import day_of, days_between, format_day, to_day
+from src.preprocessing.feature_store import write_feature_table
+from src.preprocessing.ingest import read_raw_table
+from src.preprocessing.msno_keys import (
+    decode_msno,
+    encode_frames,
+    load_msno_dictionary,
+    merge_on_key,
+)
+from src.preprocessing.segments import (
+    KeySegments,
+    segment_diff,
+    segment_max,
+    segment_max_gap,
+    segment_mean,
+    segment_nunique,
+    segment_std,
+    segment_sum,
+)
+from src.preprocessing.subscription_intervals import subscription_features
+
 warnings.filterwarnings('ignore')
 
 # ============================================
 # 설정
 # ============================================
 T = pd.Timestamp('2017-03-31')  # 기준 시점
+RECENCY_WINDOWS = [30, 90, 180]  # 결제 횟수 lookback 일수 (payment_count_last_{d}d)
 
 DATA_DIR = Path(__file__).parent.parent / 'data'
 
@@ -29,44 +59,56 @@ DATA_DIR = Path(__file__).parent.parent / 'data'
 # ============================================
 # 집계 함수
 # ============================================
-def load_transactions(data_dir: Path = DATA_DIR) -> pd.DataFrame:
-    """transactions_v2.csv 로드 및 전처리"""
-    print("📂 transactions_v2.csv 로드 중...")
+def load_transactions(data_dir: Path = DATA_DIR, msno_ids: bool = False,
+                      t: pd.Timestamp = T) -> pd.DataFrame:
+    """transactions_v2 로드 및 전처리 (ingest Parquet이 있으면 t 이전 행만 읽음, msno_ids=True면 int32 대리키)"""
+    print("📂 transactions_v2 로드 중...")
     
-    df = pd.read_csv(data_dir / 'transactions_v2.csv')
-    print(f"  ✓ 원본: {df.shape}")
+    df = read_raw_table(data_dir, 'transactions_v2',
+                        filters=[('transaction_date', '<=', int(t.strftime('%Y%m%d')))],
+                        msno_ids=msno_ids)
+    print(f"  ✓ 원본 (T 이전): {df.shape}")
     
-    # 날짜 변환
-    df['transaction_date'] = pd.to_datetime(df['transaction_date'], format='%Y%m%d')
-    df['membership_expire_date'] = pd.to_datetime(df['membership_expire_date'], format='%Y%m%d')
+    # 날짜 변환 (YYYYMMDD → int32 일자 서수)
+    df['transaction_date'] = to_day(df['transaction_date'])
+    df['membership_expire_date'] = to_day(df['membership_expire_date'])
     
     # T 이전 데이터만 사용 (데이터 누수 방지)
-    df = df[df['transaction_date'] <= T].copy()
+    df = df[df['transaction_date'] <= day_of(t)].copy()
     
     print(f"  ✓ T 이전 필터링 후: {df.shape}")
-    print(f"  ✓ 날짜 범위: {df['transaction_date'].min().strftime('%Y-%m-%d')} ~ {df['transaction_date'].max().strftime('%Y-%m-%d')}")
+    print(f"  ✓ 날짜 범위: {format_day(df['transaction_date'].min())} ~ {format_day(df['transaction_date'].max())}")
     print(f"  ✓ 고유 사용자: {df['msno'].nunique():,}")
     
     return df
 
 
-def create_state_features(df: pd.DataFrame) -> pd.DataFrame:
+def transaction_segments(df: pd.DataFrame) -> KeySegments:
+    """(msno, 거래일) 정렬 1회 → 사용자별 세그먼트 (피처 함수들이 공유)"""
+    return KeySegments(df['msno'].to_numpy(), df['transaction_date'].to_numpy())
+
+
+def create_state_features(df: pd.DataFrame, t: pd.Timestamp = T,
+                          segments: Optional[KeySegments] = None) -> pd.DataFrame:
     """
     상태 기반 피처 (마지막 거래 기준)
     - 가장 중요한 피처들
     """
     print("\n📊 상태 기반 피처 생성 중...")
     
-    # 사용자별 최신 거래 추출
-    df_sorted = df.sort_values(['msno', 'transaction_date'], ascending=[True, False])
-    latest = df_sorted.groupby('msno').first().reset_index()
+    # 사용자별 최신 거래 행 위치 (전체 정렬 복사본 없이 필요한 컬럼만 gather)
+    segments = segments if segments is not None else transaction_segments(df)
+    idx = segments.latest()
+    latest = {col: df[col].to_numpy()[idx] for col in
+              ['msno', 'transaction_date', 'membership_expire_date', 'is_auto_renew', 'payment_plan_days',
+               'payment_method_id', 'actual_amount_paid', 'plan_list_price', 'is_cancel']}
     
     # 상태 피처 생성
     features = pd.DataFrame()
     features['msno'] = latest['msno']
     
     # 마지막 결제 후 경과일
-    features['days_since_last_payment'] = (T - latest['transaction_date']).dt.days
+    features['days_since_last_payment'] = days_between(day_of(t), latest['transaction_date'])
     
     # 마지막 거래 정보
     features['is_auto_renew_last'] = latest['is_auto_renew']
@@ -80,7 +122,7 @@ def create_state_features(df: pd.DataFrame) -> pd.DataFrame:
     features['last_discount_rate'] = features['last_discount_rate'].clip(0, 1)
     
     # 만료까지 남은 일수 (T 기준)
-    features['days_to_expire'] = (latest['membership_expire_date'] - T).dt.days
+    features['days_to_expire'] = days_between(latest['membership_expire_date'], day_of(t))
     
     # 이미 만료됨 플래그
     features['is_expired'] = (features['days_to_expire'] < 0).astype(int)
@@ -93,45 +135,36 @@ def create_state_features(df: pd.DataFrame) -> pd.DataFrame:
     return features
 
 
-def create_history_features(df: pd.DataFrame) -> pd.DataFrame:
+def create_history_features(df: pd.DataFrame,
+                            segments: Optional[KeySegments] = None) -> pd.DataFrame:
     """
     누적 히스토리 피처 (전체 기간)
     - 2015-01-01 ~ 2017-03-31
     """
     print("\n📊 누적 히스토리 피처 생성 중...")
     
+    segments = segments if segments is not None else transaction_segments(df)
+    starts = segments.starts
+    paid = segments.gather(df['actual_amount_paid'].to_numpy())
+    
     # 할인율 계산
-    df = df.copy()
-    df['discount_rate'] = 1 - (df['actual_amount_paid'] / (df['plan_list_price'] + 1e-9))
-    df['discount_rate'] = df['discount_rate'].clip(0, 1)
-    
-    # 집계
-    agg_dict = {
-        'transaction_date': 'count',           # 총 거래 횟수
-        'actual_amount_paid': ['sum', 'mean'], # 총/평균 결제액
-        'is_cancel': 'sum',                    # 취소 횟수
-        'is_auto_renew': 'mean',               # 자동갱신 비율
-        'payment_plan_days': ['mean', 'nunique'],  # 평균/고유 플랜
-        'payment_method_id': 'nunique',        # 고유 결제수단
-        'discount_rate': 'mean',               # 평균 할인율
-    }
-    
-    history = df.groupby('msno').agg(agg_dict)
-    
-    # 컬럼명 정리
-    history.columns = [
-        'total_payment_count',
-        'total_amount_paid',
-        'avg_amount_per_payment',
-        'total_cancel_count',
-        'auto_renew_rate_history',
-        'avg_plan_days',
-        'unique_plan_count',
-        'unique_payment_method_count',
-        'avg_discount_rate_history',
-    ]
-    
-    history = history.reset_index()
+    discount_rate = np.clip(1 - (paid / (segments.gather(df['plan_list_price'].to_numpy()) + 1e-9)), 0, 1)
+    plan_days = segments.gather(df['payment_plan_days'].to_numpy())
+    
+    # 집계 (사용자 세그먼트별)
+    history = pd.DataFrame({
+        'msno': segments.keys,
+        'total_payment_count': segments.counts,                                        # 총 거래 횟수
+        'total_amount_paid': segment_sum(paid, starts),                                # 총 결제액
+        'avg_amount_per_payment': segment_mean(paid, starts),                          # 평균 결제액
+        'total_cancel_count': segment_sum(segments.gather(df['is_cancel'].to_numpy()), starts),  # 취소 횟수
+        'auto_renew_rate_history': segment_mean(segments.gather(df['is_auto_renew'].to_numpy()), starts),  # 자동갱신 비율
+        'avg_plan_days': segment_mean(plan_days, starts),                              # 평균 플랜
+        'unique_plan_count': segment_nunique(plan_days, starts),                       # 고유 플랜
+        'unique_payment_method_count': segment_nunique(
+            segments.gather(df['payment_method_id'].to_numpy()), starts),              # 고유 결제수단
+        'avg_discount_rate_history': segment_mean(discount_rate, starts),              # 평균 할인율
+    })
     
     # 추가 파생 피처
     # 취소 비율
@@ -148,79 +181,126 @@ def create_history_features(df: pd.DataFrame) -> pd.DataFrame:
     return history
 
 
-def create_recency_features(df: pd.DataFrame) -> pd.DataFrame:
+def create_recency_features(df: pd.DataFrame, t: pd.Timestamp = T,
+                            windows: List[int] = RECENCY_WINDOWS,
+                            segments: Optional[KeySegments] = None) -> pd.DataFrame:
     """
-    제한적 Recency 집계 (30일, 90일)
+    제한적 Recency 집계 (기본 30일, 90일, 180일)
     - 7일, 14일은 대부분 0이므로 비권장
+    - (msno, 거래일) 정렬 1회 후 윈도우별 하한을 searchsorted → 윈도우 추가 비용이 거의 없음
     """
     print("\n📊 Recency 피처 생성 중...")
     
-    features = pd.DataFrame({'msno': df['msno'].unique()})
-    
-    # 최근 30일 (2017-03-01 ~ 2017-03-31)
-    last_30d = df[df['transaction_date'] >= T - pd.Timedelta(days=30)]
-    count_30d = last_30d.groupby('msno').size().reset_index(name='payment_count_last_30d')
+    # 윈도우 d일 = transaction_date >= t - d (예: 30일 → 2017-03-01 ~ 2017-03-31)
+    segments = segments if segments is not None else transaction_segments(df)
+    counts = segments.count_since([day_of(t) - days for days in windows])
     
-    # 최근 90일 (2017-01-01 ~ 2017-03-31)
-    last_90d = df[df['transaction_date'] >= T - pd.Timedelta(days=90)]
-    count_90d = last_90d.groupby('msno').size().reset_index(name='payment_count_last_90d')
-    
-    # 최근 180일
-    last_180d = df[df['transaction_date'] >= T - pd.Timedelta(days=180)]
-    count_180d = last_180d.groupby('msno').size().reset_index(name='payment_count_last_180d')
-    
-    # 병합
-    features = features.merge(count_30d, on='msno', how='left')
-    features = features.merge(count_90d, on='msno', how='left')
-    features = features.merge(count_180d, on='msno', how='left')
-    
-    # 결측 = 0
-    features = features.fillna(0)
+    features = pd.DataFrame({'msno': segments.keys})
+    for j, days in enumerate(windows):
+        features[f'payment_count_last_{days}d'] = counts[:, j]
     
     # 최근 결제 집중도
-    features['recency_30d_90d_ratio'] = features['payment_count_last_30d'] / (features['payment_count_last_90d'] + 1e-9)
+    if 30 in windows and 90 in windows:
+        features['recency_30d_90d_ratio'] = features['payment_count_last_30d'] / (features['payment_count_last_90d'] + 1e-9)
     
     print(f"  ✓ Recency 피처 {len(features.columns)-1}개 생성")
     
     return features
 
 
-def create_cancel_features(df: pd.DataFrame) -> pd.DataFrame:
+def create_cancel_features(df: pd.DataFrame, t: pd.Timestamp = T,
+                           segments: Optional[KeySegments] = None) -> pd.DataFrame:
     """취소 관련 상세 피처"""
     print("\n📊 취소 관련 피처 생성 중...")
     
-    # 취소 거래만 필터링
-    cancel_df = df[df['is_cancel'] == 1]
+    segments = segments if segments is not None else transaction_segments(df)
     
-    if len(cancel_df) == 0:
+    # 취소 거래만 선택 (정렬 순서 마스크)
+    rows, starts, key_index = segments.subset(segments.gather(df['is_cancel'].to_numpy()) == 1)
+    
+    if len(rows) == 0:
         print("  ⚠️ 취소 데이터 없음")
-        return pd.DataFrame({'msno': df['msno'].unique()})
+        # 컬럼은 유지 (병합 후 결측 = 0, 취소 이력이 없는 사용자와 같은 값)
+        return pd.DataFrame({'msno': segments.keys, 'days_since_last_cancel': np.nan})
     
     # 마지막 취소일
-    last_cancel = cancel_df.groupby('msno')['transaction_date'].max().reset_index()
-    last_cancel.columns = ['msno', 'last_cancel_date']
-    last_cancel['days_since_last_cancel'] = (T - last_cancel['last_cancel_date']).dt.days
+    dates = segments.gather(df['transaction_date'].to_numpy())
+    last_cancel_date = segment_max(dates[rows], starts)
     
-    features = last_cancel[['msno', 'days_since_last_cancel']]
+    features = pd.DataFrame({
+        'msno': segments.keys[key_index],
+        'days_since_last_cancel': days_between(day_of(t), last_cancel_date),
+    })
     
     print(f"  ✓ 취소 피처 {len(features.columns)-1}개 생성")
     
     return features
 
 
+def create_renewal_features(df: pd.DataFrame,
+                            segments: Optional[KeySegments] = None) -> pd.DataFrame:
+    """
+    갱신 간격 규칙성 피처 (취소 제외 결제 사이 일수)
+    - 규칙적으로 갱신하던 사용자의 간격이 벌어지는 것을 포착
+    - 결제 2건 미만 사용자는 결측 (병합 후 0)
+    """
+    print("\n📊 갱신 간격 피처 생성 중...")
+    
+    segments = segments if segments is not None else transaction_segments(df)
+    
+    # 결제(비취소) 거래만 선택 → 세그먼트 안 연속 결제일 차이
+    rows, starts, key_index = segments.subset(segments.gather(df['is_cancel'].to_numpy()) == 0)
+    dates = segments.gather(df['transaction_date'].to_numpy())[rows]
+    intervals = segment_diff(dates, starts)
+    
+    features = pd.DataFrame({'msno': segments.keys[key_index]})
+    features['avg_renewal_interval'] = segment_mean(intervals, starts)
+    features['renewal_interval_std'] = segment_std(intervals, starts, ddof=0)
+    features['max_renewal_gap'] = segment_max_gap(dates, starts)
+    
+    # 간격 변동계수 (0에 가까울수록 규칙적)
+    features['renewal_interval_cv'] = features['renewal_interval_std'] / (features['avg_renewal_interval'] + 1e-9)
+    
+    print(f"  ✓ 갱신 간격 피처 {len(features.columns)-1}개 생성")
+    
+    return features
+
+
+def create_subscription_features(df: pd.DataFrame, t: pd.Timestamp = T,
+                                 segments: Optional[KeySegments] = None) -> pd.DataFrame:
+    """
+    구독 구간 피처 (subscription_intervals 참고)
+    - 거래별 [거래일, 만료일]을 최신 거래 우선으로 병합한 연속 구독 구간 기준
+    - 구간 수, 총 구독 일수, 공백 합/최대, 30일 초과 공백(과거 이탈) 횟수, 현재 구간 경과일
+    """
+    print("\n📊 구독 구간 피처 생성 중...")
+    
+    features = subscription_features(df, t, segments)
+    
+    print(f"  ✓ 구독 구간 피처 {len(features.columns)-1}개 생성")
+    
+    return features
+
+
 def merge_all_features(state_features: pd.DataFrame,
                        history_features: pd.DataFrame,
                        recency_features: pd.DataFrame,
-                       cancel_features: pd.DataFrame) -> pd.DataFrame:
+                       cancel_features: pd.DataFrame,
+                       renewal_features: Optional[pd.DataFrame] = None,
+                       subscription_features: Optional[pd.DataFrame] = None) -> pd.DataFrame:
     """모든 피처 병합"""
     print("\n🔗 피처 병합 중...")
     
     # state 기준으로 병합
     result = state_features.copy()
     
-    result = result.merge(history_features, on='msno', how='left')
-    result = result.merge(recency_features, on='msno', how='left')
-    result = result.merge(cancel_features, on='msno', how='left')
+    result = merge_on_key(result, history_features, how='left')
+    result = merge_on_key(result, recency_features, how='left')
+    result = merge_on_key(result, cancel_features, how='left')
+    if renewal_features is not None:
+        result = merge_on_key(result, renewal_features, how='left')
+    if subscription_features is not None:
+        result = merge_on_key(result, subscription_features, how='left')
     
     # 결측치 처리
     result = result.fillna(0)
@@ -252,33 +332,59 @@ def sanity_check(df: pd.DataFrame) -> None:
             print(f"    {feat}: mean={df[feat].mean():.2f}, std={df[feat].std():.2f}")
 
 
-def run_aggregation_pipeline(data_dir: Path = DATA_DIR,
-                             save: bool = True) -> pd.DataFrame:
-    """전체 집계 파이프라인 실행"""
+def build_transaction_features(transactions: pd.DataFrame, t: pd.Timestamp = T,
+                               recency_windows: List[int] = RECENCY_WINDOWS) -> pd.DataFrame:
+    """기준 시점 t의 상태/히스토리/Recency/취소/갱신 간격/구독 구간 피처 생성 + 병합 (transactions는 t 이전 행만)"""
+    # (msno, 거래일) 세그먼트 (정렬 1회, 모든 피처가 공유)
+    segments = transaction_segments(transactions)
     
-    print("=" * 60)
-    print("🚀 Transactions 집계 파이프라인 (상태 + 누적)")
-    print("=" * 60)
-    print(f"기준 시점 (T): {T.strftime('%Y-%m-%d')}")
+    # 상태 기반 피처
+    state_features = create_state_features(transactions, t, segments)
+    
+    # 누적 히스토리 피처
+    history_features = create_history_features(transactions, segments)
     
-    # 1. 데이터 로드
-    transactions = load_transactions(data_dir)
+    # Recency 피처
+    recency_features = create_recency_features(transactions, t, recency_windows, segments)
     
-    # 2. 상태 기반 피처
-    state_features = create_state_features(transactions)
+    # 취소 관련 피처
+    cancel_features = create_cancel_features(transactions, t, segments)
     
-    # 3. 누적 히스토리 피처
-    history_features = create_history_features(transactions)
+    # 갱신 간격 피처
+    renewal_features = create_renewal_features(transactions, segments)
     
-    # 4. Recency 피처
-    recency_features = create_recency_features(transactions)
+    # 구독 구간 피처
+    span_features = create_subscription_features(transactions, t, segments)
+    
+    return merge_all_features(state_features, history_features,
+                              recency_features, cancel_features, renewal_features, span_features)
+
+
+def run_aggregation_pipeline(data_dir: Path = DATA_DIR,
+                             save: bool = True,
+                             t: pd.Timestamp = T,
+                             layout: Optional[str] = None,
+                             recency_windows: List[int] = RECENCY_WINDOWS) -> pd.DataFrame:
+    """
+    전체 집계 파이프라인 실행 (t: 기준 시점, 여러 기준 시점은 backfill.py 사용)
+    
+    layout: 저장 Parquet 레이아웃 ('msno' / 'hash' 정렬 + row group + zstd, None이면 기본 to_parquet)
+    recency_windows: payment_count_last_{d}d를 만들 lookback 일수 목록
+    """
+    
+    print("=" * 60)
+    print("🚀 Transactions 집계 파이프라인 (상태 + 누적)")
+    print("=" * 60)
+    print(f"기준 시점 (T): {t.strftime('%Y-%m-%d')}")
     
-    # 5. 취소 관련 피처
-    cancel_features = create_cancel_features(transactions)
+    # 1. 데이터 로드 (msno는 int32 대리키로 치환, 출력 직전에 복원)
+    keys = load_msno_dictionary(data_dir)
+    transactions = load_transactions(data_dir, msno_ids=keys is not None, t=t)
+    keys, (transactions,) = encode_frames([transactions], keys)
     
-    # 6. 병합
-    agg_df = merge_all_features(state_features, history_features, 
-                                 recency_features, cancel_features)
+    # 2~6. 상태 / 히스토리 / Recency / 취소 / 갱신 간격 / 구독 구간 피처 생성 + 병합
+    agg_df = build_transaction_features(transactions, t, recency_windows)
+    agg_df = decode_msno(agg_df, keys)
     
     # 7. Sanity Check
     sanity_check(agg_df)
@@ -286,7 +392,7 @@ def run_aggregation_pipeline(data_dir: Path = DATA_DIR,
     # 8. 저장 (Parquet + PyArrow)
     if save:
         output_path = data_dir / 'transactions_aggregated_ldh.parquet'
-        agg_df.to_parquet(output_path, engine='pyarrow', index=False)
+        write_feature_table(agg_df, output_path, layout)
         print(f"\n💾 저장 완료 (Parquet): {output_path}")
     
     print("\n" + "=" * 60)
@@ -305,5 +411,12 @@ def run_aggregation_pipeline(data_dir: Path = DATA_DIR,
 # 실행
 # ============================================
 if __name__ == "__main__":
-    agg_df = run_aggregation_pipeline()
+    parser = argparse.ArgumentParser(description='Transactions 집계 파이프라인')
+    parser.add_argument('--layout', choices=['msno', 'hash'], default=None,
+                        help='저장 레이아웃 (msno/hash 정렬 + row group + zstd, 기본 to_parquet)')
+    parser.add_argument('--recency-windows', type=int, nargs='+', default=RECENCY_WINDOWS,
+                        help='결제 횟수 lookback 일수 목록 (예: 7 14 30 60 90 180 365)')
+    args = parser.parse_args()
+    
+    agg_df = run_aggregation_pipeline(layout=args.layout, recency_windows=args.recency_windows)
 
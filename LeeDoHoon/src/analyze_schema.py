@@ -1,109 +1,255 @@
 """
-데이터 스키마 분석 스크립트
+데이터 스키마 분석 스크립트 (원패스 스트리밍 프로파일러)
+
+각 원본 테이블을 청크 단위로 한 번만 읽어 컬럼별 통계를 스케치로 누적합니다.
+- 행 수, 결측 수, 최소/최대 (수치 컬럼)
+- 빈도 상위 값 (Misra-Gries, sketches.FrequentItems)
+- 근사 고유값 수 (HyperLogLog, sketches.HyperLogLog)
+- 테이블 간 msno 커버리지
+  * 기준 테이블(train_v2) 사용자: 정렬 키 위치 비트맵으로 정확히 계산 (cohort.CohortFilter.locate)
+  * 그 외 테이블 쌍: HLL 포함-배제 교집합 추정
+
+메모리는 청크 크기 + 컬럼당 스케치 + 기준 테이블 사용자 수에만 비례하므로
+v2 파일뿐 아니라 전체 이력(user_logs.csv 등 ~30GB)에도 그대로 사용할 수 있습니다.
+
+출력: {out_dir}/schema_profile.json, {out_dir}/schema_profile.md
+
+사용법:
+    python LeeDoHoon/src/analyze_schema.py --data-dir data
+    python LeeDoHoon/src/analyze_schema.py --tables train_v2 user_logs transactions
 """
+import argparse
+import json
+import sys
+import time
 import pandas as pd
+import numpy as np
+from itertools import combinations
 from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+from src.preprocessing.cohort import CohortFilter
+from src.preprocessing.ingest import SCHEMAS, iter_raw_chunks
+from src.preprocessing.sketches import FrequentItems, HyperLogLog
 
 DATA_DIR = Path(__file__).parent.parent / 'data'
 
-def analyze_all():
-    print("=" * 60)
-    print("TRAIN_V2")
-    print("=" * 60)
-    df = pd.read_csv(DATA_DIR / 'train_v2.csv')
-    print(f"Shape: {df.shape}")
-    print(f"Columns: {list(df.columns)}")
-    print(f"Dtypes:\n{df.dtypes}")
-    print(f"\nFirst 3 rows:\n{df.head(3)}")
-    print(f"\nNull counts:\n{df.isnull().sum()}")
-    print(f"\nis_churn distribution:")
-    print(df['is_churn'].value_counts())
-    print(f"is_churn ratio: {df['is_churn'].mean()*100:.2f}%")
-    
-    print("\n" + "=" * 60)
-    print("MEMBERS_V3")
-    print("=" * 60)
-    df = pd.read_csv(DATA_DIR / 'members_v3.csv')
-    print(f"Shape: {df.shape}")
-    print(f"Columns: {list(df.columns)}")
-    print(f"Dtypes:\n{df.dtypes}")
-    print(f"\nFirst 3 rows:\n{df.head(3)}")
-    print(f"\nNull counts:\n{df.isnull().sum()}")
-    print(f"\nregistration_init_time range:")
-    df['registration_init_time'] = pd.to_datetime(df['registration_init_time'], format='%Y%m%d', errors='coerce')
-    print(f"  Min: {df['registration_init_time'].min()}")
-    print(f"  Max: {df['registration_init_time'].max()}")
-    print(f"\ngender distribution:")
-    print(df['gender'].value_counts(dropna=False))
-    print(f"\nbd (age) stats:")
-    print(df['bd'].describe())
-    
-    print("\n" + "=" * 60)
-    print("TRANSACTIONS_V2")
-    print("=" * 60)
-    df = pd.read_csv(DATA_DIR / 'transactions_v2.csv')
-    print(f"Shape: {df.shape}")
-    print(f"Columns: {list(df.columns)}")
-    print(f"Dtypes:\n{df.dtypes}")
-    print(f"\nFirst 3 rows:\n{df.head(3)}")
-    print(f"\nNull counts:\n{df.isnull().sum()}")
-    print(f"\ntransaction_date range:")
-    df['transaction_date'] = pd.to_datetime(df['transaction_date'], format='%Y%m%d', errors='coerce')
-    print(f"  Min: {df['transaction_date'].min()}")
-    print(f"  Max: {df['transaction_date'].max()}")
-    print(f"\nmembership_expire_date range:")
-    df['membership_expire_date'] = pd.to_datetime(df['membership_expire_date'], format='%Y%m%d', errors='coerce')
-    print(f"  Min: {df['membership_expire_date'].min()}")
-    print(f"  Max: {df['membership_expire_date'].max()}")
-    print(f"\nis_auto_renew distribution:")
-    print(df['is_auto_renew'].value_counts())
-    print(f"\nis_cancel distribution:")
-    print(df['is_cancel'].value_counts())
-    print(f"\npayment_method_id distribution:")
-    print(df['payment_method_id'].value_counts().head(10))
-    
-    print("\n" + "=" * 60)
-    print("USER_LOGS_V2")
+TABLES = ['train_v2', 'members_v3', 'transactions_v2', 'user_logs_v2']
+REFERENCE_TABLE = 'train_v2'
+CHUNKSIZE = 1_000_000
+TOP_K = 10
+TOP_K_CAPACITY = 1000
+HLL_PRECISION = 14
+
+
+def _scalar(value):
+    """numpy 스칼라 → JSON 직렬화 가능한 Python 값"""
+    return value.item() if isinstance(value, np.generic) else value
+
+
+class ColumnProfile:
+    """컬럼 하나의 스트리밍 통계 (결측 / 최소 / 최대 / 상위 값 / 근사 고유값 수)"""
+
+    def __init__(self):
+        self.dtype: Optional[str] = None
+        self.nulls = 0
+        self.min = None
+        self.max = None
+        self.distinct = HyperLogLog(HLL_PRECISION)
+        self.frequent = FrequentItems(TOP_K_CAPACITY)
+
+    def update(self, values: pd.Series) -> None:
+        self.dtype = self.dtype or str(values.dtype)
+        self.nulls += int(values.isna().sum())
+        values = values.dropna()
+        if len(values) == 0:
+            return
+        if values.dtype.kind in 'iuf':
+            lo, hi = values.min(), values.max()
+            self.min = lo if self.min is None else min(self.min, lo)
+            self.max = hi if self.max is None else max(self.max, hi)
+        self.distinct.update(values.to_numpy())
+        self.frequent.update(values)
+
+    def summary(self) -> dict:
+        return {
+            'dtype': self.dtype,
+            'nulls': self.nulls,
+            'min': _scalar(self.min),
+            'max': _scalar(self.max),
+            'distinct_approx': int(round(self.distinct.count())),
+            'top': [[_scalar(value), int(count)] for value, count in self.frequent.top(TOP_K).items()],
+            'top_count_error': self.frequent.error_bound(),
+        }
+
+
+def iter_table_chunks(data_dir: Path, table: str, chunksize: int = CHUNKSIZE) -> Iterator[pd.DataFrame]:
+    """ingest 스키마가 있는 v2 테이블은 Parquet/CSV 공용 로더, 그 외(v1 이력 등)는 CSV 청크"""
+    if table in SCHEMAS:
+        yield from iter_raw_chunks(data_dir, table, chunksize=chunksize)
+    else:
+        yield from pd.read_csv(Path(data_dir) / f'{table}.csv', chunksize=chunksize)
+
+
+def profile_table(data_dir: Path, table: str, chunksize: int = CHUNKSIZE,
+                  reference: Optional[CohortFilter] = None,
+                  collect_msno: bool = False) -> dict:
+    """
+    테이블 하나를 한 번 스캔해 컬럼 통계 수집
+
+    Args:
+        reference: 기준 테이블 사용자 필터 (지정 시 기준 사용자별 등장 여부 기록)
+        collect_msno: True면 고유 msno를 모아 반환 (기준 테이블용)
+
+    Returns:
+        {'rows', 'columns': {컬럼: ColumnProfile}, 'seen': bool 배열 | None, 'msno': 배열 | None}
+    """
+    started = time.perf_counter()
+    rows = 0
+    columns: Dict[str, ColumnProfile] = {}
+    seen = np.zeros(len(reference), dtype=bool) if reference is not None else None
+    msno_parts = []
+
+    for chunk in iter_table_chunks(data_dir, table, chunksize):
+        rows += len(chunk)
+        for col in chunk.columns:
+            columns.setdefault(col, ColumnProfile()).update(chunk[col])
+        if 'msno' not in chunk.columns:
+            continue
+        if seen is not None:
+            pos = reference.locate(chunk['msno'].dropna().to_numpy())
+            seen[pos[pos >= 0]] = True
+        if collect_msno:
+            msno_parts.append(chunk['msno'].dropna().unique())
+
+    print(f"  {table}: {rows:,} rows, {len(columns)} columns ({time.perf_counter() - started:.1f}s)")
+    msno = pd.unique(np.concatenate(msno_parts)) if msno_parts else None
+    return {'rows': rows, 'columns': columns, 'seen': seen, 'msno': msno}
+
+
+def profile_all(data_dir: Path = DATA_DIR, tables: List[str] = TABLES,
+                chunksize: int = CHUNKSIZE, reference_table: str = REFERENCE_TABLE) -> dict:
+    """
+    전체 테이블 원패스 프로파일 + msno 커버리지
+
+    기준 테이블을 먼저 스캔해 사용자 정렬 키를 만들고, 나머지 테이블은 스캔하면서
+    기준 사용자별 등장 여부를 함께 기록합니다 (테이블 재로드 없음).
+    """
+    tables = list(dict.fromkeys(tables))
+    if reference_table in tables:
+        tables = [reference_table] + [t for t in tables if t != reference_table]
+
+    print("Profiling tables (one streaming pass each)...")
+    results = {}
+    reference = None
+    for table in tables:
+        is_reference = table == reference_table
+        results[table] = profile_table(data_dir, table, chunksize,
+                                       reference=None if is_reference else reference,
+                                       collect_msno=is_reference)
+        if is_reference and results[table]['msno'] is not None:
+            reference = CohortFilter(results[table]['msno'], method='sorted')
+
+    profile = {
+        'data_dir': str(data_dir),
+        'chunksize': chunksize,
+        'hll_relative_error': HyperLogLog(HLL_PRECISION).relative_error,
+        'tables': {
+            table: {
+                'rows': result['rows'],
+                'columns': {col: p.summary() for col, p in result['columns'].items()},
+            }
+            for table, result in results.items()
+        },
+    }
+
+    msno_sketches = {table: result['columns']['msno'].distinct
+                     for table, result in results.items() if 'msno' in result['columns']}
+    coverage = {
+        'distinct_msno_approx': {t: int(round(h.count())) for t, h in msno_sketches.items()},
+        'intersections_approx': [
+            {'a': a, 'b': b, 'intersection': int(round(msno_sketches[a].intersection(msno_sketches[b])))}
+            for a, b in combinations(msno_sketches, 2)
+        ],
+    }
+    if reference is not None:
+        coverage['reference'] = {
+            'table': reference_table,
+            'users': len(reference),
+            'covered': {t: int(r['seen'].sum()) for t, r in results.items() if r['seen'] is not None},
+            'missing': {t: int(len(reference) - r['seen'].sum())
+                        for t, r in results.items() if r['seen'] is not None},
+        }
+    profile['msno_coverage'] = coverage
+    return profile
+
+
+def to_markdown(profile: dict) -> str:
+    """프로파일 → Markdown 보고서"""
+    lines = ["# Schema Profile", "",
+             f"- data_dir: `{profile['data_dir']}`",
+             f"- distinct counts are HyperLogLog estimates (±{profile['hll_relative_error'] * 100:.1f}%)", ""]
+    for table, info in profile['tables'].items():
+        lines += [f"## {table}", "", f"Rows: {info['rows']:,}", "",
+                  "| column | dtype | nulls | min | max | distinct≈ | top values |",
+                  "|---|---|---:|---:|---:|---:|---|"]
+        for col, stats in info['columns'].items():
+            top = ', '.join(f"{str(v)[:12]} ({c:,})" for v, c in stats['top'][:5])
+            lines.append(f"| {col} | {stats['dtype']} | {stats['nulls']:,} | "
+                         f"{'' if stats['min'] is None else stats['min']} | "
+                         f"{'' if stats['max'] is None else stats['max']} | "
+                         f"{stats['distinct_approx']:,} | {top} |")
+        lines.append("")
+
+    coverage = profile['msno_coverage']
+    lines += ["## msno coverage", ""]
+    if 'reference' in coverage:
+        ref = coverage['reference']
+        lines += [f"Reference `{ref['table']}` users: {ref['users']:,} (exact)", "",
+                  "| table | covered | missing |", "|---|---:|---:|"]
+        for table, covered in ref['covered'].items():
+            lines.append(f"| {table} | {covered:,} | {ref['missing'][table]:,} |")
+        lines.append("")
+    lines += ["| table A | table B | intersection≈ |", "|---|---|---:|"]
+    for item in coverage['intersections_approx']:
+        lines.append(f"| {item['a']} | {item['b']} | {item['intersection']:,} |")
+    return '\n'.join(lines) + '\n'
+
+
+def write_profile(profile: dict, out_dir: Path) -> Dict[str, Path]:
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    paths = {'json': out_dir / 'schema_profile.json', 'markdown': out_dir / 'schema_profile.md'}
+    with open(paths['json'], 'w', encoding='utf-8') as f:
+        json.dump(profile, f, ensure_ascii=False, indent=2)
+    paths['markdown'].write_text(to_markdown(profile), encoding='utf-8')
+    return paths
+
+
+def analyze_all(data_dir: Path = DATA_DIR, tables: List[str] = TABLES,
+                chunksize: int = CHUNKSIZE, out_dir: Optional[Path] = None) -> dict:
     print("=" * 60)
-    df = pd.read_csv(DATA_DIR / 'user_logs_v2.csv')
-    print(f"Shape: {df.shape}")
-    print(f"Columns: {list(df.columns)}")
-    print(f"Dtypes:\n{df.dtypes}")
-    print(f"\nFirst 3 rows:\n{df.head(3)}")
-    print(f"\nNull counts:\n{df.isnull().sum()}")
-    print(f"\ndate range:")
-    df['date'] = pd.to_datetime(df['date'], format='%Y%m%d', errors='coerce')
-    print(f"  Min: {df['date'].min()}")
-    print(f"  Max: {df['date'].max()}")
-    print(f"\nUnique users: {df['msno'].nunique()}")
-    
-    # 테이블 간 관계
-    print("\n" + "=" * 60)
-    print("TABLE RELATIONSHIPS")
+    print("SCHEMA PROFILE")
     print("=" * 60)
-    train = pd.read_csv(DATA_DIR / 'train_v2.csv')
-    members = pd.read_csv(DATA_DIR / 'members_v3.csv')
-    transactions = pd.read_csv(DATA_DIR / 'transactions_v2.csv')
-    user_logs = pd.read_csv(DATA_DIR / 'user_logs_v2.csv')
-    
-    train_users = set(train['msno'])
-    members_users = set(members['msno'])
-    txn_users = set(transactions['msno'])
-    logs_users = set(user_logs['msno'])
-    
-    print(f"train_v2 unique users: {len(train_users):,}")
-    print(f"members_v3 unique users: {len(members_users):,}")
-    print(f"transactions_v2 unique users: {len(txn_users):,}")
-    print(f"user_logs_v2 unique users: {len(logs_users):,}")
-    
-    print(f"\ntrain ∩ members: {len(train_users & members_users):,}")
-    print(f"train ∩ transactions: {len(train_users & txn_users):,}")
-    print(f"train ∩ user_logs: {len(train_users & logs_users):,}")
-    
-    print(f"\ntrain - members (no member info): {len(train_users - members_users):,}")
-    print(f"train - transactions (no txn): {len(train_users - txn_users):,}")
-    print(f"train - user_logs (no logs): {len(train_users - logs_users):,}")
+    profile = profile_all(data_dir, tables, chunksize)
+    print()
+    print(to_markdown(profile))
+    paths = write_profile(profile, out_dir or data_dir)
+    print(f"Saved: {paths['json']}, {paths['markdown']}")
+    return profile
 
-if __name__ == "__main__":
-    analyze_all()
 
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='One-pass streaming schema profiler')
+    parser.add_argument('--data-dir', type=Path, default=DATA_DIR)
+    parser.add_argument('--tables', nargs='+', default=TABLES,
+                        help='프로파일할 테이블 (v1 이력 CSV 이름도 가능, 예: user_logs transactions)')
+    parser.add_argument('--chunksize', type=int, default=CHUNKSIZE)
+    parser.add_argument('--out-dir', type=Path, default=None,
+                        help='schema_profile.json / .md 저장 위치 (기본 data-dir)')
+    args = parser.parse_args()
+    analyze_all(args.data_dir, args.tables, args.chunksize, args.out_dir)
@@ -10,13 +10,43 @@ EPIC 1에서 정의한 원칙을 준수합니다:
 - 미래 정보 누수 금지
 """
 
+import argparse
+import sys
 import pandas as pd
 import numpy as np
 from pathlib import Path
-from typing import Tuple, Optional, Dict, Any
+from typing import Tuple, Optional, Dict, Any, List
 from sklearn.model_selection import train_test_split
 import warnings
 
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+from src.preprocessing.calendar_utils import date_mask, day_of, days_between, format_day, to_day
+from src.preprocessing.cohort import CohortFilter, read_cohort_msno
+from src.preprocessing.ingest import (
+    date_range_filter,
+    has_parquet,
+    iter_raw_chunks,
+    parquet_path,
+    read_raw_table,
+)
+from src.preprocessing.msno_keys import (
+    decode_msno,
+    encode_frames,
+    load_msno_dictionary,
+    merge_on_key,
+)
+from src.preprocessing.segments import latest_index
+from src.preprocessing.resources import (
+    SpillingReducer,
+    StageProfiler,
+    parse_memory_budget,
+    plan_chunksize,
+    spill_budget,
+)
+
 warnings.filterwarnings('ignore')
 
 # ============================================
@@ -62,10 +92,26 @@ PREPROCESSING_RULES = {
 # ============================================
 # 데이터 로드 함수
 # ============================================
-def load_raw_data(data_dir: Optional[Path] = None) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+def load_raw_data(data_dir: Optional[Path] = None,
+                  msno_ids: bool = False,
+                  include_user_logs: bool = True,
+                  cohort_filter: bool = False,
+                  scoring_msno: Optional[np.ndarray] = None) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame]:
     """
     원본 데이터를 로드합니다.
     
+    ingest 결과(data_dir/parquet/)가 있으면 Parquet을 읽고, user_logs는 관측 윈도우
+    날짜 파티션만 읽습니다 (pruning). 없으면 CSV를 읽습니다.
+    msno_ids=True면 msno 컬럼을 int32 대리키로 읽습니다.
+    include_user_logs=False면 user_logs는 읽지 않고 None을 반환합니다
+    (메모리 예산 모드에서 청크 단위로 집계할 때).
+    
+    cohort_filter=True면 train의 msno로 코호트 필터를 만들어 user_logs / transactions를
+    청크 단위로 읽으며 코호트 밖 사용자 행을 버립니다 (사용자별 집계 + train 기준
+    LEFT JOIN이므로 결과는 같음). members는 나이 중앙값 대체가 전체 회원 기준이므로
+    필터하지 않습니다. scoring_msno(msno 문자열 목록)를 주면 train도 그 사용자로 좁힌 뒤
+    코호트를 만듭니다.
+    
     Returns:
         train, user_logs, transactions, members 데이터프레임 튜플
     """
@@ -74,17 +120,30 @@ def load_raw_data(data_dir: Optional[Path] = None) -> Tuple[pd.DataFrame, pd.Dat
     
     print("📂 데이터 로드 중...")
     
-    train = pd.read_csv(data_dir / 'train_v2.csv')
-    print(f"  ✓ train_v2.csv: {len(train):,} rows")
+    train = read_raw_table(data_dir, 'train_v2', msno_ids=msno_ids)
+    print(f"  ✓ train_v2: {len(train):,} rows")
+    
+    if scoring_msno is not None:
+        target = load_msno_dictionary(data_dir).encode(scoring_msno) if msno_ids else scoring_msno
+        train = CohortFilter(target).filter(train).reset_index(drop=True)
+        print(f"  ✓ 스코어링 대상: {len(scoring_msno):,}명 → train {len(train):,} rows")
     
-    user_logs = pd.read_csv(data_dir / 'user_logs_v2.csv')
-    print(f"  ✓ user_logs_v2.csv: {len(user_logs):,} rows")
+    cohort = CohortFilter(train['msno']) if cohort_filter else None
+    if cohort is not None:
+        print(f"  ✓ 코호트 필터: {cohort}")
     
-    transactions = pd.read_csv(data_dir / 'transactions_v2.csv')
-    print(f"  ✓ transactions_v2.csv: {len(transactions):,} rows")
+    user_logs = None
+    if include_user_logs:
+        user_logs = read_raw_table(data_dir, 'user_logs_v2',
+                                   filters=date_range_filter('date', OBSERVATION_START, OBSERVATION_END),
+                                   msno_ids=msno_ids, cohort=cohort)
+        print(f"  ✓ user_logs_v2: {len(user_logs):,} rows (관측 윈도우)")
     
-    members = pd.read_csv(data_dir / 'members_v3.csv')
-    print(f"  ✓ members_v3.csv: {len(members):,} rows")
+    transactions = read_raw_table(data_dir, 'transactions_v2', msno_ids=msno_ids, cohort=cohort)
+    print(f"  ✓ transactions_v2: {len(transactions):,} rows")
+    
+    members = read_raw_table(data_dir, 'members_v3', msno_ids=msno_ids)
+    print(f"  ✓ members_v3: {len(members):,} rows")
     
     return train, user_logs, transactions, members
 
@@ -96,22 +155,25 @@ def preprocess_dates(user_logs: pd.DataFrame,
                      transactions: pd.DataFrame, 
                      members: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
     """
-    날짜 컬럼을 datetime 형식으로 변환합니다.
+    날짜 컬럼(YYYYMMDD)을 int32 일자 서수로 변환합니다. (calendar_utils.to_day)
+    
+    윈도우 필터와 일수 차이는 모두 정수 연산으로 처리하고, datetime 변환은 출력용으로만 씁니다.
     """
     print("\n🔧 날짜 형식 변환 중...")
     
-    # user_logs
-    user_logs = user_logs.copy()
-    user_logs['date'] = pd.to_datetime(user_logs['date'], format='%Y%m%d')
+    # user_logs (메모리 예산 모드에서는 청크 집계 시 변환하므로 None)
+    if user_logs is not None:
+        user_logs = user_logs.copy()
+        user_logs['date'] = to_day(user_logs['date'])
     
     # transactions
     transactions = transactions.copy()
-    transactions['transaction_date'] = pd.to_datetime(transactions['transaction_date'], format='%Y%m%d')
-    transactions['membership_expire_date'] = pd.to_datetime(transactions['membership_expire_date'], format='%Y%m%d')
+    transactions['transaction_date'] = to_day(transactions['transaction_date'])
+    transactions['membership_expire_date'] = to_day(transactions['membership_expire_date'])
     
     # members
     members = members.copy()
-    members['registration_init_time'] = pd.to_datetime(members['registration_init_time'], format='%Y%m%d')
+    members['registration_init_time'] = to_day(members['registration_init_time'])
     
     print("  ✓ 날짜 변환 완료")
     
@@ -119,31 +181,38 @@ def preprocess_dates(user_logs: pd.DataFrame,
 
 
 def filter_observation_window(user_logs: pd.DataFrame, 
-                               transactions: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
+                               transactions: pd.DataFrame,
+                               observation_start: pd.Timestamp = OBSERVATION_START,
+                               observation_end: pd.Timestamp = OBSERVATION_END,
+                               prediction_time: pd.Timestamp = PREDICTION_TIME
+                               ) -> Tuple[pd.DataFrame, pd.DataFrame]:
     """
     관측 윈도우 및 예측 시점 T 기준으로 데이터를 필터링합니다.
     - user_logs: 2017-03-01 ~ 2017-03-31
     - transactions: T (2017-04-01) 이전 (전체 이력 사용)
+    
+    백필(backfill.py)에서는 기준 시점별로 관측 윈도우/T를 넘겨 재사용합니다.
     """
     print("\n🔧 관측 윈도우 필터링 중...")
     
     # user_logs: 관측 윈도우 내 데이터만 (30일)
-    user_logs_filtered = user_logs[
-        (user_logs['date'] >= OBSERVATION_START) & 
-        (user_logs['date'] <= OBSERVATION_END)
-    ].copy()
-    print(f"  ✓ user_logs: {len(user_logs):,} → {len(user_logs_filtered):,} rows (30일 윈도우)")
+    user_logs_filtered = None
+    if user_logs is not None:
+        user_logs_filtered = user_logs[
+            date_mask(user_logs['date'], observation_start, observation_end)
+        ].copy()
+        print(f"  ✓ user_logs: {len(user_logs):,} → {len(user_logs_filtered):,} rows (30일 윈도우)")
     
     # transactions: T 이전 데이터만 (2015년~2017년 3월, 약 2년치)
     transactions_filtered = transactions[
-        transactions['transaction_date'] < PREDICTION_TIME
+        transactions['transaction_date'] < day_of(prediction_time)
     ].copy()
     
     # transactions 기간 확인
     txn_min = transactions_filtered['transaction_date'].min()
     txn_max = transactions_filtered['transaction_date'].max()
     print(f"  ✓ transactions: {len(transactions):,} → {len(transactions_filtered):,} rows")
-    print(f"    (기간: {txn_min.strftime('%Y-%m-%d')} ~ {txn_max.strftime('%Y-%m-%d')})")
+    print(f"    (기간: {format_day(txn_min)} ~ {format_day(txn_max)})")
     
     return user_logs_filtered, transactions_filtered
 
@@ -172,9 +241,11 @@ def create_user_log_features(user_logs: pd.DataFrame) -> pd.DataFrame:
     
     df = user_logs.copy()
     
-    # 총 곡 수 계산
-    df['total_songs'] = (df['num_25'] + df['num_50'] + df['num_75'] + 
+    # 총 곡 수 계산 (Parquet의 uint16 카운트 합산 overflow 방지를 위해 int64로 계산)
+    df['total_songs'] = (df['num_25'].astype('int64') + df['num_50'] + df['num_75'] + 
                          df['num_985'] + df['num_100'])
+    # Parquet의 float32 청취 시간도 float64로 합산 (CSV 경로와 같은 dtype / 정밀도)
+    df['total_secs'] = df['total_secs'].astype('float64')
     
     # 집계
     agg_dict = {
@@ -193,7 +264,15 @@ def create_user_log_features(user_logs: pd.DataFrame) -> pd.DataFrame:
     features.columns = ['msno', 'total_songs', 'total_secs', 'num_25_sum', 
                         'num_50_sum', 'num_75_sum', 'num_985_sum', 'num_100_sum',
                         'num_unq_sum', 'active_days']
+    features = derive_user_log_ratios(features)
     
+    print(f"  ✓ {len(features):,} users, {len(features.columns)-1} features")
+    
+    return features
+
+
+def derive_user_log_ratios(features: pd.DataFrame) -> pd.DataFrame:
+    """사용자별 합계/활동일수로 비율 피처 생성 (전체 로드 / 청크 집계 공용)"""
     # 파생 피처 생성
     eps = 1e-9  # 0으로 나누기 방지
     
@@ -205,12 +284,85 @@ def create_user_log_features(user_logs: pd.DataFrame) -> pd.DataFrame:
     features['listening_variety'] = features['num_unq_sum'] / (features['total_songs'] + eps)
     features['avg_song_length'] = features['total_secs'] / (features['total_songs'] + eps)
     
+    return features
+
+
+# 청크 부분 집계에서 합산하는 컬럼 (create_user_log_features의 sum 대상)
+USER_LOG_SUM_COLUMNS = ['total_songs', 'total_secs', 'num_25', 'num_50', 'num_75',
+                        'num_985', 'num_100', 'num_unq']
+
+
+def user_log_partial(chunk: pd.DataFrame,
+                     observation_start: pd.Timestamp = OBSERVATION_START) -> pd.DataFrame:
+    """
+    청크 하나의 사용자별 부분 집계 (합계 + 관측 윈도우 활동일 비트마스크)
+    
+    같은 (msno, date)가 여러 청크에 나뉘어도 활동일은 비트 OR로 한 번만 셉니다.
+    """
+    chunk = chunk.copy()
+    chunk['total_songs'] = (chunk['num_25'].astype('int64') + chunk['num_50'] + chunk['num_75'] + 
+                            chunk['num_985'] + chunk['num_100'])
+    chunk['total_secs'] = chunk['total_secs'].astype('float64')
+    day = to_day(chunk['date']) - day_of(observation_start)
+    chunk['day_mask'] = np.left_shift(np.uint64(1), day.astype(np.uint64))
+    
+    partial = chunk.groupby('msno')[USER_LOG_SUM_COLUMNS].sum()
+    # (msno, date) 중복 제거 후 비트 합 = 비트 OR
+    days = chunk.drop_duplicates(['msno', 'date']).groupby('msno')['day_mask'].sum()
+    partial['day_mask'] = days.astype(np.uint64)
+    return partial.reset_index()
+
+
+def combine_user_log_partials(parts: List[pd.DataFrame]) -> pd.DataFrame:
+    """부분 집계 병합 (합계는 더하고 활동일 비트마스크는 OR)"""
+    df = pd.concat(parts, ignore_index=True).sort_values('msno', kind='stable')
+    keys = df['msno'].to_numpy()
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    
+    combined = df.groupby('msno', sort=True)[USER_LOG_SUM_COLUMNS].sum().reset_index()
+    combined['day_mask'] = np.bitwise_or.reduceat(df['day_mask'].to_numpy(dtype=np.uint64), starts)
+    return combined
+
+
+def create_user_log_features_chunked(data_dir: Optional[Path] = None,
+                                     msno_ids: bool = False,
+                                     memory_budget: Optional[int] = None,
+                                     observation_start: pd.Timestamp = OBSERVATION_START,
+                                     observation_end: pd.Timestamp = OBSERVATION_END,
+                                     cohort: Optional[CohortFilter] = None) -> pd.DataFrame:
+    """
+    create_user_log_features()와 같은 결과를 user_logs 전체 로드 없이 생성
+    
+    측정한 행당 바이트로 청크 크기를 정하고, 사용자별 부분 집계가 예산을 넘으면
+    디스크로 스필한 뒤 마지막에 병합합니다. cohort가 있으면 청크마다 코호트 밖 행을
+    부분 집계 전에 버립니다.
+    """
+    print("\n🎵 User Log Features 생성 중 (청크 집계)...")
+    data_dir = data_dir or DATA_DIR
+    filters = date_range_filter('date', observation_start, observation_end)
+    source = (parquet_path(data_dir, 'user_logs_v2') if has_parquet(data_dir, 'user_logs_v2')
+              else Path(data_dir) / 'user_logs_v2.csv')
+    chunksize = plan_chunksize(source, 'user_logs_v2', None, memory_budget, 1_000_000, filters)
+    
+    reducer = SpillingReducer(combine_user_log_partials, spill_budget(memory_budget))
+    for chunk in iter_raw_chunks(data_dir, 'user_logs_v2', filters=filters,
+                                 chunksize=chunksize, msno_ids=msno_ids, cohort=cohort):
+        reducer.add(user_log_partial(chunk, observation_start))
+    partial = reducer.result()
+    if partial is None:
+        partial = pd.DataFrame(columns=['msno'] + USER_LOG_SUM_COLUMNS + ['day_mask'])
+    
+    features = partial.rename(columns={col: f'{col}_sum' for col in USER_LOG_SUM_COLUMNS[2:]})
+    features['active_days'] = np.bitwise_count(partial['day_mask'].to_numpy(dtype=np.uint64)).astype(np.int64)
+    features = derive_user_log_ratios(features.drop(columns='day_mask'))
+    
     print(f"  ✓ {len(features):,} users, {len(features.columns)-1} features")
     
     return features
 
 
-def create_transaction_features(transactions: pd.DataFrame) -> pd.DataFrame:
+def create_transaction_features(transactions: pd.DataFrame,
+                                prediction_time: pd.Timestamp = PREDICTION_TIME) -> pd.DataFrame:
     """
     transactions_v2에서 사용자별 결제 피처를 생성합니다.
     약 2년치 거래 이력을 집계합니다.
@@ -230,9 +382,8 @@ def create_transaction_features(transactions: pd.DataFrame) -> pd.DataFrame:
     
     df = transactions.copy()
     
-    # 최신 거래 추출
-    df_sorted = df.sort_values(['msno', 'transaction_date'], ascending=[True, False])
-    latest = df_sorted.groupby('msno').first().reset_index()
+    # 최신 거래 행 위치 (msno 오름차순 = 아래 groupby 출력 순서)
+    idx = latest_index(df['msno'].to_numpy(), df['transaction_date'].to_numpy())
     
     # 할인율 계산
     df['discount_rate'] = 1 - (df['actual_amount_paid'] / (df['plan_list_price'] + 1e-9))
@@ -253,21 +404,18 @@ def create_transaction_features(transactions: pd.DataFrame) -> pd.DataFrame:
                         'cancel_count', 'auto_renew_rate', 'avg_discount_rate', 
                         'transaction_count']
     
-    # 최신 거래 정보 병합
-    latest_cols = latest[['msno', 'is_auto_renew', 'payment_plan_days', 
-                          'membership_expire_date', 'payment_method_id']]
-    latest_cols = latest_cols.rename(columns={
+    # 최신 거래 정보 (행 순서가 같으므로 merge 없이 위치로 gather)
+    latest_cols = {
         'is_auto_renew': 'is_auto_renew_last',
         'payment_plan_days': 'plan_days_last',
-        'membership_expire_date': 'expire_date',
-        'payment_method_id': 'payment_method_last'
-    })
-    
-    features = features.merge(latest_cols, on='msno', how='left')
+        'payment_method_id': 'payment_method_last',
+    }
+    for col, name in latest_cols.items():
+        features[name] = df[col].to_numpy()[idx]
     
     # 만료까지 남은 일수
-    features['days_to_expire'] = (features['expire_date'] - PREDICTION_TIME).dt.days
-    features = features.drop('expire_date', axis=1)
+    features['days_to_expire'] = days_between(df['membership_expire_date'].to_numpy()[idx],
+                                              day_of(prediction_time))
     
     # 취소 여부 플래그
     features['has_cancelled'] = (features['cancel_count'] > 0).astype(int)
@@ -277,7 +425,8 @@ def create_transaction_features(transactions: pd.DataFrame) -> pd.DataFrame:
     return features
 
 
-def create_member_features(members: pd.DataFrame) -> pd.DataFrame:
+def create_member_features(members: pd.DataFrame,
+                           prediction_time: pd.Timestamp = PREDICTION_TIME) -> pd.DataFrame:
     """
     members_v3에서 사용자별 정적 피처를 생성합니다.
     
@@ -293,7 +442,7 @@ def create_member_features(members: pd.DataFrame) -> pd.DataFrame:
     df = members.copy()
     
     # 가입 후 경과 일수
-    df['tenure_days'] = (PREDICTION_TIME - df['registration_init_time']).dt.days
+    df['tenure_days'] = days_between(day_of(prediction_time), df['registration_init_time'])
     
     # 나이 이상치 처리 (0~100 범위 외 → NaN → 중앙값 대체)
     original_invalid = ((df['bd'] <= 0) | (df['bd'] >= 100)).sum()
@@ -353,19 +502,20 @@ def merge_features(train: pd.DataFrame,
                    member_features: pd.DataFrame) -> pd.DataFrame:
     """
     모든 피처를 train 기준으로 LEFT JOIN하여 병합합니다.
+    msno가 int32 대리키면 정렬 배열 merge join을 사용합니다.
     """
     print("\n🔗 피처 병합 중...")
     
     # train 기준으로 병합
     df = train.copy()
     
-    df = df.merge(user_log_features, on='msno', how='left')
+    df = merge_on_key(df, user_log_features, how='left')
     print(f"  ✓ + user_log_features: {df.shape}")
     
-    df = df.merge(transaction_features, on='msno', how='left')
+    df = merge_on_key(df, transaction_features, how='left')
     print(f"  ✓ + transaction_features: {df.shape}")
     
-    df = df.merge(member_features, on='msno', how='left')
+    df = merge_on_key(df, member_features, how='left')
     print(f"  ✓ + member_features: {df.shape}")
     
     return df
@@ -538,7 +688,10 @@ def sanity_check(df: pd.DataFrame, name: str = "Dataset") -> Dict[str, Any]:
 # ============================================
 def run_preprocessing_pipeline(data_dir: Optional[Path] = None, 
                                 save_dir: Optional[Path] = None,
-                                split_data: bool = True) -> Tuple[pd.DataFrame, Optional[Tuple]]:
+                                split_data: bool = True,
+                                memory_budget: Optional[int] = None,
+                                cohort_filter: bool = True,
+                                cohort_path: Optional[Path] = None) -> Tuple[pd.DataFrame, Optional[Tuple]]:
     """
     전체 전처리 및 피처 엔지니어링 파이프라인을 실행합니다.
     
@@ -546,6 +699,10 @@ def run_preprocessing_pipeline(data_dir: Optional[Path] = None,
         data_dir: 데이터 디렉토리 경로
         save_dir: 결과 저장 디렉토리 (None이면 저장하지 않음)
         split_data: train/valid/test 분할 여부
+        memory_budget: 메모리 예산 (바이트). 지정 시 user_logs를 전체 로드하지 않고
+                       예산에 맞춘 청크로 집계 (부분 집계는 예산 초과 시 디스크 스필)
+        cohort_filter: train 사용자 코호트로 원본 행을 읽는 단계에서 필터 (세미 조인 pushdown)
+        cohort_path: 스코어링 대상 msno 목록 (CSV / Parquet). 지정 시 train을 그 사용자로 좁힘
     
     Returns:
         (전체 피처 테이블, (train, valid, test) 또는 None)
@@ -556,30 +713,60 @@ def run_preprocessing_pipeline(data_dir: Optional[Path] = None,
     print(f"예측 시점 (T): {PREDICTION_TIME.strftime('%Y-%m-%d')}")
     print(f"관측 윈도우: {OBSERVATION_START.strftime('%Y-%m-%d')} ~ {OBSERVATION_END.strftime('%Y-%m-%d')}")
     
-    # 1. 데이터 로드
-    train, user_logs, transactions, members = load_raw_data(data_dir)
+    stages = StageProfiler()
+    
+    # 1. 데이터 로드 (msno는 int32 대리키로 치환, 출력 직전에 복원)
+    stages.begin('[1/8] 데이터 로드')
+    keys = load_msno_dictionary(data_dir or DATA_DIR)
+    scoring_msno = read_cohort_msno(cohort_path) if cohort_path is not None else None
+    cohort_filter = cohort_filter or scoring_msno is not None
+    train, user_logs, transactions, members = load_raw_data(data_dir, msno_ids=keys is not None,
+                                                            include_user_logs=memory_budget is None,
+                                                            cohort_filter=cohort_filter,
+                                                            scoring_msno=scoring_msno)
+    user_log_features = None
+    if memory_budget is not None:
+        cohort = CohortFilter(train['msno']) if cohort_filter else None
+        user_log_features = create_user_log_features_chunked(data_dir, msno_ids=keys is not None,
+                                                             memory_budget=memory_budget,
+                                                             cohort=cohort)
+    frames = [train, transactions, members] + [f for f in (user_logs, user_log_features) if f is not None]
+    keys, frames = encode_frames(frames, keys)
+    train, transactions, members = frames[:3]
+    if memory_budget is None:
+        user_logs = frames[3]
+    else:
+        user_log_features = frames[3]
     
     # 2. 날짜 전처리
+    stages.begin('[2/8] 날짜 전처리')
     user_logs, transactions, members = preprocess_dates(user_logs, transactions, members)
     
     # 3. 관측 윈도우 필터링
+    stages.begin('[3/8] 관측 윈도우 필터링')
     user_logs, transactions = filter_observation_window(user_logs, transactions)
     
     # 4. Feature Engineering
-    user_log_features = create_user_log_features(user_logs)
+    stages.begin('[4/8] Feature Engineering')
+    if user_log_features is None:
+        user_log_features = create_user_log_features(user_logs)
     transaction_features = create_transaction_features(transactions)
     member_features = create_member_features(members)
     
     # 5. 데이터 병합
+    stages.begin('[5/8] 데이터 병합')
     df = merge_features(train, user_log_features, transaction_features, member_features)
     
     # 6. 결측치 처리
+    stages.begin('[6/8] 결측치 처리 + 인코딩')
     df = handle_missing_values(df)
     
     # 7. 범주형 인코딩
     df = encode_categorical_features(df)
+    df = decode_msno(df, keys)
     
     # 8. Sanity Check (전체 데이터)
+    stages.begin('[7/8] Sanity Check')
     sanity_check(df, "Full Dataset")
     
     # 9. 결과 요약
@@ -590,6 +777,7 @@ def run_preprocessing_pipeline(data_dir: Optional[Path] = None,
     print(f"Churn 비율: {df['is_churn'].mean()*100:.2f}%")
     
     # 10. 데이터 분할
+    stages.begin('[8/8] 분할 + 저장')
     splits = None
     if split_data:
         train_df, valid_df, test_df = split_dataset(df)
@@ -617,6 +805,7 @@ def run_preprocessing_pipeline(data_dir: Optional[Path] = None,
             test_df.to_csv(save_dir / 'test_set.csv', index=False)
             print(f"💾 저장 완료: train_set.csv, valid_set.csv, test_set.csv")
     
+    stages.finish()
     return df, splits
 
 
@@ -674,8 +863,20 @@ def get_feature_info() -> pd.DataFrame:
 # 실행
 # ============================================
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='KKBox Preprocessing & Feature Engineering (LDH)')
+    parser.add_argument('--memory-budget', type=str, default=None,
+                        help='메모리 예산 (예: 8GB). 지정 시 user_logs를 청크 단위로 집계')
+    parser.add_argument('--cohort', type=Path, default=None,
+                        help='스코어링 대상 msno 목록 (CSV / Parquet). 지정 시 해당 사용자만 피처 생성')
+    parser.add_argument('--no-cohort-filter', action='store_true',
+                        help='원본 로드 시 train 코호트 필터를 끄고 전체 사용자 행을 읽음')
+    args = parser.parse_args()
+    
     # 파이프라인 실행 및 저장
-    df, splits = run_preprocessing_pipeline(save_dir=DATA_DIR, split_data=True)
+    df, splits = run_preprocessing_pipeline(save_dir=DATA_DIR, split_data=True,
+                                            memory_budget=parse_memory_budget(args.memory_budget),
+                                            cohort_filter=not args.no_cohort_filter,
+                                            cohort_path=args.cohort)
     
     # 피처 목록 출력
     print("\n📋 생성된 피처 목록:")
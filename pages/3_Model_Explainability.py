@@ -11,8 +11,10 @@ from sklearn.preprocessing import StandardScaler
 # Setup Paths & Imports
 current_dir = Path(__file__).parent
 project_root = current_dir.parent
+sys.path.append(str(project_root))
 sys.path.append(str(project_root / "src"))
 
+from src.preprocessing.feature_store import feature_columns, read_sample
 from ui_components import header, subheader, section_header, apply_global_styles, card
 
 
@@ -56,15 +58,19 @@ def main():
     subheader("troubleshoot", "3.2 행동 데이터 심층 분석 (Z-Score Deviation)")
     st.caption("이탈 유저들은 일반 유저와 비교해 **얼마나 다른 행동 패턴**을 보일까요?")
 
+    v5_2_features = ['active_decay_rate', 'skip_passion_index', 'secs_trend_w7_w30', 'engagement_density']
+
     @st.cache_data
     def load_data():
         data_path = project_root / "data/processed/kkbox_train_feature_v4.parquet"
         if data_path.exists():
-             return pd.read_parquet(data_path).sample(n=5000, random_state=42)
+             # Column projection: only the Z-score features + label are read
+             available = feature_columns(data_path)
+             columns = [c for c in v5_2_features + ['is_churn'] if c in available]
+             return read_sample(data_path, n=5000, columns=columns, random_state=42)
         return None
 
     df_z = load_data()
-    v5_2_features = ['active_decay_rate', 'skip_passion_index', 'secs_trend_w7_w30', 'engagement_density']
     
     # Mocking if columns missing (for demo stability)
     if df_z is not None:
@@ -12,9 +12,11 @@ current_dir = Path(__file__).parent
 project_root = current_dir.parent
 model_dir = project_root / "03_trained_model"
 
+sys.path.append(str(project_root))
 sys.path.append(str(project_root / "src"))
 sys.path.append(str(model_dir))
 
+from src.preprocessing.feature_store import read_sample
 from ui_components import header, subheader, section_header, card, apply_global_styles
 
 try:
@@ -35,7 +37,7 @@ def load_and_score():
         if not data_path.exists(): return None
         
         # Load sample
-        df = pd.read_parquet(data_path).sample(n=2000, random_state=42)
+        df = read_sample(data_path, n=2000, random_state=42)
         
         # Load models
         inf_v4 = ModelInference(model_dir=str(model_dir), model_version='v4')
@@ -11,9 +11,11 @@ current_dir = Path(__file__).parent
 project_root = current_dir.parent
 model_dir = project_root / "03_trained_model"
 
+sys.path.append(str(project_root))
 sys.path.append(str(project_root / "src"))
 sys.path.append(str(model_dir))
 
+from src.preprocessing.feature_store import read_sample
 from ui_components import header, subheader, section_header, card, apply_global_styles
 
 try:
@@ -31,7 +33,7 @@ def load_and_score():
     try:
         data_path = project_root / "data/processed/kkbox_train_feature_v4.parquet"
         if not data_path.exists(): return None
-        df = pd.read_parquet(data_path).sample(n=3000, random_state=42) # Sample for speed
+        df = read_sample(data_path, n=3000, random_state=42) # Sample for speed
         inf_v4 = ModelInference(model_dir=str(model_dir), model_version='v4')
         inf_v5 = ModelInference(model_dir=str(model_dir), model_version='v5.2')
         df['score_v4'] = inf_v4.predict(df)
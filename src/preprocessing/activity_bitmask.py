@@ -0,0 +1,143 @@
+"""
+사용자별 31일 활동 비트마스크
+==============================
+
+목적: 윈도우마다 date.nunique()를 다시 세거나 last_active_gap을 위해 원본을 한 번 더
+      읽는 대신, 집계 패스에서 사용자당 uint32 하나(bit d = 구간 시작일 + d일에 활동)를 만들고
+      활동일 수 / 마지막 활동일 / 연속 비활동 구간을 모두 비트 연산으로 계산
+
+- 구간: 가장 늦은 윈도우 종료일에서 거슬러 올라간 최대 MASK_DAYS(31)일
+- 윈도우 활동일 수: popcount(mask & window_bits)
+- 마지막 활동일: 최상위 set bit (sketches.bit_length)
+- 연속 구간 길이: x &= x << 1 반복 횟수 (최대 31회, 사용자 축으로 벡터화)
+
+추가 피처 (activity_features):
+- activity_mask: 원본 비트마스크 (uint32)
+- current_inactive_streak: 구간 종료일까지 연속 비활동 일수 (활동이 없으면 구간 길이)
+  = last_active_gap() (build_features_v4 / user_event_index의 last_active_gap과 같은 값)
+- longest_inactive_run: 구간 내 가장 긴 비활동 연속 일수
+- longest_active_streak: 구간 내 가장 긴 활동 연속 일수
+"""
+
+import pandas as pd
+import numpy as np
+from typing import Dict, Optional, Tuple
+
+from src.preprocessing.calendar_utils import day_of
+from src.preprocessing.sketches import bit_length
+
+# ============================================================
+# 설정
+# ============================================================
+MASK_DAYS = 31  # uint32 한 개에 담는 일수 (bit 0 ~ 30)
+MASK_DTYPE = np.uint32
+ACTIVITY_FEATURES = ['activity_mask', 'current_inactive_streak', 'longest_inactive_run', 'longest_active_streak']
+
+
+def mask_span(windows: Dict[str, Tuple[pd.Timestamp, pd.Timestamp]]) -> Tuple[int, int]:
+    """윈도우 정의 → (구간 시작 서수, 구간 일수); 가장 늦은 종료일 기준 최대 MASK_DAYS일"""
+    first = min(day_of(start) for start, _ in windows.values())
+    last = max(day_of(end) for _, end in windows.values())
+    base = max(first, last - MASK_DAYS + 1)
+    return base, last - base + 1
+
+
+def window_offsets(windows: Dict[str, Tuple[pd.Timestamp, pd.Timestamp]],
+                   base_day: int) -> Dict[str, Optional[Tuple[int, int]]]:
+    """윈도우별 (시작, 종료) 비트 위치 (구간을 벗어나는 윈도우는 None → nunique로 계산)"""
+    offsets = {}
+    for name, (start, end) in windows.items():
+        s, e = day_of(start) - base_day, day_of(end) - base_day
+        offsets[name] = (s, e) if 0 <= s <= e < MASK_DAYS else None
+    return offsets
+
+
+def window_bits(start: int, end: int) -> np.uint32:
+    """[start, end] 비트 위치(양 끝 포함)만 1인 마스크"""
+    return MASK_DTYPE(((1 << (end - start + 1)) - 1) << start)
+
+
+# ============================================================
+# 비트마스크 생성
+# ============================================================
+def build_masks(msno, day: np.ndarray, base_day: int,
+                n_days: int = MASK_DAYS) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (msno, 일자 서수) 행 → 사용자별 활동 비트마스크
+
+    Returns:
+        (msno 고유값, uint32 마스크) - 구간 밖 행만 있는 사용자는 마스크 0
+    """
+    codes, uniques = pd.factorize(np.asarray(msno))
+    offset = np.asarray(day, dtype=np.int64) - base_day
+    in_span = (offset >= 0) & (offset < n_days)
+    masks = np.zeros(len(uniques), dtype=MASK_DTYPE)
+    np.bitwise_or.at(masks, codes[in_span], np.left_shift(MASK_DTYPE(1), offset[in_span].astype(MASK_DTYPE)))
+    return np.asarray(uniques), masks
+
+
+def truncate_mask(day_mask: np.ndarray, n_days: int) -> Tuple[np.ndarray, int]:
+    """
+    구간 시작일 기준 uint64 비트마스크(n_days일) → 마지막 MASK_DAYS일의 uint32 마스크
+
+    Returns:
+        (uint32 마스크, 마스크 일수)
+    """
+    keep = min(n_days, MASK_DAYS)
+    shifted = np.asarray(day_mask, dtype=np.uint64) >> np.uint64(n_days - keep)
+    return (shifted & np.uint64((1 << keep) - 1)).astype(MASK_DTYPE), keep
+
+
+def pack_days(active: np.ndarray) -> np.ndarray:
+    """(사용자, 일) bool 배열 (최대 MASK_DAYS일) → uint32 마스크"""
+    active = np.asarray(active, dtype=bool)
+    if active.shape[1] > MASK_DAYS:
+        raise ValueError(f"Cannot pack {active.shape[1]} days into a {MASK_DAYS}-day mask")
+    weights = np.left_shift(MASK_DTYPE(1), np.arange(active.shape[1], dtype=MASK_DTYPE))
+    return (active * weights).sum(axis=1, dtype=MASK_DTYPE)
+
+
+# ============================================================
+# 비트 연산 피처
+# ============================================================
+def active_days(masks: np.ndarray, bits: np.uint32) -> np.ndarray:
+    """window_bits() 구간의 활동일 수 (popcount)"""
+    return np.bitwise_count(np.asarray(masks, dtype=MASK_DTYPE) & bits).astype(np.int64)
+
+
+def last_active_offset(masks: np.ndarray) -> np.ndarray:
+    """마지막 활동일의 비트 위치 (활동이 없으면 -1)"""
+    return bit_length(np.asarray(masks, dtype=np.uint64)).astype(np.int64) - 1
+
+
+def last_active_gap(masks: np.ndarray, n_days: int = MASK_DAYS) -> np.ndarray:
+    """
+    구간 종료일(bit n_days - 1) - 마지막 활동일 (일 단위, 활동이 없으면 n_days)
+
+    기준은 데이터 전체의 최대 활동일이 아니라 마스크 구간 종료일이라, 배치 테이블과
+    단일 사용자 계산이 같은 값을 냅니다.
+    """
+    return n_days - 1 - last_active_offset(masks)
+
+
+def longest_run(masks: np.ndarray) -> np.ndarray:
+    """가장 긴 연속 1 비트 길이 (x &= x << 1을 0이 될 때까지 반복한 횟수)"""
+    x = np.asarray(masks, dtype=MASK_DTYPE).copy()
+    length = np.zeros(len(x), dtype=np.int64)
+    while x.any():
+        length += x != 0
+        x &= x << MASK_DTYPE(1)
+    return length
+
+
+def activity_features(msno, masks: np.ndarray, n_days: int = MASK_DAYS) -> pd.DataFrame:
+    """사용자별 마스크 → ACTIVITY_FEATURES 프레임 (n_days: 마스크 구간 일수)"""
+    masks = np.asarray(masks, dtype=MASK_DTYPE)
+    full = MASK_DTYPE((1 << n_days) - 1)
+    return pd.DataFrame({
+        'msno': msno,
+        'activity_mask': masks,
+        'current_inactive_streak': last_active_gap(masks, n_days),
+        'longest_inactive_run': longest_run(~masks & full),
+        'longest_active_streak': longest_run(masks),
+    })
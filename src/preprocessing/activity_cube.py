@@ -0,0 +1,394 @@
+"""
+User Logs 일별 활동 큐브
+========================
+
+목적: user_logs_v2.csv를 (사용자 × 일자 × 채널) 형태의 고정 크기 배열로 한 번만
+      변환해 디스크에 저장하고, 일자 축 누적합(prefix sum)으로 임의 윈도우의
+      합계/평균/추세/활동일수/last_active_gap을 O(users) 배열 연산으로 계산
+출력: user_logs_cube/ (msno.npy, total_secs.npy, secs_m2.npy, counts.npy, n_rows.npy, meta.json)
+
+채널:
+- total_secs (float32): 일별 총 청취 시간
+- secs_m2 (float32): 일별 행 단위 total_secs 편차 제곱합 (하루 1행이면 0, 표준편차 계산용)
+- counts (uint16): num_25, num_50, num_75, num_985, num_100, num_unq
+- n_rows (uint8): 일별 로그 행 수
+
+사용법:
+    python src/preprocessing/activity_cube.py --data-dir data
+    python src/preprocessing/activity_cube.py --source data/user_logs_v2.csv --out-dir data/user_logs_cube
+"""
+
+import argparse
+import json
+import sys
+import pandas as pd
+import numpy as np
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+from src.preprocessing.activity_bitmask import activity_features, mask_span, pack_days
+from src.preprocessing.aggregate_user_logs import (
+    DATA_DIR,
+    WINDOWS,
+    cast_count_columns,
+    derive_window_features,
+)
+from src.preprocessing.calendar_utils import day_of, format_day, to_day
+from src.preprocessing.user_logs_streaming import (
+    DEFAULT_CHUNKSIZE,
+    SUM_COLUMNS,
+    iter_user_log_chunks,
+)
+
+# ============================================================
+# 설정
+# ============================================================
+CUBE_DIR = DATA_DIR / 'user_logs_cube'
+
+COUNT_COLUMNS = SUM_COLUMNS[1:]  # num_25 ~ num_unq
+UINT16_MAX = np.iinfo(np.uint16).max
+UINT8_MAX = np.iinfo(np.uint8).max
+
+
+# ============================================================
+# 큐브 생성
+# ============================================================
+def _scan_users_and_dates(csv_path: Path, chunksize: int) -> Tuple[np.ndarray, int, int]:
+    """1차 패스: 정렬된 고유 msno와 날짜 범위(YYYYMMDD) 수집"""
+    uniques = []
+    min_date, max_date = None, None
+    for chunk in iter_user_log_chunks(csv_path, chunksize, usecols=['msno', 'date']):
+        uniques.append(chunk['msno'].unique())
+        lo, hi = chunk['date'].min(), chunk['date'].max()
+        min_date = lo if min_date is None else min(min_date, lo)
+        max_date = hi if max_date is None else max(max_date, hi)
+    msno = np.unique(np.concatenate(uniques)) if uniques else np.array([], dtype=object)
+    return msno, int(min_date), int(max_date)
+
+
+def aggregate_cells(cell: np.ndarray, values: np.ndarray
+                    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    로그 행을 (사용자, 일자) 셀 단위로 합산
+
+    Args:
+        cell: 행별 셀 키 (정수)
+        values: 행별 SUM_COLUMNS 값 (클리핑 적용 후)
+
+    Returns:
+        (정렬된 고유 셀, 행 수, total_secs 합, total_secs 셀 내 M2, 카운트 합 (cells, 6))
+    """
+    cells, inverse = np.unique(cell, return_inverse=True)
+    rows = np.bincount(inverse)
+    secs = np.bincount(inverse, weights=values[:, 0])
+    mean = secs / rows
+    m2 = np.bincount(inverse, weights=(values[:, 0] - mean[inverse]) ** 2)
+    counts = np.column_stack([np.bincount(inverse, weights=values[:, j + 1], minlength=len(cells))
+                              for j in range(len(COUNT_COLUMNS))])
+    return cells, rows, secs, m2, counts
+
+
+def build_activity_cube(csv_path: Path = DATA_DIR / 'user_logs_v2.csv',
+                        cube_dir: Path = CUBE_DIR,
+                        start_date: Optional[pd.Timestamp] = None,
+                        n_days: Optional[int] = None,
+                        clip_bounds: Optional[Dict[str, Tuple[float, float]]] = None,
+                        chunksize: int = DEFAULT_CHUNKSIZE) -> Path:
+    """
+    user_logs CSV를 두 번의 스트리밍 패스로 일별 활동 큐브로 변환
+
+    Args:
+        csv_path: user_logs CSV 또는 ingest Parquet 디렉토리 경로
+        cube_dir: 큐브 저장 디렉토리
+        start_date: 큐브 첫 날 (None이면 로그의 최소 날짜)
+        n_days: 큐브 일수 (None이면 로그의 날짜 범위 전체)
+        clip_bounds: {컬럼: (하한, 상한)} 이상치 클리핑 경계 (None이면 클리핑 안 함)
+        chunksize: 청크당 행 수
+
+    Returns:
+        큐브 디렉토리 경로
+    """
+    cube_dir = Path(cube_dir)
+    cube_dir.mkdir(parents=True, exist_ok=True)
+    clip_bounds = clip_bounds or {}
+
+    print("  [cube 1/2] Scanning users and date range...")
+    msno, min_date, max_date = _scan_users_and_dates(csv_path, chunksize)
+    if start_date is None:
+        start_date = pd.Timestamp(format_day(day_of(int(min_date))))
+    if n_days is None:
+        n_days = day_of(int(max_date)) - day_of(start_date) + 1
+    n_users = len(msno)
+    print(f"  Users: {n_users:,}, days: {n_days} (from {start_date.date()})")
+
+    np.save(cube_dir / 'msno.npy', msno.astype('S'))
+    total_secs = np.lib.format.open_memmap(cube_dir / 'total_secs.npy', mode='w+',
+                                           dtype=np.float32, shape=(n_users, n_days))
+    secs_m2 = np.lib.format.open_memmap(cube_dir / 'secs_m2.npy', mode='w+',
+                                        dtype=np.float32, shape=(n_users, n_days))
+    counts = np.lib.format.open_memmap(cube_dir / 'counts.npy', mode='w+',
+                                       dtype=np.uint16, shape=(n_users, n_days, len(COUNT_COLUMNS)))
+    n_rows = np.lib.format.open_memmap(cube_dir / 'n_rows.npy', mode='w+',
+                                       dtype=np.uint8, shape=(n_users, n_days))
+
+    user_index = pd.Index(msno)
+    flat_secs = total_secs.reshape(-1)
+    flat_m2 = secs_m2.reshape(-1)
+    flat_counts = counts.reshape(-1, len(COUNT_COLUMNS))
+    flat_rows = n_rows.reshape(-1)
+
+    print("  [cube 2/2] Filling daily cells...")
+    for i, chunk in enumerate(iter_user_log_chunks(csv_path, chunksize)):
+        day = to_day(chunk['date']) - day_of(start_date)
+        keep = (day >= 0) & (day < n_days)
+        if not keep.any():
+            continue
+        chunk = chunk[keep]
+        uid = user_index.get_indexer(chunk['msno'])
+        values = chunk[SUM_COLUMNS].to_numpy(dtype=np.float64)
+        for j, col in enumerate(SUM_COLUMNS):
+            if col in clip_bounds:
+                np.clip(values[:, j], *clip_bounds[col], out=values[:, j])
+
+        # 청크 내 (사용자, 일자) 셀 단위로 먼저 합산한 뒤 디스크 배열에 반영
+        cells, rows, secs, m2, cell_counts = aggregate_cells(uid.astype(np.int64) * n_days + day[keep],
+                                                             values)
+        mean = secs / rows
+
+        # 이전 청크에서 같은 셀이 채워진 경우 병렬 분산 공식으로 M2 병합
+        prev_rows = flat_rows[cells].astype(np.float64)
+        prev_secs = flat_secs[cells].astype(np.float64)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            delta = np.where(prev_rows > 0, prev_secs / prev_rows - mean, 0.0)
+        m2 += delta ** 2 * prev_rows * rows / (prev_rows + rows)
+
+        flat_m2[cells] += m2.astype(np.float32)
+        flat_secs[cells] += secs.astype(np.float32)
+        flat_rows[cells] = np.minimum(flat_rows[cells] + rows, UINT8_MAX)
+        for j in range(len(COUNT_COLUMNS)):
+            flat_counts[cells, j] = np.minimum(np.rint(flat_counts[cells, j] + cell_counts[:, j]), UINT16_MAX)
+
+        if i % 10 == 0:
+            print(f"  Processed chunk {i}...")
+
+    for arr in (total_secs, secs_m2, counts, n_rows):
+        arr.flush()
+
+    meta = {
+        'start_date': start_date.strftime('%Y-%m-%d'),
+        'n_days': int(n_days),
+        'n_users': int(n_users),
+        'count_columns': COUNT_COLUMNS,
+        'clip_bounds': {col: list(bounds) for col, bounds in clip_bounds.items()},
+    }
+    with open(cube_dir / 'meta.json', 'w') as f:
+        json.dump(meta, f, indent=2)
+
+    print(f"  Saved cube to: {cube_dir}")
+    return cube_dir
+
+
+def window_base_from_sums(msno: np.ndarray, count: np.ndarray, active: np.ndarray,
+                          total: np.ndarray, m2: np.ndarray, counts: np.ndarray) -> pd.DataFrame:
+    """
+    윈도우 합계들로 aggregate_single_window()의 groupby 결과와 같은 형태의 기본 집계 생성
+
+    Args:
+        count: 윈도우 내 로그 행 수
+        active: 윈도우 내 활동 일수
+        total: total_secs 합
+        m2: sum(일별 M2) + sum(일별 S^2 / n) (윈도우 분산 = (m2 - S_w^2 / n_w) / (n_w - 1))
+        counts: COUNT_COLUMNS 합 (users, 6)
+
+    Returns:
+        기본 집계 프레임 (윈도우 활동 여부 판단용 '_count' 컬럼 포함)
+    """
+    count = np.asarray(count, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = np.where(count > 0, total / count, np.nan)
+        var = (m2 - total * mean) / (count - 1)
+    std = np.where(count > 1, np.sqrt(np.maximum(var, 0)), np.nan)
+
+    base = pd.DataFrame({
+        'msno': msno,
+        'num_days_active': np.asarray(active, dtype=np.float64),
+        'total_secs': total,
+        'avg_secs_per_day': mean,
+        'std_secs': std,
+    })
+    for j, col in enumerate(COUNT_COLUMNS):
+        base[col] = counts[:, j].astype(np.float64)
+    base['_count'] = count
+    return base
+
+
+# ============================================================
+# 큐브 조회
+# ============================================================
+class ActivityCube:
+    """
+    디스크에 저장된 일별 활동 큐브 (memory-mapped)
+
+    채널별 누적합은 처음 사용할 때 한 번만 계산해 캐시하며,
+    이후 모든 윈도우 집계는 P[:, end+1] - P[:, start] 형태의 배열 연산입니다.
+    """
+
+    def __init__(self, cube_dir: Path = CUBE_DIR):
+        self.cube_dir = Path(cube_dir)
+        with open(self.cube_dir / 'meta.json', 'r') as f:
+            self.meta = json.load(f)
+
+        self.start_date = pd.Timestamp(self.meta['start_date'])
+        self.n_days = self.meta['n_days']
+        self.msno = np.load(self.cube_dir / 'msno.npy').astype(str).astype(object)
+        self.total_secs = np.load(self.cube_dir / 'total_secs.npy', mmap_mode='r')
+        self.secs_m2 = np.load(self.cube_dir / 'secs_m2.npy', mmap_mode='r')
+        self.counts = np.load(self.cube_dir / 'counts.npy', mmap_mode='r')
+        self.n_rows = np.load(self.cube_dir / 'n_rows.npy', mmap_mode='r')
+        self._prefix: Dict[str, np.ndarray] = {}
+
+    def __len__(self) -> int:
+        return len(self.msno)
+
+    def _channel(self, name: str) -> np.ndarray:
+        """채널 이름 -> (users, days) 배열"""
+        if name == 'total_secs':
+            return self.total_secs
+        if name == 'secs_m2':
+            return self.secs_m2
+        if name == 'secs_sq_over_n':
+            # 일별 S_d^2 / n_d (윈도우 분산 = sum(M2_d) + sum(S_d^2/n_d) - S_w^2/n_w)
+            secs = np.asarray(self.total_secs, dtype=np.float64)
+            rows = np.asarray(self.n_rows, dtype=np.float64)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                return np.where(rows > 0, secs ** 2 / rows, 0.0)
+        if name == 'n_rows':
+            return self.n_rows
+        if name == 'active':
+            return self.n_rows > 0
+        return self.counts[:, :, COUNT_COLUMNS.index(name)]
+
+    def prefix(self, name: str) -> np.ndarray:
+        """일자 축 누적합 (users, days + 1), 첫 열은 0"""
+        if name not in self._prefix:
+            channel = self._channel(name)
+            dtype = np.float64 if name in ('total_secs', 'secs_m2', 'secs_sq_over_n') else np.int32
+            prefix = np.zeros((len(self), self.n_days + 1), dtype=dtype)
+            np.cumsum(channel, axis=1, dtype=dtype, out=prefix[:, 1:])
+            self._prefix[name] = prefix
+        return self._prefix[name]
+
+    def day_offset(self, date: pd.Timestamp) -> int:
+        """날짜 -> 큐브 일자 인덱스"""
+        return (pd.Timestamp(date) - self.start_date).days
+
+    def window_sum(self, name: str, start: pd.Timestamp, end: pd.Timestamp) -> np.ndarray:
+        """[start, end] 구간 채널 합계 (양 끝 포함)"""
+        s = min(max(self.day_offset(start), 0), self.n_days)
+        e = min(max(self.day_offset(end) + 1, 0), self.n_days)
+        prefix = self.prefix(name)
+        return prefix[:, e] - prefix[:, s]
+
+    def window_base_frame(self, start: pd.Timestamp, end: pd.Timestamp) -> pd.DataFrame:
+        """aggregate_single_window()의 groupby 결과와 같은 형태의 기본 집계 (전체 사용자)"""
+        return window_base_from_sums(
+            self.msno,
+            count=self.window_sum('n_rows', start, end),
+            active=self.window_sum('active', start, end),
+            total=self.window_sum('total_secs', start, end),
+            m2=self.window_sum('secs_m2', start, end) + self.window_sum('secs_sq_over_n', start, end),
+            counts=np.column_stack([self.window_sum(col, start, end) for col in COUNT_COLUMNS]),
+        )
+
+    def window_features(self, windows: Dict[str, Tuple[pd.Timestamp, pd.Timestamp]] = WINDOWS
+                        ) -> pd.DataFrame:
+        """
+        윈도우 정의별 피처를 한 번에 계산 (aggregate_all_windows()와 동일한 컬럼)
+
+        새로운 윈도우(예: w3, w10)도 누적합 슬라이스만으로 계산됩니다.
+        """
+        seen = np.zeros(len(self), dtype=bool)
+        frames = []
+        for name, (start, end) in windows.items():
+            base = self.window_base_frame(start, end)
+            seen |= base.pop('_count').to_numpy() > 0
+            frames.append(derive_window_features(base, name))
+
+        result = frames[0]
+        for frame in frames[1:]:
+            result = pd.concat([result, frame.drop(columns='msno')], axis=1)
+        result = pd.concat([result, self.activity_features(windows).drop(columns='msno')], axis=1)
+
+        # 어느 윈도우에도 활동이 없는 사용자 제외 (outer merge 결과와 동일), 개수 컬럼은 int64
+        return cast_count_columns(result[seen].reset_index(drop=True).fillna(0))
+
+    def activity_features(self, windows: Dict[str, Tuple[pd.Timestamp, pd.Timestamp]] = WINDOWS
+                          ) -> pd.DataFrame:
+        """윈도우 구간 마지막 31일의 일별 활동 여부를 uint32 마스크로 묶어 최근성 피처 계산"""
+        base, n_days = mask_span(windows)
+        idx = base - day_of(self.start_date) + np.arange(n_days)
+        inside = (idx >= 0) & (idx < self.n_days)
+        active = np.zeros((len(self), n_days), dtype=bool)
+        active[:, inside] = np.asarray(self.n_rows[:, idx[inside]]) > 0
+        return activity_features(self.msno, pack_days(active), n_days)
+
+    def last_active_day(self) -> np.ndarray:
+        """사용자별 마지막 활동일 인덱스 (활동이 없으면 -1)"""
+        active = self.n_rows > 0
+        last = self.n_days - 1 - np.argmax(active[:, ::-1], axis=1)
+        return np.where(active.any(axis=1), last, -1)
+
+    def last_active_gap(self, reference_date: Optional[pd.Timestamp] = None) -> pd.DataFrame:
+        """
+        msno별 last_active_gap (기준일 - 마지막 활동일, 일 단위)
+
+        Args:
+            reference_date: 기준일 (None이면 전체 로그의 최대 활동일)
+        """
+        last = self.last_active_day()
+        ref = last.max() if reference_date is None else self.day_offset(reference_date)
+        has_log = last >= 0
+        return pd.DataFrame({
+            'msno': self.msno[has_log],
+            'last_active_gap': (ref - last[has_log]).astype(np.int64),
+        })
+
+
+# ============================================================
+# 실행
+# ============================================================
+if __name__ == '__main__':
+    from src.preprocessing.aggregate_user_logs import CLIP_BOUNDS_FILENAME, load_clip_bounds
+    from src.preprocessing.ingest import has_parquet, parquet_path
+    from src.preprocessing.user_logs_streaming import compute_clip_bounds
+
+    parser = argparse.ArgumentParser(description='Build the user_logs daily activity cube')
+    parser.add_argument('--data-dir', type=Path, default=DATA_DIR)
+    parser.add_argument('--source', type=Path, default=None,
+                        help='user_logs CSV 또는 ingest Parquet 디렉토리 '
+                             '(기본 {data-dir}의 ingest Parquet, 없으면 user_logs_v2.csv)')
+    parser.add_argument('--out-dir', type=Path, default=None,
+                        help='출력 디렉토리 (기본 {data-dir}/user_logs_cube)')
+    parser.add_argument('--start-date', type=str, default=None, help='큐브 첫 날 (기본 로그의 최소 날짜)')
+    parser.add_argument('--days', type=int, default=None, help='큐브 일수 (기본 로그의 날짜 범위 전체)')
+    parser.add_argument('--chunksize', type=int, default=DEFAULT_CHUNKSIZE)
+    args = parser.parse_args()
+
+    source = args.source
+    if source is None:
+        source = (parquet_path(args.data_dir, 'user_logs_v2') if has_parquet(args.data_dir, 'user_logs_v2')
+                  else args.data_dir / 'user_logs_v2.csv')
+    bounds_path = args.data_dir / CLIP_BOUNDS_FILENAME
+    if bounds_path.exists():
+        clip_bounds = load_clip_bounds(bounds_path)
+    else:
+        clip_bounds = compute_clip_bounds(source, chunksize=args.chunksize, method='sketch')
+
+    print(f"Building user_logs activity cube from {source}...")
+    build_activity_cube(source, args.out_dir or args.data_dir / 'user_logs_cube',
+                        start_date=pd.Timestamp(args.start_date) if args.start_date else None,
+                        n_days=args.days, clip_bounds=clip_bounds, chunksize=args.chunksize)
@@ -1,320 +1,677 @@
-"""
-User Logs 집계 스크립트
-========================
-작성자: 이도훈 (LDH)
-작성일: 2025-12-16
-
-목적: user_logs_v2.csv를 msno 기준으로 멀티 윈도우 집계
-출력: user_logs_aggregated_ldh.parquet
-"""
-
-import pandas as pd
-import numpy as np
-from pathlib import Path
-from typing import Dict, List, Tuple
-
-# ============================================================
-# 설정
-# ============================================================
-DATA_DIR = Path(__file__).resolve().parents[2] / 'data'
-T = pd.Timestamp('2017-04-01')  # 예측 시점
-
-# 멀티 윈도우 정의
-WINDOWS = {
-    'w7': (pd.Timestamp('2017-03-25'), pd.Timestamp('2017-03-31')),   # 최근 7일
-    'w14': (pd.Timestamp('2017-03-18'), pd.Timestamp('2017-03-31')),  # 최근 14일
-    'w21': (pd.Timestamp('2017-03-11'), pd.Timestamp('2017-03-31')),  # 최근 21일
-    'w30': (pd.Timestamp('2017-03-01'), pd.Timestamp('2017-03-31')),  # 전체 30일
-}
-
-
-# ============================================================
-# 이상치 처리 함수
-# ============================================================
-def clip_outliers(df: pd.DataFrame, column: str, lower_pct: float = 0.001, upper_pct: float = 0.999) -> pd.DataFrame:
-    """
-    Percentile 기반 이상치 클리핑
-    
-    Args:
-        df: 데이터프레임
-        column: 클리핑할 컬럼명
-        lower_pct: 하한 퍼센타일 (기본 0.1%)
-        upper_pct: 상한 퍼센타일 (기본 99.9%)
-    
-    Returns:
-        클리핑된 데이터프레임
-    """
-    if column not in df.columns:
-        return df
-    
-    lower_bound = df[column].quantile(lower_pct)
-    upper_bound = df[column].quantile(upper_pct)
-    
-    original_min = df[column].min()
-    original_max = df[column].max()
-    
-    df[column] = df[column].clip(lower=lower_bound, upper=upper_bound)
-    
-    clipped_count = ((df[column] == lower_bound) | (df[column] == upper_bound)).sum()
-    
-    print(f"  {column}: [{original_min:.2f}, {original_max:.2f}] -> [{lower_bound:.2f}, {upper_bound:.2f}] (clipped: {clipped_count})")
-    
-    return df
-
-
-def handle_outliers(df: pd.DataFrame) -> pd.DataFrame:
-    """
-    user_logs 데이터의 이상치 처리
-    
-    처리 대상:
-    - total_secs: 총 청취 시간
-    - num_25, num_50, num_75, num_985, num_100: 재생 구간별 곡 수
-    - num_unq: 고유 곡 수
-    """
-    print("\n[Outlier Handling] Percentile-based clipping (0.1% - 99.9%):")
-    
-    outlier_columns = ['total_secs', 'num_25', 'num_50', 'num_75', 'num_985', 'num_100', 'num_unq']
-    
-    for col in outlier_columns:
-        df = clip_outliers(df, col)
-    
-    return df
-
-
-# ============================================================
-# 데이터 로드
-# ============================================================
-def load_user_logs(data_dir: Path = DATA_DIR) -> pd.DataFrame:
-    """user_logs_v2.csv 로드 및 기본 전처리"""
-    print("[1/5] Loading user_logs_v2.csv...")
-    
-    df = pd.read_csv(data_dir / 'user_logs_v2.csv')
-    print(f"  Raw shape: {df.shape}")
-    
-    # 날짜 변환
-    df['date'] = pd.to_datetime(df['date'], format='%Y%m%d')
-    
-    # 이상치 처리
-    df = handle_outliers(df)
-    
-    # 기본 통계
-    print(f"  Date range: {df['date'].min()} ~ {df['date'].max()}")
-    print(f"  Unique users: {df['msno'].nunique():,}")
-    
-    return df
-
-
-# ============================================================
-# 단일 윈도우 집계
-# ============================================================
-def aggregate_single_window(df: pd.DataFrame, window_name: str, 
-                            start_date: pd.Timestamp, end_date: pd.Timestamp) -> pd.DataFrame:
-    """
-    단일 윈도우에 대한 집계 수행
-    
-    Args:
-        df: user_logs 데이터프레임
-        window_name: 윈도우 이름 (예: 'w7', 'w14')
-        start_date: 시작일
-        end_date: 종료일
-    
-    Returns:
-        집계된 데이터프레임
-    """
-    # 윈도우 필터링
-    mask = (df['date'] >= start_date) & (df['date'] <= end_date)
-    window_df = df[mask].copy()
-    
-    if len(window_df) == 0:
-        print(f"  Warning: No data in window {window_name}")
-        return pd.DataFrame()
-    
-    # 기본 집계
-    agg = window_df.groupby('msno').agg({
-        'date': 'nunique',           # 활동 일수
-        'total_secs': ['sum', 'mean', 'std'],  # 청취 시간
-        'num_25': 'sum',             # 25% 미만 청취 (스킵)
-        'num_50': 'sum',             # 50% 미만 청취
-        'num_75': 'sum',             # 75% 미만 청취
-        'num_985': 'sum',            # 98.5% 미만 청취
-        'num_100': 'sum',            # 100% 청취 (완주)
-        'num_unq': 'sum',            # 고유 곡 수
-    }).reset_index()
-    
-    # 컬럼명 정리
-    agg.columns = ['msno', 
-                   'num_days_active', 'total_secs', 'avg_secs_per_day', 'std_secs',
-                   'num_25', 'num_50', 'num_75', 'num_985', 'num_100', 'num_unq']
-    
-    # 총 재생 곡 수 계산
-    agg['num_songs'] = agg['num_25'] + agg['num_50'] + agg['num_75'] + agg['num_985'] + agg['num_100']
-    
-    # 일평균 곡 수
-    agg['avg_songs_per_day'] = agg['num_songs'] / (agg['num_days_active'] + 1e-9)
-    
-    # 50% 미만 재생 (short play)
-    agg['short_play'] = agg['num_25'] + agg['num_50']
-    
-    # 비율 계산 (epsilon 추가로 0 나눗셈 방지)
-    eps = 1e-9
-    agg['skip_ratio'] = agg['num_25'] / (agg['num_songs'] + eps)
-    agg['completion_ratio'] = agg['num_100'] / (agg['num_songs'] + eps)
-    agg['short_play_ratio'] = agg['short_play'] / (agg['num_songs'] + eps)
-    agg['variety_ratio'] = agg['num_unq'] / (agg['num_songs'] + eps)
-    
-    # 불필요 컬럼 제거
-    agg = agg.drop(['num_50', 'num_75', 'num_985'], axis=1)
-    
-    # 윈도우 접미사 추가
-    rename_dict = {col: f"{col}_{window_name}" for col in agg.columns if col != 'msno'}
-    agg = agg.rename(columns=rename_dict)
-    
-    # Inf 값 처리
-    agg = agg.replace([np.inf, -np.inf], 0)
-    
-    return agg
-
-
-# ============================================================
-# 전체 윈도우 집계
-# ============================================================
-def aggregate_all_windows(df: pd.DataFrame) -> pd.DataFrame:
-    """모든 윈도우에 대해 집계 수행 후 병합"""
-    print("\n[2/5] Aggregating by windows...")
-    
-    result = None
-    
-    for window_name, (start_date, end_date) in WINDOWS.items():
-        print(f"  Processing {window_name}: {start_date.date()} ~ {end_date.date()}")
-        
-        window_agg = aggregate_single_window(df, window_name, start_date, end_date)
-        
-        if result is None:
-            result = window_agg
-        else:
-            result = result.merge(window_agg, on='msno', how='outer')
-    
-    # NaN을 0으로 채우기 (해당 윈도우에 활동이 없는 경우)
-    result = result.fillna(0)
-    
-    print(f"  Combined shape: {result.shape}")
-    
-    return result
-
-
-# ============================================================
-# 변화량/추세 피처 생성
-# ============================================================
-def add_trend_features(df: pd.DataFrame) -> pd.DataFrame:
-    """윈도우 간 변화량/추세 피처 추가"""
-    print("\n[3/5] Adding trend features...")
-    
-    eps = 1e-9
-    
-    # 청취 시간 추세 (최근 / 전체)
-    df['secs_trend_w7_w30'] = df['total_secs_w7'] / (df['total_secs_w30'] + eps)
-    df['secs_trend_w14_w30'] = df['total_secs_w14'] / (df['total_secs_w30'] + eps)
-    
-    # 활동일 추세
-    df['days_trend_w7_w14'] = df['num_days_active_w7'] / (df['num_days_active_w14'] + eps)
-    df['days_trend_w7_w30'] = df['num_days_active_w7'] / (df['num_days_active_w30'] + eps)
-    
-    # 곡 수 추세
-    df['songs_trend_w7_w30'] = df['num_songs_w7'] / (df['num_songs_w30'] + eps)
-    df['songs_trend_w14_w30'] = df['num_songs_w14'] / (df['num_songs_w30'] + eps)
-    
-    # 스킵율/완주율 변화 (차이)
-    df['skip_trend_w7_w30'] = df['skip_ratio_w7'] - df['skip_ratio_w30']
-    df['completion_trend_w7_w30'] = df['completion_ratio_w7'] - df['completion_ratio_w30']
-    
-    # 최근성 비율 (recency)
-    df['recency_secs_ratio'] = df['total_secs_w7'] / (df['total_secs_w30'] + eps)
-    df['recency_songs_ratio'] = df['num_songs_w7'] / (df['num_songs_w30'] + eps)
-    
-    # Inf 값 처리
-    df = df.replace([np.inf, -np.inf], 0)
-    
-    # 비율 값 클리핑 (0~1 범위)
-    ratio_cols = [col for col in df.columns if 'trend' in col or 'ratio' in col]
-    for col in ratio_cols:
-        if 'trend' in col and 'skip' not in col and 'completion' not in col:
-            df[col] = df[col].clip(0, 1)
-    
-    print(f"  Added {len(ratio_cols)} trend features")
-    
-    return df
-
-
-# ============================================================
-# 최종 검증
-# ============================================================
-def validate_output(df: pd.DataFrame) -> None:
-    """출력 데이터 검증"""
-    print("\n[4/5] Validating output...")
-    
-    # 결측치 확인
-    null_counts = df.isnull().sum()
-    if null_counts.sum() > 0:
-        print("  Warning: Null values found!")
-        print(null_counts[null_counts > 0])
-    else:
-        print("  No null values")
-    
-    # Inf 값 확인
-    inf_counts = np.isinf(df.select_dtypes(include=[np.number])).sum()
-    if inf_counts.sum() > 0:
-        print("  Warning: Inf values found!")
-        print(inf_counts[inf_counts > 0])
-    else:
-        print("  No inf values")
-    
-    # 기본 통계
-    print(f"  Shape: {df.shape}")
-    print(f"  Columns: {df.columns.tolist()}")
-
-
-# ============================================================
-# 메인 파이프라인
-# ============================================================
-def run_aggregation_pipeline(data_dir: Path = DATA_DIR, save: bool = True) -> pd.DataFrame:
-    """전체 집계 파이프라인 실행"""
-    print("=" * 60)
-    print("User Logs Aggregation Pipeline")
-    print("=" * 60)
-    
-    # 1. 데이터 로드
-    df = load_user_logs(data_dir)
-    
-    # 2. 윈도우별 집계
-    agg_df = aggregate_all_windows(df)
-    
-    # 3. 추세 피처 추가
-    agg_df = add_trend_features(agg_df)
-    
-    # 4. 검증
-    validate_output(agg_df)
-    
-    # 5. 저장
-    if save:
-        print("\n[5/5] Saving to parquet...")
-        output_path = data_dir / 'user_logs_aggregated_ldh.parquet'
-        agg_df.to_parquet(output_path, engine='pyarrow', index=False)
-        print(f"  Saved to: {output_path}")
-    
-    print("\n" + "=" * 60)
-    print("Pipeline completed!")
-    print("=" * 60)
-    
-    # head 출력
-    print("\n[Sample Data - head(5)]")
-    print(agg_df.head())
-    
-    return agg_df
-
-
-# ============================================================
-# 실행
-# ============================================================
-if __name__ == '__main__':
-    agg_df = run_aggregation_pipeline()
-
+"""
+User Logs 집계 스크립트
+========================
+작성자: 이도훈 (LDH)
+작성일: 2025-12-16
+
+목적: user_logs_v2.csv를 msno 기준으로 멀티 윈도우 집계
+출력: user_logs_aggregated_ldh.parquet
+"""
+
+import argparse
+import json
+import sys
+import pandas as pd
+import numpy as np
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+# ============================================================
+# 설정
+# ============================================================
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+from src.preprocessing.activity_bitmask import (
+    activity_features,
+    active_days,
+    build_masks,
+    mask_span,
+    window_bits,
+    window_offsets,
+)
+from src.preprocessing.calendar_utils import day_of, format_day, to_day
+from src.preprocessing.msno_keys import (
+    decode_msno,
+    encode_frames,
+    load_msno_dictionary,
+    merge_on_key,
+)
+from src.preprocessing.segments import (
+    KeySegments,
+    segment_mean,
+    segment_nunique,
+    segment_std,
+    segment_sum,
+)
+
+DATA_DIR = PROJECT_ROOT / 'data'
+T = pd.Timestamp('2017-04-01')  # 예측 시점
+
+# 학습 시점 이상치 클리핑 경계 아티팩트 (스코어링 시 재사용)
+CLIP_BOUNDS_FILENAME = 'user_logs_clip_bounds.json'
+OUTLIER_COLUMNS = ['total_secs', 'num_25', 'num_50', 'num_75', 'num_985', 'num_100', 'num_unq']
+
+# 윈도우 피처 중 개수(정수) 컬럼 - 엔진 / 경로와 무관하게 int64로 출력 (cast_count_columns)
+COUNT_FEATURES = ['num_days_active', 'num_25', 'num_100', 'num_unq', 'num_songs', 'short_play']
+
+# 멀티 윈도우 길이 (종료일 포함 일수, w30은 관측월 전체 31일)
+WINDOW_DAYS = {
+    'w7': 7,     # 최근 7일
+    'w14': 14,   # 최근 14일
+    'w21': 21,   # 최근 21일
+    'w30': 31,   # 전체 30일 (3/1 ~ 3/31)
+}
+
+
+def make_windows(end_date, window_days: Dict[str, int] = WINDOW_DAYS
+                 ) -> Dict[str, Tuple[pd.Timestamp, pd.Timestamp]]:
+    """종료일 기준 상대 윈도우 정의 {이름: (시작일, 종료일)}"""
+    end_date = pd.Timestamp(end_date)
+    return {name: (end_date - pd.Timedelta(days=n_days - 1), end_date)
+            for name, n_days in window_days.items()}
+
+
+# 멀티 윈도우 정의 (2017-03-31 종료)
+WINDOWS = make_windows('2017-03-31')
+
+
+# ============================================================
+# 이상치 처리 함수
+# ============================================================
+def clip_outliers(df: pd.DataFrame, column: str, lower_pct: float = 0.001, upper_pct: float = 0.999,
+                  bounds: Optional[Tuple[float, float]] = None) -> pd.DataFrame:
+    """
+    Percentile 기반 이상치 클리핑
+    
+    Args:
+        df: 데이터프레임
+        column: 클리핑할 컬럼명
+        lower_pct: 하한 퍼센타일 (기본 0.1%)
+        upper_pct: 상한 퍼센타일 (기본 99.9%)
+        bounds: (하한, 상한) 지정 시 분위수를 다시 계산하지 않고 그대로 사용
+    
+    Returns:
+        클리핑된 데이터프레임
+    """
+    if column not in df.columns:
+        return df
+    
+    if bounds is None:
+        lower_bound = df[column].quantile(lower_pct)
+        upper_bound = df[column].quantile(upper_pct)
+    else:
+        lower_bound, upper_bound = bounds
+    
+    original_min = df[column].min()
+    original_max = df[column].max()
+    
+    df[column] = df[column].clip(lower=lower_bound, upper=upper_bound)
+    
+    clipped_count = ((df[column] == lower_bound) | (df[column] == upper_bound)).sum()
+    
+    print(f"  {column}: [{original_min:.2f}, {original_max:.2f}] -> [{lower_bound:.2f}, {upper_bound:.2f}] (clipped: {clipped_count})")
+    
+    return df
+
+
+def handle_outliers(df: pd.DataFrame,
+                    clip_bounds: Optional[Dict[str, Tuple[float, float]]] = None) -> pd.DataFrame:
+    """
+    user_logs 데이터의 이상치 처리
+    
+    처리 대상:
+    - total_secs: 총 청취 시간
+    - num_25, num_50, num_75, num_985, num_100: 재생 구간별 곡 수
+    - num_unq: 고유 곡 수
+    
+    Args:
+        df: user_logs 데이터프레임
+        clip_bounds: {컬럼: (하한, 상한)} 학습 시점 경계 (None이면 현재 데이터로 분위수 계산)
+    """
+    if clip_bounds is None:
+        print("\n[Outlier Handling] Percentile-based clipping (0.1% - 99.9%):")
+    else:
+        print("\n[Outlier Handling] Clipping with saved training-time bounds:")
+    
+    fitted = {}
+    for col in OUTLIER_COLUMNS:
+        if col not in df.columns:
+            continue
+        if clip_bounds is not None and col in clip_bounds:
+            bounds = tuple(clip_bounds[col])
+        else:
+            bounds = (float(df[col].quantile(0.001)), float(df[col].quantile(0.999)))
+        df = clip_outliers(df, col, bounds=bounds)
+        fitted[col] = bounds
+    
+    # 적용된 경계 기록 (아티팩트 저장용)
+    df.attrs['clip_bounds'] = fitted
+    
+    return df
+
+
+def save_clip_bounds(clip_bounds: Dict[str, Tuple[float, float]], path: Path,
+                     **metadata) -> Path:
+    """이상치 클리핑 경계를 JSON 아티팩트로 저장"""
+    payload = {
+        'bounds': {col: [float(lower), float(upper)] for col, (lower, upper) in clip_bounds.items()},
+        **metadata,
+    }
+    with open(path, 'w') as f:
+        json.dump(payload, f, indent=2)
+    print(f"  Saved clip bounds to: {path}")
+    return path
+
+
+def load_clip_bounds(path: Path) -> Dict[str, Tuple[float, float]]:
+    """save_clip_bounds()로 저장한 이상치 클리핑 경계 로드"""
+    with open(path, 'r') as f:
+        payload = json.load(f)
+    return {col: (lower, upper) for col, (lower, upper) in payload['bounds'].items()}
+
+
+def clip_bounds_method(path: Path) -> str:
+    """저장된 경계를 계산한 분위수 방식 ('exact' / 'sketch', 기록이 없는 이전 아티팩트는 'unknown')"""
+    with open(path, 'r') as f:
+        return json.load(f).get('quantile_method', 'unknown')
+
+
+# ============================================================
+# 데이터 로드
+# ============================================================
+def load_user_logs(data_dir: Path = DATA_DIR,
+                   clip_bounds: Optional[Dict[str, Tuple[float, float]]] = None,
+                   msno_ids: bool = False) -> pd.DataFrame:
+    """
+    user_logs_v2 로드 및 기본 전처리 (clip_bounds 지정 시 학습 시점 경계로 클리핑)
+
+    ingest 결과(data/parquet/)가 있으면 Parquet을, 없으면 CSV를 읽습니다.
+    msno_ids=True면 msno 컬럼을 int32 대리키로 읽습니다 (msno_keys 참고).
+    """
+    from src.preprocessing.ingest import has_parquet, read_raw_table
+    
+    source = 'parquet' if has_parquet(data_dir, 'user_logs_v2') else 'csv'
+    print(f"[1/5] Loading user_logs_v2 ({source})...")
+    
+    df = read_raw_table(data_dir, 'user_logs_v2', msno_ids=msno_ids)
+    print(f"  Raw shape: {df.shape}")
+    
+    # 날짜 변환 (YYYYMMDD → int32 일자 서수, 윈도우 필터는 정수 비교)
+    df['date'] = to_day(df['date'])
+    
+    # 이상치 처리
+    df = handle_outliers(df, clip_bounds)
+    
+    # 기본 통계
+    print(f"  Date range: {format_day(df['date'].min())} ~ {format_day(df['date'].max())}")
+    print(f"  Unique users: {df['msno'].nunique():,}")
+    
+    return df
+
+
+# ============================================================
+# 단일 윈도우 집계
+# ============================================================
+LogSegments = Tuple[KeySegments, Dict[str, np.ndarray]]
+
+
+def sort_log_segments(df: pd.DataFrame) -> LogSegments:
+    """
+    user_logs → (msno, date) 세그먼트 + 정렬 순서로 재배열한 집계 컬럼
+
+    정렬은 한 번만 하고 윈도우마다 select()로 날짜 구간만 잘라 씁니다.
+    Parquet의 좁은 dtype(uint16/float32)은 합계가 넘치므로 int64/float64로 확장합니다.
+    """
+    segments = KeySegments(*_log_days(df))
+    columns = {'date': segments.sorted_order_by}
+    for col in OUTLIER_COLUMNS:
+        wide = 'int64' if pd.api.types.is_integer_dtype(df[col]) else 'float64'
+        columns[col] = segments.gather(df[col].to_numpy(dtype=wide))
+    return segments, columns
+
+
+def aggregate_window_segments(log_segments: LogSegments, window_name: str,
+                              start_date: pd.Timestamp, end_date: pd.Timestamp,
+                              days_active: Optional[pd.Series] = None) -> pd.DataFrame:
+    """sort_log_segments() 결과로 단일 윈도우 기본 집계 (aggregate_single_window의 pandas 엔진)"""
+    segments, columns = log_segments
+    
+    # 윈도우 필터링 (정렬 배열에서 사용자별 날짜 구간 [start, end]만 선택)
+    rows, starts, key_index = segments.select(day_of(start_date), day_of(end_date))
+    
+    # 빈 윈도우도 같은 컬럼의 0행 프레임으로 집계 (outer merge 후 결측 = 0, 단일 사용자 계산 시 필요)
+    if len(rows) == 0:
+        print(f"  Warning: No data in window {window_name}")
+    
+    msno = segments.keys[key_index]
+    if days_active is not None:
+        num_days_active = days_active.reindex(msno).to_numpy(dtype=np.int64)
+    else:
+        # (msno, date) 정렬이므로 세그먼트 안 날짜 변화 지점 수 = 활동 일수
+        num_days_active = segment_nunique(columns['date'][rows], starts, assume_sorted=True)
+    
+    secs = columns['total_secs'][rows]
+    agg = pd.DataFrame({
+        'msno': msno,
+        'num_days_active': num_days_active,           # 활동 일수
+        'total_secs': segment_sum(secs, starts),      # 청취 시간
+        'avg_secs_per_day': segment_mean(secs, starts),
+        'std_secs': segment_std(secs, starts),
+    })
+    for col in ['num_25', 'num_50', 'num_75', 'num_985', 'num_100', 'num_unq']:
+        agg[col] = segment_sum(columns[col][rows], starts)  # 재생 구간별 곡 수 / 고유 곡 수
+    
+    return derive_window_features(agg, window_name)
+
+
+def aggregate_single_window(df: pd.DataFrame, window_name: str, 
+                            start_date: pd.Timestamp, end_date: pd.Timestamp,
+                            engine: str = 'pandas',
+                            days_active: Optional[pd.Series] = None,
+                            log_segments: Optional[LogSegments] = None) -> pd.DataFrame:
+    """
+    단일 윈도우에 대한 집계 수행
+    
+    Args:
+        df: user_logs 데이터프레임 (engine='arrow'면 load_user_logs_arrow()의 pa.Table)
+        window_name: 윈도우 이름 (예: 'w7', 'w14')
+        start_date: 시작일
+        end_date: 종료일
+        engine: 'pandas' - (msno, date) 정렬 1회 후 numpy 세그먼트 합계 (segments.py)
+                'arrow'  - pyarrow.compute Table.group_by (멀티스레드, 같은 컬럼/dtype)
+        days_active: msno별 윈도우 활동일 수 (활동 비트마스크 popcount, pandas 엔진 전용).
+                     지정 시 세그먼트 고유 날짜 수를 계산하지 않음
+        log_segments: sort_log_segments(df) 결과 (pandas 엔진, 여러 윈도우에서 정렬 1회 공유)
+    
+    Returns:
+        집계된 데이터프레임
+    """
+    if engine == 'arrow':
+        from src.preprocessing.arrow_aggregation import aggregate_single_window_arrow
+        return aggregate_single_window_arrow(df, window_name, start_date, end_date)
+    if engine != 'pandas':
+        raise ValueError(f"Unknown aggregation engine: {engine}. Options: 'pandas', 'arrow'")
+    
+    if log_segments is None:
+        log_segments = sort_log_segments(df)
+    return aggregate_window_segments(log_segments, window_name, start_date, end_date, days_active)
+
+
+def derive_window_features(agg: pd.DataFrame, window_name: str) -> pd.DataFrame:
+    """
+    윈도우 기본 집계값으로부터 파생 피처 생성 및 윈도우 접미사 부여
+    
+    Args:
+        agg: msno, num_days_active, total_secs, avg_secs_per_day, std_secs,
+             num_25 ~ num_100, num_unq 컬럼을 가진 집계 데이터프레임
+        window_name: 윈도우 이름 (예: 'w7', 'w14')
+    
+    Returns:
+        파생 피처가 추가된 데이터프레임
+    """
+    # 총 재생 곡 수 계산
+    agg['num_songs'] = agg['num_25'] + agg['num_50'] + agg['num_75'] + agg['num_985'] + agg['num_100']
+    
+    # 일평균 곡 수
+    agg['avg_songs_per_day'] = agg['num_songs'] / (agg['num_days_active'] + 1e-9)
+    
+    # 50% 미만 재생 (short play)
+    agg['short_play'] = agg['num_25'] + agg['num_50']
+    
+    # 비율 계산 (epsilon 추가로 0 나눗셈 방지)
+    eps = 1e-9
+    agg['skip_ratio'] = agg['num_25'] / (agg['num_songs'] + eps)
+    agg['completion_ratio'] = agg['num_100'] / (agg['num_songs'] + eps)
+    agg['short_play_ratio'] = agg['short_play'] / (agg['num_songs'] + eps)
+    agg['variety_ratio'] = agg['num_unq'] / (agg['num_songs'] + eps)
+    
+    # 불필요 컬럼 제거
+    agg = agg.drop(['num_50', 'num_75', 'num_985'], axis=1)
+    
+    # 윈도우 접미사 추가
+    rename_dict = {col: f"{col}_{window_name}" for col in agg.columns if col != 'msno'}
+    agg = agg.rename(columns=rename_dict)
+    
+    # Inf 값 처리
+    agg = agg.replace([np.inf, -np.inf], 0)
+    
+    return agg
+
+
+def cast_count_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    *_w7 ~ *_w30 개수 컬럼(COUNT_FEATURES)을 int64로 변환
+
+    outer merge의 NaN 채움이나 float 누적 상태로 만든 결과도 같은 스키마가 되도록
+    모든 집계 경로(배치 / arrow / 스트리밍 / 부분 집계 / 증분 / 큐브)에서 사용합니다.
+    """
+    for col in df.columns:
+        if col.rsplit('_', 1)[0] in COUNT_FEATURES and df[col].dtype != np.int64:
+            df[col] = np.rint(df[col].to_numpy(dtype=np.float64)).astype(np.int64)
+    return df
+
+
+# ============================================================
+# 전체 윈도우 집계
+# ============================================================
+def _log_days(df) -> Tuple[np.ndarray, np.ndarray]:
+    """user_logs(DataFrame 또는 pa.Table) → (msno, 일자 서수) 배열"""
+    if isinstance(df, pd.DataFrame):
+        msno, dates = df['msno'].to_numpy(), df['date']
+    else:
+        msno, dates = df['msno'].to_pandas().to_numpy(), df['date'].to_pandas()
+    if pd.api.types.is_datetime64_any_dtype(dates):
+        return msno, dates.to_numpy().astype('datetime64[D]').astype(np.int64)
+    if isinstance(df, pd.DataFrame):
+        return msno, dates.to_numpy()
+    return msno, to_day(dates)  # Arrow 로드는 YYYYMMDD 정수 유지
+
+
+def aggregate_all_windows(df: pd.DataFrame,
+                          windows: Dict[str, Tuple[pd.Timestamp, pd.Timestamp]] = WINDOWS,
+                          engine: str = 'pandas') -> pd.DataFrame:
+    """
+    모든 윈도우에 대해 집계 수행 후 병합 (engine: aggregate_single_window 참고)
+    
+    사용자별 31일 활동 비트마스크를 한 번 만들어 윈도우 활동일 수(pandas 엔진)와
+    최근성 피처(activity_bitmask.ACTIVITY_FEATURES)를 비트 연산으로 계산합니다.
+    """
+    print("\n[2/5] Aggregating by windows...")
+    
+    # 활동 비트마스크 (bit d = 구간 시작일 + d일 활동)
+    base_day, n_days = mask_span(windows)
+    users, masks = build_masks(*_log_days(df), base_day, n_days)
+    offsets = window_offsets(windows, base_day)
+    
+    # (msno, date) 정렬 1회 → 윈도우별 세그먼트 합계 (pandas 엔진)
+    log_segments = sort_log_segments(df) if engine == 'pandas' else None
+    
+    result = None
+    
+    for window_name, (start_date, end_date) in windows.items():
+        print(f"  Processing {window_name}: {start_date.date()} ~ {end_date.date()}")
+        
+        days_active = None
+        if engine == 'pandas' and offsets[window_name] is not None:
+            days_active = pd.Series(active_days(masks, window_bits(*offsets[window_name])), index=users)
+        window_agg = aggregate_single_window(df, window_name, start_date, end_date, engine, days_active,
+                                             log_segments)
+        
+        if result is None:
+            result = window_agg
+        else:
+            result = merge_on_key(result, window_agg, how='outer')
+    
+    # 비트마스크 최근성 피처 (current_inactive_streak, longest_inactive_run, ...)
+    result = merge_on_key(result, activity_features(users, masks, n_days), how='left')
+    
+    # NaN을 0으로 채우기 (해당 윈도우에 활동이 없는 경우) → 개수 컬럼은 int64
+    result = cast_count_columns(result.fillna(0))
+    
+    print(f"  Combined shape: {result.shape}")
+    
+    return result
+
+
+# ============================================================
+# 변화량/추세 피처 생성
+# ============================================================
+def add_trend_features(df: pd.DataFrame) -> pd.DataFrame:
+    """윈도우 간 변화량/추세 피처 추가"""
+    print("\n[3/5] Adding trend features...")
+    
+    eps = 1e-9
+    
+    # 청취 시간 추세 (최근 / 전체)
+    df['secs_trend_w7_w30'] = df['total_secs_w7'] / (df['total_secs_w30'] + eps)
+    df['secs_trend_w14_w30'] = df['total_secs_w14'] / (df['total_secs_w30'] + eps)
+    
+    # 활동일 추세
+    df['days_trend_w7_w14'] = df['num_days_active_w7'] / (df['num_days_active_w14'] + eps)
+    df['days_trend_w7_w30'] = df['num_days_active_w7'] / (df['num_days_active_w30'] + eps)
+    
+    # 곡 수 추세
+    df['songs_trend_w7_w30'] = df['num_songs_w7'] / (df['num_songs_w30'] + eps)
+    df['songs_trend_w14_w30'] = df['num_songs_w14'] / (df['num_songs_w30'] + eps)
+    
+    # 스킵율/완주율 변화 (차이)
+    df['skip_trend_w7_w30'] = df['skip_ratio_w7'] - df['skip_ratio_w30']
+    df['completion_trend_w7_w30'] = df['completion_ratio_w7'] - df['completion_ratio_w30']
+    
+    # 최근성 비율 (recency)
+    df['recency_secs_ratio'] = df['total_secs_w7'] / (df['total_secs_w30'] + eps)
+    df['recency_songs_ratio'] = df['num_songs_w7'] / (df['num_songs_w30'] + eps)
+    
+    # Inf 값 처리
+    df = df.replace([np.inf, -np.inf], 0)
+    
+    # 비율 값 클리핑 (0~1 범위)
+    ratio_cols = [col for col in df.columns if 'trend' in col or 'ratio' in col]
+    for col in ratio_cols:
+        if 'trend' in col and 'skip' not in col and 'completion' not in col:
+            df[col] = df[col].clip(0, 1)
+    
+    print(f"  Added {len(ratio_cols)} trend features")
+    
+    return df
+
+
+# ============================================================
+# 최종 검증
+# ============================================================
+def validate_output(df: pd.DataFrame) -> None:
+    """출력 데이터 검증"""
+    print("\n[4/5] Validating output...")
+    
+    # 결측치 확인
+    null_counts = df.isnull().sum()
+    if null_counts.sum() > 0:
+        print("  Warning: Null values found!")
+        print(null_counts[null_counts > 0])
+    else:
+        print("  No null values")
+    
+    # Inf 값 확인
+    inf_counts = np.isinf(df.select_dtypes(include=[np.number])).sum()
+    if inf_counts.sum() > 0:
+        print("  Warning: Inf values found!")
+        print(inf_counts[inf_counts > 0])
+    else:
+        print("  No inf values")
+    
+    # 기본 통계
+    print(f"  Shape: {df.shape}")
+    print(f"  Columns: {df.columns.tolist()}")
+
+
+# ============================================================
+# 메인 파이프라인
+# ============================================================
+def run_aggregation_pipeline(data_dir: Path = DATA_DIR, save: bool = True,
+                             streaming: bool = False, chunksize: int = 1_000_000,
+                             cube_dir: Optional[Path] = None,
+                             clip_bounds_path: Optional[Path] = None,
+                             workers: Optional[int] = None,
+                             memory_budget: Optional[int] = None,
+                             engine: str = 'pandas',
+                             layout: Optional[str] = None,
+                             quantile_method: str = 'sketch') -> pd.DataFrame:
+    """
+    전체 집계 파이프라인 실행
+    
+    Args:
+        data_dir: 데이터 디렉토리
+        save: parquet 저장 여부
+        streaming: True면 CSV를 청크 단위로 한 번만 읽어 모든 윈도우를 동시에 집계
+                   (메모리가 로그 행 수가 아닌 사용자 수에 비례)
+        chunksize: 스트리밍 모드의 청크당 행 수
+        cube_dir: 일별 활동 큐브 디렉토리 (지정 시 원본 CSV 대신 큐브 누적합으로 집계)
+        clip_bounds_path: 학습 시점 이상치 클리핑 경계 JSON (지정 시 분위수 재계산 없이 재사용,
+                          None이면 현재 데이터로 경계를 계산해 아티팩트로 저장)
+        workers: 스트리밍 모드에서 병렬 집계할 워커 프로세스 수 (CSV는 바이트 구간,
+                 ingest Parquet은 데이터 파일 그룹으로 분할; 경계는 exact 분위수)
+        memory_budget: 메모리 예산 (바이트). 지정 시 스트리밍 모드로 실행하고
+                       측정한 행당 바이트로 청크 크기 / 병렬 블록 크기를 정함
+        engine: 전체 로드 모드의 집계 엔진 ('pandas' 또는 'arrow')
+        layout: 저장 Parquet 레이아웃 ('msno' / 'hash': 정렬 + row group + zstd + 통계,
+                None: 기본 to_parquet; feature_store.write_feature_table 참고)
+        quantile_method: 단일 프로세스 스트리밍 모드에서 clip_bounds_path가 없을 때 경계 계산 방식
+                         ('sketch': 근사, 'exact': 배치 경로와 같은 경계; 병렬 / 전체 로드는 항상 exact)
+    """
+    from src.preprocessing.resources import StageProfiler
+    
+    print("=" * 60)
+    print("User Logs Aggregation Pipeline")
+    print("=" * 60)
+    stages = StageProfiler()
+    if memory_budget is not None and cube_dir is None:
+        streaming = True
+    
+    clip_bounds = None
+    if clip_bounds_path is not None:
+        print(f"Reusing clip bounds: {clip_bounds_path} ({clip_bounds_method(clip_bounds_path)} quantiles)")
+        clip_bounds = load_clip_bounds(clip_bounds_path)
+    fitted_bounds = None
+    bounds_method = 'exact'  # 전체 로드(pandas / arrow)와 병렬 스트리밍은 exact 분위수
+    
+    if cube_dir is not None:
+        from src.preprocessing.activity_cube import ActivityCube
+        
+        # 1~2. 큐브 로드 + 누적합 슬라이스로 윈도우별 집계
+        stages.begin('[1/5] Loading activity cube')
+        print(f"[1/5] Loading activity cube from {cube_dir}...")
+        cube = ActivityCube(cube_dir)
+        stages.begin('[2/5] Aggregating by windows')
+        print("\n[2/5] Aggregating by windows (cube prefix sums)...")
+        agg_df = cube.window_features(WINDOWS)
+        print(f"  Combined shape: {agg_df.shape}")
+    elif streaming:
+        from src.preprocessing.ingest import has_parquet, parquet_path
+        from src.preprocessing.resources import csv_block_bytes_for_budget, plan_chunksize
+        from src.preprocessing.user_logs_streaming import LOG_COLUMNS, aggregate_all_windows_streaming
+        
+        # 1~2. 청크 단위 로드 + 윈도우별 집계 (single pass)
+        stages.begin('[1-2/5] Loading + aggregating')
+        if has_parquet(data_dir, 'user_logs_v2'):
+            source = parquet_path(data_dir, 'user_logs_v2')
+        else:
+            source = data_dir / 'user_logs_v2.csv'
+        if workers and workers > 1:
+            from src.preprocessing.parallel_csv import DEFAULT_BLOCK_BYTES, aggregate_all_windows_parallel
+            
+            # CSV는 줄 경계 바이트 구간, ingest Parquet은 데이터 파일 그룹을 워커마다 나눠 읽음
+            block_bytes = DEFAULT_BLOCK_BYTES
+            if memory_budget is not None and source.suffix == '.csv':
+                block_bytes = csv_block_bytes_for_budget(source, memory_budget, workers)
+            elif memory_budget is not None:
+                chunksize = plan_chunksize(source, 'user_logs_v2', LOG_COLUMNS, memory_budget // workers, chunksize)
+            unit = 'byte ranges' if source.suffix == '.csv' else 'Parquet file groups'
+            print(f"[1/5] Reading {source.name} in {workers} {unit}...")
+            print("\n[2/5] Aggregating by windows (parallel partials)...")
+            agg_df = aggregate_all_windows_parallel(source, n_workers=workers,
+                                                    clip_bounds=clip_bounds,
+                                                    block_bytes=block_bytes,
+                                                    chunksize=chunksize)
+        else:
+            chunksize = plan_chunksize(source, 'user_logs_v2', LOG_COLUMNS, memory_budget, chunksize)
+            print(f"[1/5] Streaming {source.name} (chunksize={chunksize:,})...")
+            print("\n[2/5] Aggregating by windows (single pass)...")
+            agg_df = aggregate_all_windows_streaming(source, chunksize=chunksize,
+                                                     clip_bounds=clip_bounds,
+                                                     quantile_method=quantile_method)
+            bounds_method = quantile_method
+        fitted_bounds = agg_df.attrs.get('clip_bounds')
+    elif engine == 'arrow':
+        from src.preprocessing.arrow_aggregation import load_user_logs_arrow
+        
+        # 1. Arrow 테이블 로드 (pandas 변환 없이 클리핑)
+        stages.begin('[1/5] Loading')
+        table, fitted_bounds = load_user_logs_arrow(data_dir, clip_bounds)
+        
+        # 2. 윈도우별 집계 (Table.group_by)
+        stages.begin('[2/5] Aggregating by windows')
+        agg_df = aggregate_all_windows(table, engine='arrow')
+    else:
+        # 1. 데이터 로드 (msno는 int32 대리키로 치환, 출력 직전에 복원)
+        stages.begin('[1/5] Loading')
+        keys = load_msno_dictionary(data_dir)
+        df = load_user_logs(data_dir, clip_bounds, msno_ids=keys is not None)
+        fitted_bounds = df.attrs.get('clip_bounds')
+        keys, (df,) = encode_frames([df], keys)
+        
+        # 2. 윈도우별 집계
+        stages.begin('[2/5] Aggregating by windows')
+        agg_df = decode_msno(aggregate_all_windows(df), keys)
+    
+    # 3. 추세 피처 추가
+    stages.begin('[3/5] Adding trend features')
+    agg_df = add_trend_features(agg_df)
+    
+    # 4. 검증
+    stages.begin('[4/5] Validating output')
+    validate_output(agg_df)
+    
+    # 5. 저장
+    stages.begin('[5/5] Saving')
+    if save:
+        print("\n[5/5] Saving to parquet...")
+        from src.preprocessing.feature_store import write_feature_table
+        
+        output_path = data_dir / 'user_logs_aggregated_ldh.parquet'
+        write_feature_table(agg_df, output_path, layout)
+        print(f"  Saved to: {output_path}")
+        
+        # 학습 실행이면 클리핑 경계를 아티팩트로 저장 (스코어링 시 재사용)
+        if clip_bounds is None and fitted_bounds:
+            print(f"  Clip bounds computed with {bounds_method} quantiles")
+            save_clip_bounds(fitted_bounds, data_dir / CLIP_BOUNDS_FILENAME,
+                             lower_pct=0.001, upper_pct=0.999, quantile_method=bounds_method)
+    
+    stages.finish()
+    print("\n" + "=" * 60)
+    print("Pipeline completed!")
+    print("=" * 60)
+    
+    # head 출력
+    print("\n[Sample Data - head(5)]")
+    print(agg_df.head())
+    
+    return agg_df
+
+
+# ============================================================
+# 실행
+# ============================================================
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='User Logs Aggregation Pipeline')
+    parser.add_argument('--streaming', action='store_true',
+                        help='청크 단위 single-pass 집계 (메모리 절약 모드)')
+    parser.add_argument('--chunksize', type=int, default=1_000_000,
+                        help='스트리밍 모드의 청크당 행 수')
+    parser.add_argument('--cube-dir', type=Path, default=None,
+                        help='일별 활동 큐브 디렉토리 (activity_cube.py로 생성)')
+    parser.add_argument('--clip-bounds', type=Path, default=None,
+                        help='학습 시점 클리핑 경계 JSON (스코어링 실행 시 재사용)')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='병렬 집계 워커 수 (CSV 바이트 구간 / ingest Parquet 파일 그룹, 지정 시 스트리밍 모드로 실행)')
+    parser.add_argument('--memory-budget', type=str, default=None,
+                        help="메모리 예산 (예: 8GB, 512MB). 지정 시 스트리밍 모드 + 청크 크기 자동 결정")
+    parser.add_argument('--engine', choices=['pandas', 'arrow'], default='pandas',
+                        help='전체 로드 모드의 윈도우 집계 엔진')
+    parser.add_argument('--layout', choices=['msno', 'hash'], default=None,
+                        help='저장 레이아웃 (msno/hash 정렬 + row group + zstd, 기본 to_parquet)')
+    parser.add_argument('--quantile-method', choices=['sketch', 'exact'], default='sketch',
+                        help='스트리밍 모드의 클리핑 경계 분위수 계산 방식 (exact: 배치 경로와 같은 경계)')
+    args = parser.parse_args()
+    
+    from src.preprocessing.resources import parse_memory_budget
+    
+    agg_df = run_aggregation_pipeline(streaming=args.streaming or bool(args.workers),
+                                      chunksize=args.chunksize, cube_dir=args.cube_dir,
+                                      clip_bounds_path=args.clip_bounds, workers=args.workers,
+                                      memory_budget=parse_memory_budget(args.memory_budget),
+                                      engine=args.engine, layout=args.layout,
+                                      quantile_method=args.quantile_method)
+
@@ -0,0 +1,243 @@
+"""
+User Logs Arrow 집계 엔진
+==========================
+
+목적: aggregate_single_window(engine='arrow')의 백엔드
+      pyarrow.compute Table.group_by로 같은 집계를 멀티스레드로 수행 (pandas object dtype 경유 없음)
+
+- load_user_logs_arrow(): Parquet/CSV → pa.Table + 이상치 클리핑 (handle_outliers와 같은 규칙)
+- aggregate_single_window_arrow(): 윈도우 필터 + group_by 집계 → derive_window_features
+- compare_engines(): pandas / arrow 결과 일치 검증 + 소요 시간 비교
+
+pandas 경로와의 호환:
+- 컬럼 이름/순서/dtype, msno 정렬 순서가 같음 (카운트 int64, total_secs float64)
+- 정수 컬럼은 완전히 일치, 실수 합계/평균/표준편차는 합산 순서 차이로 마지막 몇 비트까지만 다를 수 있음
+
+사용법:
+    python src/preprocessing/arrow_aggregation.py --data-dir data   # 일치 검증 + 시간 비교
+"""
+
+import argparse
+import io
+import sys
+import time
+import contextlib
+import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+from src.preprocessing.aggregate_user_logs import (
+    DATA_DIR,
+    OUTLIER_COLUMNS,
+    WINDOWS,
+    aggregate_all_windows,
+    derive_window_features,
+    load_user_logs,
+    make_windows,
+)
+from src.preprocessing.calendar_utils import date_mask, format_day
+from src.preprocessing.ingest import has_parquet, read_raw_arrow
+
+# ============================================================
+# 설정
+# ============================================================
+COUNT_COLUMNS = ['num_25', 'num_50', 'num_75', 'num_985', 'num_100', 'num_unq']
+
+# (입력 컬럼, 집계 함수, 옵션) - aggregate_single_window()의 agg dict와 같은 순서
+WINDOW_AGGREGATIONS = [
+    ('date', 'count_distinct', None),
+    ('total_secs', 'sum', None),
+    ('total_secs', 'mean', None),
+    ('total_secs', 'stddev', pc.VarianceOptions(ddof=1)),
+] + [(col, 'sum', None) for col in COUNT_COLUMNS]
+
+AGG_COLUMNS = ['num_days_active', 'total_secs', 'avg_secs_per_day', 'std_secs'] + COUNT_COLUMNS
+
+
+# ============================================================
+# 로드 / 이상치 클리핑
+# ============================================================
+def _clip_column(column: pa.ChunkedArray, lower: float, upper: float) -> pa.ChunkedArray:
+    """pandas Series.clip과 같은 dtype 규칙으로 클리핑 (정수 + 비정수 경계면 float64로 승격)"""
+    if pa.types.is_integer(column.type) and not (float(lower).is_integer() and float(upper).is_integer()):
+        column = column.cast(pa.float64())
+    lo = pa.scalar(lower).cast(column.type)
+    hi = pa.scalar(upper).cast(column.type)
+    return pc.min_element_wise(pc.max_element_wise(column, lo), hi)
+
+
+def clip_table(table: pa.Table,
+               clip_bounds: Optional[Dict[str, Tuple[float, float]]] = None
+               ) -> Tuple[pa.Table, Dict[str, Tuple[float, float]]]:
+    """
+    handle_outliers()의 Arrow 버전
+
+    Returns:
+        (클리핑된 테이블, 적용된 경계 {컬럼: (하한, 상한)})
+    """
+    fitted = {}
+    for col in OUTLIER_COLUMNS:
+        if col not in table.column_names:
+            continue
+        if clip_bounds is not None and col in clip_bounds:
+            bounds = tuple(clip_bounds[col])
+        else:
+            q = pc.quantile(table[col], q=[0.001, 0.999], interpolation='linear').to_pylist()
+            bounds = (float(q[0]), float(q[1]))
+        table = table.set_column(table.schema.get_field_index(col), col,
+                                 _clip_column(table[col], *bounds))
+        fitted[col] = bounds
+        print(f"  {col}: clip to [{bounds[0]:.2f}, {bounds[1]:.2f}]")
+    return table, fitted
+
+
+def load_user_logs_arrow(data_dir: Path = DATA_DIR,
+                         clip_bounds: Optional[Dict[str, Tuple[float, float]]] = None
+                         ) -> Tuple[pa.Table, Dict[str, Tuple[float, float]]]:
+    """
+    load_user_logs()의 Arrow 버전 (date는 YYYYMMDD 정수 그대로 유지)
+
+    Returns:
+        (user_logs 테이블, 적용된 클리핑 경계)
+    """
+    source = 'parquet' if has_parquet(data_dir, 'user_logs_v2') else 'csv'
+    print(f"[1/5] Loading user_logs_v2 ({source}, arrow)...")
+    table = read_raw_arrow(data_dir, 'user_logs_v2')
+    print(f"  Raw shape: ({table.num_rows}, {table.num_columns})")
+    return clip_table(table, clip_bounds)
+
+
+# ============================================================
+# 윈도우 집계
+# ============================================================
+def _date_mask(dates: pa.ChunkedArray, start_date: pd.Timestamp, end_date: pd.Timestamp):
+    """date 컬럼이 YYYYMMDD 정수든 timestamp든 [start, end] 조건"""
+    if pa.types.is_integer(dates.type):
+        lo, hi = int(start_date.strftime('%Y%m%d')), int(end_date.strftime('%Y%m%d'))
+    else:
+        lo = pa.scalar(start_date.to_datetime64(), type=dates.type)
+        hi = pa.scalar(end_date.to_datetime64(), type=dates.type)
+    return pc.and_(pc.greater_equal(dates, lo), pc.less_equal(dates, hi))
+
+
+def _widen(table: pa.Table) -> pa.Table:
+    """Parquet 좁은 dtype(uint16/float32)을 합계용 int64/float64로 확장"""
+    for col in ['total_secs'] + COUNT_COLUMNS:
+        column = table[col]
+        target = pa.int64() if pa.types.is_integer(column.type) else pa.float64()
+        if column.type != target:
+            table = table.set_column(table.schema.get_field_index(col), col, column.cast(target))
+    return table
+
+
+def aggregate_single_window_arrow(table: pa.Table, window_name: str,
+                                  start_date: pd.Timestamp, end_date: pd.Timestamp,
+                                  use_threads: bool = True) -> pd.DataFrame:
+    """aggregate_single_window()와 같은 결과를 pa.Table group_by로 계산"""
+    if isinstance(table, pd.DataFrame):
+        # load_user_logs() 출력: date가 일자 서수이므로 pandas 쪽에서 윈도우 필터
+        window = pa.Table.from_pandas(table[date_mask(table['date'], start_date, end_date)],
+                                      preserve_index=False)
+    else:
+        window = table.filter(_date_mask(table['date'], start_date, end_date))
+    # 빈 윈도우도 group_by로 같은 컬럼/dtype의 0행 프레임 생성 (pandas 엔진과 같음, outer merge 가능)
+    if window.num_rows == 0:
+        print(f"  Warning: No data in window {window_name}")
+
+    window = _widen(window.select(['msno', 'date', 'total_secs'] + COUNT_COLUMNS))
+    aggregations = [(col, func) if options is None else (col, func, options)
+                    for col, func, options in WINDOW_AGGREGATIONS]
+    grouped = window.group_by('msno', use_threads=use_threads).aggregate(aggregations)
+
+    # pandas groupby와 같은 msno 정렬 + 컬럼 순서
+    grouped = grouped.sort_by('msno')
+    out_names = [f'{col}_{func}' for col, func, _ in WINDOW_AGGREGATIONS]
+    agg = grouped.select(['msno'] + out_names).rename_columns(['msno'] + AGG_COLUMNS).to_pandas()
+
+    return derive_window_features(agg, window_name)
+
+
+# ============================================================
+# 엔진 비교
+# ============================================================
+def _assert_parity(expected: pd.DataFrame, actual: pd.DataFrame, rtol: float) -> None:
+    """compare_engines()의 일치 조건 검사 (불일치 시 AssertionError)"""
+    assert list(expected.columns) == list(actual.columns), "column mismatch"
+    assert (expected.dtypes == actual.dtypes).all(), "dtype mismatch"
+    assert len(expected) == len(actual), "row count mismatch"
+    assert (expected['msno'].to_numpy() == actual['msno'].to_numpy()).all(), "msno order mismatch"
+    for col in expected.columns.drop('msno'):
+        if pd.api.types.is_integer_dtype(expected[col]):
+            assert (expected[col] == actual[col]).all(), f"{col} differs"
+        else:
+            np.testing.assert_allclose(actual[col], expected[col], rtol=rtol, atol=0, err_msg=col)
+
+
+def compare_engines(data_dir: Path = DATA_DIR,
+                    clip_bounds: Optional[Dict[str, Tuple[float, float]]] = None,
+                    windows: Dict[str, Tuple[pd.Timestamp, pd.Timestamp]] = WINDOWS,
+                    rtol: float = 1e-9) -> pd.DataFrame:
+    """
+    pandas / arrow 엔진의 로드 + 전체 윈도우 집계 결과 일치 검증 및 소요 시간 비교
+
+    컬럼 이름/순서/dtype과 msno 순서는 완전히 같아야 하고, 정수 컬럼은 값이 같아야 하며,
+    실수 컬럼은 상대 오차 rtol 이내여야 합니다. 불일치 시 AssertionError.
+    같은 길이의 윈도우를 첫 로그일 전날에 끝나게 옮긴 경우(모든 윈도우가 빈 경우)도 검증합니다.
+
+    Returns:
+        엔진별 단계 소요 시간 (초) 표
+    """
+    timings = {}
+    results = {}
+    empty_results = {}
+    empty_windows = None
+    for engine in ('pandas', 'arrow'):
+        with contextlib.redirect_stdout(io.StringIO()):
+            started = time.perf_counter()
+            if engine == 'pandas':
+                data = load_user_logs(data_dir, clip_bounds)
+                # 첫 로그일 전날 종료 → 모든 윈도우가 빈 경우
+                first_day = int(data['date'].min())
+                empty_windows = make_windows(format_day(first_day - 1),
+                                             {name: (end - start).days + 1 for name, (start, end) in windows.items()})
+            else:
+                data, _ = load_user_logs_arrow(data_dir, clip_bounds)
+            loaded = time.perf_counter()
+            results[engine] = aggregate_all_windows(data, windows, engine=engine)
+            done = time.perf_counter()
+            empty_results[engine] = aggregate_all_windows(data, empty_windows, engine=engine)
+        timings[engine] = {'load': loaded - started, 'aggregate': done - loaded, 'total': done - started}
+
+    _assert_parity(results['pandas'], results['arrow'], rtol)
+    _assert_parity(empty_results['pandas'], empty_results['arrow'], rtol)
+    expected = results['pandas']
+
+    report = pd.DataFrame(timings).T
+    report['speedup'] = report.loc['pandas', 'total'] / report['total']
+    print(f"  Parity OK: {expected.shape}, {len(expected.columns) - 1} feature columns")
+    print(report.round(3))
+    return report
+
+
+# ============================================================
+# 실행
+# ============================================================
+if __name__ == '__main__':
+    from src.preprocessing.aggregate_user_logs import CLIP_BOUNDS_FILENAME, load_clip_bounds
+
+    parser = argparse.ArgumentParser(description='pandas vs arrow user_logs aggregation parity / timing')
+    parser.add_argument('--data-dir', type=Path, default=DATA_DIR)
+    parser.add_argument('--clip-bounds', type=Path, default=None,
+                        help='클리핑 경계 JSON (기본 {data-dir}/user_logs_clip_bounds.json, 없으면 분위수 계산)')
+    args = parser.parse_args()
+
+    bounds_path = args.clip_bounds or args.data_dir / CLIP_BOUNDS_FILENAME
+    bounds = load_clip_bounds(bounds_path) if bounds_path.exists() else None
+    compare_engines(args.data_dir, bounds)
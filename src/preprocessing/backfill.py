@@ -0,0 +1,222 @@
+"""
+다중 기준 시점(cutoff) 피처 스냅샷 백필
+========================================
+
+목적: 기준 시점 목록을 받아 기준 시점마다 피처 스냅샷 1개를 생성
+      (스크립트를 기준 시점마다 다시 실행해 원본을 K번 읽지 않음)
+
+공유 계산:
+- user_logs: 모든 기준 시점의 윈도우를 덮는 기간으로 일별 활동 큐브를 한 번만 만들고,
+  채널별 누적합도 한 번만 계산 → 기준 시점별 윈도우 합계는 P[:, end+1] - P[:, start]
+  (연속된 기준 시점의 겹치는 윈도우 구간을 다시 합산하지 않음)
+- transactions: 가장 늦은 기준 시점 이전 행만 한 번 읽어 transaction_date로 정렬하고,
+  기준 시점별로 searchsorted한 앞부분만 잘라 집계
+
+기준 시점 C는 예측 시점 T와 같은 의미입니다.
+- user_logs 윈도우: make_windows(C - 1일)  (aggregate_user_logs.py의 T=2017-04-01 → 03-31 종료)
+- transactions 기준일: C - 1일            (aggregate_transactions_ldh.py의 T=2017-03-31)
+
+출력: {out_dir}/features_{YYYYMMDD}.parquet
+      (user_logs 윈도우/추세 피처 + transactions 상태/누적 피처, msno outer merge, 결측 = 0)
+
+사용법:
+    python src/preprocessing/backfill.py --cutoffs 2017-03-01 2017-03-15 2017-04-01
+"""
+
+import argparse
+import sys
+import time
+import pandas as pd
+import numpy as np
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+from src.preprocessing.activity_cube import ActivityCube, build_activity_cube
+from src.preprocessing.aggregate_user_logs import (
+    CLIP_BOUNDS_FILENAME,
+    DATA_DIR,
+    WINDOW_DAYS,
+    add_trend_features,
+    load_clip_bounds,
+    make_windows,
+)
+from src.preprocessing.calendar_utils import day_of
+from src.preprocessing.ingest import has_parquet, parquet_path
+from src.preprocessing.msno_keys import (
+    MsnoDictionary,
+    decode_msno,
+    encode_msno,
+    load_msno_dictionary,
+    merge_on_key,
+)
+from src.preprocessing.user_logs_streaming import DEFAULT_CHUNKSIZE, compute_clip_bounds
+from LeeDoHoon.src.aggregate_transactions_ldh import build_transaction_features, load_transactions
+
+# ============================================================
+# 설정
+# ============================================================
+BACKFILL_DIR = DATA_DIR / 'backfill'
+
+
+def snapshot_path(out_dir: Path, cutoff: pd.Timestamp) -> Path:
+    return Path(out_dir) / f"features_{pd.Timestamp(cutoff).strftime('%Y%m%d')}.parquet"
+
+
+# ============================================================
+# user_logs (공유 큐브)
+# ============================================================
+def _cube_covers(cube_dir: Path, start: pd.Timestamp, end: pd.Timestamp,
+                 clip_bounds: Dict[str, Tuple[float, float]]) -> bool:
+    """기존 큐브가 [start, end] 기간과 같은 클리핑 경계로 만들어졌는지"""
+    if not (Path(cube_dir) / 'meta.json').exists():
+        return False
+    cube = ActivityCube(cube_dir)
+    cube_end = cube.start_date + pd.Timedelta(days=cube.n_days - 1)
+    same_bounds = {col: list(b) for col, b in clip_bounds.items()} == cube.meta['clip_bounds']
+    return cube.start_date <= start and cube_end >= end and same_bounds
+
+
+def prepare_cube(data_dir: Path, cube_dir: Path, cutoffs: List[pd.Timestamp],
+                 clip_bounds: Dict[str, Tuple[float, float]],
+                 window_days: Dict[str, int] = WINDOW_DAYS,
+                 chunksize: int = DEFAULT_CHUNKSIZE) -> ActivityCube:
+    """모든 기준 시점의 윈도우를 덮는 활동 큐브 (범위/경계가 맞는 기존 큐브는 재사용)"""
+    start = cutoffs[0] - pd.Timedelta(days=max(window_days.values()))
+    end = cutoffs[-1] - pd.Timedelta(days=1)
+    if _cube_covers(cube_dir, start, end, clip_bounds):
+        print(f"  Reusing activity cube: {cube_dir}")
+    else:
+        if has_parquet(data_dir, 'user_logs_v2'):
+            source = parquet_path(data_dir, 'user_logs_v2')
+        else:
+            source = Path(data_dir) / 'user_logs_v2.csv'
+        print(f"  Building activity cube {start.date()} ~ {end.date()} from {source.name}...")
+        build_activity_cube(source, cube_dir, start_date=start, n_days=(end - start).days + 1,
+                            clip_bounds=clip_bounds, chunksize=chunksize)
+    return ActivityCube(cube_dir)
+
+
+def user_log_snapshot(cube: ActivityCube, cutoff: pd.Timestamp,
+                      window_days: Dict[str, int] = WINDOW_DAYS) -> pd.DataFrame:
+    """기준 시점 하나의 user_logs 윈도우 + 추세 피처 (aggregate_user_logs 출력과 같은 컬럼)"""
+    windows = make_windows(cutoff - pd.Timedelta(days=1), window_days)
+    return add_trend_features(cube.window_features(windows))
+
+
+# ============================================================
+# transactions (한 번 로드 + 정렬)
+# ============================================================
+def load_sorted_transactions(data_dir: Path, last_cutoff: pd.Timestamp,
+                             keys: Optional[MsnoDictionary]) -> pd.DataFrame:
+    """가장 늦은 기준 시점 이전 거래를 한 번 읽어 transaction_date 기준 안정 정렬"""
+    df = load_transactions(data_dir, msno_ids=keys is not None,
+                           t=last_cutoff - pd.Timedelta(days=1))
+    return df.sort_values('transaction_date', kind='stable').reset_index(drop=True)
+
+
+def transaction_snapshot(transactions: pd.DataFrame, cutoff: pd.Timestamp) -> pd.DataFrame:
+    """정렬된 거래에서 기준 시점 이전 앞부분만 잘라 피처 생성"""
+    t = cutoff - pd.Timedelta(days=1)
+    n = np.searchsorted(transactions['transaction_date'].to_numpy(), day_of(t), side='right')
+    return build_transaction_features(transactions.iloc[:n], t)
+
+
+# ============================================================
+# 백필
+# ============================================================
+def backfill_snapshots(cutoffs: Iterable, data_dir: Path = DATA_DIR,
+                       out_dir: Path = BACKFILL_DIR,
+                       cube_dir: Optional[Path] = None,
+                       clip_bounds: Optional[Dict[str, Tuple[float, float]]] = None,
+                       window_days: Dict[str, int] = WINDOW_DAYS,
+                       chunksize: int = DEFAULT_CHUNKSIZE) -> Dict[pd.Timestamp, Path]:
+    """
+    기준 시점별 피처 스냅샷 생성
+
+    Args:
+        cutoffs: 기준 시점(예측 시점 T) 목록
+        data_dir: 원본 CSV / ingest Parquet 디렉토리
+        out_dir: 스냅샷 출력 디렉토리
+        cube_dir: 공유 활동 큐브 디렉토리 (기본 {out_dir}/user_logs_cube)
+        clip_bounds: 학습 시점 이상치 클리핑 경계 (None이면 {data_dir}/user_logs_clip_bounds.json,
+                     없으면 전체 로그의 exact 분위수로 한 번 계산해 모든 기준 시점에 같은 경계 적용)
+
+    Returns:
+        {기준 시점: 스냅샷 경로}
+    """
+    cutoffs = sorted({pd.Timestamp(c) for c in cutoffs})
+    if not cutoffs:
+        return {}
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    cube_dir = Path(cube_dir) if cube_dir is not None else out_dir / 'user_logs_cube'
+
+    print("=" * 60)
+    print(f"Feature Snapshot Backfill ({len(cutoffs)} cutoffs)")
+    print("=" * 60)
+
+    if clip_bounds is None:
+        bounds_path = Path(data_dir) / CLIP_BOUNDS_FILENAME
+        if bounds_path.exists():
+            clip_bounds = load_clip_bounds(bounds_path)
+        else:
+            source = (parquet_path(data_dir, 'user_logs_v2') if has_parquet(data_dir, 'user_logs_v2')
+                      else Path(data_dir) / 'user_logs_v2.csv')
+            clip_bounds = compute_clip_bounds(source, chunksize=chunksize)
+
+    print("[1/3] Preparing shared activity cube...")
+    cube = prepare_cube(data_dir, cube_dir, cutoffs, clip_bounds, window_days, chunksize)
+
+    print("\n[2/3] Loading transactions once...")
+    keys = load_msno_dictionary(data_dir)
+    transactions = load_sorted_transactions(data_dir, cutoffs[-1], keys)
+    if keys is None:
+        keys = MsnoDictionary.from_values(cube.msno, transactions['msno'])
+    transactions = encode_msno(transactions, keys)
+
+    print("\n[3/3] Writing snapshots...")
+    paths = {}
+    for cutoff in cutoffs:
+        started = time.perf_counter()
+        logs = encode_msno(user_log_snapshot(cube, cutoff, window_days), keys)
+        txn = transaction_snapshot(transactions, cutoff)
+
+        snapshot = merge_on_key(logs, txn, how='outer')
+        feature_columns = snapshot.columns.drop('msno')
+        snapshot[feature_columns] = snapshot[feature_columns].fillna(0)
+        snapshot = decode_msno(snapshot, keys)
+
+        paths[cutoff] = snapshot_path(out_dir, cutoff)
+        snapshot.to_parquet(paths[cutoff], engine='pyarrow', index=False)
+        print(f"  {cutoff.date()}: {snapshot.shape} -> {paths[cutoff].name} "
+              f"({time.perf_counter() - started:.1f}s)")
+
+    print("\n" + "=" * 60)
+    print("Backfill completed!")
+    print("=" * 60)
+    return paths
+
+
+# ============================================================
+# 실행
+# ============================================================
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Multi-cutoff feature snapshot backfill')
+    parser.add_argument('--cutoffs', nargs='+', required=True,
+                        help='기준 시점 목록 (예: 2017-03-01 2017-04-01)')
+    parser.add_argument('--data-dir', type=Path, default=DATA_DIR)
+    parser.add_argument('--out-dir', type=Path, default=BACKFILL_DIR)
+    parser.add_argument('--cube-dir', type=Path, default=None,
+                        help='공유 활동 큐브 디렉토리 (기본 {out-dir}/user_logs_cube)')
+    parser.add_argument('--clip-bounds', type=Path, default=None,
+                        help='학습 시점 클리핑 경계 JSON')
+    parser.add_argument('--chunksize', type=int, default=DEFAULT_CHUNKSIZE)
+    args = parser.parse_args()
+
+    bounds = load_clip_bounds(args.clip_bounds) if args.clip_bounds is not None else None
+    backfill_snapshots(args.cutoffs, args.data_dir, args.out_dir, args.cube_dir,
+                       bounds, chunksize=args.chunksize)
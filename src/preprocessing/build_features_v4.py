@@ -1,6 +1,8 @@
+import argparse
 import pandas as pd
 import numpy as np
 import os
+import sys
 from datetime import datetime
 from pathlib import Path
 
@@ -11,100 +13,202 @@ PROJECT_ROOT = Path(__file__).resolve().parents[2]
 DATA_DIR = PROJECT_ROOT / "data/processed"
 RAW_DATA_DIR = PROJECT_ROOT / "data/raw"
 
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+from src.preprocessing.activity_bitmask import MASK_DAYS, MASK_DTYPE, last_active_gap
+from src.preprocessing.calendar_utils import days_between, format_day, to_day
+from src.preprocessing.feature_store import LAYOUTS, write_feature_table
+from src.preprocessing.ingest import has_parquet, iter_raw_chunks, parquet_path
+from src.preprocessing.msno_keys import decode_msno, encode_msno, load_msno_dictionary, merge_on_key
+from src.preprocessing.parallel_csv import DEFAULT_BLOCK_BYTES, default_workers, parallel_last_active_dates
+from src.preprocessing.resources import (
+    SpillingReducer,
+    StageProfiler,
+    csv_block_bytes_for_budget,
+    parse_memory_budget,
+    plan_chunksize,
+    spill_budget,
+)
+
 V3_PATH = DATA_DIR / "kkbox_train_feature_v3.parquet"
 USER_LOGS_PATH = RAW_DATA_DIR / "user_logs_v2.csv"
+CUBE_DIR = DATA_DIR / "user_logs_cube"
 OUTPUT_PATH = DATA_DIR / "kkbox_train_feature_v4.parquet"
-
-print(f"Project Root: {PROJECT_ROOT}")
-print(f"Loading V3 Data from: {V3_PATH}")
-
-if not V3_PATH.exists():
-    print(f"Error: V3 file not found at {V3_PATH}")
-    # Fallback/Debug info
-    if (PROJECT_ROOT / "data").exists():
-        print(f"Data directory exists at {PROJECT_ROOT / 'data'}")
+N_WORKERS = default_workers()  # parallel CSV reader processes for last_active_gap
+CHUNKSIZE = 1000000  # rows per user_logs chunk when no memory budget is given
+
+
+def combine_max_dates(parts):
+    """Merge per-chunk (msno, date) maxima into one row per msno"""
+    return pd.concat(parts, ignore_index=True).groupby('msno', as_index=False)['date'].max()
+
+
+def main(memory_budget=None, layout=None):
+    """
+    memory_budget: bytes; sizes user_logs chunks from measured bytes/row and spills partial maxima
+    layout: 'msno' / 'hash' writes a sorted, row-group-tuned zstd Parquet (see feature_store); None keeps to_parquet defaults
+
+    last_active_gap: when V3 carries activity_mask (aggregate_all_windows always adds it), the gap is counted
+    back from the end of the 31-day mask span (not from the latest active day in the table), and users
+    without logs in the span get MASK_DAYS (31) instead of max_gap + 1
+    """
+    stages = StageProfiler()
+    stages.begin("[1/4] Loading V3")
+    print(f"Project Root: {PROJECT_ROOT}")
+    print(f"Loading V3 Data from: {V3_PATH}")
+
+    if not V3_PATH.exists():
+        print(f"Error: V3 file not found at {V3_PATH}")
+        # Fallback/Debug info
+        if (PROJECT_ROOT / "data").exists():
+            print(f"Data directory exists at {PROJECT_ROOT / 'data'}")
+        else:
+            print(f"Data directory MISSING at {PROJECT_ROOT / 'data'}")
+        exit(1)
+
+    df_v3 = pd.read_parquet(V3_PATH)
+    print(f"V3 Shape: {df_v3.shape}")
+
+    stages.begin("[2/4] Arithmetic features")
+    print("Creating Arithmetic Derived Features...")
+    df_v4 = df_v3.copy()
+
+    # 1. Active Decay Rate (활동 감소율)
+    epsilon = 1e-6
+    val_decay = df_v4['num_days_active_w7'] / ((df_v4['num_days_active_w30'] / 4) + epsilon)
+    df_v4['active_decay_rate'] = val_decay.clip(upper=10.0)
+
+    # 2. Listening Time Velocity (청취 가속도)
+    df_v4['listening_time_velocity'] = df_v4['avg_secs_per_day_w7'] - df_v4['avg_secs_per_day_w14']
+
+    # 3. Discovery Index (탐색 지수)
+    val_disc = df_v4['num_unq_w7'] / (df_v4['num_songs_w7'] + epsilon)
+    df_v4['discovery_index'] = val_disc.clip(upper=1.0)
+
+    # 4. Skip Passion Index (스킵 열정도)
+    val_skip = df_v4['num_25_w7'] / (df_v4['num_100_w7'] + epsilon)
+    df_v4['skip_passion_index'] = val_skip.clip(upper=100.0)
+
+    # 5. Daily Listening Variance (Renaming existing feature)
+    df_v4['daily_listening_variance'] = df_v4['std_secs_w7']
+
+    # 6. Engagement Density (몰입 밀도)
+    df_v4['engagement_density'] = df_v4['total_secs_w7'] / (df_v4['num_days_active_w7'] + epsilon)
+
+    print("Arithmetic features created.")
+
+    # 7. Last Active Gap
+    stages.begin("[3/4] Last active gap")
+    print("Processing Raw User Logs for Last Active Gap...")
+
+    if 'activity_mask' in df_v4.columns:
+        # The aggregated user_logs features carry a 31-day activity bitmask (bit d = day d of the window span);
+        # the highest set bit is the last active day, so no raw log pass is needed.
+        # Gap is measured from the span end and users without activity get MASK_DAYS,
+        # the same helper user_event_index.compute_user_features uses
+        # V3 rows are train users, so users without logs have NaN masks: treat them as "no active day"
+        print("Using activity_mask from the aggregated user_logs features...")
+        masks = df_v4['activity_mask'].fillna(0).to_numpy().astype(MASK_DTYPE)
+        print(f"Users without activity in the mask span: {(masks == 0).sum():,} (gap = {MASK_DAYS})")
+        df_v4['last_active_gap'] = last_active_gap(masks, MASK_DAYS)
+    elif (CUBE_DIR / "meta.json").exists():
+        # 일별 활동 큐브가 있으면 원본 CSV를 다시 읽지 않고 마지막 활동일 인덱스로 계산
+        from src.preprocessing.activity_cube import ActivityCube
+
+        print(f"Using activity cube at {CUBE_DIR}...")
+        final_last_active = ActivityCube(CUBE_DIR).last_active_gap()
+        print(f"Max Active Dates Calculated. Users: {len(final_last_active)}")
+
+        df_v4 = df_v4.merge(final_last_active, on='msno', how='left')
+
+        max_gap_found = df_v4['last_active_gap'].max()
+        df_v4['last_active_gap'] = df_v4['last_active_gap'].fillna(max_gap_found + 1)
+    elif not os.path.exists(USER_LOGS_PATH) and not has_parquet(RAW_DATA_DIR, "user_logs_v2"):
+         print(f"Warning: Raw user logs not found at {USER_LOGS_PATH}. Skipping last_active_gap calculation (filling with -1).")
+         df_v4['last_active_gap'] = -1
     else:
-        print(f"Data directory MISSING at {PROJECT_ROOT / 'data'}")
-    exit(1)
-
-df_v3 = pd.read_parquet(V3_PATH)
-print(f"V3 Shape: {df_v3.shape}")
-
-print("Creating Arithmetic Derived Features...")
-df_v4 = df_v3.copy()
-
-# 1. Active Decay Rate (활동 감소율)
-epsilon = 1e-6
-val_decay = df_v4['num_days_active_w7'] / ((df_v4['num_days_active_w30'] / 4) + epsilon)
-df_v4['active_decay_rate'] = val_decay.clip(upper=10.0)
-
-# 2. Listening Time Velocity (청취 가속도)
-df_v4['listening_time_velocity'] = df_v4['avg_secs_per_day_w7'] - df_v4['avg_secs_per_day_w14']
-
-# 3. Discovery Index (탐색 지수)
-val_disc = df_v4['num_unq_w7'] / (df_v4['num_songs_w7'] + epsilon)
-df_v4['discovery_index'] = val_disc.clip(upper=1.0)
-
-# 4. Skip Passion Index (스킵 열정도)
-val_skip = df_v4['num_25_w7'] / (df_v4['num_100_w7'] + epsilon)
-df_v4['skip_passion_index'] = val_skip.clip(upper=100.0)
-
-# 5. Daily Listening Variance (Renaming existing feature)
-df_v4['daily_listening_variance'] = df_v4['std_secs_w7']
-
-# 6. Engagement Density (몰입 밀도)
-df_v4['engagement_density'] = df_v4['total_secs_w7'] / (df_v4['num_days_active_w7'] + epsilon)
-
-print("Arithmetic features created.")
-
-# 7. Last Active Gap
-print("Processing Raw User Logs for Last Active Gap...")
-
-if not os.path.exists(USER_LOGS_PATH):
-     print(f"Warning: Raw user logs not found at {USER_LOGS_PATH}. Skipping last_active_gap calculation (filling with -1).")
-     df_v4['last_active_gap'] = -1
-else:
-    # user_logs_v2.csv is large, read necessary columns only
-    chunks = pd.read_csv(USER_LOGS_PATH, usecols=['msno', 'date'], chunksize=1000000)
-
-    max_dates = []
-    print("Reading chunks...")
-    for i, chunk in enumerate(chunks):
-        chunk_max = chunk.groupby('msno')['date'].max()
-        max_dates.append(chunk_max)
-        if i % 10 == 0:
-            print(f"Processed chunk {i}...")
-
-    # Combine and find global max per user
-    all_max_dates = pd.concat(max_dates)
-    final_last_active = all_max_dates.groupby(level=0).max().reset_index()
-    final_last_active.rename(columns={'date': 'last_active_date'}, inplace=True)
-
-    # Convert to datetime
-    final_last_active['last_active_date'] = pd.to_datetime(final_last_active['last_active_date'], format='%Y%m%d')
-
-    print(f"Max Active Dates Calculated. Users: {len(final_last_active)}")
+        # With the ingest msno dictionary, group/join on int32 msno ids and restore strings before saving
+        msno_keys = load_msno_dictionary(RAW_DATA_DIR)
+
+        if not has_parquet(RAW_DATA_DIR, "user_logs_v2") and N_WORKERS > 1:
+            # Split the CSV into line-aligned byte ranges; each worker returns per-msno max dates
+            print(f"Reading {USER_LOGS_PATH.name} with {N_WORKERS} worker processes...")
+            block_bytes = DEFAULT_BLOCK_BYTES
+            if memory_budget is not None:
+                block_bytes = csv_block_bytes_for_budget(USER_LOGS_PATH, memory_budget, N_WORKERS)
+            final_last_active = parallel_last_active_dates(USER_LOGS_PATH, n_workers=N_WORKERS,
+                                                           block_bytes=block_bytes)
+            if msno_keys is not None:
+                final_last_active = encode_msno(final_last_active, msno_keys)
+        else:
+            # user_logs_v2 is large, read necessary columns only (ingest Parquet if available)
+            source = USER_LOGS_PATH
+            if has_parquet(RAW_DATA_DIR, "user_logs_v2"):
+                source = parquet_path(RAW_DATA_DIR, "user_logs_v2")
+            chunksize = plan_chunksize(source, "user_logs_v2", ['msno', 'date'], memory_budget, CHUNKSIZE)
+            chunks = iter_raw_chunks(RAW_DATA_DIR, "user_logs_v2", columns=['msno', 'date'], chunksize=chunksize,
+                                     msno_ids=msno_keys is not None)
+
+            # Per-chunk maxima are compacted (and spilled to disk) once they exceed the budget
+            max_dates = SpillingReducer(combine_max_dates, spill_budget(memory_budget))
+            print("Reading chunks...")
+            for i, chunk in enumerate(chunks):
+                max_dates.add(chunk.groupby('msno', as_index=False)['date'].max())
+                if i % 10 == 0:
+                    print(f"Processed chunk {i}...")
+
+            # Combine and find global max per user
+            final_last_active = max_dates.result()
+            if final_last_active is None:
+                final_last_active = pd.DataFrame(columns=['msno', 'date'])
+        final_last_active.rename(columns={'date': 'last_active_date'}, inplace=True)
+
+        # Convert YYYYMMDD to int32 day ordinals (integer gap arithmetic, no datetime parsing)
+        final_last_active['last_active_date'] = to_day(final_last_active['last_active_date'])
+
+        print(f"Max Active Dates Calculated. Users: {len(final_last_active)}")
     
-    # Determine Study Cutoff Date
-    global_max_date = final_last_active['last_active_date'].max()
-    print(f"Global Max Date in Logs: {global_max_date}")
+        # Determine Study Cutoff Date
+        global_max_date = final_last_active['last_active_date'].max()
+        print(f"Global Max Date in Logs: {format_day(global_max_date)}")
 
-    # Calculate Gap
-    final_last_active['last_active_gap'] = (global_max_date - final_last_active['last_active_date']).dt.days
+        # Calculate Gap
+        final_last_active['last_active_gap'] = days_between(global_max_date, final_last_active['last_active_date'])
     
-    # Merge with V4 DataFrame
-    df_v4 = df_v4.merge(final_last_active[['msno', 'last_active_gap']], on='msno', how='left')
-
-    # Fill NA for users with no logs
-    max_gap_found = df_v4['last_active_gap'].max()
-    df_v4['last_active_gap'] = df_v4['last_active_gap'].fillna(max_gap_found + 1)
-
-print("Merged Last Active Gap.")
-
-print(f"Saving V4 to {OUTPUT_PATH}...")
-df_v4.to_parquet(OUTPUT_PATH, index=False)
-print("Done.")
-
-print("New Feature Statistics:")
-new_cols = ['active_decay_rate', 'listening_time_velocity', 'discovery_index', 'skip_passion_index', 'last_active_gap']
-print(df_v4[new_cols].describe())
+        # Merge with V4 DataFrame
+        if msno_keys is not None:
+            df_v4 = encode_msno(df_v4, msno_keys)
+        df_v4 = merge_on_key(df_v4, final_last_active[['msno', 'last_active_gap']], how='left')
+        if msno_keys is not None:
+            df_v4 = decode_msno(df_v4, msno_keys)
+
+        # Fill NA for users with no logs
+        max_gap_found = df_v4['last_active_gap'].max()
+        df_v4['last_active_gap'] = df_v4['last_active_gap'].fillna(max_gap_found + 1)
+
+    print("Merged Last Active Gap.")
+
+    stages.begin("[4/4] Saving")
+    print(f"Saving V4 to {OUTPUT_PATH}...")
+    write_feature_table(df_v4, OUTPUT_PATH, layout)
+    print("Done.")
+
+    print("New Feature Statistics:")
+    new_cols = ['active_decay_rate', 'listening_time_velocity', 'discovery_index', 'skip_passion_index', 'last_active_gap']
+    print(df_v4[new_cols].describe())
+    stages.finish()
+
+
+# Worker processes re-import this module (spawn), so the pipeline runs only under the main guard
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Build V4 features. last_active_gap is counted back from the end of the 31-day "
+                    "activity_mask span (users without logs: 31) when V3 has activity_mask; otherwise "
+                    "from the latest log date (users without logs: max gap + 1)")
+    parser.add_argument("--memory-budget", type=str, default=None,
+                        help="Memory budget (e.g. 8GB, 512MB); sizes chunks and spills partial aggregates")
+    parser.add_argument("--layout", choices=LAYOUTS, default=None,
+                        help="Sorted Parquet layout for the output (msno: point lookups, hash: cheap random samples)")
+    args = parser.parse_args()
+    main(parse_memory_budget(args.memory_budget), args.layout)
@@ -0,0 +1,116 @@
+"""
+정수 달력 (YYYYMMDD ↔ 일자 서수)
+=================================
+
+목적: 원본의 YYYYMMDD 정수 날짜를 pd.to_datetime(format='%Y%m%d') 문자열 파싱 없이
+      룩업 테이블 한 번으로 int32 일자 서수(1970-01-01 = 0)로 변환해,
+      윈도우 필터와 일수 차이를 모두 정수 연산으로 처리
+
+- to_day(): YYYYMMDD 배열 → int32 서수 (벡터화 룩업, 결측은 NA_DAY)
+- day_of(): Timestamp / 'YYYY-MM-DD' / YYYYMMDD 스칼라 → 서수
+- days_between(): 서수 차이 (결측이 있으면 NaN, .dt.days와 같은 dtype 규칙)
+- date_mask(): [start, end] 윈도우 조건 (정수 비교)
+- to_datetime(): 서수 → datetime64 (화면 출력 / 저장용으로만 사용)
+
+룩업 테이블은 연도마다 12 × 31칸을 두고 (연, 월, 일)을 그대로 인덱스로 쓰므로
+존재하지 않는 날짜(예: 20170231)는 NA_DAY로 표시됩니다.
+"""
+
+import pandas as pd
+import numpy as np
+from typing import Union
+
+# ============================================================
+# 설정
+# ============================================================
+MIN_YEAR = 1900
+MAX_YEAR = 2100
+NA_DAY = np.iinfo(np.int32).min  # 결측 / 무효 날짜 서수
+_DAYS_PER_YEAR_SLOT = 12 * 31
+
+
+def _build_table() -> np.ndarray:
+    """(연 - MIN_YEAR) * 372 + (월 - 1) * 31 + (일 - 1) → 서수 (무효 날짜는 NA_DAY)"""
+    table = np.full((MAX_YEAR - MIN_YEAR + 1) * _DAYS_PER_YEAR_SLOT, NA_DAY, dtype=np.int32)
+    dates = pd.date_range(f'{MIN_YEAR}-01-01', f'{MAX_YEAR}-12-31', freq='D')
+    slots = (dates.year - MIN_YEAR) * _DAYS_PER_YEAR_SLOT + (dates.month - 1) * 31 + (dates.day - 1)
+    table[slots] = dates.values.astype('datetime64[D]').astype(np.int64)
+    return table
+
+
+_TABLE = _build_table()
+
+
+# ============================================================
+# 변환
+# ============================================================
+def to_day(values, errors: str = 'raise') -> np.ndarray:
+    """
+    YYYYMMDD 정수 배열 → int32 일자 서수
+
+    Args:
+        values: YYYYMMDD 정수 (Series / ndarray / list, 결측 NaN 허용)
+        errors: 'raise' - 존재하지 않는 날짜가 있으면 ValueError
+                'coerce' - 존재하지 않는 날짜를 NA_DAY로 표시
+
+    Returns:
+        int32 배열 (결측은 NA_DAY)
+    """
+    values = np.asarray(values)
+    missing = pd.isna(values) if values.dtype.kind in 'fO' else np.zeros(values.shape, dtype=bool)
+    ymd = np.where(missing, 0, values).astype(np.int64)
+
+    year, month, day = ymd // 10000, ymd // 100 % 100, ymd % 100
+    valid = ((year >= MIN_YEAR) & (year <= MAX_YEAR) & (month >= 1) & (month <= 12)
+             & (day >= 1) & (day <= 31))
+    slot = np.where(valid, (year - MIN_YEAR) * _DAYS_PER_YEAR_SLOT + (month - 1) * 31 + (day - 1), 0)
+    days = np.where(valid, _TABLE[slot], NA_DAY).astype(np.int32)
+
+    invalid = (days == NA_DAY) & ~missing
+    if invalid.any() and errors == 'raise':
+        sample = ymd[invalid][:5].tolist()
+        raise ValueError(f"{int(invalid.sum()):,} values are not valid YYYYMMDD dates (e.g. {sample})")
+    return days
+
+
+def day_of(date: Union[pd.Timestamp, str, int]) -> int:
+    """스칼라 날짜 → 일자 서수 (정수는 YYYYMMDD로 해석)"""
+    if isinstance(date, (int, np.integer)):
+        return int(to_day([date])[0])
+    return int(pd.Timestamp(date).to_datetime64().astype('datetime64[D]').astype(np.int64))
+
+
+def days_between(end, start) -> Union[np.ndarray, pd.Series]:
+    """
+    end - start 일수 (서수 배열 또는 스칼라)
+
+    NA_DAY가 섞이면 float64 + NaN, 아니면 int64 (Series.dt.days와 같은 규칙).
+    Series가 들어오면 인덱스를 유지한 Series를 반환합니다.
+    """
+    index = next((x.index for x in (end, start) if isinstance(x, pd.Series)), None)
+    e = np.asarray(end, dtype=np.int64)
+    s = np.asarray(start, dtype=np.int64)
+    diff = e - s
+    missing = (e == NA_DAY) | (s == NA_DAY)
+    if np.any(missing):
+        diff = np.where(missing, np.nan, diff)
+    return pd.Series(diff, index=index) if index is not None else diff
+
+
+def date_mask(dates: pd.Series, start, end) -> pd.Series:
+    """[start, end] 조건 (서수 컬럼은 정수 비교, datetime 컬럼은 Timestamp 비교)"""
+    if pd.api.types.is_datetime64_any_dtype(dates):
+        return (dates >= pd.Timestamp(start)) & (dates <= pd.Timestamp(end))
+    return (dates >= day_of(start)) & (dates <= day_of(end))
+
+
+def to_datetime(days) -> pd.DatetimeIndex:
+    """일자 서수 → datetime64 (출력용, NA_DAY는 NaT)"""
+    days = np.asarray(days, dtype=np.int64)
+    values = np.where(days == NA_DAY, np.datetime64('NaT'), days.astype('datetime64[D]'))
+    return pd.DatetimeIndex(values.astype('datetime64[ns]'))
+
+
+def format_day(day: int) -> str:
+    """일자 서수 → 'YYYY-MM-DD' 문자열"""
+    return str(np.datetime64(int(day), 'D'))
@@ -0,0 +1,168 @@
+"""
+대상 코호트(cohort) 세미 조인 필터
+==================================
+
+목적: 최종 피처 테이블은 train_v2(또는 스코어링 대상 목록) 기준 LEFT JOIN이므로,
+      원본 로그/거래를 읽는 단계에서 코호트 밖 msno 행을 청크마다 먼저 버려
+      groupby 전에 작업량을 코호트/전체 사용자 비율만큼 줄임
+
+- CohortFilter: 코호트 msno(int32 대리키 또는 문자열)로 만든 멤버십 필터
+  - 'sorted': 정렬된 정수 키 배열 + np.searchsorted (대리키면 정확)
+  - 'bloom': 비트 배열 Bloom filter (대규모 코호트에서 메모리 고정, 위양성 허용)
+  - 'auto': 코호트가 BLOOM_MIN_SIZE 이상이면 bloom, 아니면 sorted
+- read_cohort_msno(): 스코어링 대상 목록 파일(CSV / Parquet의 msno 컬럼) 로드
+
+문자열 msno는 pd.util.hash_array로 64비트 해시 키를 만들어 비교합니다.
+해시 충돌 / Bloom 위양성으로 코호트 밖 사용자가 일부 남을 수 있지만, 집계는 사용자 단위이고
+최종 병합이 코호트 기준 LEFT JOIN이므로 결과에는 영향이 없습니다 (코호트 사용자는 누락되지 않음).
+
+사용법:
+    cohort = CohortFilter(train['msno'])
+    for chunk in iter_raw_chunks(data_dir, 'user_logs_v2', cohort=cohort):
+        ...                                   # 코호트 사용자 행만
+"""
+
+import pandas as pd
+import numpy as np
+from pathlib import Path
+
+# ============================================================
+# 설정
+# ============================================================
+BLOOM_MIN_SIZE = 20_000_000      # 'auto'에서 Bloom filter로 바꾸는 코호트 크기
+BLOOM_FALSE_POSITIVE_RATE = 0.01
+_HASH_KEY = '0123456789123456'   # pd.util.hash_array 기본 키 (고정 → 실행 간 같은 해시)
+
+
+def _hash_keys(values: np.ndarray) -> np.ndarray:
+    """msno 값 → uint64 키 (정수 대리키는 그대로, 문자열은 64비트 해시)"""
+    if values.dtype.kind in 'iu':
+        return values.astype(np.uint64)
+    return pd.util.hash_array(values.astype(object), hash_key=_HASH_KEY, categorize=False)
+
+
+# ============================================================
+# Bloom filter
+# ============================================================
+class BloomFilter:
+    """
+    uint64 키의 Bloom filter (double hashing: h1 + i * h2, i = 0..k-1)
+
+    Args:
+        keys: 멤버 uint64 키
+        false_positive_rate: 목표 위양성률 (비트 수 m, 해시 수 k 결정)
+    """
+
+    def __init__(self, keys: np.ndarray, false_positive_rate: float = BLOOM_FALSE_POSITIVE_RATE):
+        n = max(len(keys), 1)
+        n_bits = int(np.ceil(-n * np.log(false_positive_rate) / np.log(2) ** 2))
+        self.n_bits = max(64, (n_bits + 63) // 64 * 64)
+        self.n_hashes = max(1, int(round(self.n_bits / n * np.log(2))))
+        self.words = np.zeros(self.n_bits // 64, dtype=np.uint64)
+        for pos in self._positions(keys):
+            np.bitwise_or.at(self.words, pos >> np.uint64(6),
+                             np.left_shift(np.uint64(1), pos & np.uint64(63)))
+
+    def _positions(self, keys: np.ndarray):
+        """키별 k개 비트 위치 (해시 1번으로 두 32비트 해시를 만들어 조합)"""
+        h = pd.util.hash_array(np.asarray(keys, dtype=np.uint64), hash_key=_HASH_KEY, categorize=False)
+        h1 = h & np.uint64(0xFFFFFFFF)
+        h2 = (h >> np.uint64(32)) | np.uint64(1)
+        m = np.uint64(self.n_bits)
+        for i in range(self.n_hashes):
+            yield (h1 + np.uint64(i) * h2) % m
+
+    def contains(self, keys: np.ndarray) -> np.ndarray:
+        mask = np.ones(len(keys), dtype=bool)
+        for pos in self._positions(keys):
+            bits = self.words[pos >> np.uint64(6)] >> (pos & np.uint64(63))
+            mask &= (bits & np.uint64(1)).astype(bool)
+        return mask
+
+    @property
+    def nbytes(self) -> int:
+        return self.words.nbytes
+
+
+# ============================================================
+# 코호트 필터
+# ============================================================
+class CohortFilter:
+    """
+    코호트 msno 멤버십 필터
+
+    Args:
+        msno: 코호트 msno (int32 대리키 또는 문자열; 읽을 원본과 같은 표현이어야 함)
+        method: 'auto' | 'sorted' | 'bloom'
+        false_positive_rate: method='bloom'일 때 목표 위양성률
+    """
+
+    def __init__(self, msno, method: str = 'auto',
+                 false_positive_rate: float = BLOOM_FALSE_POSITIVE_RATE):
+        values = np.asarray(pd.unique(pd.Series(msno).dropna()))
+        if method == 'auto':
+            method = 'bloom' if len(values) >= BLOOM_MIN_SIZE else 'sorted'
+        if method not in ('sorted', 'bloom'):
+            raise ValueError(f"Unknown cohort filter method: {method}. Options: 'auto', 'sorted', 'bloom'")
+
+        self.method = method
+        self.size = len(values)
+        self.integer_keys = values.dtype.kind in 'iu'
+        keys = _hash_keys(values)
+        if method == 'sorted':
+            self._sorted = np.unique(keys)
+            self._bloom = None
+        else:
+            self._sorted = None
+            self._bloom = BloomFilter(keys, false_positive_rate)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __repr__(self) -> str:
+        return f"CohortFilter({self.size:,} users, {self.method}, {self.nbytes / 1024 ** 2:.1f} MB)"
+
+    @property
+    def nbytes(self) -> int:
+        return self._sorted.nbytes if self._sorted is not None else self._bloom.nbytes
+
+    def _keys(self, values) -> np.ndarray:
+        values = np.asarray(values)
+        if (values.dtype.kind in 'iu') != self.integer_keys:
+            raise TypeError("Cohort and data msno representations differ "
+                            "(int32 ids vs strings); build the cohort with the same msno_ids setting")
+        return _hash_keys(values)
+
+    def mask(self, values) -> np.ndarray:
+        """values(msno 컬럼)의 행별 코호트 포함 여부"""
+        if self._bloom is not None:
+            return self._bloom.contains(self._keys(values))
+        return self.locate(values) >= 0
+
+    def locate(self, values) -> np.ndarray:
+        """
+        values의 코호트 내 위치 (0..len-1, 코호트 밖은 -1; method='sorted'만 지원)
+
+        코호트 사용자별 등장 여부를 길이 len(cohort)의 bool 배열로 기록할 때 사용합니다.
+        """
+        if self._sorted is None:
+            raise ValueError("locate() requires method='sorted'")
+        keys = self._keys(values)
+        if len(self._sorted) == 0:
+            return np.full(len(keys), -1, dtype=np.int64)
+        pos = np.searchsorted(self._sorted, keys).clip(max=len(self._sorted) - 1)
+        return np.where(self._sorted[pos] == keys, pos, -1)
+
+    def filter(self, df: pd.DataFrame, column: str = 'msno') -> pd.DataFrame:
+        """코호트 사용자 행만 남김"""
+        return df[self.mask(df[column].to_numpy())]
+
+
+def read_cohort_msno(path: Path) -> np.ndarray:
+    """스코어링 대상 목록 (CSV / Parquet, msno 컬럼) → 중복 없는 msno 문자열 배열"""
+    path = Path(path)
+    if path.suffix == '.parquet':
+        msno = pd.read_parquet(path, columns=['msno'])['msno']
+    else:
+        msno = pd.read_csv(path, usecols=['msno'])['msno']
+    return pd.unique(msno.dropna().astype(object))
@@ -0,0 +1,298 @@
+"""
+User Logs 외부(out-of-core) 집계
+=================================
+
+목적: 전체 이력 user_logs.csv(3억+ 행, ~30GB)를 pandas에 통째로 올리지 않고
+      msno 해시로 디스크 버킷에 나눈 뒤, 버킷별로 독립 집계해 8GB 머신에서도 처리
+
+1) 파티션 (스트리밍 1패스)
+   - 청크마다 pd.util.hash_array(msno) % n_buckets로 버킷을 정해 버킷별 Parquet에 append
+   - 윈도우 기간 밖의 행은 버킷에 쓰지 않음 (집계에 쓰이지 않으므로 디스크 I/O 절감)
+   - 클리핑 경계 아티팩트가 없으면 같은 패스에서 QuantileSketch로 전체 행의 분위수 경계 추정
+2) 버킷 집계 (병렬)
+   - 한 사용자의 모든 행은 한 버킷에만 있으므로 버킷별로 기존 정의 그대로
+     handle_outliers → aggregate_all_windows → add_trend_features를 실행하고 이어 붙이면
+     전체 데이터로 한 번에 집계한 결과와 같음 (msno 정렬)
+
+각 단계의 처리량(rows/s)을 출력합니다.
+
+사용법:
+    python src/preprocessing/external_aggregation.py --source data/user_logs.csv --memory-budget 8GB
+"""
+
+import argparse
+import contextlib
+import io
+import math
+import shutil
+import sys
+import time
+import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+from src.preprocessing.aggregate_user_logs import (
+    CLIP_BOUNDS_FILENAME,
+    DATA_DIR,
+    OUTLIER_COLUMNS,
+    WINDOWS,
+    add_trend_features,
+    aggregate_all_windows,
+    handle_outliers,
+    load_clip_bounds,
+)
+from src.preprocessing.calendar_utils import day_of, to_day
+from src.preprocessing.parallel_csv import default_workers
+from src.preprocessing.resources import format_bytes, measure_bytes_per_row
+from src.preprocessing.sketches import QuantileSketch
+from src.preprocessing.user_logs_streaming import DEFAULT_CHUNKSIZE, LOG_COLUMNS, iter_user_log_chunks
+
+# ============================================================
+# 설정
+# ============================================================
+DEFAULT_BUCKETS = 64
+MAX_BUCKETS = 4096
+# 버킷 하나를 집계할 때 필요한 메모리 / 버킷 데이터프레임 크기 (윈도우 필터 복사본 + groupby 임시 배열)
+BUCKET_MEMORY_FACTOR = 4
+
+BUCKET_SCHEMA = pa.schema([
+    ('msno', pa.string()),
+    ('date', pa.int64()),
+    ('num_25', pa.int64()),
+    ('num_50', pa.int64()),
+    ('num_75', pa.int64()),
+    ('num_985', pa.int64()),
+    ('num_100', pa.int64()),
+    ('num_unq', pa.int64()),
+    ('total_secs', pa.float64()),
+])
+
+
+def bucket_path(work_dir: Path, bucket: int) -> Path:
+    return Path(work_dir) / f'bucket-{bucket:05d}.parquet'
+
+
+def estimate_rows(source: Path, sample_bytes: int = 4 * 1024 * 1024) -> int:
+    """CSV 앞부분의 평균 줄 길이로 전체 행 수 추정"""
+    size = Path(source).stat().st_size
+    with open(source, 'rb') as f:
+        sample = f.read(sample_bytes)
+    lines = max(sample.count(b'\n') - 1, 1)
+    return int(size / (len(sample) / lines)) if sample else 0
+
+
+def buckets_for_budget(source: Path, memory_budget: int, n_workers: int) -> int:
+    """워커 n개가 버킷 하나씩 동시에 집계해도 예산 안에 들도록 버킷 수 결정 (행 수는 상한 추정)"""
+    bytes_per_row = measure_bytes_per_row(source, 'user_logs_v2', LOG_COLUMNS)
+    total = estimate_rows(source) * bytes_per_row * BUCKET_MEMORY_FACTOR
+    per_worker = memory_budget / max(n_workers, 1)
+    n_buckets = max(1, min(MAX_BUCKETS, math.ceil(total / per_worker)))
+    print(f"  Memory budget {format_bytes(memory_budget)}: ~{format_bytes(total)} working set "
+          f"-> {n_buckets} buckets ({n_workers} workers)")
+    return n_buckets
+
+
+# ============================================================
+# 1) 해시 파티션
+# ============================================================
+def partition_user_logs(source: Path, work_dir: Path, n_buckets: int,
+                        windows: Dict[str, Tuple[pd.Timestamp, pd.Timestamp]] = WINDOWS,
+                        chunksize: int = DEFAULT_CHUNKSIZE,
+                        fit_clip_bounds: bool = False) -> Tuple[List[Path], Dict[str, float], Optional[dict]]:
+    """
+    user_logs를 msno 해시 버킷 Parquet으로 분할 (스트리밍 1패스)
+
+    Returns:
+        (버킷 파일 목록, 처리 통계, fit_clip_bounds=True면 전체 행 기준 근사 클리핑 경계)
+    """
+    work_dir = Path(work_dir)
+    work_dir.mkdir(parents=True, exist_ok=True)
+    span_start = day_of(min(start for start, _ in windows.values()))
+    span_end = day_of(max(end for _, end in windows.values()))
+    sketches = {col: QuantileSketch() for col in OUTLIER_COLUMNS} if fit_clip_bounds else None
+
+    writers: Dict[int, pq.ParquetWriter] = {}
+    rows_read = rows_written = 0
+    started = time.perf_counter()
+    try:
+        for i, chunk in enumerate(iter_user_log_chunks(source, chunksize)):
+            rows_read += len(chunk)
+            if sketches is not None:
+                for col, sketch in sketches.items():
+                    sketch.update(chunk[col].to_numpy())
+
+            day = to_day(chunk['date'])
+            chunk = chunk[(day >= span_start) & (day <= span_end)]
+            if len(chunk) == 0:
+                continue
+            bucket = pd.util.hash_array(chunk['msno'].to_numpy(dtype=object)) % np.uint64(n_buckets)
+            order = np.argsort(bucket, kind='stable')
+            bucket = bucket[order]
+            table = pa.Table.from_pandas(chunk.iloc[order][BUCKET_SCHEMA.names], schema=BUCKET_SCHEMA,
+                                         preserve_index=False)
+            bounds = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1], True])
+            for lo, hi in zip(bounds[:-1], bounds[1:]):
+                b = int(bucket[lo])
+                if b not in writers:
+                    writers[b] = pq.ParquetWriter(bucket_path(work_dir, b), BUCKET_SCHEMA, compression='zstd')
+                writers[b].write_table(table.slice(lo, hi - lo))
+            rows_written += len(chunk)
+            if i % 10 == 0:
+                elapsed = time.perf_counter() - started
+                print(f"  chunk {i}: {rows_read:,} rows read ({rows_read / max(elapsed, 1e-9):,.0f} rows/s)")
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+    elapsed = time.perf_counter() - started
+    stats = {'rows_read': rows_read, 'rows_written': rows_written, 'seconds': elapsed,
+             'rows_per_sec': rows_read / max(elapsed, 1e-9)}
+    print(f"  Partitioned {rows_read:,} rows ({rows_written:,} in window span) into {len(writers)} buckets: "
+          f"{elapsed:.1f}s, {stats['rows_per_sec']:,.0f} rows/s")
+
+    fitted = None
+    if sketches is not None:
+        fitted = {}
+        for col, sketch in sketches.items():
+            if sketch.n:
+                lower, upper = sketch.quantile([0.001, 0.999])
+                fitted[col] = (float(lower), float(upper))
+    return [bucket_path(work_dir, b) for b in sorted(writers)], stats, fitted
+
+
+# ============================================================
+# 2) 버킷 집계
+# ============================================================
+def aggregate_bucket(path: Path, windows: Dict[str, Tuple[pd.Timestamp, pd.Timestamp]] = WINDOWS,
+                     clip_bounds: Optional[Dict[str, Tuple[float, float]]] = None) -> Tuple[pd.DataFrame, int]:
+    """버킷 하나에 기존 윈도우/추세 정의 적용 → (피처, 행 수)"""
+    df = pd.read_parquet(path)
+    n_rows = len(df)
+    with contextlib.redirect_stdout(io.StringIO()):
+        df['date'] = to_day(df['date'])
+        df = handle_outliers(df, clip_bounds)
+        features = add_trend_features(aggregate_all_windows(df, windows))
+    return features, n_rows
+
+
+def aggregate_buckets(paths: List[Path], windows: Dict[str, Tuple[pd.Timestamp, pd.Timestamp]] = WINDOWS,
+                      clip_bounds: Optional[Dict[str, Tuple[float, float]]] = None,
+                      n_workers: Optional[int] = None) -> pd.DataFrame:
+    """버킷별 집계를 병렬 실행하고 msno 순서로 이어 붙임 (사용자는 버킷 간에 겹치지 않음)"""
+    n_workers = min(n_workers or default_workers(), max(len(paths), 1))
+    run = partial(aggregate_bucket, windows=windows, clip_bounds=clip_bounds)
+    started = time.perf_counter()
+    parts, n_rows = [], 0
+    if n_workers == 1:
+        results = map(run, paths)
+    else:
+        pool = ProcessPoolExecutor(max_workers=n_workers)
+        results = pool.map(run, paths)
+    try:
+        for i, (features, rows) in enumerate(results):
+            parts.append(features)
+            n_rows += rows
+            if i % 10 == 0 or i == len(paths) - 1:
+                print(f"  bucket {i + 1}/{len(paths)}: {n_rows:,} rows aggregated")
+    finally:
+        if n_workers > 1:
+            pool.shutdown()
+
+    elapsed = time.perf_counter() - started
+    print(f"  Aggregated {n_rows:,} rows in {len(paths)} buckets ({n_workers} workers): "
+          f"{elapsed:.1f}s, {n_rows / max(elapsed, 1e-9):,.0f} rows/s")
+    result = pd.concat(parts, ignore_index=True)
+    return result.sort_values('msno', kind='stable').reset_index(drop=True)
+
+
+# ============================================================
+# 진입점
+# ============================================================
+def aggregate_external(source: Path, work_dir: Path,
+                       n_buckets: Optional[int] = None,
+                       n_workers: Optional[int] = None,
+                       memory_budget: Optional[int] = None,
+                       clip_bounds: Optional[Dict[str, Tuple[float, float]]] = None,
+                       windows: Dict[str, Tuple[pd.Timestamp, pd.Timestamp]] = WINDOWS,
+                       chunksize: int = DEFAULT_CHUNKSIZE,
+                       keep_buckets: bool = False) -> pd.DataFrame:
+    """
+    해시 파티션 + 버킷 병렬 집계
+
+    Args:
+        source: user_logs CSV (전체 이력 user_logs.csv 또는 user_logs_v2.csv)
+        work_dir: 버킷 Parquet 임시 디렉토리
+        n_buckets: 버킷 수 (None이면 memory_budget으로 결정, 예산도 없으면 DEFAULT_BUCKETS)
+        clip_bounds: 학습 시점 클리핑 경계 (None이면 파티션 패스에서 스케치로 추정)
+
+    Returns:
+        run_aggregation_pipeline()과 같은 컬럼의 윈도우 + 추세 피처 (msno 정렬)
+        (적용된 경계는 result.attrs['clip_bounds'])
+    """
+    n_workers = n_workers or default_workers()
+    if n_buckets is None:
+        n_buckets = buckets_for_budget(source, memory_budget, n_workers) if memory_budget else DEFAULT_BUCKETS
+
+    started = time.perf_counter()
+    print(f"[1/2] Hash-partitioning {Path(source).name} into {n_buckets} buckets...")
+    paths, stats, fitted = partition_user_logs(source, work_dir, n_buckets, windows, chunksize,
+                                               fit_clip_bounds=clip_bounds is None)
+    clip_bounds = clip_bounds or fitted
+    for col, (lower, upper) in clip_bounds.items():
+        print(f"  {col}: clip to [{lower:.2f}, {upper:.2f}]")
+
+    print(f"\n[2/2] Aggregating buckets...")
+    result = aggregate_buckets(paths, windows, clip_bounds, n_workers)
+    result.attrs['clip_bounds'] = clip_bounds
+    if not keep_buckets:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    elapsed = time.perf_counter() - started
+    print(f"\nTotal: {stats['rows_read']:,} rows in {elapsed:.1f}s "
+          f"({stats['rows_read'] / max(elapsed, 1e-9):,.0f} rows/s), {result.shape}")
+    return result
+
+
+if __name__ == '__main__':
+    from src.preprocessing.resources import parse_memory_budget
+
+    parser = argparse.ArgumentParser(description='Hash-partitioned out-of-core user_logs aggregation')
+    parser.add_argument('--source', type=Path, default=None,
+                        help='user_logs CSV (기본 {data-dir}/user_logs.csv, 없으면 user_logs_v2.csv)')
+    parser.add_argument('--data-dir', type=Path, default=DATA_DIR)
+    parser.add_argument('--work-dir', type=Path, default=None,
+                        help='버킷 디렉토리 (기본 {data-dir}/user_logs_buckets)')
+    parser.add_argument('--buckets', type=int, default=None)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--memory-budget', type=str, default=None, help='예: 8GB (버킷 수 결정)')
+    parser.add_argument('--clip-bounds', type=Path, default=None,
+                        help='클리핑 경계 JSON (기본 {data-dir}/user_logs_clip_bounds.json, 없으면 스케치 추정)')
+    parser.add_argument('--chunksize', type=int, default=DEFAULT_CHUNKSIZE)
+    parser.add_argument('--out', type=Path, default=None,
+                        help='출력 Parquet (기본 {data-dir}/user_logs_aggregated_external.parquet)')
+    parser.add_argument('--keep-buckets', action='store_true')
+    args = parser.parse_args()
+
+    source = args.source
+    if source is None:
+        source = args.data_dir / 'user_logs.csv'
+        if not source.exists():
+            source = args.data_dir / 'user_logs_v2.csv'
+    bounds_path = args.clip_bounds or args.data_dir / CLIP_BOUNDS_FILENAME
+    result = aggregate_external(source, args.work_dir or args.data_dir / 'user_logs_buckets',
+                                n_buckets=args.buckets, n_workers=args.workers,
+                                memory_budget=parse_memory_budget(args.memory_budget),
+                                clip_bounds=load_clip_bounds(bounds_path) if bounds_path.exists() else None,
+                                chunksize=args.chunksize, keep_buckets=args.keep_buckets)
+    out = args.out or args.data_dir / 'user_logs_aggregated_external.parquet'
+    result.to_parquet(out, engine='pyarrow', index=False)
+    print(f"Saved: {out}")
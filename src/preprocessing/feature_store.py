@@ -0,0 +1,433 @@
+"""
+피처 테이블 Parquet 레이아웃
+=============================
+
+목적: kkbox_train_feature_v4.parquet 등 피처 테이블을 기본 to_parquet(임의 행 순서, 단일 큰
+      row group) 대신 정렬 + 고정 크기 row group + zstd + 컬럼 통계로 저장해,
+      읽는 쪽이 row group 통계로 필요 없는 구간을 건너뛰고(predicate pushdown)
+      필요한 컬럼만 읽도록(column projection) 함
+
+레이아웃 (write_feature_table(layout=...)):
+- 'msno': msno 문자열 정렬 → row group마다 msno min/max 범위가 겹치지 않아
+          단일 사용자 / 소규모 코호트 조회가 row group 몇 개만 읽음
+- 'hash': msno 64비트 해시(msno_hash 컬럼) 정렬 → 파일 앞부분이 곧 균등 무작위 표본이므로
+          대시보드의 .sample(n)을 앞쪽 row group만 읽는 read_sample()로 대체
+          (msno 조회는 msno_hash 통계로 pushdown)
+- None: 기존 to_parquet 그대로
+
+레이아웃 정보는 Parquet 메타데이터(b'feature_layout')에 기록되어 읽기 함수가 자동으로 활용합니다.
+scan_report() / compare_layouts()는 row group 통계로 걸러진 뒤 실제로 읽는 압축 바이트와
+읽기 시간을 출력합니다.
+
+단일 사용자 조회 인덱스:
+- {stem}.msno_index.npy: msno 정렬 구조체 배열 (msno, row_group, offset), 레이아웃 저장 시 함께 생성
+- {stem}.msno_index.json: 인덱스를 만든 Parquet 파일의 지문 (크기, mtime_ns, 행 수)
+  → 테이블을 다시 쓰면(같은 행 수, 다른 순서 포함) 지문이 달라져 인덱스를 다시 만듦
+- FeatureIndex / get_user_features(): 인덱스를 memmap + searchsorted로 찾고
+  memory-mapped ParquetFile에서 해당 row group 하나만 읽어 한 행 반환
+  (ModelInference.predict에 그대로 입력 가능)
+
+사용법:
+    # 기존 테이블을 정렬 레이아웃으로 다시 쓰고 전/후 읽기 비용 비교
+    python src/preprocessing/feature_store.py --src data/processed/kkbox_train_feature_v4.parquet \\
+        --out data/processed/kkbox_train_feature_v4.sorted.parquet --layout msno
+    # 기존 파일에 msno 인덱스만 생성
+    python src/preprocessing/feature_store.py --src data/processed/kkbox_train_feature_v4.parquet
+
+    row = get_user_features('<msno>')                  # 1행 DataFrame (없으면 KeyError)
+"""
+
+import argparse
+import json
+import sys
+import time
+import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+from src.preprocessing.resources import format_bytes
+
+# ============================================================
+# 설정
+# ============================================================
+LAYOUTS = ['msno', 'hash']
+ROW_GROUP_SIZE = 65_536          # row group당 행 수 (단일 사용자 조회 시 읽는 최소 단위)
+COMPRESSION = 'zstd'
+HASH_COLUMN = 'msno_hash'
+LAYOUT_METADATA_KEY = b'feature_layout'
+INDEX_SUFFIX = '.msno_index.npy'
+FINGERPRINT_SUFFIX = '.msno_index.json'
+FEATURE_TABLE_PATH = PROJECT_ROOT / 'data' / 'processed' / 'kkbox_train_feature_v4.parquet'
+_HASH_KEY = '0123456789123456'   # pd.util.hash_array 기본 키 (고정 → 실행 간 같은 해시)
+
+
+def msno_hash(msno) -> np.ndarray:
+    """msno → int64 해시 (hash 레이아웃 정렬 키, Parquet 통계 비교가 가능하도록 부호 있는 정수)"""
+    values = np.asarray(msno, dtype=object)
+    return pd.util.hash_array(values, hash_key=_HASH_KEY, categorize=False).view(np.int64)
+
+
+# ============================================================
+# 쓰기
+# ============================================================
+def write_feature_table(df: pd.DataFrame, path: Path, layout: Optional[str] = 'msno',
+                        row_group_size: int = ROW_GROUP_SIZE,
+                        compression: str = COMPRESSION,
+                        index: bool = True) -> Path:
+    """
+    피처 테이블 저장
+
+    Args:
+        df: msno 컬럼을 가진 피처 테이블
+        layout: 'msno' | 'hash' | None (None이면 기존 to_parquet 기본 설정)
+        row_group_size: row group당 행 수
+        index: 레이아웃 저장 시 msno 조회 인덱스({stem}.msno_index.npy)도 함께 생성
+               (layout=None이거나 False면 이전 인덱스를 지워 FeatureIndex가 다시 만들게 함)
+    """
+    path = Path(path)
+    if layout is None:
+        df.to_parquet(path, engine='pyarrow', index=False)
+        remove_msno_index(path)
+        return path
+    if layout not in LAYOUTS:
+        raise ValueError(f"Unknown feature table layout: {layout}. Options: {LAYOUTS} or None")
+
+    if layout == 'hash':
+        df = df.assign(**{HASH_COLUMN: msno_hash(df['msno'])})
+        order = np.argsort(df[HASH_COLUMN].to_numpy(), kind='stable')
+    else:
+        order = np.argsort(df['msno'].to_numpy(dtype=object), kind='stable')
+    table = pa.Table.from_pandas(df.iloc[order], preserve_index=False)
+
+    meta = {'layout': layout, 'row_group_size': row_group_size,
+            'sort_column': HASH_COLUMN if layout == 'hash' else 'msno'}
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}),
+                                           LAYOUT_METADATA_KEY: json.dumps(meta).encode()})
+    pq.write_table(table, path, row_group_size=row_group_size, compression=compression,
+                   write_statistics=True)
+    if index:
+        build_msno_index(path)
+    else:
+        remove_msno_index(path)
+    return path
+
+
+def read_layout(path: Path) -> Optional[dict]:
+    """write_feature_table()이 기록한 레이아웃 정보 (기본 to_parquet 파일이면 None)"""
+    metadata = pq.read_schema(path).metadata or {}
+    raw = metadata.get(LAYOUT_METADATA_KEY)
+    return json.loads(raw) if raw else None
+
+
+def feature_columns(path: Path) -> List[str]:
+    """파일의 피처 컬럼 이름 (hash 레이아웃의 정렬 키 컬럼 제외)"""
+    return [name for name in pq.read_schema(path).names if name != HASH_COLUMN]
+
+
+# ============================================================
+# 읽기 (pushdown / projection)
+# ============================================================
+def _msno_filters(path: Path, msno) -> List[tuple]:
+    """msno 목록 → row group 통계로 걸러지는 필터 (hash 레이아웃은 정렬 키 조건을 함께 사용)"""
+    msno = list(pd.unique(np.asarray(msno, dtype=object)))
+    filters = [('msno', 'in', msno)]
+    layout = read_layout(path)
+    if layout is not None and layout['layout'] == 'hash':
+        filters.insert(0, (HASH_COLUMN, 'in', msno_hash(msno).tolist()))
+    return filters
+
+
+def read_features(path: Path, columns: Optional[List[str]] = None, msno=None,
+                  filters: Optional[List[tuple]] = None) -> pd.DataFrame:
+    """
+    피처 테이블 읽기
+
+    Args:
+        columns: 읽을 컬럼 (None이면 전체; msno를 지정하면 msno 컬럼은 항상 포함)
+        msno: 조회할 사용자 msno 목록 (row group 통계로 나머지 구간은 읽지 않음)
+        filters: 추가 pyarrow 필터 (예: [('is_churn', '=', 1)])
+    """
+    filters = list(filters or [])
+    if msno is not None:
+        filters = _msno_filters(path, msno) + filters
+        if columns is not None and 'msno' not in columns:
+            columns = ['msno'] + list(columns)
+    if columns is None:
+        columns = feature_columns(path)
+    table = pq.read_table(path, columns=columns, filters=filters or None)
+    return table.to_pandas()
+
+
+def read_sample(path: Path, n: int, columns: Optional[List[str]] = None,
+                random_state: int = 42) -> pd.DataFrame:
+    """
+    n행 무작위 표본
+
+    hash 레이아웃이면 해시 순서 앞쪽 row group만 읽어 앞의 n행을 반환하고
+    (해시 순서 = 사용자 무작위 순서), 그 외 레이아웃은 전체를 읽어 .sample()합니다.
+    """
+    columns = columns or feature_columns(path)
+    layout = read_layout(path)
+    if layout is None or layout['layout'] != 'hash':
+        df = pd.read_parquet(path, columns=columns)
+        return df.sample(n=min(n, len(df)), random_state=random_state)
+
+    pf = pq.ParquetFile(path)
+    row_groups, rows = [], 0
+    for i in range(pf.num_row_groups):
+        if rows >= n:
+            break
+        row_groups.append(i)
+        rows += pf.metadata.row_group(i).num_rows
+    return pf.read_row_groups(row_groups, columns=columns).slice(0, n).to_pandas()
+
+
+# ============================================================
+# 단일 사용자 조회 인덱스
+# ============================================================
+def index_path(path: Path) -> Path:
+    path = Path(path)
+    return path.with_name(path.stem + INDEX_SUFFIX)
+
+
+def fingerprint_path(path: Path) -> Path:
+    path = Path(path)
+    return path.with_name(path.stem + FINGERPRINT_SUFFIX)
+
+
+def file_fingerprint(path: Path) -> dict:
+    """Parquet 파일 지문 (크기, mtime_ns, 행 수) - 인덱스와 함께 저장해 파일 교체를 감지"""
+    stat = Path(path).stat()
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+            'num_rows': pq.read_metadata(path).num_rows}
+
+
+def index_is_current(path: Path) -> bool:
+    """인덱스가 있고, 저장된 지문이 현재 Parquet 파일과 같은지"""
+    if not index_path(path).exists() or not fingerprint_path(path).exists():
+        return False
+    with open(fingerprint_path(path), 'r') as f:
+        return json.load(f) == file_fingerprint(path)
+
+
+def remove_msno_index(path: Path) -> None:
+    """이전 테이블의 인덱스 / 지문 파일 삭제 (없으면 무시)"""
+    index_path(path).unlink(missing_ok=True)
+    fingerprint_path(path).unlink(missing_ok=True)
+
+
+def build_msno_index(path: Path) -> Path:
+    """
+    피처 테이블의 msno → (row group, row group 내 위치) 인덱스 생성
+
+    msno 컬럼만 row group 단위로 읽어 msno 정렬 구조체 배열로 저장합니다 (np.load(mmap_mode='r') 가능).
+    인덱스를 만든 파일의 지문({stem}.msno_index.json)을 함께 기록합니다.
+    """
+    fingerprint = file_fingerprint(path)
+    pf = pq.ParquetFile(path)
+    parts = []
+    for i in range(pf.num_row_groups):
+        msno = pf.read_row_group(i, columns=['msno']).column('msno').to_numpy(zero_copy_only=False)
+        parts.append((msno.astype('S'), np.full(len(msno), i, dtype=np.int32),
+                      np.arange(len(msno), dtype=np.int32)))
+    msno = np.concatenate([p[0] for p in parts]) if parts else np.array([], dtype='S1')
+    index = np.empty(len(msno), dtype=[('msno', msno.dtype), ('row_group', np.int32), ('offset', np.int32)])
+    index['msno'] = msno
+    index['row_group'] = np.concatenate([p[1] for p in parts]) if parts else []
+    index['offset'] = np.concatenate([p[2] for p in parts]) if parts else []
+    index.sort(order='msno', kind='stable')
+    if len(index) > 1 and (index['msno'][1:] == index['msno'][:-1]).any():
+        raise ValueError(f"Duplicate msno in {path}; a point-lookup index needs one row per user")
+
+    out = index_path(path)
+    np.save(out, index)
+    with open(fingerprint_path(path), 'w') as f:
+        json.dump(fingerprint, f)
+    return out
+
+
+class FeatureIndex:
+    """
+    피처 테이블 단일 사용자 조회기
+
+    인덱스는 memmap, Parquet은 memory_map=True로 열어 조회마다 row group 하나만 디코딩합니다.
+    인덱스가 없거나 저장된 파일 지문이 현재 파일과 다르면(테이블을 다시 쓴 경우) 다시 만듭니다.
+    """
+
+    def __init__(self, path: Path = FEATURE_TABLE_PATH):
+        self.path = Path(path)
+        self._load()
+
+    def _load(self, rebuild: bool = False) -> None:
+        if rebuild or not index_is_current(self.path):
+            build_msno_index(self.path)
+        self.fingerprint = file_fingerprint(self.path)
+        self.file = pq.ParquetFile(self.path, memory_map=True)
+        self.index = np.load(index_path(self.path), mmap_mode='r')
+        self.columns = feature_columns(self.path)
+
+    def is_current(self) -> bool:
+        """연 뒤로 Parquet 파일이 바뀌지 않았는지 (지문 비교)"""
+        return self.path.exists() and file_fingerprint(self.path) == self.fingerprint
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def locate(self, msno: str) -> Optional[Tuple[int, int]]:
+        """msno → (row group, 위치), 없으면 None"""
+        key = str(msno).encode()
+        if len(self.index) == 0 or len(key) > self.index.dtype['msno'].itemsize:
+            return None
+        pos = int(np.searchsorted(self.index['msno'], key))
+        if pos >= len(self.index) or self.index['msno'][pos] != key:
+            return None
+        return int(self.index['row_group'][pos]), int(self.index['offset'][pos])
+
+    def get(self, msno: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """msno 한 명의 피처 행 (1행 DataFrame, 없으면 KeyError)"""
+        location = self.locate(msno)
+        if location is None:
+            raise KeyError(f"msno not found in {self.path.name}: {msno}")
+        row = self._read_row(location, columns)
+        if row['msno'].iloc[0] != msno:
+            # 지문으로 못 잡은 교체 (같은 크기 / mtime) → 인덱스를 다시 만들고 한 번 더 조회
+            self._load(rebuild=True)
+            location = self.locate(msno)
+            if location is None:
+                raise KeyError(f"msno not found in {self.path.name}: {msno}")
+            row = self._read_row(location, columns)
+        columns = list(columns) if columns is not None else self.columns
+        return row[columns]
+
+    def _read_row(self, location: Tuple[int, int], columns: Optional[List[str]]) -> pd.DataFrame:
+        row_group, offset = location
+        columns = list(columns) if columns is not None else self.columns
+        read = columns if 'msno' in columns else ['msno'] + columns
+        return self.file.read_row_group(row_group, columns=read).slice(offset, 1).to_pandas()
+
+
+@lru_cache(maxsize=4)
+def _open_index(path: str) -> FeatureIndex:
+    return FeatureIndex(Path(path))
+
+
+def get_user_features(msno: str, path: Path = FEATURE_TABLE_PATH,
+                      columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    한 사용자의 피처 행 조회 (프로세스 안에서 인덱스 / 파일 핸들 재사용)
+
+    캐시된 인덱스를 연 뒤 파일이 다시 쓰였으면 캐시를 비우고 새로 엽니다.
+
+    Returns:
+        1행 DataFrame (ModelInference.predict 입력 형태, 없으면 KeyError)
+    """
+    key = str(Path(path).resolve())
+    index = _open_index(key)
+    if not index.is_current():
+        _open_index.cache_clear()
+        index = _open_index(key)
+    return index.get(msno, columns)
+
+
+# ============================================================
+# 읽기 비용 리포트
+# ============================================================
+def scan_report(path: Path, columns: Optional[List[str]] = None,
+                filters: Optional[List[tuple]] = None) -> Dict[str, float]:
+    """
+    읽기 비용: row group 통계로 걸러진 뒤 남는 row group 수와 읽는 압축 바이트, 읽기 시간
+
+    Returns:
+        {'row_groups', 'row_groups_total', 'bytes_scanned', 'bytes_total', 'rows', 'seconds'}
+    """
+    pf = pq.ParquetFile(path)
+    meta = pf.metadata
+    names = pf.schema_arrow.names
+    read_columns = list(columns) if columns is not None else [c for c in names if c != HASH_COLUMN]
+    filter_columns = [f[0] for f in filters or []]
+    scanned_columns = set(read_columns) | set(filter_columns)
+
+    if filters:
+        fragment = next(ds.dataset(path, format='parquet').get_fragments())
+        kept = [rg.id for piece in fragment.split_by_row_group(pq.filters_to_expression(filters))
+                for rg in piece.row_groups]
+    else:
+        kept = list(range(meta.num_row_groups))
+
+    index = {meta.schema.column(j).path.split('.')[0]: j for j in range(meta.num_columns)}
+    total = sum(meta.row_group(i).column(j).total_compressed_size
+                for i in range(meta.num_row_groups) for j in range(meta.num_columns))
+    scanned = sum(meta.row_group(i).column(index[c]).total_compressed_size
+                  for i in kept for c in scanned_columns if c in index)
+
+    started = time.perf_counter()
+    table = pq.read_table(path, columns=read_columns, filters=filters or None)
+    seconds = time.perf_counter() - started
+    return {'row_groups': len(kept), 'row_groups_total': meta.num_row_groups,
+            'bytes_scanned': scanned, 'bytes_total': total, 'rows': table.num_rows, 'seconds': seconds}
+
+
+def _print_report(label: str, report: Dict[str, float]) -> None:
+    print(f"  {label:<28} {report['rows']:>10,} rows  "
+          f"{report['row_groups']:>4}/{report['row_groups_total']:<4} row groups  "
+          f"{format_bytes(report['bytes_scanned']):>10} scanned  {report['seconds'] * 1000:8.1f} ms")
+
+
+def compare_layouts(src: Path, out: Path, layout: str = 'msno', row_group_size: int = ROW_GROUP_SIZE,
+                    columns: Optional[List[str]] = None, n_lookup: int = 100,
+                    random_state: int = 42) -> Dict[str, Dict[str, Dict[str, float]]]:
+    """
+    src를 레이아웃 적용 파일 out으로 다시 쓰고, 같은 질의의 읽기 비용을 전/후로 비교
+
+    질의: 전체 읽기, 컬럼 projection, 단일 사용자 조회, n_lookup명 코호트 조회
+    """
+    df = pd.read_parquet(src)
+    write_feature_table(df, out, layout, row_group_size)
+    print(f"Rewrote {src} -> {out} (layout={layout}, row_group_size={row_group_size:,}): "
+          f"{format_bytes(Path(src).stat().st_size)} -> {format_bytes(Path(out).stat().st_size)}")
+
+    columns = columns or [c for c in df.columns if c != 'msno'][:5]
+    cohort = df['msno'].sample(n=min(n_lookup, len(df)), random_state=random_state).tolist()
+    queries = {
+        'full table': (None, None),
+        f'{len(columns)} columns': (columns, None),
+        'single user': (columns, cohort[:1]),
+        f'{len(cohort)}-user cohort': (columns, cohort),
+    }
+    results = {}
+    for name, path in [('before', Path(src)), ('after', Path(out))]:
+        print(f"\n[{name}] {path.name}")
+        results[name] = {}
+        for label, (cols, users) in queries.items():
+            filters = _msno_filters(path, users) if users is not None else None
+            report = scan_report(path, cols, filters)
+            _print_report(label, report)
+            results[name][label] = report
+    return results
+
+
+# ============================================================
+# 실행
+# ============================================================
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Rewrite a feature table with a sorted Parquet layout')
+    parser.add_argument('--src', type=Path, required=True)
+    parser.add_argument('--out', type=Path, default=None,
+                        help='정렬 레이아웃으로 다시 쓸 경로 (생략하면 --src의 msno 인덱스만 생성)')
+    parser.add_argument('--layout', choices=LAYOUTS, default='msno')
+    parser.add_argument('--row-group-size', type=int, default=ROW_GROUP_SIZE)
+    parser.add_argument('--columns', nargs='+', default=None, help='projection 비교에 쓸 컬럼')
+    args = parser.parse_args()
+    if args.out is None:
+        print(f"Saved msno index: {build_msno_index(args.src)}")
+    else:
+        compare_layouts(args.src, args.out, args.layout, args.row_group_size, args.columns)
@@ -0,0 +1,452 @@
+"""
+User Logs 증분(일별) 집계
+==========================
+
+목적: 매일 들어오는 하루치 user_logs만 반영해 윈도우/추세 피처를 갱신
+      (전체 월 재집계 없이 하루치 로그에 비례하는 비용)
+
+상태 (state_dir/):
+- meta.json: 링 크기, 사용자 수, 마지막 반영일, 슬롯별 날짜, 클리핑 경계, 피처 컬럼
+- msno.txt: 사용자 id 순서의 msno (append-only)
+- 링 버퍼 (users × ring_days, 슬롯 = 날짜 서수 % ring_days)
+  * secs.bin (float32), secs_m2.bin (float32), counts.bin (uint16 × 6), n_rows.bin (uint8)
+- slot_users_{k}.npy: 슬롯 k 날짜에 활동한 사용자 id (퇴출/경계 이탈 사용자 조회용)
+- features.bin (float64, users × 피처), has_features.bin (uint8): 사용자별 최신 피처 행
+  * 활동 비트마스크 피처(ACTIVITY_FEATURES)는 로그가 없는 날에도 모든 사용자에서 바뀌므로
+    내보낼 때 링의 마지막 31일 슬롯으로 다시 계산
+
+하루 D 반영 시 갱신 대상 사용자 (touched):
+- D에 로그가 있는 사용자
+- 윈도우 길이 L마다 D-L일에 활동한 사용자 (윈도우 경계 밖으로 밀려난 날)
+  → L = ring_days 인 날은 링에서 퇴출되는 슬롯
+
+사용법:
+    # 최초 1회: 관측 기간 로그로 상태 생성
+    python src/preprocessing/incremental_user_logs.py --init --end-date 2017-03-31
+    # 매일: 하루치 델타 반영
+    python src/preprocessing/incremental_user_logs.py --delta data/user_logs_20170401.csv
+    # 피처 테이블 내보내기
+    python src/preprocessing/incremental_user_logs.py --export data/user_logs_aggregated_ldh.parquet
+"""
+
+import argparse
+import json
+import sys
+import pandas as pd
+import numpy as np
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+from src.preprocessing.activity_bitmask import (
+    ACTIVITY_FEATURES,
+    MASK_DAYS,
+    activity_features,
+    pack_days,
+)
+from src.preprocessing.activity_cube import (
+    COUNT_COLUMNS,
+    UINT8_MAX,
+    UINT16_MAX,
+    aggregate_cells,
+    window_base_from_sums,
+)
+from src.preprocessing.aggregate_user_logs import (
+    CLIP_BOUNDS_FILENAME,
+    DATA_DIR,
+    WINDOW_DAYS,
+    add_trend_features,
+    cast_count_columns,
+    derive_window_features,
+    load_clip_bounds,
+)
+from src.preprocessing.ingest import date_range_filter, has_parquet, read_raw_table
+from src.preprocessing.user_logs_streaming import LOG_COLUMNS, SUM_COLUMNS
+
+# ============================================================
+# 설정
+# ============================================================
+STATE_DIR = DATA_DIR / 'user_logs_state'
+INITIAL_CAPACITY = 1024
+
+# 채널 파일: (dtype, 사용자 1명당 슬롯 뒤 shape)
+RING_CHANNELS = {
+    'secs': (np.float32, ()),
+    'secs_m2': (np.float32, ()),
+    'counts': (np.uint16, (len(COUNT_COLUMNS),)),
+    'n_rows': (np.uint8, ()),
+}
+
+
+def _ordinal(date) -> int:
+    return pd.Timestamp(date).toordinal()
+
+
+def _from_ordinal(ordinal: int) -> pd.Timestamp:
+    return pd.Timestamp.fromordinal(int(ordinal))
+
+
+# ============================================================
+# 상태
+# ============================================================
+class UserLogRingState:
+    """
+    사용자별 최근 ring_days일 일별 집계를 보관하는 디스크 링 버퍼
+
+    배열은 사용자 축이 첫 번째인 raw 파일(np.memmap)이라, 신규 사용자는 파일 끝을
+    늘리는 것만으로 추가됩니다 (기존 데이터 복사 없음).
+    """
+
+    def __init__(self, state_dir: Path = STATE_DIR):
+        self.state_dir = Path(state_dir)
+        with open(self.state_dir / 'meta.json', 'r') as f:
+            self.meta = json.load(f)
+        self.ring_days = self.meta['ring_days']
+        self.window_days: Dict[str, int] = self.meta['window_days']
+        self.clip_bounds = {col: tuple(b) for col, b in self.meta['clip_bounds'].items()}
+        self.feature_columns: List[str] = self.meta['feature_columns']
+        self.slot_dates = np.asarray(self.meta['slot_dates'], dtype=np.int64)
+
+        msno_path = self.state_dir / 'msno.txt'
+        self.msno = msno_path.read_text().split() if msno_path.exists() else []
+        self._index: Optional[pd.Index] = None
+        self._open(self.meta['capacity'])
+        self.slot_users = [self._load_slot_users(k) for k in range(self.ring_days)]
+
+    # ----------------------------------------------------------
+    # 생성 / 저장
+    # ----------------------------------------------------------
+    @classmethod
+    def create(cls, state_dir: Path = STATE_DIR,
+               clip_bounds: Optional[Dict[str, Tuple[float, float]]] = None,
+               window_days: Dict[str, int] = WINDOW_DAYS) -> 'UserLogRingState':
+        """빈 상태 생성 (기존 상태 덮어씀)"""
+        state_dir = Path(state_dir)
+        state_dir.mkdir(parents=True, exist_ok=True)
+        ring_days = max(window_days.values())
+        for path in list(state_dir.glob('*.bin')) + list(state_dir.glob('slot_users_*.npy')):
+            path.unlink()
+        (state_dir / 'msno.txt').write_text('')
+
+        meta = {
+            'ring_days': ring_days,
+            'window_days': dict(window_days),
+            'n_users': 0,
+            'capacity': 0,
+            'last_date': None,
+            'slot_dates': [-1] * ring_days,
+            'clip_bounds': {col: list(b) for col, b in (clip_bounds or {}).items()},
+            'feature_columns': [],
+        }
+        with open(state_dir / 'meta.json', 'w') as f:
+            json.dump(meta, f, indent=2)
+
+        state = cls(state_dir)
+        columns = state._compute_features(np.array([], dtype=np.int64)).columns
+        state.feature_columns = [col for col in columns if col not in ('msno', '_seen')]
+        state._grow(INITIAL_CAPACITY)
+        state.save()
+        return state
+
+    def save(self) -> None:
+        """meta / 슬롯별 사용자 / 배열 flush"""
+        for arr in self._arrays():
+            arr.flush()
+        for k, users in enumerate(self.slot_users):
+            np.save(self.state_dir / f'slot_users_{k}.npy', users)
+        self.meta.update({
+            'n_users': len(self.msno),
+            'capacity': self.capacity,
+            'slot_dates': [int(d) for d in self.slot_dates],
+            'feature_columns': self.feature_columns,
+        })
+        with open(self.state_dir / 'meta.json', 'w') as f:
+            json.dump(self.meta, f, indent=2)
+
+    def _load_slot_users(self, k: int) -> np.ndarray:
+        path = self.state_dir / f'slot_users_{k}.npy'
+        return np.load(path) if path.exists() else np.array([], dtype=np.int64)
+
+    def _open(self, capacity: int) -> None:
+        """capacity 사용자 크기로 배열 파일을 열기 (파일이 작으면 0으로 확장)"""
+        self.capacity = capacity
+        self.ring: Dict[str, np.ndarray] = {}
+        for name, (dtype, tail) in RING_CHANNELS.items():
+            self.ring[name] = self._memmap(f'{name}.bin', dtype, (capacity, self.ring_days) + tail)
+        n_features = max(len(self.feature_columns), 1)
+        self.features = self._memmap('features.bin', np.float64, (capacity, n_features))
+        self.has_features = self._memmap('has_features.bin', np.uint8, (capacity,))
+
+    def _memmap(self, filename: str, dtype, shape: Tuple[int, ...]) -> np.ndarray:
+        path = self.state_dir / filename
+        nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        with open(path, 'ab') as f:
+            if f.tell() < nbytes:
+                f.truncate(nbytes)
+        if nbytes == 0:
+            return np.zeros(shape, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode='r+', shape=shape)
+
+    def _arrays(self) -> List[np.ndarray]:
+        arrays = list(self.ring.values()) + [self.features, self.has_features]
+        return [arr for arr in arrays if isinstance(arr, np.memmap)]
+
+    def _grow(self, n_users: int) -> None:
+        if n_users <= self.capacity:
+            return
+        for arr in self._arrays():
+            arr.flush()
+        self._open(max(n_users, 2 * self.capacity, INITIAL_CAPACITY))
+
+    # ----------------------------------------------------------
+    # 사용자 인덱스
+    # ----------------------------------------------------------
+    def encode(self, msno: pd.Series) -> np.ndarray:
+        """msno → 사용자 id (처음 보는 msno는 파일 끝에 추가)"""
+        if self._index is None:
+            self._index = pd.Index(self.msno)
+        uniques = pd.unique(msno)
+        ids = self._index.get_indexer(uniques)
+        new = uniques[ids < 0]
+        if len(new):
+            ids[ids < 0] = np.arange(len(self.msno), len(self.msno) + len(new))
+            self.msno.extend(new)
+            with open(self.state_dir / 'msno.txt', 'a') as f:
+                f.write(''.join(f'{m}\n' for m in new))
+            self._index = None
+            self._grow(len(self.msno))
+        return ids[pd.Index(uniques).get_indexer(msno)].astype(np.int64)
+
+    # ----------------------------------------------------------
+    # 일별 반영
+    # ----------------------------------------------------------
+    @property
+    def last_date(self) -> Optional[pd.Timestamp]:
+        last = self.meta['last_date']
+        return None if last is None else pd.Timestamp(last)
+
+    def _advance(self, day: int) -> np.ndarray:
+        """
+        링의 끝을 day로 이동 (가장 오래된 슬롯 퇴출)
+
+        Returns:
+            피처가 바뀌는 사용자 id (퇴출 슬롯 + 윈도우 경계 밖으로 밀려난 날의 활동 사용자)
+        """
+        touched = []
+        for n_days in set(self.window_days.values()):
+            dropped_day = day - n_days
+            slot = dropped_day % self.ring_days
+            if self.slot_dates[slot] == dropped_day:
+                touched.append(self.slot_users[slot])
+
+        slot = day % self.ring_days
+        evicted = self.slot_users[slot]
+        for arr in self.ring.values():
+            arr[evicted, slot] = 0
+        self.slot_dates[slot] = day
+        self.slot_users[slot] = np.array([], dtype=np.int64)
+        self.meta['last_date'] = _from_ordinal(day).strftime('%Y-%m-%d')
+        return np.concatenate(touched) if touched else np.array([], dtype=np.int64)
+
+    def apply_day(self, delta: pd.DataFrame, refresh: bool = True) -> np.ndarray:
+        """
+        하루치 로그 반영
+
+        Args:
+            delta: 하루치 user_logs (msno, date, SUM_COLUMNS)
+            refresh: True면 갱신 대상 사용자의 피처를 즉시 재계산
+
+        Returns:
+            갱신 대상 사용자 id
+        """
+        dates = pd.unique(delta['date'])
+        if len(dates) != 1:
+            raise ValueError(f"Delta must contain exactly one date, got {len(dates)}")
+        day = _ordinal(pd.to_datetime(str(dates[0]), format='%Y%m%d'))
+        last = self.last_date
+        if last is not None and day <= last.toordinal():
+            raise ValueError(f"Delta date {_from_ordinal(day).date()} is not after last applied "
+                             f"date {last.date()}")
+
+        # 건너뛴 날(로그 없음)도 링을 한 칸씩 이동
+        touched = []
+        first = day if last is None else last.toordinal() + 1
+        for d in range(first, day + 1):
+            touched.append(self._advance(d))
+
+        uid = self.encode(delta['msno'])
+        values = delta[SUM_COLUMNS].to_numpy(dtype=np.float64)
+        for j, col in enumerate(SUM_COLUMNS):
+            if col in self.clip_bounds:
+                np.clip(values[:, j], *self.clip_bounds[col], out=values[:, j])
+
+        users, rows, secs, m2, counts = aggregate_cells(uid, values)
+        slot = day % self.ring_days
+        self.ring['n_rows'][users, slot] = np.minimum(rows, UINT8_MAX)
+        self.ring['secs'][users, slot] = secs
+        self.ring['secs_m2'][users, slot] = m2
+        self.ring['counts'][users, slot] = np.minimum(np.rint(counts), UINT16_MAX)
+        self.slot_users[slot] = users
+        touched.append(users)
+
+        touched = np.unique(np.concatenate(touched))
+        if refresh:
+            self.refresh(touched)
+        return touched
+
+    # ----------------------------------------------------------
+    # 피처
+    # ----------------------------------------------------------
+    def _window_sums(self, rows: np.ndarray, n_days: int) -> Dict[str, np.ndarray]:
+        """마지막 반영일까지 n_days일 윈도우의 사용자별 합계"""
+        end = self.last_date.toordinal() if self.last_date is not None else 0
+        slots = [s for s in range(self.ring_days) if end - n_days < self.slot_dates[s] <= end]
+        n_rows = self.ring['n_rows'][rows][:, slots].astype(np.float64)
+        secs = self.ring['secs'][rows][:, slots].astype(np.float64)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            sq_over_n = np.where(n_rows > 0, secs ** 2 / n_rows, 0.0)
+        return {
+            'count': n_rows.sum(axis=1),
+            'active': (n_rows > 0).sum(axis=1),
+            'total': secs.sum(axis=1),
+            'm2': self.ring['secs_m2'][rows][:, slots].astype(np.float64).sum(axis=1) + sq_over_n.sum(axis=1),
+            'counts': self.ring['counts'][rows][:, slots].astype(np.float64).sum(axis=1),
+        }
+
+    def _activity_features(self, rows: np.ndarray) -> pd.DataFrame:
+        """rows 사용자의 마지막 반영일까지 최대 MASK_DAYS일 활동 비트마스크 피처 (mask_span과 같은 구간)"""
+        end = self.last_date.toordinal() if self.last_date is not None else 0
+        n_days = min(self.ring_days, MASK_DAYS)
+        days = np.arange(end - n_days + 1, end + 1)
+        slots = days % self.ring_days
+        inside = self.slot_dates[slots] == days
+        active = np.zeros((len(rows), n_days), dtype=bool)
+        active[:, inside] = self.ring['n_rows'][rows][:, slots[inside]] > 0
+        msno = np.asarray(self.msno, dtype=object)[rows] if len(rows) else np.array([], dtype=object)
+        return activity_features(msno, pack_days(active), n_days)
+
+    def _compute_features(self, rows: np.ndarray) -> pd.DataFrame:
+        """rows 사용자의 윈도우/추세 피처 (배치 파이프라인과 같은 컬럼, '_seen' 포함)"""
+        msno = np.asarray(self.msno, dtype=object)[rows] if len(rows) else np.array([], dtype=object)
+        seen = np.zeros(len(rows), dtype=bool)
+        result = None
+        for name, n_days in self.window_days.items():
+            base = window_base_from_sums(msno, **self._window_sums(rows, n_days))
+            seen |= base.pop('_count').to_numpy() > 0
+            window_agg = derive_window_features(base, name)
+            result = window_agg if result is None else pd.concat(
+                [result, window_agg.drop(columns='msno')], axis=1)
+        result = pd.concat([result, self._activity_features(rows).drop(columns='msno')], axis=1)
+        result = add_trend_features(result.fillna(0))
+        result['_seen'] = seen
+        return result
+
+    def refresh(self, rows: np.ndarray) -> None:
+        """rows 사용자의 피처 행 재계산 (어느 윈도우에도 활동이 없으면 제외 표시)"""
+        rows = np.asarray(rows, dtype=np.int64)
+        if len(rows) == 0:
+            return
+        features = self._compute_features(rows)
+        self.features[rows] = features[self.feature_columns].to_numpy(dtype=np.float64)
+        self.has_features[rows] = features['_seen'].to_numpy(dtype=np.uint8)
+
+    def to_frame(self) -> pd.DataFrame:
+        """현재 피처 테이블 (aggregate_all_windows() + add_trend_features()와 같은 형태, msno 정렬)"""
+        rows = np.flatnonzero(self.has_features[:len(self.msno)])
+        msno = np.asarray(self.msno, dtype=object)[rows]
+        order = np.argsort(msno, kind='stable')
+        rows = rows[order]
+        result = pd.DataFrame(self.features[rows], columns=self.feature_columns)
+        result.insert(0, 'msno', msno[order])
+
+        # 비활동 일수는 갱신 대상이 아닌 사용자도 매일 늘어나므로 링에서 다시 계산
+        activity = self._activity_features(rows)
+        for col in ACTIVITY_FEATURES:
+            result[col] = activity[col].to_numpy()
+        # features.bin은 float64 → 개수 컬럼은 배치와 같은 int64로
+        return cast_count_columns(result)
+
+
+# ============================================================
+# 상태 초기화 / 일별 갱신
+# ============================================================
+def bootstrap_state(data_dir: Path = DATA_DIR, state_dir: Path = STATE_DIR,
+                    end_date: pd.Timestamp = pd.Timestamp('2017-03-31'),
+                    clip_bounds: Optional[Dict[str, Tuple[float, float]]] = None,
+                    window_days: Dict[str, int] = WINDOW_DAYS) -> UserLogRingState:
+    """
+    end_date까지의 ring_days일 로그로 상태 생성 (최초 1회)
+
+    ingest Parquet이 있으면 날짜 파티션을 하루씩 읽고, 없으면 기간 전체를 한 번 읽어
+    날짜별로 나눕니다. 피처는 마지막에 한 번만 계산합니다.
+    """
+    state = UserLogRingState.create(state_dir, clip_bounds, window_days)
+    end_date = pd.Timestamp(end_date)
+    start_date = end_date - pd.Timedelta(days=state.ring_days - 1)
+    print(f"  Bootstrapping {start_date.date()} ~ {end_date.date()} ({state.ring_days} days)")
+
+    if has_parquet(data_dir, 'user_logs_v2'):
+        days = (read_raw_table(data_dir, 'user_logs_v2', columns=LOG_COLUMNS,
+                               filters=date_range_filter('date', d, d))
+                for d in pd.date_range(start_date, end_date))
+    else:
+        logs = read_raw_table(data_dir, 'user_logs_v2', columns=LOG_COLUMNS,
+                              filters=date_range_filter('date', start_date, end_date))
+        days = (group for _, group in logs.groupby('date', sort=True))
+
+    touched = []
+    for delta in days:
+        if len(delta):
+            touched.append(state.apply_day(delta, refresh=False))
+    if touched:
+        state.refresh(np.unique(np.concatenate(touched)))
+    # 로그가 없는 마지막 날짜들도 링 끝으로 반영
+    if state.last_date is not None and state.last_date < end_date:
+        state.refresh(np.unique(np.concatenate(
+            [state._advance(d) for d in range(state.last_date.toordinal() + 1, end_date.toordinal() + 1)])))
+    state.save()
+    print(f"  Users: {len(state.msno):,}, last date: {state.meta['last_date']}")
+    return state
+
+
+def apply_daily_delta(delta_path: Path, state_dir: Path = STATE_DIR) -> np.ndarray:
+    """하루치 델타 CSV를 상태에 반영하고 갱신된 사용자 id 반환"""
+    state = UserLogRingState(state_dir)
+    delta = pd.read_csv(delta_path, usecols=LOG_COLUMNS)
+    touched = state.apply_day(delta)
+    state.save()
+    print(f"  Applied {len(delta):,} rows for {state.meta['last_date']}: "
+          f"{len(touched):,} users refreshed")
+    return touched
+
+
+# ============================================================
+# 실행
+# ============================================================
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Incremental user_logs window features')
+    parser.add_argument('--state-dir', type=Path, default=STATE_DIR)
+    parser.add_argument('--data-dir', type=Path, default=DATA_DIR)
+    parser.add_argument('--init', action='store_true', help='관측 기간 로그로 상태 생성')
+    parser.add_argument('--end-date', type=str, default='2017-03-31', help='--init 기준 종료일')
+    parser.add_argument('--clip-bounds', type=Path, default=None,
+                        help='학습 시점 클리핑 경계 JSON (기본 {data-dir}/user_logs_clip_bounds.json)')
+    parser.add_argument('--delta', type=Path, default=None, help='하루치 user_logs CSV')
+    parser.add_argument('--export', type=Path, default=None, help='피처 테이블 parquet 출력 경로')
+    args = parser.parse_args()
+
+    if args.init:
+        bounds_path = args.clip_bounds or args.data_dir / CLIP_BOUNDS_FILENAME
+        bounds = load_clip_bounds(bounds_path) if bounds_path.exists() else None
+        if bounds is None:
+            print(f"  Warning: clip bounds not found at {bounds_path}; logs are not clipped")
+        bootstrap_state(args.data_dir, args.state_dir, pd.Timestamp(args.end_date), bounds)
+    if args.delta is not None:
+        apply_daily_delta(args.delta, args.state_dir)
+    if args.export is not None:
+        features = UserLogRingState(args.state_dir).to_frame()
+        features.to_parquet(args.export, engine='pyarrow', index=False)
+        print(f"  Saved {features.shape} to {args.export}")
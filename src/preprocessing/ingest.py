@@ -0,0 +1,475 @@
+"""
+원본 CSV → Parquet 일괄 변환 (ingest)
+=====================================
+
+목적: train_v2 / members_v3 / transactions_v2 / user_logs_v2 CSV를 한 번만 파싱해
+      좁은 dtype의 Parquet으로 저장하고, 이후 모든 로더가 컬럼 projection과
+      파티션 pruning으로 읽도록 함
+출력: {data_dir}/parquet/
+      - train_v2.parquet, members_v3.parquet, transactions_v2.parquet
+      - user_logs_v2/date=YYYYMMDD/*.parquet (날짜 파티션)
+      - msno_dict.parquet (msno ↔ msno_id 정렬 사전)
+
+dtype 규칙:
+- msno: 문자열 (Parquet dictionary encoding)
+- 플래그 (is_churn, is_auto_renew, is_cancel): uint8
+- 카운트 (num_*): uint16 (초과값은 65535로 포화)
+- total_secs: float32
+- 날짜 (YYYYMMDD): int32
+- msno_id: int32 대리키 (msno_dict.parquet 사전 기준, msno_keys 참고)
+- 결측 정수 값은 0이 아니라 Arrow null로 저장 (CSV 로드처럼 NaN으로 읽힘)
+
+좁은 dtype은 저장 / 스캔용입니다. pandas 로더(read_raw_table, iter_raw_chunks, iter_source_chunks)는
+정수 컬럼(msno_id 대리키 제외)을 int64로 넓혀 반환하므로 피처 테이블 스키마가 CSV 경로와 같습니다.
+
+사용법:
+    python src/preprocessing/ingest.py --raw-dir data
+"""
+
+import argparse
+import shutil
+import sys
+import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+from src.preprocessing.cohort import CohortFilter
+from src.preprocessing.msno_keys import (
+    ID_COLUMN,
+    KEY_COLUMN,
+    MSNO_DICT_FILENAME,
+    MsnoDictionary,
+    build_msno_dictionary,
+    load_msno_dictionary,
+)
+
+# ============================================================
+# 설정
+# ============================================================
+DATA_DIR = PROJECT_ROOT / 'data'
+PARQUET_DIRNAME = 'parquet'
+DEFAULT_CHUNKSIZE = 1_000_000
+
+# 테이블별 Arrow 스키마 (CSV 컬럼 순서와 동일)
+SCHEMAS: Dict[str, pa.Schema] = {
+    'train_v2': pa.schema([
+        ('msno', pa.string()),
+        ('is_churn', pa.uint8()),
+    ]),
+    'members_v3': pa.schema([
+        ('msno', pa.string()),
+        ('city', pa.uint8()),
+        ('bd', pa.int16()),
+        ('gender', pa.string()),
+        ('registered_via', pa.int8()),
+        ('registration_init_time', pa.int32()),
+    ]),
+    'transactions_v2': pa.schema([
+        ('msno', pa.string()),
+        ('payment_method_id', pa.uint8()),
+        ('payment_plan_days', pa.uint16()),
+        ('plan_list_price', pa.uint16()),
+        ('actual_amount_paid', pa.uint16()),
+        ('is_auto_renew', pa.uint8()),
+        ('transaction_date', pa.int32()),
+        ('membership_expire_date', pa.int32()),
+        ('is_cancel', pa.uint8()),
+    ]),
+    'user_logs_v2': pa.schema([
+        ('msno', pa.string()),
+        ('date', pa.int32()),
+        ('num_25', pa.uint16()),
+        ('num_50', pa.uint16()),
+        ('num_75', pa.uint16()),
+        ('num_985', pa.uint16()),
+        ('num_100', pa.uint16()),
+        ('num_unq', pa.uint16()),
+        ('total_secs', pa.float32()),
+    ]),
+}
+
+# 날짜 파티션 테이블
+PARTITION_COLUMNS = {'user_logs_v2': 'date'}
+
+
+# ============================================================
+# 경로 / 존재 확인
+# ============================================================
+def parquet_path(data_dir: Path, table: str) -> Path:
+    """테이블의 Parquet 경로 (파티션 테이블은 디렉토리)"""
+    base = Path(data_dir) / PARQUET_DIRNAME
+    if table in PARTITION_COLUMNS:
+        return base / table
+    return base / f'{table}.parquet'
+
+
+def has_parquet(data_dir: Path, table: str) -> bool:
+    """ingest 결과 Parquet 존재 여부"""
+    return parquet_path(data_dir, table).exists()
+
+
+def _partitioning(table: str) -> Optional[ds.Partitioning]:
+    """파티션 테이블의 hive 파티셔닝 (파티션 키 dtype 고정)"""
+    if table not in PARTITION_COLUMNS:
+        return None
+    key = PARTITION_COLUMNS[table]
+    return ds.partitioning(pa.schema([SCHEMAS[table].field(key)]), flavor='hive')
+
+
+def _dataset(path: Path, table: str) -> ds.Dataset:
+    return ds.dataset(path, format='parquet', partitioning=_partitioning(table))
+
+
+def _to_expression(filters: Optional[List[tuple]]) -> Optional[ds.Expression]:
+    """[(컬럼, 연산자, 값), ...] → Arrow 필터 식 (AND 결합)"""
+    if not filters:
+        return None
+    ops = {
+        '==': lambda f, v: f == v, '!=': lambda f, v: f != v,
+        '<': lambda f, v: f < v, '<=': lambda f, v: f <= v,
+        '>': lambda f, v: f > v, '>=': lambda f, v: f >= v,
+        'in': lambda f, v: f.isin(list(v)),
+    }
+    expr = None
+    for column, op, value in filters:
+        cond = ops[op](ds.field(column), value)
+        expr = cond if expr is None else expr & cond
+    return expr
+
+
+def _apply_filters(df: pd.DataFrame, filters: Optional[List[tuple]]) -> pd.DataFrame:
+    """CSV fallback용 pandas 필터"""
+    if not filters:
+        return df
+    mask = np.ones(len(df), dtype=bool)
+    for column, op, value in filters:
+        col = df[column]
+        if op == 'in':
+            mask &= col.isin(list(value)).to_numpy()
+        else:
+            mask &= {
+                '==': col == value, '!=': col != value,
+                '<': col < value, '<=': col <= value,
+                '>': col > value, '>=': col >= value,
+            }[op].to_numpy()
+    return df[mask]
+
+
+# ============================================================
+# 로더 (모든 전처리 진입점 공용)
+# ============================================================
+def _apply_cohort(df: pd.DataFrame, cohort: Optional[CohortFilter]) -> pd.DataFrame:
+    """코호트 밖 msno 행 제거 (msno 컬럼이 없는 projection이면 그대로)"""
+    if cohort is None or KEY_COLUMN not in df.columns:
+        return df
+    return cohort.filter(df, KEY_COLUMN)
+
+
+def _require_dictionary(data_dir: Path) -> MsnoDictionary:
+    keys = load_msno_dictionary(data_dir)
+    if keys is None:
+        raise FileNotFoundError(f"msno dictionary not found under {data_dir}. Run ingest.py first.")
+    return keys
+
+
+def _projection(dataset: ds.Dataset, columns: List[str], msno_ids: bool) -> List[str]:
+    """msno_ids=True이고 ingest된 msno_id 컬럼이 있으면 msno 대신 msno_id를 읽음"""
+    if msno_ids and ID_COLUMN in dataset.schema.names:
+        return [ID_COLUMN if c == KEY_COLUMN else c for c in columns]
+    return columns
+
+
+def _widen_integers(df: pd.DataFrame) -> pd.DataFrame:
+    """저장용 좁은 정수(uint8 / uint16 / int32 ...) → int64 (CSV 로드와 같은 dtype, 부호 없는 연산의 wrap 방지)"""
+    for col in df.columns:
+        if col != KEY_COLUMN and pd.api.types.is_integer_dtype(df[col]) and df[col].dtype != np.int64:
+            df[col] = df[col].astype(np.int64)
+    return df
+
+
+def _finish_frame(df: pd.DataFrame, columns: List[str],
+                  keys: Optional[MsnoDictionary]) -> pd.DataFrame:
+    """msno_id → msno 이름 정리 후, 아직 문자열이면 사전으로 인코딩 (정수 컬럼은 int64로)"""
+    df = _widen_integers(df.rename(columns={ID_COLUMN: KEY_COLUMN})[columns])
+    if keys is not None and KEY_COLUMN in columns and not pd.api.types.is_integer_dtype(df[KEY_COLUMN]):
+        df[KEY_COLUMN] = keys.encode(df[KEY_COLUMN])
+    return df
+
+
+def read_raw_table(data_dir: Path, table: str,
+                   columns: Optional[List[str]] = None,
+                   filters: Optional[List[tuple]] = None,
+                   msno_ids: bool = False,
+                   cohort: Optional[CohortFilter] = None) -> pd.DataFrame:
+    """
+    원본 테이블 로드 (ingest Parquet이 있으면 Parquet, 없으면 CSV)
+
+    Args:
+        data_dir: 원본 데이터 디렉토리 (CSV 및 parquet/ 하위 디렉토리 위치)
+        table: 'train_v2' | 'members_v3' | 'transactions_v2' | 'user_logs_v2'
+        columns: 읽을 컬럼 (column projection)
+        filters: [(컬럼, 연산자, 값), ...] 행 필터 (user_logs의 date 조건은 파티션 pruning)
+        msno_ids: True면 msno 컬럼을 int32 대리키로 반환 (ingest된 msno_id 컬럼 사용,
+                  없으면 msno 사전으로 인코딩)
+        cohort: 지정 시 청크 단위로 읽으며 코호트 밖 msno 행을 버림 (세미 조인 pushdown,
+                msno_ids와 같은 msno 표현으로 만든 필터)
+
+    Returns:
+        데이터프레임 (컬럼 순서는 columns 또는 원본 CSV 순서)
+    """
+    columns = columns or SCHEMAS[table].names
+    if cohort is not None:
+        parts = list(iter_raw_chunks(data_dir, table, columns, filters, msno_ids=msno_ids, cohort=cohort))
+        if not parts:
+            return pd.DataFrame(columns=columns)
+        return pd.concat(parts, ignore_index=True)
+
+    keys = _require_dictionary(data_dir) if msno_ids else None
+    if has_parquet(data_dir, table):
+        dataset = _dataset(parquet_path(data_dir, table), table)
+        df = dataset.to_table(columns=_projection(dataset, columns, msno_ids),
+                              filter=_to_expression(filters)).to_pandas()
+        return _finish_frame(df, columns, keys)
+
+    df = pd.read_csv(Path(data_dir) / f'{table}.csv', usecols=columns)[columns]
+    return _finish_frame(_apply_filters(df, filters).reset_index(drop=True), columns, keys)
+
+
+def read_raw_arrow(data_dir: Path, table: str,
+                   columns: Optional[List[str]] = None,
+                   filters: Optional[List[tuple]] = None) -> pa.Table:
+    """
+    read_raw_table()의 Arrow 버전 (pandas 변환 없이 pa.Table 반환)
+
+    Parquet은 dataset 스캔(projection + 파티션 pruning), CSV는 pyarrow.csv 멀티스레드 파서로
+    읽습니다. CSV의 타입 추론 결과는 pandas read_csv와 같습니다 (int64 / double / string).
+    """
+    columns = columns or SCHEMAS[table].names
+    if has_parquet(data_dir, table):
+        dataset = _dataset(parquet_path(data_dir, table), table)
+        return dataset.to_table(columns=columns, filter=_to_expression(filters))
+
+    from pyarrow import csv as pa_csv
+
+    result = pa_csv.read_csv(Path(data_dir) / f'{table}.csv',
+                             convert_options=pa_csv.ConvertOptions(include_columns=columns))
+    expr = _to_expression(filters)
+    return result if expr is None else result.filter(expr)
+
+
+def iter_raw_chunks(data_dir: Path, table: str,
+                    columns: Optional[List[str]] = None,
+                    filters: Optional[List[tuple]] = None,
+                    chunksize: int = DEFAULT_CHUNKSIZE,
+                    msno_ids: bool = False,
+                    cohort: Optional[CohortFilter] = None) -> Iterator[pd.DataFrame]:
+    """read_raw_table()의 청크 버전 (최대 chunksize 행씩)"""
+    if has_parquet(data_dir, table):
+        source = parquet_path(data_dir, table)
+    else:
+        source = Path(data_dir) / f'{table}.csv'
+    keys = _require_dictionary(data_dir) if msno_ids else None
+    yield from iter_source_chunks(source, table, columns, filters, chunksize, keys, cohort)
+
+
+def iter_source_chunks(source: Path, table: str,
+                       columns: Optional[List[str]] = None,
+                       filters: Optional[List[tuple]] = None,
+                       chunksize: int = DEFAULT_CHUNKSIZE,
+                       keys: Optional[MsnoDictionary] = None,
+                       cohort: Optional[CohortFilter] = None) -> Iterator[pd.DataFrame]:
+    """
+    CSV 파일 또는 ingest Parquet 경로를 청크 단위로 순회
+
+    Args:
+        source: {table}.csv 경로 또는 parquet_path()가 반환하는 경로
+        keys: 지정 시 msno 컬럼을 int32 대리키로 반환
+        cohort: 지정 시 청크마다 코호트 밖 msno 행을 버림 (이후 groupby 전에 적용)
+    """
+    columns = columns or SCHEMAS[table].names
+    source = Path(source)
+    if source.suffix != '.csv':
+        dataset = _dataset(source, table)
+        batches = dataset.to_batches(columns=_projection(dataset, columns, keys is not None),
+                                     filter=_to_expression(filters),
+                                     batch_size=chunksize)
+        for batch in batches:
+            if batch.num_rows:
+                yield _apply_cohort(_finish_frame(batch.to_pandas(), columns, keys), cohort)
+        return
+
+    for chunk in pd.read_csv(source, usecols=columns, chunksize=chunksize):
+        yield _apply_cohort(_finish_frame(_apply_filters(chunk[columns], filters), columns, keys), cohort)
+
+
+def source_files(source: Path, table: str) -> List[str]:
+    """ingest Parquet 경로의 데이터 파일 목록 (파티션 순서, 병렬 워커 분배용)"""
+    return sorted(_dataset(source, table).files)
+
+
+def iter_file_chunks(source: Path, table: str, files: List[str],
+                     columns: Optional[List[str]] = None,
+                     chunksize: int = DEFAULT_CHUNKSIZE) -> Iterator[pd.DataFrame]:
+    """
+    ingest Parquet 파일 일부(source_files()의 부분 목록)만 청크 단위로 순회
+
+    파티션 키 컬럼(user_logs의 date)은 source 기준 hive 경로에서 복원합니다.
+    """
+    columns = columns or SCHEMAS[table].names
+    dataset = ds.dataset(list(files), format='parquet', partitioning=_partitioning(table),
+                         partition_base_dir=str(source))
+    for batch in dataset.to_batches(columns=columns, batch_size=chunksize):
+        if batch.num_rows:
+            yield _finish_frame(batch.to_pandas(), columns, None)
+
+
+def date_range_filter(column: str, start: pd.Timestamp, end: pd.Timestamp) -> List[tuple]:
+    """[start, end] 날짜 조건 (YYYYMMDD 정수 비교 → 파티션 pruning 가능)"""
+    return [(column, '>=', int(start.strftime('%Y%m%d'))),
+            (column, '<=', int(end.strftime('%Y%m%d')))]
+
+
+# ============================================================
+# 변환
+# ============================================================
+def _keyed_schema(schema: pa.Schema) -> pa.Schema:
+    """msno_id 대리키 컬럼을 덧붙인 스키마"""
+    return schema.append(pa.field(ID_COLUMN, pa.int32()))
+
+
+def _to_arrow(chunk: pd.DataFrame, schema: pa.Schema,
+              keys: Optional[MsnoDictionary] = None) -> pa.Table:
+    """CSV 청크를 좁은 dtype의 Arrow 테이블로 변환 (정수 카운트는 포화 캐스팅, 결측은 null 유지)"""
+    if keys is not None:
+        chunk = chunk.assign(**{ID_COLUMN: keys.encode(chunk[KEY_COLUMN])})
+        schema = _keyed_schema(schema)
+    arrays = []
+    for field in schema:
+        col = chunk[field.name]
+        if pa.types.is_string(field.type):
+            arrays.append(pa.array(col.astype(object).where(col.notna(), None), type=field.type))
+            continue
+        missing = None
+        if pa.types.is_integer(field.type):
+            info = np.iinfo(field.type.to_pandas_dtype())
+            missing = col.isna().to_numpy()
+            if missing.any():
+                print(f"    {field.name}: {int(missing.sum()):,} missing values kept as nulls")
+            values = col.fillna(0).to_numpy()  # 자리 채움 (mask로 null 처리)
+            n_saturated = int(((values < info.min) | (values > info.max)).sum())
+            if n_saturated:
+                print(f"    Warning: {field.name} saturated {n_saturated:,} values to [{info.min}, {info.max}]")
+            values = np.clip(values, info.min, info.max).astype(field.type.to_pandas_dtype())
+        else:
+            values = col.to_numpy(dtype=field.type.to_pandas_dtype())
+        arrays.append(pa.array(values, type=field.type,
+                               mask=missing if missing is not None and missing.any() else None))
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+def ingest_table(raw_dir: Path, table: str, out_dir: Path,
+                 chunksize: int = DEFAULT_CHUNKSIZE,
+                 keys: Optional[MsnoDictionary] = None) -> int:
+    """CSV 하나를 청크 단위로 Parquet 변환 (파티션 테이블은 날짜별 디렉토리, keys 지정 시 msno_id 추가)"""
+    csv_path = Path(raw_dir) / f'{table}.csv'
+    schema = SCHEMAS[table]
+    out_schema = _keyed_schema(schema) if keys is not None else schema
+    n_rows = 0
+
+    if table in PARTITION_COLUMNS:
+        target = out_dir / table
+        if target.exists():
+            shutil.rmtree(target)  # 이전 ingest 결과의 남은 파티션 파일 제거
+        for i, chunk in enumerate(pd.read_csv(csv_path, chunksize=chunksize)):
+            ds.write_dataset(
+                _to_arrow(chunk, schema, keys), target, format='parquet',
+                partitioning=_partitioning(table),
+                basename_template=f'part-{i:05d}-{{i}}.parquet',
+                existing_data_behavior='overwrite_or_ignore',
+                file_options=ds.ParquetFileFormat().make_write_options(
+                    compression='zstd', use_dictionary=['msno']),
+            )
+            n_rows += len(chunk)
+            print(f"    chunk {i}: {n_rows:,} rows")
+        return n_rows
+
+    target = out_dir / f'{table}.parquet'
+    writer = None
+    try:
+        for chunk in pd.read_csv(csv_path, chunksize=chunksize):
+            if writer is None:
+                writer = pq.ParquetWriter(target, out_schema, compression='zstd', use_dictionary=['msno'])
+            writer.write_table(_to_arrow(chunk, schema, keys))
+            n_rows += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+    return n_rows
+
+
+def ingest_all(raw_dir: Path = DATA_DIR, out_dir: Optional[Path] = None,
+               tables: Optional[List[str]] = None,
+               chunksize: int = DEFAULT_CHUNKSIZE) -> Path:
+    """
+    원본 CSV 4종을 Parquet으로 일괄 변환
+
+    Args:
+        raw_dir: 원본 CSV 디렉토리
+        out_dir: 출력 디렉토리 (기본 {raw_dir}/parquet)
+        tables: 변환할 테이블 목록 (기본 전체)
+        chunksize: 청크당 행 수
+
+    Returns:
+        출력 디렉토리
+    """
+    raw_dir = Path(raw_dir)
+    out_dir = Path(out_dir) if out_dir is not None else raw_dir / PARQUET_DIRNAME
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    print("=" * 60)
+    print("Raw CSV Ingestion → Parquet")
+    print("=" * 60)
+
+    # msno 사전은 항상 전체 원본 테이블 기준으로 생성 (테이블 간 id 일관성)
+    print("\n[0] Building msno dictionary...")
+    keys = build_msno_dictionary(raw_dir, SCHEMAS, chunksize)
+    dict_path = out_dir / MSNO_DICT_FILENAME
+    if tables and dict_path.exists():
+        previous = MsnoDictionary.load(dict_path)
+        if len(previous) != len(keys) or (previous.msno != keys.msno).any():
+            print("  msno dictionary changed -> re-ingesting all tables to keep ids consistent")
+            tables = None
+    keys.save(dict_path)
+    print(f"  Users: {len(keys):,}")
+
+    tables = tables or list(SCHEMAS)
+    for i, table in enumerate(tables, start=1):
+        print(f"\n[{i}/{len(tables)}] {table}.csv")
+        n_rows = ingest_table(raw_dir, table, out_dir, chunksize, keys)
+        print(f"  Rows: {n_rows:,}")
+
+    print(f"\nSaved to: {out_dir}")
+    return out_dir
+
+
+# ============================================================
+# 실행
+# ============================================================
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Raw CSV → Parquet ingestion')
+    parser.add_argument('--raw-dir', type=Path, default=DATA_DIR, help='원본 CSV 디렉토리')
+    parser.add_argument('--out-dir', type=Path, default=None, help='출력 디렉토리 (기본 {raw-dir}/parquet)')
+    parser.add_argument('--tables', nargs='+', default=None, choices=list(SCHEMAS),
+                        help='변환할 테이블 (기본 전체)')
+    parser.add_argument('--chunksize', type=int, default=DEFAULT_CHUNKSIZE)
+    args = parser.parse_args()
+
+    ingest_all(args.raw_dir, args.out_dir, args.tables, args.chunksize)
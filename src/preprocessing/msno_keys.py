@@ -0,0 +1,228 @@
+"""
+msno 정수 대리키 (surrogate key) 사전
+=====================================
+
+목적: 44자 base64 문자열인 msno를 int32 대리키로 치환해
+      groupby / merge가 Python 문자열 해시·비교 대신 정수 연산으로 동작하도록 함
+
+- 사전은 ingest 시점에 4개 원본 테이블의 msno 합집합을 정렬해 만들고
+  {data_dir}/parquet/msno_dict.parquet 으로 저장 (msno_id = 정렬 순서)
+- 정렬 사전이므로 msno_id 순서 == msno 문자열 순서
+  → 정수 키로 정렬/outer merge 해도 결과 행 순서가 문자열 키와 동일
+- 파이프라인은 encode_msno()로 msno 컬럼을 int32로 치환한 뒤 집계/병합하고,
+  출력 직전에 decode_msno()로 문자열을 다시 붙임
+
+사용법:
+    keys = load_msno_dictionary(data_dir) or MsnoDictionary.from_values(train['msno'], ...)
+    train = encode_msno(train, keys)
+    df = merge_on_key(train, features, how='left')   # 정렬 배열 merge join
+    df = decode_msno(df, keys)
+"""
+
+import sys
+import pandas as pd
+import numpy as np
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+# ============================================================
+# 설정
+# ============================================================
+MSNO_DICT_FILENAME = 'msno_dict.parquet'
+KEY_COLUMN = 'msno'
+ID_COLUMN = 'msno_id'
+
+
+def dictionary_path(data_dir: Path) -> Path:
+    """msno 사전 경로 (ingest 출력 디렉토리 하위)"""
+    return Path(data_dir) / 'parquet' / MSNO_DICT_FILENAME
+
+
+# ============================================================
+# 사전
+# ============================================================
+class MsnoDictionary:
+    """
+    정렬된 msno 배열 기반 양방향 사전 (msno ↔ int32 id)
+
+    Args:
+        msno: 중복 없는 msno 문자열 배열 (정렬되어 있지 않으면 정렬)
+    """
+
+    def __init__(self, msno):
+        msno = np.asarray(msno, dtype=object)
+        if len(msno) > 1 and not (msno[1:] > msno[:-1]).all():
+            msno = np.unique(msno)
+        if len(msno) > np.iinfo(np.int32).max:
+            raise ValueError(f"Too many users for int32 ids: {len(msno):,}")
+        self.msno = msno
+        self._index: Optional[pd.Index] = None
+
+    @classmethod
+    def from_values(cls, *values: Iterable) -> 'MsnoDictionary':
+        """여러 msno 컬럼의 합집합으로 사전 생성 (ingest 사전이 없을 때의 fallback)"""
+        uniques = [pd.unique(pd.Series(v, dtype=object)) for v in values]
+        return cls(np.unique(np.concatenate(uniques)) if uniques else [])
+
+    def __len__(self) -> int:
+        return len(self.msno)
+
+    @property
+    def index(self) -> pd.Index:
+        # 해시 테이블은 첫 encode 시 한 번만 생성
+        if self._index is None:
+            self._index = pd.Index(self.msno)
+        return self._index
+
+    def encode(self, values) -> np.ndarray:
+        """msno 문자열 → int32 id (사전에 없는 msno는 -1)"""
+        return self.index.get_indexer(pd.Index(values)).astype(np.int32)
+
+    def decode(self, ids) -> np.ndarray:
+        """int32 id → msno 문자열"""
+        ids = np.asarray(ids)
+        if len(ids) and (ids < 0).any():
+            raise KeyError(f"{int((ids < 0).sum()):,} ids are not in the msno dictionary")
+        return self.msno[ids]
+
+    def save(self, path: Path) -> Path:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        pd.DataFrame({KEY_COLUMN: self.msno,
+                      ID_COLUMN: np.arange(len(self.msno), dtype=np.int32)}).to_parquet(path, index=False)
+        return path
+
+    @classmethod
+    def load(cls, path: Path) -> 'MsnoDictionary':
+        return cls(pd.read_parquet(path, columns=[KEY_COLUMN])[KEY_COLUMN].to_numpy(dtype=object))
+
+
+def load_msno_dictionary(data_dir: Path) -> Optional[MsnoDictionary]:
+    """ingest가 저장한 msno 사전 로드 (없으면 None)"""
+    path = dictionary_path(data_dir)
+    return MsnoDictionary.load(path) if path.exists() else None
+
+
+def build_msno_dictionary(raw_dir: Path, tables: Iterable[str],
+                          chunksize: int = 1_000_000) -> MsnoDictionary:
+    """원본 CSV들의 msno 컬럼만 읽어 사전 생성 (ingest 1단계)"""
+    uniques = []
+    for table in tables:
+        csv_path = Path(raw_dir) / f'{table}.csv'
+        if not csv_path.exists():
+            continue
+        for chunk in pd.read_csv(csv_path, usecols=[KEY_COLUMN], chunksize=chunksize):
+            uniques.append(chunk[KEY_COLUMN].dropna().unique())
+    return MsnoDictionary(np.unique(np.concatenate(uniques)) if uniques else [])
+
+
+# ============================================================
+# 프레임 변환
+# ============================================================
+def encode_msno(df: pd.DataFrame, keys: MsnoDictionary) -> pd.DataFrame:
+    """
+    msno 컬럼을 int32 id로 치환 (이미 정수면 그대로)
+
+    ingest Parquet을 msno_ids=True로 읽은 프레임은 이미 id이므로 재인코딩하지 않습니다.
+    사전에 없는 msno가 있으면 서로 다른 사용자가 같은 id로 합쳐지므로 KeyError를 냅니다.
+    """
+    if pd.api.types.is_integer_dtype(df[KEY_COLUMN]):
+        return df
+    ids = keys.encode(df[KEY_COLUMN])
+    if (ids < 0).any():
+        raise KeyError(f"{int((ids < 0).sum()):,} msno values are not in the msno dictionary")
+    df = df.copy()
+    df[KEY_COLUMN] = ids
+    return df
+
+
+def encode_frames(frames: List[pd.DataFrame],
+                  keys: Optional[MsnoDictionary] = None) -> Tuple[MsnoDictionary, List[pd.DataFrame]]:
+    """
+    여러 프레임의 msno를 같은 사전으로 int32 id 치환
+
+    keys가 None이면 (ingest 사전이 없는 CSV 경로) 프레임들의 msno 합집합으로 사전을 만듭니다.
+    """
+    if keys is None:
+        keys = MsnoDictionary.from_values(*[df[KEY_COLUMN] for df in frames])
+    return keys, [encode_msno(df, keys) for df in frames]
+
+
+def decode_msno(df: pd.DataFrame, keys: MsnoDictionary) -> pd.DataFrame:
+    """출력 직전 int32 id를 msno 문자열로 복원 (이미 문자열이면 그대로)"""
+    if not pd.api.types.is_integer_dtype(df[KEY_COLUMN]):
+        return df
+    df = df.copy()
+    df[KEY_COLUMN] = keys.decode(df[KEY_COLUMN].to_numpy())
+    return df
+
+
+# ============================================================
+# 정렬 배열 merge join
+# ============================================================
+def _unique_sorted(keys: np.ndarray):
+    """(정렬 순서, 정렬된 키, 중복 없음 여부)"""
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    unique = len(sorted_keys) < 2 or bool((sorted_keys[1:] != sorted_keys[:-1]).all())
+    return order, sorted_keys, unique
+
+
+def _lookup(sorted_keys: np.ndarray, order: np.ndarray, probe: np.ndarray) -> np.ndarray:
+    """probe 각 키의 원래 행 위치 (없으면 -1)"""
+    if len(sorted_keys) == 0:
+        return np.full(len(probe), -1, dtype=np.int64)
+    pos = np.minimum(np.searchsorted(sorted_keys, probe), len(sorted_keys) - 1)
+    return np.where(sorted_keys[pos] == probe, order[pos], -1)
+
+
+def _take(frame: pd.DataFrame, rows: np.ndarray) -> pd.DataFrame:
+    """행 위치로 가져오기 (-1은 NaN 행, pandas merge와 같은 dtype 승격)"""
+    frame = frame.reset_index(drop=True)
+    if (rows >= 0).all():
+        return frame.take(rows).reset_index(drop=True)
+    return frame.reindex(rows).reset_index(drop=True)
+
+
+def merge_on_key(left: pd.DataFrame, right: pd.DataFrame,
+                 on: str = KEY_COLUMN, how: str = 'left') -> pd.DataFrame:
+    """
+    정수 키 merge join (정렬 + searchsorted, 해시 조인 없음)
+
+    pandas merge와 같은 결과를 반환합니다.
+    - left / inner: left 행 순서 유지
+    - outer: 키 정렬 순서 (정렬 사전 id이므로 msno 문자열 순서와 동일)
+
+    키가 정수가 아니거나, right 키가 중복되거나(outer는 left도), 키 외 컬럼명이 겹치면
+    pandas merge로 위임합니다.
+    """
+    lk, rk = left[on].to_numpy(), right[on].to_numpy()
+    overlap = (set(left.columns) & set(right.columns)) - {on}
+    integer_keys = np.issubdtype(lk.dtype, np.integer) and np.issubdtype(rk.dtype, np.integer)
+    if how not in ('left', 'inner', 'outer') or overlap or not integer_keys:
+        return left.merge(right, on=on, how=how)
+
+    r_order, r_sorted, r_unique = _unique_sorted(rk)
+    if not r_unique:
+        return left.merge(right, on=on, how=how)
+    right_values = right.drop(columns=on)
+
+    if how == 'outer':
+        l_order, l_sorted, l_unique = _unique_sorted(lk)
+        if not l_unique:
+            return left.merge(right, on=on, how=how)
+        keys = np.union1d(l_sorted, r_sorted)
+        left_part = _take(left.drop(columns=on), _lookup(l_sorted, l_order, keys))
+        right_part = _take(right_values, _lookup(r_sorted, r_order, keys))
+        left_part.insert(list(left.columns).index(on), on, keys)
+        return pd.concat([left_part, right_part], axis=1)
+
+    rows = _lookup(r_sorted, r_order, lk)
+    if how == 'inner':
+        hit = rows >= 0
+        left, rows = left[hit], rows[hit]
+    return pd.concat([left.reset_index(drop=True), _take(right_values, rows)], axis=1)
@@ -0,0 +1,275 @@
+"""
+멀티 프로세스 CSV 리더
+======================
+
+목적: 큰 CSV(user_logs_v2.csv)를 줄 경계에 맞춘 바이트 구간으로 나누고,
+      구간마다 워커 프로세스가 직접 파싱 + 부분 집계한 뒤 결과만 병합
+
+- split_byte_ranges(): 헤더 이후를 n개의 [start, end) 바이트 구간으로 분할 (줄 경계 정렬)
+- iter_range_chunks(): 한 구간을 block_bytes 단위로 읽어 데이터프레임 청크로 변환
+- split_file_groups(): ingest Parquet 디렉토리는 데이터 파일을 크기 기준으로 n개 그룹으로 분할
+                       (워커는 자기 그룹 파일만 Arrow 배치로 읽음)
+- parallel_map_reduce(): 구간별 partial 함수를 ProcessPool에서 실행하고 merge 함수로 병합
+
+부분 결과는 사용자 수에 비례하는 작은 구조만 반환합니다.
+- msno별 최대 날짜 (last_active_gap)
+- WindowAccumulator (윈도우별 행 수/합계/제곱합 + 활동일 비트마스크)
+- 컬럼별 value_counts (이상치 클리핑 경계)
+
+주의: spawn 방식(Windows/macOS)에서는 호출 스크립트에 `if __name__ == '__main__':` 가드가 필요합니다.
+"""
+
+import io
+import os
+import sys
+import pandas as pd
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial, reduce
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+from src.preprocessing.aggregate_user_logs import OUTLIER_COLUMNS, WINDOWS
+from src.preprocessing.ingest import DEFAULT_CHUNKSIZE, iter_file_chunks, source_files
+from src.preprocessing.user_logs_streaming import (
+    WindowAccumulator,
+    bounds_from_counts,
+    merge_value_counts,
+    value_counts_partial,
+)
+
+# ============================================================
+# 설정
+# ============================================================
+DEFAULT_BLOCK_BYTES = 64 * 1024 * 1024  # 워커가 한 번에 파싱하는 바이트 수
+
+
+def default_workers() -> int:
+    return os.cpu_count() or 1
+
+
+# ============================================================
+# 바이트 구간 분할 / 읽기
+# ============================================================
+def read_header(csv_path: Path) -> Tuple[List[str], int]:
+    """(컬럼명 목록, 헤더 끝 바이트 위치)"""
+    with open(csv_path, 'rb') as f:
+        header = f.readline()
+    return header.decode('utf-8').strip().split(','), len(header)
+
+
+def _align(f, offset: int) -> int:
+    """offset 이후 첫 줄 시작 위치 (offset이 줄 중간이면 그 줄 끝까지 건너뜀)"""
+    f.seek(offset - 1)
+    if f.read(1) == b'\n':
+        return offset
+    f.readline()
+    return f.tell()
+
+
+def split_byte_ranges(csv_path: Path, n_parts: int) -> List[Tuple[int, int]]:
+    """
+    헤더 이후를 줄 경계에 맞춘 [start, end) 바이트 구간 n_parts개로 분할
+
+    구간 경계는 항상 줄 시작이므로 어떤 행도 두 구간에 걸치지 않습니다.
+    """
+    _, data_start = read_header(csv_path)
+    size = Path(csv_path).stat().st_size
+    if size <= data_start:
+        return []
+    n_parts = max(1, min(n_parts, size - data_start))
+    step = (size - data_start) / n_parts
+
+    bounds = [data_start]
+    with open(csv_path, 'rb') as f:
+        for i in range(1, n_parts):
+            cut = _align(f, data_start + int(i * step))
+            bounds.append(min(max(cut, bounds[-1]), size))
+    bounds.append(size)
+    return [(start, end) for start, end in zip(bounds[:-1], bounds[1:]) if end > start]
+
+
+def iter_range_chunks(csv_path: Path, start: int, end: int,
+                      usecols: Optional[List[str]] = None,
+                      block_bytes: int = DEFAULT_BLOCK_BYTES) -> Iterator[pd.DataFrame]:
+    """[start, end) 바이트 구간을 block_bytes 단위(줄 경계 정렬)로 파싱"""
+    names, _ = read_header(csv_path)
+    with open(csv_path, 'rb') as f:
+        f.seek(start)
+        pos = start
+        while pos < end:
+            buf = f.read(min(block_bytes, end - pos))
+            if pos + len(buf) < end and not buf.endswith(b'\n'):
+                buf += f.readline()  # 블록 끝을 줄 경계까지 확장
+            pos += len(buf)
+            if buf.strip():
+                yield pd.read_csv(io.BytesIO(buf), header=None, names=names, usecols=usecols)
+
+
+# ============================================================
+# Parquet 파일 그룹 분할
+# ============================================================
+def split_file_groups(source: Path, n_parts: int, table: str = 'user_logs_v2') -> List[List[str]]:
+    """
+    ingest Parquet 디렉토리의 데이터 파일을 누적 크기 기준 연속 그룹 n_parts개로 분할
+
+    파일 하나는 한 그룹에만 속하므로 어떤 행도 두 워커가 읽지 않습니다.
+    """
+    files = source_files(source, table)
+    if not files:
+        return []
+    sizes = np.array([Path(f).stat().st_size for f in files], dtype=np.float64)
+    n_parts = max(1, min(n_parts, len(files)))
+    before = np.cumsum(sizes) - sizes
+    group = np.minimum((before / sizes.sum() * n_parts).astype(np.int64), n_parts - 1)
+    return [[files[i] for i in np.flatnonzero(group == g)] for g in range(n_parts) if (group == g).any()]
+
+
+# ============================================================
+# map / reduce 실행기
+# ============================================================
+def _run_range(map_partial: Callable, csv_path: Path, usecols: Optional[List[str]],
+               block_bytes: int, byte_range: Tuple[int, int]):
+    start, end = byte_range
+    return map_partial(iter_range_chunks(csv_path, start, end, usecols, block_bytes))
+
+
+def _run_files(map_partial: Callable, source: Path, table: str, usecols: Optional[List[str]],
+               chunksize: int, files: List[str]):
+    return map_partial(iter_file_chunks(source, table, files, usecols, chunksize))
+
+
+def parallel_map_reduce(csv_path: Path, map_partial: Callable, merge: Callable,
+                        n_workers: Optional[int] = None,
+                        usecols: Optional[List[str]] = None,
+                        block_bytes: int = DEFAULT_BLOCK_BYTES,
+                        chunksize: int = DEFAULT_CHUNKSIZE,
+                        table: str = 'user_logs_v2'):
+    """
+    바이트 구간(CSV) 또는 파일 그룹(ingest Parquet)별로 map_partial(청크 iterator) →
+    부분 결과를 만들고 merge(a, b)로 병합
+
+    Args:
+        csv_path: CSV 파일 또는 ingest Parquet 디렉토리 (parquet_path())
+        map_partial: 청크 iterator를 받아 부분 결과를 반환하는 pickle 가능한 함수
+        merge: 부분 결과 두 개를 병합하는 함수
+        n_workers: 워커 프로세스 수 (기본 CPU 코어 수, 1이면 현재 프로세스에서 실행)
+        block_bytes: CSV 워커가 한 번에 파싱하는 바이트 수
+        chunksize: Parquet 워커의 Arrow 배치당 행 수
+        table: Parquet 입력의 ingest 테이블 이름 (파티션 키 복원용)
+    """
+    n_workers = n_workers or default_workers()
+    if Path(csv_path).suffix == '.csv':
+        ranges = split_byte_ranges(csv_path, n_workers)
+        run = partial(_run_range, map_partial, csv_path, usecols, block_bytes)
+    else:
+        ranges = split_file_groups(csv_path, n_workers, table)
+        run = partial(_run_files, map_partial, Path(csv_path), table, usecols, chunksize)
+    if n_workers == 1 or len(ranges) <= 1:
+        partials = [run(r) for r in ranges]
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            partials = list(pool.map(run, ranges))
+    return reduce(merge, partials) if partials else None
+
+
+# ============================================================
+# 부분 집계 함수 (워커에서 실행)
+# ============================================================
+def max_date_partial(chunks: Iterator[pd.DataFrame]) -> pd.Series:
+    """msno별 최대 date (YYYYMMDD 정수)"""
+    maxes = [chunk.groupby('msno')['date'].max() for chunk in chunks]
+    if not maxes:
+        return pd.Series(dtype=np.int64, name='date')
+    return pd.concat(maxes).groupby(level=0).max()
+
+
+def merge_max_dates(left: pd.Series, right: pd.Series) -> pd.Series:
+    return pd.concat([left, right]).groupby(level=0).max()
+
+
+def window_partial(chunks: Iterator[pd.DataFrame],
+                   windows: Dict[str, Tuple[pd.Timestamp, pd.Timestamp]] = WINDOWS,
+                   clip_bounds: Optional[Dict[str, Tuple[float, float]]] = None) -> WindowAccumulator:
+    """구간 하나의 WindowAccumulator"""
+    acc = WindowAccumulator(windows=windows, clip_bounds=clip_bounds)
+    for chunk in chunks:
+        acc.update(chunk)
+    return acc
+
+
+def merge_accumulators(left: WindowAccumulator, right: WindowAccumulator) -> WindowAccumulator:
+    return left.merge(right)
+
+
+# ============================================================
+# 진입점
+# ============================================================
+def parallel_last_active_dates(csv_path: Path, n_workers: Optional[int] = None,
+                               block_bytes: int = DEFAULT_BLOCK_BYTES) -> pd.DataFrame:
+    """
+    msno별 마지막 활동일 (build_features_v4의 last_active_gap 계산용)
+
+    Returns:
+        msno, date(YYYYMMDD 정수) 컬럼 데이터프레임
+    """
+    last = parallel_map_reduce(csv_path, max_date_partial, merge_max_dates,
+                               n_workers, usecols=['msno', 'date'], block_bytes=block_bytes)
+    if last is None:
+        return pd.DataFrame(columns=['msno', 'date'])
+    return last.rename_axis('msno').reset_index(name='date')
+
+
+def parallel_clip_bounds(csv_path: Path, columns: List[str] = OUTLIER_COLUMNS,
+                         lower_pct: float = 0.001, upper_pct: float = 0.999,
+                         n_workers: Optional[int] = None,
+                         block_bytes: int = DEFAULT_BLOCK_BYTES,
+                         chunksize: int = DEFAULT_CHUNKSIZE) -> Dict[str, Tuple[float, float]]:
+    """compute_clip_bounds(method='exact')의 병렬 버전 (value_counts 병합)"""
+    counts = parallel_map_reduce(csv_path, partial(value_counts_partial, columns=columns),
+                                 merge_value_counts, n_workers, usecols=columns,
+                                 block_bytes=block_bytes, chunksize=chunksize)
+    return bounds_from_counts(counts or {}, lower_pct, upper_pct)
+
+
+def aggregate_all_windows_parallel(csv_path: Path, n_workers: Optional[int] = None,
+                                   clip_bounds: Optional[Dict[str, Tuple[float, float]]] = None,
+                                   windows: Dict[str, Tuple[pd.Timestamp, pd.Timestamp]] = WINDOWS,
+                                   block_bytes: int = DEFAULT_BLOCK_BYTES,
+                                   chunksize: int = DEFAULT_CHUNKSIZE) -> pd.DataFrame:
+    """
+    aggregate_all_windows_streaming()의 병렬 버전
+
+    Args:
+        csv_path: user_logs_v2.csv 경로 또는 ingest Parquet 디렉토리
+        n_workers: 워커 프로세스 수 (기본 CPU 코어 수)
+        clip_bounds: 학습 시점 이상치 클리핑 경계 (None이면 병렬 exact 분위수로 계산)
+
+    Returns:
+        aggregate_all_windows()와 동일한 컬럼의 집계 데이터프레임
+        (적용된 경계는 result.attrs['clip_bounds']에 기록)
+    """
+    n_workers = n_workers or default_workers()
+    if clip_bounds is None:
+        print(f"  Computing outlier clip bounds (parallel exact, {n_workers} workers)...")
+        clip_bounds = parallel_clip_bounds(csv_path, n_workers=n_workers, block_bytes=block_bytes,
+                                           chunksize=chunksize)
+    for col, (lower, upper) in clip_bounds.items():
+        print(f"  {col}: clip to [{lower:.2f}, {upper:.2f}]")
+
+    unit = 'byte ranges' if Path(csv_path).suffix == '.csv' else 'Parquet file groups'
+    print(f"  Aggregating {n_workers} {unit} in parallel...")
+    acc = parallel_map_reduce(csv_path, partial(window_partial, windows=windows, clip_bounds=clip_bounds),
+                              merge_accumulators, n_workers, block_bytes=block_bytes, chunksize=chunksize)
+    if acc is None:
+        acc = WindowAccumulator(windows=windows, clip_bounds=clip_bounds)
+    print(f"  Merged partials: {acc.n_rows:,} rows, {len(acc.index):,} users")
+
+    result = acc.to_frame()
+    result.attrs['clip_bounds'] = clip_bounds
+    print(f"  Combined shape: {result.shape}")
+    return result
@@ -0,0 +1,342 @@
+"""
+User Logs 병합 가능 부분 집계 (분산 집계)
+==========================================
+
+목적: std_secs / nunique(date)처럼 샤드 간에 바로 합칠 수 없는 윈도우 집계를
+      병합 가능한 상태(mergeable state)로 표현해, 원본 로그를 여러 머신(또는 한 머신의
+      여러 프로세스)으로 나눠 집계한 뒤 정확히 합치도록 함
+
+상태 (msno × 윈도우 한 행):
+- count: 윈도우 내 행 수
+- sum_total_secs, sum_num_25 ~ sum_num_unq: 합계
+- sumsq_total_secs: total_secs 제곱합 (표본 표준편차)
+- day_mask: 윈도우 시작일 기준 활동일 비트마스크 (bit i = 시작일 + i일, OR 병합)
+- max_date: 윈도우 내 마지막 활동일 (int32 일자 서수, calendar_utils)
+
+합계/행 수/비트마스크/최대값은 결합 법칙을 만족하므로 샤드 분할 방식과 무관하게 같은 상태가
+됩니다 (실수 합계만 합산 순서에 따른 마지막 비트 차이). 샤드는 같은 클리핑 경계를 써야 하며,
+경계와 윈도우는 Parquet 메타데이터에 기록되어 reduce 시 검증됩니다.
+
+사용법:
+    # 샤드별 (머신마다) 부분 집계
+    python src/preprocessing/partial_aggregates.py map --source data/user_logs_v2.csv \\
+        --shard 0 --num-shards 4 --out partials/part-00000.parquet
+    # 부분 집계 병합 → *_w7 ~ *_w30 피처
+    python src/preprocessing/partial_aggregates.py reduce --partials partials/*.parquet \\
+        --out data/user_logs_features.parquet
+    # 한 머신에서 프로세스 샤드로 map + reduce
+    python src/preprocessing/partial_aggregates.py local --data-dir data --num-shards 4
+"""
+
+import argparse
+import json
+import sys
+import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+from src.preprocessing.activity_bitmask import activity_features, truncate_mask
+from src.preprocessing.aggregate_user_logs import (
+    CLIP_BOUNDS_FILENAME,
+    DATA_DIR,
+    WINDOWS,
+    cast_count_columns,
+    derive_window_features,
+    load_clip_bounds,
+)
+from src.preprocessing.calendar_utils import day_of
+from src.preprocessing.parallel_csv import (
+    DEFAULT_BLOCK_BYTES,
+    default_workers,
+    iter_range_chunks,
+    parallel_clip_bounds,
+    split_byte_ranges,
+    window_partial,
+)
+from src.preprocessing.sketches import bit_length
+from src.preprocessing.user_logs_streaming import (
+    DEFAULT_CHUNKSIZE,
+    LOG_COLUMNS,
+    SUM_COLUMNS,
+    WindowAccumulator,
+    base_frame_from_state,
+    iter_user_log_chunks,
+)
+
+# ============================================================
+# 설정
+# ============================================================
+SUM_STATE_COLUMNS = [f'sum_{col}' for col in SUM_COLUMNS]
+STATE_COLUMNS = ['msno', 'window', 'count'] + SUM_STATE_COLUMNS + ['sumsq_total_secs', 'day_mask', 'max_date']
+METADATA_KEY = b'user_logs_partial'
+FORMAT_VERSION = 1
+
+
+def _windows_meta(windows: Dict[str, Tuple[pd.Timestamp, pd.Timestamp]]) -> List[list]:
+    return [[name, str(pd.Timestamp(start).date()), str(pd.Timestamp(end).date())]
+            for name, (start, end) in windows.items()]
+
+
+def _bounds_meta(clip_bounds: Optional[Dict[str, Tuple[float, float]]]) -> Dict[str, list]:
+    return {col: [float(lower), float(upper)] for col, (lower, upper) in (clip_bounds or {}).items()}
+
+
+# ============================================================
+# 상태 변환 / 병합
+# ============================================================
+def state_from_accumulator(acc: WindowAccumulator) -> pd.DataFrame:
+    """WindowAccumulator → (msno, 윈도우)별 병합 가능 상태 (행 수 0인 조합은 제외)"""
+    n_users = len(acc.index)
+    msno = acc.index.msno
+    day_mask = acc.day_mask[:n_users]
+    frames = []
+    for name, (start, end) in acc.offsets.items():
+        count = acc.count[name][:n_users]
+        rows = np.flatnonzero(count > 0)
+        width = end - start + 1
+        mask = (day_mask[rows] >> np.uint64(start)) & np.uint64((1 << width) - 1)
+        frame = pd.DataFrame({'msno': msno[rows], 'window': name, 'count': count[rows]})
+        for j, col in enumerate(SUM_STATE_COLUMNS):
+            frame[col] = acc.sums[name][rows, j]
+        frame['sumsq_total_secs'] = acc.sumsq[name][rows]
+        frame['day_mask'] = mask
+        frame['max_date'] = (day_of(acc.base_date) + start + bit_length(mask) - 1).astype(np.int32)
+        frames.append(frame)
+    if not frames:
+        return empty_state()
+    state = pd.concat(frames, ignore_index=True)
+    return state.sort_values(['msno', 'window'], kind='stable').reset_index(drop=True)
+
+
+def empty_state() -> pd.DataFrame:
+    state = pd.DataFrame({col: pd.Series(dtype=np.float64) for col in STATE_COLUMNS})
+    return state.astype({'msno': object, 'window': object, 'count': np.int64,
+                         'day_mask': np.uint64, 'max_date': np.int32})
+
+
+def merge_states(states: List[pd.DataFrame]) -> pd.DataFrame:
+    """
+    부분 상태 병합: 합계/행 수는 더하고, 비트마스크는 OR, max_date는 최대값
+
+    (msno, window)로 정렬한 뒤 그룹 경계에서 reduceat으로 한 번에 병합합니다.
+    """
+    states = [s for s in states if len(s)]
+    if not states:
+        return empty_state()
+    df = pd.concat(states, ignore_index=True).sort_values(['msno', 'window'], kind='stable')
+    msno = df['msno'].to_numpy()
+    window = df['window'].to_numpy()
+    starts = np.flatnonzero(np.r_[True, (msno[1:] != msno[:-1]) | (window[1:] != window[:-1])])
+
+    merged = pd.DataFrame({'msno': msno[starts], 'window': window[starts]})
+    merged['count'] = np.add.reduceat(df['count'].to_numpy(dtype=np.int64), starts)
+    for col in SUM_STATE_COLUMNS + ['sumsq_total_secs']:
+        merged[col] = np.add.reduceat(df[col].to_numpy(dtype=np.float64), starts)
+    merged['day_mask'] = np.bitwise_or.reduceat(df['day_mask'].to_numpy(dtype=np.uint64), starts)
+    merged['max_date'] = np.maximum.reduceat(df['max_date'].to_numpy(dtype=np.int32), starts)
+    return merged
+
+
+def features_from_state(state: pd.DataFrame,
+                        windows: Dict[str, Tuple[pd.Timestamp, pd.Timestamp]] = WINDOWS) -> pd.DataFrame:
+    """병합된 상태 → aggregate_all_windows()와 같은 컬럼/순서의 *_w7 ~ *_w30 피처"""
+    users = np.unique(state['msno'].to_numpy()) if len(state) else np.array([], dtype=object)
+    n = len(users)
+    first = min(day_of(start) for start, _ in windows.values())
+    n_days = max(day_of(end) for _, end in windows.values()) - first + 1
+    day_mask = np.zeros(n, dtype=np.uint64)
+    result = None
+    for name, (start, _) in windows.items():
+        sub = state[state['window'] == name]
+        pos = np.searchsorted(users, sub['msno'].to_numpy())
+        count = np.zeros(n, dtype=np.int64)
+        sums = np.zeros((n, len(SUM_COLUMNS)), dtype=np.float64)
+        sumsq = np.zeros(n, dtype=np.float64)
+        active = np.zeros(n, dtype=np.int64)
+        count[pos] = sub['count'].to_numpy()
+        sums[pos] = sub[SUM_STATE_COLUMNS].to_numpy(dtype=np.float64)
+        sumsq[pos] = sub['sumsq_total_secs'].to_numpy()
+        active[pos] = np.bitwise_count(sub['day_mask'].to_numpy(dtype=np.uint64))
+        day_mask[pos] |= sub['day_mask'].to_numpy(dtype=np.uint64) << np.uint64(day_of(start) - first)
+
+        window_agg = derive_window_features(base_frame_from_state(users, count, sums, sumsq, active), name)
+        result = window_agg if result is None else pd.concat([result, window_agg.drop(columns='msno')], axis=1)
+
+    # 윈도우 마스크를 구간 시작일 기준으로 OR → 최근성 피처
+    mask, mask_days = truncate_mask(day_mask, n_days)
+    result = pd.concat([result, activity_features(users, mask, mask_days).drop(columns='msno')], axis=1)
+    return cast_count_columns(result.fillna(0))
+
+
+# ============================================================
+# Parquet 부분 집계 파일
+# ============================================================
+def write_partial(state: pd.DataFrame, path: Path,
+                  windows: Dict[str, Tuple[pd.Timestamp, pd.Timestamp]],
+                  clip_bounds: Optional[Dict[str, Tuple[float, float]]],
+                  n_rows: int) -> Path:
+    """상태를 Parquet으로 저장 (윈도우 / 클리핑 경계 / 원본 행 수는 스키마 메타데이터)"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    meta = {'version': FORMAT_VERSION, 'windows': _windows_meta(windows),
+            'clip_bounds': _bounds_meta(clip_bounds), 'rows': int(n_rows)}
+    table = pa.Table.from_pandas(state[STATE_COLUMNS], preserve_index=False)
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}),
+                                           METADATA_KEY: json.dumps(meta).encode()})
+    pq.write_table(table, path, compression='zstd')
+    return path
+
+
+def read_partial(path: Path) -> Tuple[pd.DataFrame, dict]:
+    """(상태, 메타데이터)"""
+    table = pq.read_table(path)
+    metadata = table.schema.metadata or {}
+    if METADATA_KEY not in metadata:
+        raise ValueError(f"{path} is not a user_logs partial aggregate")
+    return table.to_pandas(), json.loads(metadata[METADATA_KEY])
+
+
+def aggregate_shard(source: Path, out_path: Path,
+                    windows: Dict[str, Tuple[pd.Timestamp, pd.Timestamp]] = WINDOWS,
+                    clip_bounds: Optional[Dict[str, Tuple[float, float]]] = None,
+                    byte_range: Optional[Tuple[int, int]] = None,
+                    chunksize: int = DEFAULT_CHUNKSIZE,
+                    block_bytes: int = DEFAULT_BLOCK_BYTES) -> Path:
+    """
+    샤드 하나의 부분 집계 → Parquet (map 단계)
+
+    Args:
+        source: user_logs CSV (또는 샤드 전용 CSV / ingest Parquet 디렉토리)
+        byte_range: CSV의 [start, end) 바이트 구간 (None이면 source 전체)
+    """
+    if byte_range is not None:
+        chunks = iter_range_chunks(source, byte_range[0], byte_range[1], LOG_COLUMNS, block_bytes)
+    else:
+        chunks = iter_user_log_chunks(source, chunksize)
+    acc = window_partial(chunks, windows=windows, clip_bounds=clip_bounds)
+    return write_partial(state_from_accumulator(acc), out_path, windows, clip_bounds, acc.n_rows)
+
+
+def reduce_partials(paths: List[Path]) -> pd.DataFrame:
+    """
+    부분 집계 파일 병합 → 피처 (reduce 단계)
+
+    모든 파일의 윈도우 / 클리핑 경계가 같아야 합니다 (다르면 ValueError).
+    """
+    if not paths:
+        raise ValueError("No partial aggregates to reduce")
+    states, meta = [], None
+    n_rows = 0
+    for path in paths:
+        state, part_meta = read_partial(path)
+        if meta is None:
+            meta = part_meta
+        elif (part_meta['windows'], part_meta['clip_bounds']) != (meta['windows'], meta['clip_bounds']):
+            raise ValueError(f"{path} was aggregated with different windows or clip bounds")
+        states.append(state)
+        n_rows += part_meta['rows']
+
+    windows = {name: (pd.Timestamp(start), pd.Timestamp(end)) for name, start, end in meta['windows']}
+    state = merge_states(states)
+    print(f"  Merged {len(paths)} partials: {n_rows:,} rows, {state['msno'].nunique():,} users")
+    features = features_from_state(state, windows)
+    features.attrs['clip_bounds'] = {col: tuple(b) for col, b in meta['clip_bounds'].items()}
+    return features
+
+
+def aggregate_local_shards(csv_path: Path, partial_dir: Path,
+                           n_shards: Optional[int] = None,
+                           clip_bounds: Optional[Dict[str, Tuple[float, float]]] = None,
+                           windows: Dict[str, Tuple[pd.Timestamp, pd.Timestamp]] = WINDOWS,
+                           block_bytes: int = DEFAULT_BLOCK_BYTES) -> pd.DataFrame:
+    """
+    한 머신에서 바이트 구간 샤드를 프로세스별로 map → 부분 집계 파일 → reduce
+    (여러 머신 분산 실행의 로컬 대용)
+    """
+    n_shards = n_shards or default_workers()
+    if clip_bounds is None:
+        print(f"  Computing outlier clip bounds (parallel exact, {n_shards} workers)...")
+        clip_bounds = parallel_clip_bounds(csv_path, n_workers=n_shards, block_bytes=block_bytes)
+
+    ranges = split_byte_ranges(csv_path, n_shards)
+    paths = [Path(partial_dir) / f'part-{i:05d}.parquet' for i in range(len(ranges))]
+    run = partial(aggregate_shard, csv_path, windows=windows, clip_bounds=clip_bounds,
+                  block_bytes=block_bytes)
+    print(f"  Aggregating {len(ranges)} shards -> {partial_dir}")
+    if len(ranges) <= 1:
+        for path, byte_range in zip(paths, ranges):
+            run(path, byte_range=byte_range)
+    else:
+        with ProcessPoolExecutor(max_workers=len(ranges)) as pool:
+            list(pool.map(_run_shard, [run] * len(ranges), paths, ranges))
+    return reduce_partials(paths)
+
+
+def _run_shard(run, path: Path, byte_range: Tuple[int, int]) -> Path:
+    return run(path, byte_range=byte_range)
+
+
+# ============================================================
+# 실행
+# ============================================================
+def _resolve_clip_bounds(path: Optional[Path], data_dir: Path) -> Optional[Dict[str, Tuple[float, float]]]:
+    path = path or Path(data_dir) / CLIP_BOUNDS_FILENAME
+    return load_clip_bounds(path) if path.exists() else None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Mergeable user_logs partial aggregates (map / reduce)')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    map_parser = sub.add_parser('map', help='샤드 하나의 부분 집계 파일 생성')
+    map_parser.add_argument('--source', type=Path, required=True, help='user_logs CSV (또는 샤드 파일)')
+    map_parser.add_argument('--out', type=Path, required=True)
+    map_parser.add_argument('--shard', type=int, default=None, help='CSV 바이트 구간 샤드 번호 (0부터)')
+    map_parser.add_argument('--num-shards', type=int, default=None)
+    map_parser.add_argument('--clip-bounds', type=Path, required=True,
+                            help='모든 샤드가 공유할 클리핑 경계 JSON (aggregate_user_logs.py 출력)')
+
+    reduce_parser = sub.add_parser('reduce', help='부분 집계 파일 병합 → 피처')
+    reduce_parser.add_argument('--partials', type=Path, nargs='+', required=True)
+    reduce_parser.add_argument('--out', type=Path, required=True)
+
+    local_parser = sub.add_parser('local', help='한 머신에서 프로세스 샤드로 map + reduce')
+    local_parser.add_argument('--data-dir', type=Path, default=DATA_DIR)
+    local_parser.add_argument('--num-shards', type=int, default=None)
+    local_parser.add_argument('--partial-dir', type=Path, default=None,
+                              help='부분 집계 디렉토리 (기본 {data-dir}/user_logs_partials)')
+    local_parser.add_argument('--clip-bounds', type=Path, default=None)
+    local_parser.add_argument('--out', type=Path, default=None,
+                              help='피처 Parquet (기본 {data-dir}/user_logs_features_sharded.parquet)')
+    args = parser.parse_args()
+
+    if args.command == 'map':
+        byte_range = None
+        if args.shard is not None:
+            if args.num_shards is None:
+                parser.error('--shard requires --num-shards')
+            ranges = split_byte_ranges(args.source, args.num_shards)
+            byte_range = ranges[args.shard] if args.shard < len(ranges) else (0, 0)
+        path = aggregate_shard(args.source, args.out, clip_bounds=load_clip_bounds(args.clip_bounds),
+                               byte_range=byte_range)
+        print(f"Saved partial: {path}")
+    elif args.command == 'reduce':
+        features = reduce_partials(args.partials)
+        features.to_parquet(args.out, engine='pyarrow', index=False)
+        print(f"Saved features {features.shape}: {args.out}")
+    else:
+        partial_dir = args.partial_dir or args.data_dir / 'user_logs_partials'
+        features = aggregate_local_shards(args.data_dir / 'user_logs_v2.csv', partial_dir, args.num_shards,
+                                          _resolve_clip_bounds(args.clip_bounds, args.data_dir))
+        out = args.out or args.data_dir / 'user_logs_features_sharded.parquet'
+        features.to_parquet(out, engine='pyarrow', index=False)
+        print(f"Saved features {features.shape}: {out}")
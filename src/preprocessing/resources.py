@@ -0,0 +1,290 @@
+"""
+메모리 예산 기반 실행 도구
+==========================
+
+목적: 같은 파이프라인을 8GB 워커와 64GB 서버에서 모두 돌릴 수 있도록
+      --memory-budget 하나로 청크 크기 / 부분 집계 스필을 조정하고,
+      번호 붙은 단계("[1/5] Loading...")마다 소요 시간과 최대 RSS를 보고
+
+- parse_memory_budget(): '8GB', '512MB', '2g', '1073741824' → 바이트
+- chunksize_for_budget(): 측정한 행당 바이트(memory_usage(deep=True))로 청크 행 수 결정
+- SpillingReducer: 청크별 부분 집계를 모으다 예산을 넘으면 병합(compaction)하고,
+  병합 후에도 크면 Parquet으로 디스크에 내려 마지막에 하나씩 다시 병합
+- StageProfiler: 단계 시작/종료 시점의 경과 시간 + 단계 구간 최대 RSS
+
+RSS는 Linux /proc/self/status (VmRSS, VmHWM)를 읽습니다. 단계별 최대값은
+/proc/self/clear_refs로 VmHWM을 초기화해 측정하며, 초기화할 수 없는 환경에서는
+프로세스 전체 최대값(resource.getrusage)을 보고합니다.
+"""
+
+import io
+import re
+import shutil
+import sys
+import tempfile
+import time
+import pandas as pd
+from pathlib import Path
+from typing import Callable, List, Optional
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+from src.preprocessing.ingest import iter_source_chunks
+
+# ============================================================
+# 설정
+# ============================================================
+# 청크 하나에 쓰는 예산 비율 (groupby/merge 임시 배열 + 누적 상태 여유분)
+CHUNK_BUDGET_FRACTION = 0.125
+# 청크별 부분 집계를 메모리에 쌓아 둘 수 있는 예산 비율
+SPILL_BUDGET_FRACTION = 0.25
+MIN_CHUNKSIZE = 10_000
+MAX_CHUNKSIZE = 50_000_000
+SAMPLE_ROWS = 100_000
+
+_UNITS = {'': 1, 'B': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+
+
+def parse_memory_budget(text) -> Optional[int]:
+    """'8GB' / '512M' / '1.5g' / 바이트 정수 → 바이트 (None이면 None)"""
+    if text is None or isinstance(text, int):
+        return text
+    match = re.fullmatch(r'\s*([\d.]+)\s*([KMGT]?)I?B?\s*', str(text).upper())
+    if match is None:
+        raise ValueError(f"Invalid memory budget: {text!r} (e.g. '8GB', '512MB')")
+    return int(float(match.group(1)) * _UNITS[match.group(2)])
+
+
+def format_bytes(n: Optional[float]) -> str:
+    if n is None:
+        return 'n/a'
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if abs(n) < 1024:
+            return f"{n:.1f} {unit}"
+        n /= 1024
+    return f"{n:.1f} TB"
+
+
+# ============================================================
+# RSS 측정
+# ============================================================
+def _proc_status_kb(field: str) -> Optional[int]:
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def current_rss() -> Optional[int]:
+    """현재 RSS (바이트, 측정 불가면 None)"""
+    return _proc_status_kb('VmRSS')
+
+
+def peak_rss() -> Optional[int]:
+    """마지막 초기화 이후 최대 RSS (바이트)"""
+    peak = _proc_status_kb('VmHWM')
+    if peak is not None:
+        return peak
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+
+def reset_peak_rss() -> bool:
+    """VmHWM을 현재 RSS로 초기화 (Linux 4.0+), 성공 여부 반환"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+class StageProfiler:
+    """
+    번호 붙은 파이프라인 단계별 소요 시간 / 최대 RSS 기록
+
+    사용법:
+        stages = StageProfiler()
+        stages.begin('[1/5] Loading')
+        ...
+        stages.begin('[2/5] Aggregating')   # 이전 단계 종료 + 보고
+        ...
+        stages.finish()                     # 마지막 단계 종료 + 요약 표
+    """
+
+    def __init__(self, verbose: bool = True):
+        self.verbose = verbose
+        self.records: List[dict] = []
+        self._label: Optional[str] = None
+        self._started = 0.0
+        self._per_stage = False
+
+    def begin(self, label: str) -> None:
+        self.end()
+        self._label = label
+        self._per_stage = reset_peak_rss()
+        self._started = time.perf_counter()
+
+    def end(self) -> None:
+        if self._label is None:
+            return
+        record = {
+            'stage': self._label,
+            'seconds': time.perf_counter() - self._started,
+            'peak_rss': peak_rss(),
+            'per_stage_peak': self._per_stage,
+        }
+        self.records.append(record)
+        self._label = None
+        if self.verbose:
+            scope = '' if record['per_stage_peak'] else ' (process)'
+            print(f"  -> {record['stage']}: {record['seconds']:.1f}s, "
+                  f"peak RSS{scope} {format_bytes(record['peak_rss'])}")
+
+    def finish(self) -> pd.DataFrame:
+        """마지막 단계를 닫고 단계별 요약 반환/출력"""
+        self.end()
+        report = pd.DataFrame(self.records, columns=['stage', 'seconds', 'peak_rss', 'per_stage_peak'])
+        if self.verbose and len(report):
+            print("\n[Stage Report]")
+            for row in report.itertuples():
+                print(f"  {row.stage:<40s} {row.seconds:8.1f}s  {format_bytes(row.peak_rss):>10s}")
+        return report
+
+
+# ============================================================
+# 청크 크기
+# ============================================================
+def frame_bytes(df: pd.DataFrame) -> int:
+    """문자열(object) 컬럼을 포함한 실제 메모리 사용량"""
+    return int(df.memory_usage(deep=True, index=True).sum())
+
+
+def measure_bytes_per_row(source: Path, table: str, columns: Optional[List[str]] = None,
+                          filters: Optional[List[tuple]] = None,
+                          sample_rows: int = SAMPLE_ROWS) -> float:
+    """원본(CSV 또는 ingest Parquet)의 첫 sample_rows 행으로 행당 메모리 바이트 측정"""
+    for chunk in iter_source_chunks(source, table, columns, filters, chunksize=sample_rows):
+        if len(chunk):
+            return frame_bytes(chunk) / len(chunk)
+    return 0.0
+
+
+def chunksize_for_budget(bytes_per_row: float, memory_budget: int,
+                         fraction: float = CHUNK_BUDGET_FRACTION) -> int:
+    """예산의 fraction을 청크 하나에 쓰도록 청크 행 수 결정"""
+    if bytes_per_row <= 0:
+        return MAX_CHUNKSIZE
+    rows = int(memory_budget * fraction / bytes_per_row)
+    return max(MIN_CHUNKSIZE, min(rows, MAX_CHUNKSIZE))
+
+
+def plan_chunksize(source: Path, table: str, columns: Optional[List[str]],
+                   memory_budget: Optional[int], default: int,
+                   filters: Optional[List[tuple]] = None) -> int:
+    """memory_budget이 있으면 측정한 행당 바이트로 청크 크기 결정, 없으면 default"""
+    if memory_budget is None:
+        return default
+    bytes_per_row = measure_bytes_per_row(source, table, columns, filters)
+    chunksize = chunksize_for_budget(bytes_per_row, memory_budget)
+    print(f"  Memory budget {format_bytes(memory_budget)}: {bytes_per_row:.0f} bytes/row "
+          f"-> chunksize {chunksize:,}")
+    return chunksize
+
+
+def spill_budget(memory_budget: Optional[int]) -> Optional[int]:
+    """부분 집계 누적에 쓸 예산 (SpillingReducer budget_bytes)"""
+    return None if memory_budget is None else int(memory_budget * SPILL_BUDGET_FRACTION)
+
+
+def csv_block_bytes_for_budget(csv_path: Path, memory_budget: int, n_workers: int,
+                               sample_bytes: int = 4 * 1024 * 1024) -> int:
+    """
+    병렬 CSV 리더의 워커별 블록 바이트 (CSV 텍스트 → 데이터프레임 팽창 비율을 표본으로 측정)
+    """
+    with open(csv_path, 'rb') as f:
+        sample = f.read(sample_bytes)
+    sample = sample[:sample.rfind(b'\n') + 1]
+    frame = pd.read_csv(io.BytesIO(sample))
+    expansion = max(frame_bytes(frame) / max(len(sample), 1), 1.0)
+    block = int(memory_budget * CHUNK_BUDGET_FRACTION / max(n_workers, 1) / expansion)
+    return max(block, 1024 * 1024)
+
+
+# ============================================================
+# 부분 집계 스필
+# ============================================================
+class SpillingReducer:
+    """
+    청크별 부분 집계(데이터프레임)를 모아 combine으로 병합
+
+    budget_bytes를 넘으면 메모리의 부분 결과를 먼저 combine으로 압축하고,
+    압축 후에도 예산의 절반을 넘으면 Parquet 파일로 스필합니다.
+    result()는 메모리 부분 결과와 스필 파일을 하나씩 읽어 차례로 병합합니다.
+
+    Args:
+        combine: 부분 결과 목록 → 병합된 부분 결과 (결합 법칙을 만족해야 함, 예: groupby max/sum)
+        budget_bytes: 부분 결과에 쓸 수 있는 메모리 (None이면 스필 없이 마지막에 한 번 병합)
+        spill_dir: 스필 파일 디렉토리 (None이면 임시 디렉토리)
+    """
+
+    def __init__(self, combine: Callable[[List[pd.DataFrame]], pd.DataFrame],
+                 budget_bytes: Optional[int] = None, spill_dir: Optional[Path] = None):
+        self.combine = combine
+        self.budget_bytes = budget_bytes
+        self._spill_dir = Path(spill_dir) if spill_dir is not None else None
+        self._own_dir = False
+        self._parts: List[pd.DataFrame] = []
+        self._bytes = 0
+        self.spilled: List[Path] = []
+
+    def add(self, partial: pd.DataFrame) -> None:
+        self._parts.append(partial)
+        if self.budget_bytes is None:
+            return
+        self._bytes += frame_bytes(partial)
+        if self._bytes > self.budget_bytes:
+            self._compact()
+
+    def _compact(self) -> None:
+        merged = self.combine(self._parts)
+        size = frame_bytes(merged)
+        if size > self.budget_bytes / 2:
+            self._spill(merged)
+            self._parts, self._bytes = [], 0
+        else:
+            self._parts, self._bytes = [merged], size
+
+    def _spill(self, frame: pd.DataFrame) -> None:
+        if self._spill_dir is None:
+            self._spill_dir = Path(tempfile.mkdtemp(prefix='spill_'))
+            self._own_dir = True
+        self._spill_dir.mkdir(parents=True, exist_ok=True)
+        path = self._spill_dir / f'part_{len(self.spilled):05d}.parquet'
+        frame.to_parquet(path, engine='pyarrow', index=False)
+        self.spilled.append(path)
+        print(f"  Spilled partial aggregate {len(self.spilled)} ({format_bytes(frame_bytes(frame))}) to {path}")
+
+    def result(self) -> Optional[pd.DataFrame]:
+        """모든 부분 결과 병합 (스필 파일은 읽은 뒤 삭제)"""
+        running = self.combine(self._parts) if self._parts else None
+        self._parts, self._bytes = [], 0
+        for path in self.spilled:
+            part = pd.read_parquet(path)
+            running = part if running is None else self.combine([running, part])
+            path.unlink()
+        self.spilled = []
+        if self._own_dir:
+            shutil.rmtree(self._spill_dir, ignore_errors=True)
+            self._spill_dir, self._own_dir = None, False
+        return running
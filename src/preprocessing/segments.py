@@ -0,0 +1,353 @@
+"""
+키별 세그먼트 연산
+==================
+
+목적: "msno별, 그 사용자의 정렬된 행에 대해" 계산하는 피처(마지막/첫 값, 개수, 합계,
+      연속 거래 간격, 최대 공백, 취소 횟수 ...)를 피처마다 pandas groupby를 따로 돌리는 대신
+      (정렬된 키, 값) 배열 위의 numpy 세그먼트 연산으로 계산
+
+- 세그먼트: 정렬된 키 배열에서 같은 키가 이어지는 구간 [starts[i], starts[i + 1])
+  (마지막 세그먼트는 배열 끝까지, starts 앞쪽 행은 무시 → 결측 키 행을 앞에 둘 수 있음)
+- segment_*(values, starts): np.ufunc.reduceat / 경계 마스크 기반 (정렬 없음)
+- KeySegments: (키, 정수 기준) 합성 값 정렬 1회 → 키별 세그먼트
+  - gather(): 컬럼을 (키, 기준) 순서로 재배열 (안정 정렬, 같은 기준 값은 원래 순서)
+  - count_since(): 여러 하한(예: 기준일 - 30/90/180일)의 키별 행 수를 searchsorted 한 번으로 계산
+  - select(): 기준 값 구간 [lo, hi] 행만 골라 다시 세그먼트로 (윈도우 집계용)
+- latest_index(): 키별 정렬 기준이 최대인 행 위치 (동률이면 원래 순서상 첫 행)
+- 결과는 키 오름차순 (groupby 출력 순서와 같음, 결측 키 제외)
+- 합계는 정수면 int64, 실수면 float64로 누적 (좁은 Parquet dtype 오버플로 방지), 실수 NaN은 pandas처럼 제외
+"""
+
+import pandas as pd
+import numpy as np
+from functools import cached_property
+from typing import Sequence, Tuple
+
+
+# ============================================================
+# 세그먼트 경계
+# ============================================================
+def segment_starts(sorted_keys: np.ndarray) -> np.ndarray:
+    """정렬된 키 배열 → 각 세그먼트(같은 키 구간)의 시작 위치"""
+    sorted_keys = np.asarray(sorted_keys)
+    if len(sorted_keys) == 0:
+        return np.zeros(0, dtype=np.int64)
+    return np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+
+
+def segment_counts(starts: np.ndarray, n: int) -> np.ndarray:
+    """세그먼트별 행 수 (n: 전체 배열 길이)"""
+    return np.diff(np.r_[starts, n]).astype(np.int64)
+
+
+def _segment_ids(starts: np.ndarray, n: int) -> np.ndarray:
+    """행별 세그먼트 번호 (starts 앞쪽 행은 -1)"""
+    ids = np.full(n, -1, dtype=np.int64)
+    if len(starts):
+        ids[starts[0]:] = np.repeat(np.arange(len(starts)), segment_counts(starts, n))
+    return ids
+
+
+def _accumulator(values: np.ndarray) -> np.ndarray:
+    """합계용 dtype 확장 (정수/불리언 → int64, 실수 → float64)"""
+    values = np.asarray(values)
+    if values.dtype.kind in 'biu':
+        return values.astype(np.int64, copy=False)
+    return values.astype(np.float64, copy=False)
+
+
+# ============================================================
+# 세그먼트 연산
+# ============================================================
+def segment_first(values: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    """세그먼트 첫 값"""
+    return np.asarray(values)[starts]
+
+
+def segment_last(values: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    """세그먼트 마지막 값"""
+    values = np.asarray(values)
+    if len(starts) == 0:
+        return values[:0]
+    return values[np.r_[starts[1:], len(values)].astype(np.int64) - 1]
+
+
+def segment_sum(values: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    """세그먼트 합계 (정수 int64 / 실수 float64, NaN 제외)"""
+    values = _accumulator(values)
+    if values.dtype.kind == 'f':
+        values = np.where(np.isnan(values), 0.0, values)
+    if len(starts) == 0:
+        return np.zeros(0, dtype=values.dtype)
+    return np.add.reduceat(values, starts)
+
+
+def segment_max(values: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    """세그먼트 최대값"""
+    values = np.asarray(values)
+    if len(starts) == 0:
+        return np.zeros(0, dtype=values.dtype)
+    return np.maximum.reduceat(values, starts)
+
+
+def segment_argmax(values: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    """세그먼트 최대값의 첫 위치 (배열 전체 기준 위치)"""
+    values = np.asarray(values)
+    if len(starts) == 0:
+        return np.zeros(0, dtype=np.int64)
+    seg_max = np.repeat(np.maximum.reduceat(values, starts), segment_counts(starts, len(values)))
+    positions = np.flatnonzero(values[starts[0]:] == seg_max) + starts[0]
+    ids = _segment_ids(starts, len(values))[positions]
+    return positions[segment_starts(ids)]
+
+
+def segment_mean(values: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    """세그먼트 평균 (NaN 제외, 값이 없으면 NaN)"""
+    values = _accumulator(values)
+    if values.dtype.kind == 'f':
+        valid = ~np.isnan(values)
+        count = segment_sum(valid, starts)
+    else:
+        count = segment_counts(starts, len(values))
+    total = segment_sum(values, starts)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(count > 0, total / np.maximum(count, 1), np.nan)
+
+
+def segment_std(values: np.ndarray, starts: np.ndarray, ddof: int = 1) -> np.ndarray:
+    """세그먼트 표준편차 (2-pass, NaN 제외, 값 개수 <= ddof면 NaN)"""
+    values = np.asarray(values, dtype=np.float64)
+    if len(starts) == 0:
+        return np.zeros(0, dtype=np.float64)
+    valid = ~np.isnan(values)
+    count = segment_sum(valid, starts)
+    mean = segment_mean(values, starts)
+    ids = _segment_ids(starts, len(values))
+    row_mean = np.where(ids >= 0, mean[np.maximum(ids, 0)], 0.0)
+    squares = np.where(valid, (values - row_mean) ** 2, 0.0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(count > ddof, np.sqrt(segment_sum(squares, starts) / np.maximum(count - ddof, 1)), np.nan)
+
+
+def segment_nunique(values: np.ndarray, starts: np.ndarray, assume_sorted: bool = False) -> np.ndarray:
+    """
+    세그먼트별 고유값 개수
+
+    assume_sorted=True면 세그먼트 안에서 값이 이미 정렬돼 있다고 보고 경계 마스크만 셉니다
+    (예: (키, 날짜) 정렬 후 날짜). 아니면 (세그먼트, 값) 쌍을 한 번 정렬합니다.
+    """
+    values = np.asarray(values)
+    if len(starts) == 0:
+        return np.zeros(0, dtype=np.int64)
+    ids = _segment_ids(starts, len(values))
+    if not assume_sorted:
+        order = np.lexsort((values, ids))
+        ids, values = ids[order], values[order]
+    changed = np.r_[True, (values[1:] != values[:-1]) | (ids[1:] != ids[:-1])]
+    return np.bincount(ids[changed & (ids >= 0)], minlength=len(starts)).astype(np.int64)
+
+
+def segment_diff(values: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    """세그먼트 안의 직전 행 대비 차이 (float64, 세그먼트 첫 행은 NaN; groupby().diff()와 같음)"""
+    values = np.asarray(values, dtype=np.float64)
+    diff = np.full(len(values), np.nan)
+    diff[1:] = values[1:] - values[:-1]
+    if len(starts):
+        diff[starts] = np.nan
+        diff[:starts[0]] = np.nan
+    return diff
+
+
+def segment_max_gap(values: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    """세그먼트 안의 연속 행 간 최대 차이 (정렬된 날짜 → 최대 공백 일수, 행이 1개면 NaN)"""
+    if len(starts) == 0:
+        return np.zeros(0, dtype=np.float64)
+    diff = segment_diff(values, starts)
+    gaps = np.maximum.reduceat(np.where(np.isnan(diff), -np.inf, diff), starts)
+    return np.where(segment_counts(starts, len(diff)) < 2, np.nan, gaps)
+
+
+# ============================================================
+# 키 정렬
+# ============================================================
+def _key_codes(keys: np.ndarray):
+    """
+    키 → (정렬 순서를 보존하는 int64 코드, 코드 개수, 코드 → 키 복원 함수)
+
+    int 대리키는 최소값만 빼서 코드로 사용 (해시 factorize 생략), 결측 키는 코드 -1
+    """
+    if np.issubdtype(keys.dtype, np.integer):
+        lo = keys.min()
+        codes = keys.astype(np.int64) - lo
+        return codes, int(codes.max()) + 1, lambda c: (c + lo).astype(keys.dtype)
+    codes, uniques = pd.factorize(keys, sort=True)
+    return codes.astype(np.int64), len(uniques), lambda c: np.asarray(uniques)[c]
+
+
+def latest_index(keys, order_by) -> np.ndarray:
+    """
+    키별 최신 행 위치
+
+    sort_values([키, order_by], ascending=[True, False]) 후 groupby(키).first()가 고르는 행과
+    같습니다 (결측 없는 컬럼 기준, 동률은 원래 순서상 첫 행).
+
+    Args:
+        keys: 키 배열 (msno 문자열 또는 int32 대리키)
+        order_by: 정수 정렬 기준 (일자 서수 등)
+
+    Returns:
+        키 오름차순의 행 위치 배열 (int64, 키당 1개)
+    """
+    keys = np.asarray(keys)
+    order_by = np.asarray(order_by, dtype=np.int64)
+    if len(keys) == 0:
+        return np.zeros(0, dtype=np.int64)
+    codes, _, _ = _key_codes(keys)
+
+    if np.all(codes[1:] >= codes[:-1]):
+        # 이미 키 순서: 정렬 없이 세그먼트 argmax
+        starts = segment_starts(codes)
+        if codes[0] < 0:
+            starts = starts[1:]
+        return segment_argmax(order_by, starts)
+
+    return KeySegments(keys, order_by).latest()
+
+
+class KeySegments:
+    """
+    (키, 정수 기준) 정렬 1회로 만든 키별 세그먼트
+
+    (키 코드, 기준) int64 합성 값 하나를 정렬해 두고, 행 수 / 구간 조회는 이 배열에 대한
+    searchsorted만 사용합니다. 컬럼 값이 필요한 연산은 gather()로 재배열한 배열에
+    segment_*를 적용합니다 (재배열 순서 order는 처음 필요할 때 한 번 계산).
+
+    keys 속성은 키 오름차순 고유값이고, starts / ends는 정렬 배열에서의 세그먼트 경계입니다
+    (결측 키 행은 정렬 배열 앞쪽에 모이고 어느 세그먼트에도 속하지 않음).
+    """
+
+    def __init__(self, keys, order_by):
+        keys = np.asarray(keys)
+        order_by = np.asarray(order_by, dtype=np.int64)
+        self.n_rows = len(keys)
+        if self.n_rows == 0:
+            self.keys = keys[:0]
+            self._lo, self._span = 0, 1
+            self._composite = self._sorted = self._codes = np.zeros(0, dtype=np.int64)
+            self.starts = self.ends = np.zeros(0, dtype=np.int64)
+            return
+
+        codes, n_codes, key_of = _key_codes(keys)
+        self._lo = int(order_by.min())
+        self._span = int(order_by.max()) - self._lo + 1
+        if (n_codes + 1) * self._span >= 2 ** 62:
+            raise ValueError(f"Key/order range too wide for an int64 composite ({n_codes} keys x {self._span})")
+
+        # 합성 값 = 코드 * span + (기준 - 최소) → 코드 = 합성 값 // span (결측 키 -1 포함)
+        self._composite = codes * self._span + (order_by - self._lo)
+        self._sorted = np.sort(self._composite)
+        sorted_codes = self._sorted // self._span
+        starts = segment_starts(sorted_codes)
+        if sorted_codes[0] < 0:
+            starts = starts[1:]
+        self.starts = starts
+        self.ends = np.r_[starts[1:], self.n_rows].astype(np.int64)
+        self._codes = sorted_codes[starts]
+        self.keys = key_of(self._codes)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    @property
+    def counts(self) -> np.ndarray:
+        """키별 행 수"""
+        return self.ends - self.starts
+
+    @property
+    def sorted_order_by(self) -> np.ndarray:
+        """(키, 기준) 정렬 순서의 order_by 값 (gather(order_by)와 같음, 재배열 없이 합성 값에서 복원)"""
+        return self._sorted % self._span + self._lo
+
+    @cached_property
+    def order(self) -> np.ndarray:
+        """
+        정렬 배열 위치 → 원본 행 위치 (안정 정렬)
+
+        합성 값 * 행 수 + 행 번호가 int64에 들어가면 고유 값 정렬 1회로 구함
+        (np.sort가 안정 argsort보다 훨씬 빠름), 아니면 안정 argsort
+        """
+        n = self.n_rows
+        top = int(self._sorted[-1]) + 1 if n else 0
+        if n and int(self._sorted[0]) >= 0 and top * n < 2 ** 63:
+            return np.sort(self._composite * n + np.arange(n, dtype=np.int64)) % n
+        return np.argsort(self._composite, kind='stable')
+
+    def gather(self, values) -> np.ndarray:
+        """원본 순서 컬럼 → (키, 기준) 정렬 순서"""
+        return np.asarray(values)[self.order]
+
+    def lower_bounds(self, values: np.ndarray) -> np.ndarray:
+        """
+        키별 '기준 >= value' 첫 정렬 위치 (없으면 세그먼트 끝)
+
+        values: (1, m) 배열(모든 키에 같은 값) 또는 (키 수, m) 배열(키마다 다른 값) → (키 수, m)
+        """
+        offset = np.clip(np.asarray(values, dtype=np.int64) - self._lo, 0, self._span)
+        bounds = self._codes[:, None] * self._span + offset
+        return np.searchsorted(self._sorted, bounds.ravel()).reshape(bounds.shape)
+
+    def latest(self) -> np.ndarray:
+        """키별 order_by 최대 행의 원본 위치 (동률이면 원래 순서상 첫 행, latest_index() 참고)"""
+        # (키, 기준) 오름차순 안정 정렬 → 최대 기준 블록의 첫 행 = 원래 순서상 첫 행
+        return self.order[segment_argmax(self._sorted, self.starts)]
+
+    def latest_before(self, values: np.ndarray) -> np.ndarray:
+        """
+        키별 order_by < value인 최신 행의 정렬 위치 (gather() 결과 인덱스, 없으면 -1)
+
+        동률(같은 기준 값 여러 행)이면 latest()처럼 원래 순서상 첫 행을 고릅니다.
+        values 형태는 lower_bounds()와 같음 → (키 수, m)
+        """
+        after = self.lower_bounds(values)
+        last = self._sorted[np.maximum(after - 1, 0)] if self.n_rows else np.zeros_like(after)
+        first = np.searchsorted(self._sorted, last)
+        return np.where(after > self.starts[:, None], first, -1)
+
+    def count_since(self, since: Sequence[int]) -> np.ndarray:
+        """
+        키별 order_by >= since 행 수 (since 여러 개를 한 번에)
+
+        Returns:
+            (키 수, len(since)) int64 배열
+        """
+        since = np.asarray(since, dtype=np.int64).reshape(1, -1)
+        return self.ends[:, None] - self.lower_bounds(since)
+
+    def select(self, lo: int, hi: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        order_by가 [lo, hi]인 행만 골라 세그먼트 재구성
+
+        Returns:
+            (rows: 정렬 배열 위치 - gather() 결과에 인덱싱,
+             starts: rows 기준 세그먼트 시작, key_index: 해당 세그먼트의 keys 위치)
+        """
+        bounds = self.lower_bounds(np.array([[lo, hi + 1]]))
+        first, n = bounds[:, 0], bounds[:, 1] - bounds[:, 0]
+        key_index = np.flatnonzero(n > 0)
+        first, n = first[key_index], n[key_index]
+        starts = np.r_[0, np.cumsum(n)[:-1]].astype(np.int64) if len(n) else np.zeros(0, dtype=np.int64)
+        rows = np.repeat(first - starts, n) + np.arange(int(n.sum()), dtype=np.int64)
+        return rows, starts, key_index
+
+    def subset(self, mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        정렬 순서 불리언 마스크(예: gather(is_cancel) == 0)로 행을 골라 세그먼트 재구성
+
+        Returns:
+            select()와 같은 (rows, starts, key_index)
+        """
+        rows = np.flatnonzero(mask)
+        ids = _segment_ids(self.starts, self.n_rows)[rows]
+        rows, ids = rows[ids >= 0], ids[ids >= 0]
+        starts = segment_starts(ids)
+        return rows, starts, ids[starts]
@@ -0,0 +1,251 @@
+"""
+User Logs 일별 시퀀스 텐서
+===========================
+
+목적: LSTM 등 시퀀스 모델용 (사용자 × 일자 × 채널) float32 텐서를 원본 로그 한 번의
+      스트리밍 패스로 디스크 memmap에 바로 채워, 학습 시 pandas pivot / 파싱 없이
+      미니배치를 디스크에서 읽도록 함
+출력: {out_dir}/
+      - sequences.npy (float32, users × days × channels): 일별 채널 합계 (기본 SEQUENCE_CHANNELS,
+        channels=로 SUM_COLUMNS 중 일부 / 순서 지정 가능)
+      - mask.npy (bool, users × days): 일별 활동 여부
+      - lengths.npy (int16, users): 첫 활동일부터 마지막 날까지 일수 (활동이 없으면 0)
+      - msno.npy: 사용자 순서 (대상 목록 순서 그대로)
+      - labels.npy (int8, 선택): 대상 목록에 is_churn이 있으면 같은 순서의 라벨
+      - meta.json: 시작일 / 일수 / 채널 / 클리핑 경계
+
+사용자 축은 대상 목록(train_v2 등)으로 미리 고정하므로 msno 스캔 패스가 필요 없고,
+목록 밖 사용자 / 기간 밖 행은 청크마다 버립니다.
+
+사용법:
+    python src/preprocessing/sequence_tensor.py --data-dir data --out-dir data/user_log_sequences
+
+    seq = SequenceTensor('data/user_log_sequences')
+    for x, mask, lengths, y in seq.iter_batches(256, shuffle=True):
+        ...                                    # x: (256, 31, 7) float32 (memmap에서 바로 읽음)
+"""
+
+import argparse
+import json
+import sys
+import pandas as pd
+import numpy as np
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+from src.preprocessing.aggregate_user_logs import CLIP_BOUNDS_FILENAME, DATA_DIR, WINDOWS, load_clip_bounds
+from src.preprocessing.calendar_utils import day_of, to_day
+from src.preprocessing.user_logs_streaming import DEFAULT_CHUNKSIZE, SUM_COLUMNS, iter_user_log_chunks
+
+# ============================================================
+# 설정
+# ============================================================
+SEQUENCE_DIR = DATA_DIR / 'user_log_sequences'
+SEQUENCE_CHANNELS = SUM_COLUMNS  # total_secs, num_25 ~ num_100, num_unq
+
+# 기본 시퀀스 구간: 가장 긴 윈도우 (w30: 2017-03-01 ~ 2017-03-31, 31일)
+DEFAULT_START, DEFAULT_END = WINDOWS['w30']
+
+
+def read_target_users(path: Path) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """대상 목록 (CSV / Parquet) → (msno 배열, is_churn 배열 | None), 파일 순서 유지 / 중복 제거"""
+    path = Path(path)
+    df = pd.read_parquet(path) if path.suffix == '.parquet' else pd.read_csv(path)
+    df = df.drop_duplicates('msno')
+    labels = df['is_churn'].to_numpy(dtype=np.int8) if 'is_churn' in df.columns else None
+    return df['msno'].to_numpy(dtype=object), labels
+
+
+# ============================================================
+# 텐서 생성
+# ============================================================
+def build_sequence_tensor(source: Path, msno: np.ndarray, out_dir: Path = SEQUENCE_DIR,
+                          start_date: pd.Timestamp = DEFAULT_START,
+                          n_days: Optional[int] = None,
+                          labels: Optional[np.ndarray] = None,
+                          clip_bounds: Optional[Dict[str, Tuple[float, float]]] = None,
+                          chunksize: int = DEFAULT_CHUNKSIZE,
+                          channels: Optional[List[str]] = None) -> Path:
+    """
+    user_logs를 한 번 스트리밍해 (사용자 × 일자 × 채널) memmap 생성
+
+    Args:
+        source: user_logs CSV 또는 ingest Parquet 디렉토리 경로
+        msno: 사용자 축 순서 (대상 목록)
+        start_date: 시퀀스 첫 날
+        n_days: 시퀀스 일수 (None이면 start_date ~ 기본 구간 종료일)
+        labels: msno와 같은 순서의 라벨 (지정 시 labels.npy로 저장)
+        clip_bounds: {컬럼: (하한, 상한)} 이상치 클리핑 경계 (handle_outliers와 같은 규칙)
+        channels: 채널 컬럼과 순서 (SUM_COLUMNS의 부분집합, 기본 SEQUENCE_CHANNELS)
+
+    Returns:
+        출력 디렉토리 경로
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    clip_bounds = clip_bounds or {}
+    start_date = pd.Timestamp(start_date)
+    if n_days is None:
+        n_days = day_of(DEFAULT_END) - day_of(start_date) + 1
+    channels = list(channels or SEQUENCE_CHANNELS)
+    unknown = [col for col in channels if col not in SUM_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown sequence channels: {unknown}. Options: {SUM_COLUMNS}")
+    msno = np.asarray(msno, dtype=object)
+    n_users, n_channels = len(msno), len(channels)
+    print(f"  Users: {n_users:,}, days: {n_days} (from {start_date.date()}), channels: {n_channels}")
+
+    np.save(out_dir / 'msno.npy', msno.astype('S'))
+    if labels is not None:
+        np.save(out_dir / 'labels.npy', np.asarray(labels, dtype=np.int8))
+    sequences = np.lib.format.open_memmap(out_dir / 'sequences.npy', mode='w+',
+                                          dtype=np.float32, shape=(n_users, n_days, n_channels))
+    mask = np.lib.format.open_memmap(out_dir / 'mask.npy', mode='w+', dtype=np.bool_, shape=(n_users, n_days))
+
+    user_index = pd.Index(msno)
+    flat_seq = sequences.reshape(-1, n_channels)
+    flat_mask = mask.reshape(-1)
+    base = day_of(start_date)
+    n_rows = n_kept = 0
+
+    for i, chunk in enumerate(iter_user_log_chunks(source, chunksize, usecols=['msno', 'date'] + channels)):
+        n_rows += len(chunk)
+        uid = user_index.get_indexer(chunk['msno'])
+        day = to_day(chunk['date']) - base
+        keep = (uid >= 0) & (day >= 0) & (day < n_days)
+        if not keep.any():
+            continue
+        values = chunk[channels].to_numpy(dtype=np.float64)[keep]
+        for j, col in enumerate(channels):
+            if col in clip_bounds:
+                np.clip(values[:, j], *clip_bounds[col], out=values[:, j])
+
+        # 청크 내 (사용자, 일자) 셀 단위로 합산한 뒤 디스크 배열에 한 번씩 반영 (셀은 고유)
+        cells, inverse = np.unique(uid[keep].astype(np.int64) * n_days + day[keep], return_inverse=True)
+        sums = np.column_stack([np.bincount(inverse, weights=values[:, j], minlength=len(cells))
+                                for j in range(n_channels)])
+        flat_seq[cells] += sums.astype(np.float32)
+        flat_mask[cells] = True
+        n_kept += int(keep.sum())
+
+        if i % 10 == 0:
+            print(f"  Processed chunk {i} ({n_rows:,} rows)...")
+
+    # 첫 활동일부터 마지막 날까지 길이 (왼쪽 패딩 시퀀스의 유효 길이)
+    active = mask.any(axis=1)
+    lengths = np.where(active, n_days - np.argmax(mask, axis=1), 0).astype(np.int16)
+    np.save(out_dir / 'lengths.npy', lengths)
+    for arr in (sequences, mask):
+        arr.flush()
+
+    meta = {
+        'start_date': start_date.strftime('%Y-%m-%d'),
+        'n_days': int(n_days),
+        'n_users': int(n_users),
+        'channels': channels,
+        'clip_bounds': {col: list(bounds) for col, bounds in clip_bounds.items()},
+        'rows_read': n_rows,
+        'rows_used': n_kept,
+    }
+    with open(out_dir / 'meta.json', 'w') as f:
+        json.dump(meta, f, indent=2)
+
+    print(f"  {n_kept:,} / {n_rows:,} rows used, {int(active.sum()):,} users with activity")
+    print(f"  Saved sequences to: {out_dir}")
+    return out_dir
+
+
+# ============================================================
+# 텐서 조회 (미니배치)
+# ============================================================
+class SequenceTensor:
+    """
+    디스크에 저장된 시퀀스 텐서 (memory-mapped)
+
+    seq[i]는 (x, mask, length, label) 튜플이므로 torch DataLoader의 map-style dataset으로
+    그대로 쓸 수 있고(x / mask는 쓰기 가능한 복사본이라 torch.from_numpy 경고 없음),
+    iter_batches()는 배치 인덱스를 정렬해 memmap을 순서대로 읽습니다.
+    """
+
+    def __init__(self, seq_dir: Path = SEQUENCE_DIR):
+        self.seq_dir = Path(seq_dir)
+        with open(self.seq_dir / 'meta.json', 'r') as f:
+            self.meta = json.load(f)
+
+        self.start_date = pd.Timestamp(self.meta['start_date'])
+        self.n_days = self.meta['n_days']
+        self.channels = self.meta['channels']
+        self.msno = np.load(self.seq_dir / 'msno.npy').astype(str).astype(object)
+        self.sequences = np.load(self.seq_dir / 'sequences.npy', mmap_mode='r')
+        self.mask = np.load(self.seq_dir / 'mask.npy', mmap_mode='r')
+        self.lengths = np.load(self.seq_dir / 'lengths.npy')
+        labels_path = self.seq_dir / 'labels.npy'
+        self.labels = np.load(labels_path) if labels_path.exists() else None
+
+    def __len__(self) -> int:
+        return len(self.msno)
+
+    def __getitem__(self, idx):
+        label = self.labels[idx] if self.labels is not None else -1
+        return np.array(self.sequences[idx]), np.array(self.mask[idx]), self.lengths[idx], label
+
+    def batch(self, idx: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, Optional[np.ndarray]]:
+        """인덱스 배열 → (x, mask, lengths, labels) (x: batch × days × channels float32)"""
+        idx = np.asarray(idx)
+        order = np.argsort(idx, kind='stable')
+        restore = np.empty_like(order)
+        restore[order] = np.arange(len(order))
+        sorted_idx = idx[order]
+        x = self.sequences[sorted_idx][restore]
+        mask = self.mask[sorted_idx][restore]
+        labels = self.labels[idx] if self.labels is not None else None
+        return x, mask, self.lengths[idx], labels
+
+    def iter_batches(self, batch_size: int = 256, shuffle: bool = False,
+                     indices: Optional[np.ndarray] = None,
+                     seed: Optional[int] = None) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray, Optional[np.ndarray]]]:
+        """
+        미니배치 순회
+
+        Args:
+            indices: 사용할 사용자 위치 (예: train/valid 분할 결과, None이면 전체)
+            shuffle: True면 에폭마다 순서를 섞음 (seed로 재현)
+        """
+        indices = np.arange(len(self)) if indices is None else np.asarray(indices)
+        if shuffle:
+            indices = np.random.default_rng(seed).permutation(indices)
+        for lo in range(0, len(indices), batch_size):
+            yield self.batch(indices[lo:lo + batch_size])
+
+
+# ============================================================
+# 실행
+# ============================================================
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build the per-user daily sequence tensor')
+    parser.add_argument('--data-dir', type=Path, default=DATA_DIR)
+    parser.add_argument('--source', type=Path, default=None,
+                        help='user_logs CSV 또는 ingest Parquet 디렉토리 (기본 {data-dir}/user_logs_v2.csv)')
+    parser.add_argument('--users', type=Path, default=None,
+                        help='대상 목록 CSV / Parquet (msno[, is_churn], 기본 {data-dir}/train_v2.csv)')
+    parser.add_argument('--out-dir', type=Path, default=None,
+                        help='출력 디렉토리 (기본 {data-dir}/user_log_sequences)')
+    parser.add_argument('--start-date', type=str, default=str(DEFAULT_START.date()))
+    parser.add_argument('--days', type=int, default=None)
+    parser.add_argument('--chunksize', type=int, default=DEFAULT_CHUNKSIZE)
+    parser.add_argument('--channels', nargs='+', default=None, choices=SUM_COLUMNS,
+                        help='채널 컬럼과 순서 (기본 SEQUENCE_CHANNELS)')
+    args = parser.parse_args()
+
+    msno, labels = read_target_users(args.users or args.data_dir / 'train_v2.csv')
+    bounds_path = args.data_dir / CLIP_BOUNDS_FILENAME
+    print("Building user_logs sequence tensor...")
+    build_sequence_tensor(args.source or args.data_dir / 'user_logs_v2.csv', msno,
+                          args.out_dir or args.data_dir / 'user_log_sequences',
+                          start_date=pd.Timestamp(args.start_date), n_days=args.days, labels=labels,
+                          clip_bounds=load_clip_bounds(bounds_path) if bounds_path.exists() else None,
+                          chunksize=args.chunksize, channels=args.channels)
@@ -0,0 +1,228 @@
+"""
+스트리밍 통계 스케치
+====================
+
+목적: 전체 데이터를 메모리에 올리지 않고 청크 단위로 갱신 가능한 근사 통계 구조
+
+- QuantileSketch: 동일 용량 compactor 스택 기반 분위수 스케치 (KLL/MRL 계열, pure numpy)
+  * 메모리: O(k * log(N / k))
+  * 순위 오차 상한: rank_error_bound() (정규화 순위 기준, 결정적 상한)
+- HyperLogLog: 근사 고유값 수 (2^p 개 uint8 레지스터, 상대 표준오차 1.04 / sqrt(2^p))
+  * merge()로 합집합, intersection()으로 포함-배제 교집합 추정
+- FrequentItems: Misra-Gries 빈도 상위 값 (capacity개 카운터, 카운트 과소 추정 상한 N / (capacity + 1))
+"""
+
+import numpy as np
+import pandas as pd
+from typing import List, Optional
+
+
+# ============================================================
+# 분위수 스케치
+# ============================================================
+class QuantileSketch:
+    """
+    청크 단위로 갱신/병합 가능한 분위수 스케치
+
+    레벨 h의 원소는 가중치 2^h를 가지며, 레벨 버퍼가 k개를 넘으면 정렬 후
+    랜덤 오프셋으로 절반을 다음 레벨로 올립니다(compaction). 한 번의 compaction이
+    만드는 순위 오차는 최대 2^h이므로, 누적 오차 상한을 정확히 추적할 수 있습니다.
+    """
+
+    def __init__(self, k: int = 65536, seed: Optional[int] = 719):
+        self.k = k
+        self.n = 0
+        self.levels: List[np.ndarray] = [np.empty(0, dtype=np.float64)]
+        self._error = 0.0
+        self._rng = np.random.default_rng(seed)
+
+    def update(self, values) -> 'QuantileSketch':
+        """값 배열(청크 컬럼)을 스케치에 반영 (NaN 무시)"""
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return self
+        self.n += len(values)
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+        return self
+
+    def merge(self, other: 'QuantileSketch') -> 'QuantileSketch':
+        """다른 스케치를 병합 (분산/샤드 집계용)"""
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0, dtype=np.float64))
+        for h, items in enumerate(other.levels):
+            self.levels[h] = np.concatenate([self.levels[h], items])
+        self.n += other.n
+        self._error += other._error
+        self._compress()
+        return self
+
+    def _compress(self) -> None:
+        """용량을 넘은 레벨을 아래에서부터 compaction"""
+        h = 0
+        while h < len(self.levels):
+            items = self.levels[h]
+            if len(items) > self.k:
+                items = np.sort(items)
+                # 홀수 개면 하나는 현재 레벨에 남김
+                keep = items[-1:] if len(items) % 2 else items[:0]
+                pairs = items[:len(items) - len(keep)]
+                offset = int(self._rng.integers(2))
+                promoted = pairs[offset::2]
+                if h + 1 == len(self.levels):
+                    self.levels.append(np.empty(0, dtype=np.float64))
+                self.levels[h + 1] = np.concatenate([self.levels[h + 1], promoted])
+                self.levels[h] = keep
+                self._error += 2.0 ** h
+            h += 1
+
+    def rank_error_bound(self) -> float:
+        """정규화 순위 오차 상한 (예: 1e-4 → 분위수 순위가 최대 ±0.01%p 벗어남)"""
+        return self._error / self.n if self.n else 0.0
+
+    def quantile(self, q) -> np.ndarray:
+        """
+        근사 분위수
+
+        Args:
+            q: 0~1 사이 분위수 (스칼라 또는 배열)
+        """
+        if self.n == 0:
+            return np.full(np.shape(q), np.nan)
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(items), 2.0 ** h)
+                                  for h, items in enumerate(self.levels)])
+        order = np.argsort(values, kind='stable')
+        values, cum = values[order], np.cumsum(weights[order])
+        target = np.asarray(q, dtype=np.float64) * (cum[-1] - 1)
+        idx = np.minimum(np.searchsorted(cum, target, side='right'), len(values) - 1)
+        return values[idx]
+
+    def __len__(self) -> int:
+        return sum(len(items) for items in self.levels)
+
+
+
+# ============================================================
+# 고유값 수 (HyperLogLog)
+# ============================================================
+def bit_length(values: np.ndarray) -> np.ndarray:
+    """uint64 배열의 비트 길이 (상/하위 32비트를 float64로 나눠 정확히 계산)"""
+    hi = (values >> np.uint64(32)).astype(np.float64)
+    lo = (values & np.uint64(0xFFFFFFFF)).astype(np.float64)
+    hi_len = np.frexp(hi)[1]
+    lo_len = np.frexp(lo)[1]
+    return np.where(hi_len > 0, hi_len + 32, lo_len)
+
+
+class HyperLogLog:
+    """
+    청크 단위로 갱신/병합 가능한 고유값 수 스케치
+
+    값은 pd.util.hash_array의 64비트 해시로 처리하므로 같은 값은 테이블/청크가 달라도
+    같은 레지스터에 기록됩니다 (msno 문자열의 테이블 간 교집합 추정 가능).
+
+    Args:
+        p: 레지스터 인덱스 비트 수 (레지스터 2^p개, p=14면 16KB / 상대 오차 약 0.8%)
+    """
+
+    def __init__(self, p: int = 14):
+        if not 4 <= p <= 18:
+            raise ValueError(f"HyperLogLog precision must be in [4, 18], got {p}")
+        self.p = p
+        self.registers = np.zeros(1 << p, dtype=np.uint8)
+
+    def update(self, values) -> 'HyperLogLog':
+        """값 배열(청크 컬럼)을 스케치에 반영 (결측 무시)"""
+        values = pd.Series(values).dropna().to_numpy()
+        if len(values) == 0:
+            return self
+        h = pd.util.hash_array(values, categorize=False)
+        idx = (h >> np.uint64(64 - self.p)).astype(np.intp)
+        rest = h & np.uint64((1 << (64 - self.p)) - 1)
+        rank = (64 - self.p) - bit_length(rest) + 1
+        np.maximum.at(self.registers, idx, rank.astype(np.uint8))
+        return self
+
+    def merge(self, other: 'HyperLogLog') -> 'HyperLogLog':
+        """합집합 (레지스터별 최대값)"""
+        if other.p != self.p:
+            raise ValueError("Cannot merge HyperLogLog sketches with different precision")
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def copy(self) -> 'HyperLogLog':
+        clone = HyperLogLog(self.p)
+        clone.registers = self.registers.copy()
+        return clone
+
+    def count(self) -> float:
+        """근사 고유값 수 (작은 구간은 linear counting으로 보정)"""
+        m = float(len(self.registers))
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = int((self.registers == 0).sum())
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * np.log(m / zeros)
+        return float(estimate)
+
+    def union_count(self, other: 'HyperLogLog') -> float:
+        return self.copy().merge(other).count()
+
+    def intersection(self, other: 'HyperLogLog') -> float:
+        """|A ∩ B| 포함-배제 추정 (오차는 합집합 크기 기준이므로 작은 교집합은 부정확)"""
+        return max(0.0, self.count() + other.count() - self.union_count(other))
+
+    @property
+    def relative_error(self) -> float:
+        return 1.04 / np.sqrt(len(self.registers))
+
+
+# ============================================================
+# 빈도 상위 값 (Misra-Gries)
+# ============================================================
+class FrequentItems:
+    """
+    청크 단위 빈도 상위 값 (Misra-Gries 요약)
+
+    카운터가 capacity개를 넘으면 (capacity + 1)번째로 큰 카운트만큼 모두 빼고 0 이하를 버립니다.
+    남은 카운트는 실제 빈도의 하한이며 과소 추정은 최대 error_bound()입니다.
+    """
+
+    def __init__(self, capacity: int = 1000):
+        self.capacity = capacity
+        self.n = 0
+        self._decrement = 0
+        self.counts = pd.Series(dtype=np.int64)
+
+    def update(self, values) -> 'FrequentItems':
+        """값 배열(청크 컬럼)을 반영 (결측 무시)"""
+        counts = pd.Series(values).value_counts(dropna=True)
+        self.n += int(counts.sum())
+        return self._absorb(counts)
+
+    def merge(self, other: 'FrequentItems') -> 'FrequentItems':
+        self.n += other.n
+        self._decrement += other._decrement
+        return self._absorb(other.counts)
+
+    def _absorb(self, counts: pd.Series) -> 'FrequentItems':
+        if len(self.counts) == 0:
+            merged = counts.astype(np.int64)
+        else:
+            merged = self.counts.add(counts, fill_value=0).astype(np.int64)
+        if len(merged) > self.capacity:
+            cut = int(np.partition(merged.to_numpy(), -(self.capacity + 1))[-(self.capacity + 1)])
+            merged = merged[merged > cut] - cut
+            self._decrement += cut
+        self.counts = merged
+        return self
+
+    def top(self, k: int = 10) -> pd.Series:
+        """카운트 하한 기준 상위 k개"""
+        return self.counts.sort_values(ascending=False, kind='stable').head(k)
+
+    def error_bound(self) -> int:
+        """카운트 과소 추정 상한"""
+        return self._decrement
@@ -0,0 +1,211 @@
+"""
+구독 구간 재구성 (transactions → 사용자별 연속 멤버십 구간)
+==========================================================
+
+목적: 마지막 거래 한 행(days_to_expire, is_expired)만 보는 대신, 거래 이력 전체의
+      [transaction_date, membership_expire_date]를 병합해 사용자별 연속 구독 구간 / 공백 /
+      총 구독 일수를 계산 (만료 후 30일 내 재가입 여부 등 이탈 정의와 같은 단위)
+
+- 규칙: 각 거래는 다음 거래 전까지 멤버십 만료일을 결정 (최신 거래가 우선)
+  → 거래 i의 조각 = [date_i, min(expire_i, date_{i+1} - 1)]
+  → 취소 거래(만료일을 앞당김)와 겹치는 플랜 연장이 같은 규칙으로 처리됨
+- 조각이 비는 거래(만료일 < 거래일, 결측 날짜)는 제외
+- (msno, 거래일) 정렬 1회 (segments.KeySegments) 후 이전 조각 끝 + 1 < 다음 조각 시작이면
+  새 구간 → 구간 / 사용자 집계는 모두 세그먼트 연산 (사용자별 Python 루프 없음)
+
+출력:
+- subscription_spans(): 구간 테이블 (msno, span_start, span_end, gap_before)
+- subscription_features(): 사용자별 SPAN_FEATURES (기준 시점 t까지)
+    - subscription_span_count: 연속 구독 구간 수
+    - total_covered_days: t까지 구독 상태였던 일수
+    - coverage_ratio: total_covered_days / (첫 거래일 ~ t 일수)
+    - total_gap_days / max_subscription_gap: 구간 사이 공백 일수 합 / 최대
+    - lapse_count_30d: 30일 넘는 공백 횟수 (만료 후 30일 내 미갱신 = 과거 이탈 횟수)
+    - days_since_current_span_start: 마지막 구간 시작일 ~ t 일수 (현재 연속 구독 기간)
+
+사용법:
+    python src/preprocessing/subscription_intervals.py --data-dir data
+    python src/preprocessing/subscription_intervals.py --source data/transactions.csv --cutoff 2017-03-31
+"""
+
+import argparse
+import sys
+import time
+import pandas as pd
+import numpy as np
+from pathlib import Path
+from typing import Optional, Tuple, Union
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+from src.preprocessing.calendar_utils import NA_DAY, day_of, format_day, to_day
+from src.preprocessing.segments import (
+    KeySegments,
+    segment_counts,
+    segment_first,
+    segment_last,
+    segment_max,
+    segment_starts,
+    segment_sum,
+)
+
+# ============================================================
+# 설정
+# ============================================================
+DATA_DIR = PROJECT_ROOT / 'data'
+T = pd.Timestamp('2017-03-31')  # 기준 시점 (aggregate_transactions_ldh.T와 같음)
+LAPSE_DAYS = 30  # 만료 후 이 일수 안에 갱신하지 않으면 이탈 (WSDM KKBox 정의)
+
+SPAN_FEATURES = [
+    'subscription_span_count',
+    'total_covered_days',
+    'coverage_ratio',
+    'total_gap_days',
+    'max_subscription_gap',
+    'lapse_count_30d',
+    'days_since_current_span_start',
+]
+
+Spans = Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]
+
+
+# ============================================================
+# 구간 병합
+# ============================================================
+def _merge_spans(segments: KeySegments, dates: np.ndarray, expires: np.ndarray) -> Spans:
+    """
+    (키, 거래일) 정렬 순서의 거래일 / 만료일 → 구간 배열
+
+    Returns:
+        (key_index: 구간의 segments.keys 위치 (키 오름차순),
+         span_start, span_end, gap_before: 직전 구간과의 공백 일수 (사용자 첫 구간은 -1),
+         user_starts: 구간 배열에서 사용자별 시작 위치)
+    """
+    # 다음 거래일 - 1에서 조각을 자름 (사용자 마지막 거래는 자르지 않음)
+    next_date = np.empty_like(dates)
+    next_date[:-1] = dates[1:]
+    next_date[segments.ends - 1] = np.iinfo(np.int64).max
+    piece_end = np.minimum(expires, next_date - 1)
+    valid = (piece_end >= dates) & (dates != NA_DAY) & (expires != NA_DAY)
+
+    rows, starts, key_index = segments.subset(valid)
+    piece_start, piece_end = dates[rows], piece_end[rows]
+
+    # 조각은 겹치지 않고 시간순 → 이전 조각 끝 + 1보다 늦게 시작하면 새 구간
+    gap = np.full(len(rows), -1, dtype=np.int64)
+    gap[1:] = piece_start[1:] - piece_end[:-1] - 1
+    gap[starts] = -1
+    span_idx = np.flatnonzero(gap != 0)
+
+    piece_user = np.repeat(key_index, segment_counts(starts, len(rows)))
+    span_user = piece_user[span_idx]
+    return (span_user,
+            segment_first(piece_start, span_idx),
+            segment_last(piece_end, span_idx),
+            gap[span_idx],
+            segment_starts(span_user))
+
+
+def _sorted_columns(df: pd.DataFrame, segments: Optional[KeySegments]
+                    ) -> Tuple[KeySegments, np.ndarray, np.ndarray]:
+    """transactions → (세그먼트, 정렬 순서 거래일, 정렬 순서 만료일) int64"""
+    if segments is None:
+        segments = KeySegments(df['msno'].to_numpy(), df['transaction_date'].to_numpy())
+    dates = segments.sorted_order_by
+    expires = segments.gather(df['membership_expire_date'].to_numpy().astype(np.int64))
+    return segments, dates, expires
+
+
+def subscription_spans(df: pd.DataFrame, segments: Optional[KeySegments] = None) -> pd.DataFrame:
+    """
+    사용자별 연속 구독 구간 테이블
+
+    Args:
+        df: transactions (msno, transaction_date / membership_expire_date 일자 서수)
+        segments: (msno, transaction_date) KeySegments (없으면 생성)
+
+    Returns:
+        msno, span_start, span_end (일자 서수, 종료일 포함), gap_before (사용자 첫 구간은 -1)
+        - msno / span_start 오름차순
+    """
+    segments, dates, expires = _sorted_columns(df, segments)
+    key_index, span_start, span_end, gap_before, _ = _merge_spans(segments, dates, expires)
+    return pd.DataFrame({
+        'msno': segments.keys[key_index],
+        'span_start': span_start,
+        'span_end': span_end,
+        'gap_before': gap_before,
+    })
+
+
+def subscription_features(df: pd.DataFrame, t: Union[pd.Timestamp, str] = T,
+                          segments: Optional[KeySegments] = None,
+                          lapse_days: int = LAPSE_DAYS) -> pd.DataFrame:
+    """
+    사용자별 구독 구간 피처 (SPAN_FEATURES, df는 t 이전 거래만)
+
+    유효 조각이 없는 사용자(모든 거래의 만료일이 거래일보다 이른 경우)는 행이 없습니다
+    (병합 후 0).
+    """
+    t_day = day_of(t)
+    segments, dates, expires = _sorted_columns(df, segments)
+    key_index, span_start, span_end, gap_before, user_starts = _merge_spans(segments, dates, expires)
+
+    # t 이후 선결제 구간은 t까지만 구독 일수로 셈
+    covered = np.maximum(np.minimum(span_end, t_day) - span_start + 1, 0)
+    gaps = np.maximum(gap_before, 0)
+
+    first_start = segment_first(span_start, user_starts)
+    features = pd.DataFrame({'msno': segments.keys[segment_first(key_index, user_starts)]})
+    features['subscription_span_count'] = segment_counts(user_starts, len(span_start))
+    features['total_covered_days'] = segment_sum(covered, user_starts)
+    features['coverage_ratio'] = features['total_covered_days'] / np.maximum(t_day - first_start + 1, 1)
+    features['total_gap_days'] = segment_sum(gaps, user_starts)
+    features['max_subscription_gap'] = segment_max(gaps, user_starts)
+    features['lapse_count_30d'] = segment_sum(gap_before > lapse_days, user_starts)
+    features['days_since_current_span_start'] = t_day - segment_last(span_start, user_starts)
+
+    return features
+
+
+# ============================================================
+# 실행
+# ============================================================
+def load_transaction_dates(data_dir: Path = DATA_DIR, source: Optional[Path] = None,
+                           t: Union[pd.Timestamp, str] = T) -> pd.DataFrame:
+    """
+    구간 계산에 필요한 컬럼만 로드 (t 이전 거래)
+
+    source를 지정하면 해당 CSV(예: 전체 이력 transactions.csv)를, 아니면 transactions_v2를 읽습니다.
+    """
+    columns = ['msno', 'transaction_date', 'membership_expire_date']
+    if source is not None:
+        df = pd.read_csv(source, usecols=columns, dtype={'transaction_date': np.int32,
+                                                          'membership_expire_date': np.int32})
+    else:
+        from src.preprocessing.ingest import read_raw_table
+        df = read_raw_table(data_dir, 'transactions_v2', columns=columns)
+    df['transaction_date'] = to_day(df['transaction_date'])
+    df['membership_expire_date'] = to_day(df['membership_expire_date'])
+    return df[df['transaction_date'] <= day_of(t)]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Subscription interval reconstruction from transactions')
+    parser.add_argument('--data-dir', type=Path, default=DATA_DIR)
+    parser.add_argument('--source', type=Path, default=None,
+                        help='transactions CSV 경로 (기본 {data-dir}의 transactions_v2)')
+    parser.add_argument('--cutoff', type=str, default=str(T.date()))
+    args = parser.parse_args()
+
+    df = load_transaction_dates(args.data_dir, args.source, args.cutoff)
+    print(f"Loaded {len(df):,} transactions ({df['msno'].nunique():,} users)")
+
+    started = time.perf_counter()
+    features = subscription_features(df, args.cutoff)
+    elapsed = time.perf_counter() - started
+
+    print(f"Merged subscription spans in {elapsed:.2f}s (cutoff {format_day(day_of(args.cutoff))})")
+    print(features[SPAN_FEATURES].describe().T.to_string())
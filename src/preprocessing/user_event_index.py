@@ -0,0 +1,272 @@
+"""
+msno 정렬 원본 이벤트 인덱스 (단일 사용자 즉시 피처 계산)
+==========================================================
+
+목적: 상담 등에서 사용자 한 명의 최신 피처가 필요할 때 배치 집계를 돌리지 않고,
+      msno 순으로 정렬해 둔 원본 user_logs / transactions에서 해당 사용자 구간만 읽어
+      배치와 같은 피처 함수(aggregate_all_windows, add_trend_features,
+      build_transaction_features)를 그대로 적용
+
+출력: {out_dir}/
+      - {table}/msno.npy (S, 정렬된 고유 msno)
+      - {table}/offsets.npy (int64, 고유 msno + 1): 사용자 i의 행 = [offsets[i], offsets[i + 1])
+      - {table}/{컬럼}.npy: msno 순으로 정렬한 컬럼 (날짜 컬럼은 int32 일자 서수)
+      - meta.json: 테이블별 행 수 / 사용자 수, user_logs 클리핑 경계
+
+- 조회: msno.npy searchsorted → 컬럼별 memmap 슬라이스 (사용자 행 수만큼만 읽음)
+- 정렬은 안정 정렬이라 사용자 행의 상대 순서가 원본과 같음 → 합계 / 표준편차 /
+  최신 거래 선택이 배치 결과와 정확히 일치
+- 클리핑 경계는 빌드 시점에 고정 (학습 아티팩트가 있으면 그대로, 없으면 전체 로그 분위수)
+
+사용법:
+    python src/preprocessing/user_event_index.py --data-dir data
+    python src/preprocessing/user_event_index.py --msno <msno> --cutoff 2017-04-01
+
+    features = compute_user_features(msno, cutoff='2017-04-01')   # 1행 DataFrame
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import sys
+import time
+import pandas as pd
+import numpy as np
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.append(str(PROJECT_ROOT))
+
+from src.preprocessing.activity_bitmask import last_active_gap, mask_span
+from src.preprocessing.aggregate_user_logs import (
+    CLIP_BOUNDS_FILENAME,
+    DATA_DIR,
+    T,
+    WINDOW_DAYS,
+    add_trend_features,
+    aggregate_all_windows,
+    load_clip_bounds,
+    make_windows,
+)
+from src.preprocessing.calendar_utils import day_of, to_day
+from src.preprocessing.ingest import SCHEMAS, has_parquet, parquet_path, read_raw_table
+from src.preprocessing.msno_keys import merge_on_key
+from src.preprocessing.user_logs_streaming import compute_clip_bounds
+from LeeDoHoon.src.aggregate_transactions_ldh import build_transaction_features
+
+# ============================================================
+# 설정
+# ============================================================
+EVENT_INDEX_DIR = DATA_DIR / 'user_event_index'
+EVENT_TABLES = ['user_logs_v2', 'transactions_v2']
+DATE_COLUMNS = {
+    'user_logs_v2': ['date'],
+    'transactions_v2': ['transaction_date', 'membership_expire_date'],
+}
+
+
+def _event_columns(table: str):
+    return [name for name in SCHEMAS[table].names if name != 'msno']
+
+
+# ============================================================
+# 인덱스 생성
+# ============================================================
+def build_table_index(data_dir: Path, table: str, out_dir: Path) -> Dict[str, int]:
+    """원본 테이블 하나를 msno 안정 정렬해 컬럼별 npy + 오프셋으로 저장"""
+    df = read_raw_table(data_dir, table)
+    for col in DATE_COLUMNS[table]:
+        df[col] = to_day(df[col])
+
+    # 정렬 사전 코드 (S 바이트 정렬 = msno 문자열 정렬)
+    codes, uniques = pd.factorize(df['msno'], sort=True)
+    order = np.argsort(codes, kind='stable')
+    offsets = np.zeros(len(uniques) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(codes, minlength=len(uniques)), out=offsets[1:])
+
+    table_dir = Path(out_dir) / table
+    table_dir.mkdir(parents=True, exist_ok=True)
+    np.save(table_dir / 'msno.npy', np.asarray(uniques, dtype=object).astype('S'))
+    np.save(table_dir / 'offsets.npy', offsets)
+    for col in _event_columns(table):
+        np.save(table_dir / f'{col}.npy', df[col].to_numpy()[order])
+
+    print(f"  {table}: {len(df):,} rows, {len(uniques):,} users -> {table_dir}")
+    return {'rows': int(len(df)), 'users': int(len(uniques))}
+
+
+def build_event_index(data_dir: Path = DATA_DIR, out_dir: Path = EVENT_INDEX_DIR,
+                      clip_bounds: Optional[Dict[str, Tuple[float, float]]] = None,
+                      tables: Iterable[str] = EVENT_TABLES) -> Path:
+    """
+    user_logs / transactions 원본의 msno 정렬 사본 + 오프셋 인덱스 생성
+
+    Args:
+        data_dir: 원본 CSV / ingest Parquet 디렉토리
+        out_dir: 인덱스 출력 디렉토리
+        clip_bounds: user_logs 이상치 클리핑 경계 (None이면 {data_dir}/user_logs_clip_bounds.json,
+                     없으면 전체 로그의 분위수로 계산) - 조회 시 같은 경계를 적용
+
+    Returns:
+        출력 디렉토리 경로
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    if clip_bounds is None:
+        bounds_path = Path(data_dir) / CLIP_BOUNDS_FILENAME
+        if bounds_path.exists():
+            clip_bounds = load_clip_bounds(bounds_path)
+        else:
+            source = (parquet_path(data_dir, 'user_logs_v2') if has_parquet(data_dir, 'user_logs_v2')
+                      else Path(data_dir) / 'user_logs_v2.csv')
+            clip_bounds = compute_clip_bounds(source)
+
+    print("Building msno-sorted event index...")
+    tables = list(tables)
+    meta = {
+        'tables': {table: build_table_index(data_dir, table, out_dir) for table in tables},
+        'clip_bounds': {col: [float(lower), float(upper)] for col, (lower, upper) in clip_bounds.items()},
+    }
+    with open(out_dir / 'meta.json', 'w') as f:
+        json.dump(meta, f, indent=2)
+
+    print(f"  Saved event index to: {out_dir}")
+    return out_dir
+
+
+# ============================================================
+# 인덱스 조회
+# ============================================================
+class UserEventIndex:
+    """
+    msno 정렬 이벤트 인덱스 (컬럼별 memory-mapped npy)
+
+    events(table, msno)는 해당 사용자의 원본 행만 읽어 read_raw_table()과 같은 컬럼 순서의
+    DataFrame을 반환합니다 (날짜 컬럼은 일자 서수, 없는 사용자는 0행).
+    """
+
+    def __init__(self, index_dir: Path = EVENT_INDEX_DIR):
+        self.index_dir = Path(index_dir)
+        with open(self.index_dir / 'meta.json', 'r') as f:
+            self.meta = json.load(f)
+        self.clip_bounds = {col: tuple(bounds) for col, bounds in self.meta['clip_bounds'].items()}
+
+        self._keys, self._offsets, self._columns = {}, {}, {}
+        for table in self.meta['tables']:
+            table_dir = self.index_dir / table
+            self._keys[table] = np.load(table_dir / 'msno.npy', mmap_mode='r')
+            self._offsets[table] = np.load(table_dir / 'offsets.npy', mmap_mode='r')
+            self._columns[table] = {col: np.load(table_dir / f'{col}.npy', mmap_mode='r')
+                                    for col in _event_columns(table)}
+
+    def locate(self, table: str, msno: str) -> Tuple[int, int]:
+        """msno의 행 구간 [lo, hi) (없으면 빈 구간)"""
+        keys = self._keys[table]
+        key = msno.encode()
+        if len(key) > keys.dtype.itemsize:
+            return 0, 0
+        i = int(np.searchsorted(keys, key))
+        if i == len(keys) or keys[i] != key:
+            return 0, 0
+        offsets = self._offsets[table]
+        return int(offsets[i]), int(offsets[i + 1])
+
+    def events(self, table: str, msno: str) -> pd.DataFrame:
+        """사용자 한 명의 원본 이벤트 행"""
+        lo, hi = self.locate(table, msno)
+        data = {'msno': np.full(hi - lo, msno, dtype=object)}
+        for col, values in self._columns[table].items():
+            data[col] = np.asarray(values[lo:hi])
+        return pd.DataFrame(data)
+
+
+@lru_cache(maxsize=4)
+def _open_index(index_dir: str) -> UserEventIndex:
+    return UserEventIndex(index_dir)
+
+
+# ============================================================
+# 단일 사용자 피처
+# ============================================================
+def compute_user_features(msno: str, cutoff=T, index_dir: Path = EVENT_INDEX_DIR,
+                          window_days: Dict[str, int] = WINDOW_DAYS,
+                          model=None) -> pd.DataFrame:
+    """
+    기준 시점 cutoff의 사용자 피처를 원본 이벤트에서 즉시 계산 (1행 DataFrame)
+
+    기준 시점 규칙은 backfill.py와 같습니다 (user_logs 윈도우: make_windows(C - 1일),
+    transactions 기준일: C - 1일). user_logs 윈도우/추세 피처 + transactions
+    상태/히스토리/Recency/취소 피처를 outer merge하고 결측은 0으로 채운 뒤,
+    last_active_gap을 활동 비트마스크로 계산합니다 (build_features_v4와 같은 정의).
+
+    Args:
+        msno: 사용자 ID
+        cutoff: 기준 시점 (예측 시점 T)
+        index_dir: build_event_index() 출력 디렉토리
+        model: ModelInference 지정 시 engineer_features() 파생 피처까지 추가
+
+    Raises:
+        KeyError: 기준 시점 이전 윈도우 로그와 거래가 모두 없는 사용자 (배치 출력에도 없는 사용자)
+    """
+    index = _open_index(str(index_dir))
+    end = pd.Timestamp(cutoff) - pd.Timedelta(days=1)
+    windows = make_windows(end, window_days)
+
+    logs = index.events('user_logs_v2', msno)
+    logs = logs[logs['date'] <= day_of(end)].reset_index(drop=True)
+    transactions = index.events('transactions_v2', msno)
+    transactions = transactions[transactions['transaction_date'] <= day_of(end)].reset_index(drop=True)
+
+    # clip_outliers()와 같은 Series.clip (경계 고정이라 통계 출력 생략)
+    for col, (lower, upper) in index.clip_bounds.items():
+        logs[col] = logs[col].clip(lower=lower, upper=upper)
+
+    # 배치와 같은 함수 (빈 입력은 같은 컬럼의 0행 → outer merge 후 0)
+    with contextlib.redirect_stdout(io.StringIO()):
+        log_features = add_trend_features(aggregate_all_windows(logs, windows))
+        txn_features = build_transaction_features(transactions, end)
+
+    features = merge_on_key(log_features, txn_features, how='outer')
+    if len(features) == 0:
+        raise KeyError(f"No events up to {end.date()} for msno: {msno}")
+    feature_columns = features.columns.drop('msno')
+    features[feature_columns] = features[feature_columns].fillna(0)
+
+    # 마지막 활동일 ~ 윈도우 종료일 간격 (활동이 없으면 마스크 구간 일수)
+    _, n_days = mask_span(windows)
+    features['last_active_gap'] = last_active_gap(features['activity_mask'].to_numpy(), n_days)
+
+    if model is not None:
+        features = model.engineer_features(features)
+    return features
+
+
+# ============================================================
+# 실행
+# ============================================================
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='msno-sorted raw event index / single-user features')
+    parser.add_argument('--data-dir', type=Path, default=DATA_DIR)
+    parser.add_argument('--out-dir', type=Path, default=None,
+                        help='인덱스 디렉토리 (기본 {data-dir}/user_event_index)')
+    parser.add_argument('--clip-bounds', type=Path, default=None,
+                        help='학습 시점 클리핑 경계 JSON (기본 {data-dir}/user_logs_clip_bounds.json)')
+    parser.add_argument('--msno', type=str, default=None,
+                        help='지정 시 인덱스를 만들지 않고 해당 사용자 피처만 계산해 출력')
+    parser.add_argument('--cutoff', type=str, default=str(T.date()))
+    args = parser.parse_args()
+
+    out_dir = args.out_dir or args.data_dir / 'user_event_index'
+    if args.msno is None:
+        bounds = load_clip_bounds(args.clip_bounds) if args.clip_bounds is not None else None
+        build_event_index(args.data_dir, out_dir, bounds)
+    else:
+        started = time.perf_counter()
+        features = compute_user_features(args.msno, args.cutoff, out_dir)
+        print(features.T.to_string(header=False))
+        print(f"\nComputed in {(time.perf_counter() - started) * 1000:.1f} ms")
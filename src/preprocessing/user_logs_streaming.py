@@ -0,0 +1,391 @@
+"""
+User Logs 스트리밍 집계
+========================
+
+목적: user_logs_v2.csv를 고정 크기 청크로 읽으면서 msno별 누적값(윈도우별
+      행 수/합계/제곱합 + 활동일 비트마스크)을 한 번의 패스로 갱신
+출력: aggregate_all_windows()와 동일한 컬럼의 데이터프레임
+
+메모리 사용량은 로그 행 수가 아니라 사용자 수에 비례합니다.
+"""
+
+import pandas as pd
+import numpy as np
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from src.preprocessing.activity_bitmask import activity_features, truncate_mask
+from src.preprocessing.aggregate_user_logs import (
+    OUTLIER_COLUMNS,
+    WINDOWS,
+    cast_count_columns,
+    derive_window_features,
+)
+from src.preprocessing.calendar_utils import day_of, to_day
+from src.preprocessing.ingest import iter_source_chunks
+from src.preprocessing.sketches import QuantileSketch
+
+# ============================================================
+# 설정
+# ============================================================
+DEFAULT_CHUNKSIZE = 1_000_000
+
+# 윈도우별로 합산하는 컬럼 (순서 고정)
+SUM_COLUMNS = ['total_secs', 'num_25', 'num_50', 'num_75', 'num_985', 'num_100', 'num_unq']
+
+LOG_COLUMNS = ['msno', 'date'] + SUM_COLUMNS
+
+
+# ============================================================
+# 청크 리더
+# ============================================================
+def iter_user_log_chunks(csv_path: Path, chunksize: int = DEFAULT_CHUNKSIZE,
+                         usecols: Optional[List[str]] = None) -> Iterator[pd.DataFrame]:
+    """user_logs를 chunksize 행 단위로 순회 (CSV 또는 ingest Parquet 디렉토리)"""
+    usecols = usecols or LOG_COLUMNS
+    yield from iter_source_chunks(csv_path, 'user_logs_v2', usecols, chunksize=chunksize)
+
+
+# ============================================================
+# 이상치 클리핑 경계 (스트리밍)
+# ============================================================
+def _quantile_from_counts(counts: pd.Series, q: float) -> float:
+    """정렬된 (값 -> 빈도) 시리즈에서 pandas quantile(linear)과 동일한 분위수 계산"""
+    counts = counts.sort_index()
+    cum = counts.to_numpy().cumsum()
+    pos = q * (cum[-1] - 1)
+    lo = int(np.floor(pos))
+    hi = min(lo + 1, int(cum[-1]) - 1)
+    values = counts.index.to_numpy(dtype=np.float64)
+    v_lo = values[np.searchsorted(cum, lo, side='right')]
+    v_hi = values[np.searchsorted(cum, hi, side='right')]
+    # numpy의 선형 보간 공식을 그대로 사용
+    return float(np.quantile(np.array([v_lo, v_hi]), pos - lo))
+
+
+def compute_clip_bounds(csv_path: Path, columns: List[str] = OUTLIER_COLUMNS,
+                        lower_pct: float = 0.001, upper_pct: float = 0.999,
+                        chunksize: int = DEFAULT_CHUNKSIZE,
+                        method: str = 'exact') -> Dict[str, Tuple[float, float]]:
+    """
+    청크 단위로 clip_outliers()의 분위수 경계 계산
+
+    Args:
+        method: 'exact'  - value_counts 병합으로 pandas quantile과 동일한 값
+                           (메모리는 컬럼별 고유값 개수에 비례)
+                'sketch' - QuantileSketch 근사 (메모리 고정, 순위 오차 상한 보고)
+
+    Returns:
+        {컬럼명: (하한, 상한)}
+    """
+    if method == 'sketch':
+        return sketch_clip_bounds(csv_path, columns, lower_pct, upper_pct, chunksize)
+    if method != 'exact':
+        raise ValueError(f"Unknown clip bound method: {method}. Options: 'exact', 'sketch'")
+
+    counts = value_counts_partial(iter_user_log_chunks(csv_path, chunksize, usecols=columns), columns)
+    return bounds_from_counts(counts, lower_pct, upper_pct)
+
+
+def value_counts_partial(chunks: Iterable[pd.DataFrame],
+                         columns: List[str] = OUTLIER_COLUMNS) -> Dict[str, Optional[pd.Series]]:
+    """청크들의 컬럼별 (값 -> 빈도) 누적 (병합 가능한 부분 결과)"""
+    counts: Dict[str, Optional[pd.Series]] = {col: None for col in columns}
+    for chunk in chunks:
+        for col in columns:
+            vc = chunk[col].value_counts()
+            counts[col] = vc if counts[col] is None else counts[col].add(vc, fill_value=0)
+    return counts
+
+
+def merge_value_counts(left: Dict[str, Optional[pd.Series]],
+                       right: Dict[str, Optional[pd.Series]]) -> Dict[str, Optional[pd.Series]]:
+    """value_counts_partial() 결과 두 개를 병합"""
+    merged = {}
+    for col in left:
+        if left[col] is None or right[col] is None:
+            merged[col] = left[col] if right[col] is None else right[col]
+        else:
+            merged[col] = left[col].add(right[col], fill_value=0)
+    return merged
+
+
+def bounds_from_counts(counts: Dict[str, Optional[pd.Series]],
+                       lower_pct: float = 0.001,
+                       upper_pct: float = 0.999) -> Dict[str, Tuple[float, float]]:
+    """컬럼별 빈도로부터 (하한, 상한) 분위수 경계 계산"""
+    bounds = {}
+    for col, col_counts in counts.items():
+        if col_counts is None or len(col_counts) == 0:
+            continue
+        bounds[col] = (_quantile_from_counts(col_counts, lower_pct),
+                       _quantile_from_counts(col_counts, upper_pct))
+    return bounds
+
+
+def sketch_clip_bounds(csv_path: Path, columns: List[str] = OUTLIER_COLUMNS,
+                       lower_pct: float = 0.001, upper_pct: float = 0.999,
+                       chunksize: int = DEFAULT_CHUNKSIZE,
+                       k: int = 65536) -> Dict[str, Tuple[float, float]]:
+    """
+    청크 리더가 컬럼별 QuantileSketch를 갱신하는 방식의 근사 분위수 경계
+
+    전체 컬럼 정렬 없이 고정 메모리로 동작하며, 컬럼별 정규화 순위 오차 상한을 출력합니다.
+    """
+    sketches = {col: QuantileSketch(k=k) for col in columns}
+    for chunk in iter_user_log_chunks(csv_path, chunksize, usecols=columns):
+        for col in columns:
+            sketches[col].update(chunk[col].to_numpy())
+
+    bounds = {}
+    for col, sketch in sketches.items():
+        if sketch.n == 0:
+            continue
+        lower, upper = sketch.quantile([lower_pct, upper_pct])
+        bounds[col] = (float(lower), float(upper))
+        print(f"  {col}: sketch rank error <= {sketch.rank_error_bound():.2e} "
+              f"({len(sketch):,} items for {sketch.n:,} rows)")
+
+    return bounds
+
+
+# ============================================================
+# msno 인덱스
+# ============================================================
+class UserIndex:
+    """청크 간에 누적되는 msno -> 연속 정수 id 매핑"""
+
+    def __init__(self):
+        self._ids: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def encode(self, msno: pd.Series) -> np.ndarray:
+        """msno 시리즈를 정수 id 배열로 변환 (처음 보는 msno는 새 id 부여)"""
+        codes, uniques = pd.factorize(msno)
+        ids = self._ids
+        mapping = np.fromiter((ids.setdefault(m, len(ids)) for m in uniques),
+                              dtype=np.int64, count=len(uniques))
+        return mapping[codes]
+
+    @property
+    def msno(self) -> np.ndarray:
+        """id 순서의 msno 배열"""
+        return np.array(list(self._ids), dtype=object)
+
+
+# ============================================================
+# 윈도우 누적기
+# ============================================================
+def base_frame_from_state(msno: np.ndarray, count: np.ndarray, sums: np.ndarray,
+                          sumsq: np.ndarray, active: np.ndarray) -> pd.DataFrame:
+    """
+    윈도우 누적 상태 → aggregate_single_window()의 groupby 결과와 같은 형태의 기본 집계 프레임
+
+    Args:
+        count: 사용자별 윈도우 내 행 수
+        sums: (사용자 수, len(SUM_COLUMNS)) 합계
+        sumsq: total_secs 제곱합
+        active: 윈도우 내 활동일 수
+    """
+    count = np.asarray(count).astype(np.float64)
+    total = sums[:, 0]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = np.where(count > 0, total / count, np.nan)
+        var = (sumsq - total * mean) / (count - 1)
+    std = np.where(count > 1, np.sqrt(np.maximum(var, 0)), np.nan)
+
+    base = pd.DataFrame({
+        'msno': msno,
+        'num_days_active': np.asarray(active).astype(np.float64),
+        'total_secs': total,
+        'avg_secs_per_day': mean,
+        'std_secs': std,
+    })
+    for j, col in enumerate(SUM_COLUMNS[1:], start=1):
+        base[col] = sums[:, j]
+    return base
+
+
+class WindowAccumulator:
+    """
+    모든 윈도우에 대한 msno별 누적값을 유지
+
+    - count: 윈도우 내 행 수 (평균/표준편차 계산용)
+    - sums: SUM_COLUMNS 합계
+    - sumsq: total_secs 제곱합 (표본 표준편차 계산용)
+    - day_mask: 기준일(가장 이른 윈도우 시작일)부터의 활동일 비트마스크
+    """
+
+    def __init__(self, windows: Dict[str, Tuple[pd.Timestamp, pd.Timestamp]] = WINDOWS,
+                 clip_bounds: Optional[Dict[str, Tuple[float, float]]] = None):
+        self.windows = windows
+        self.clip_bounds = clip_bounds or {}
+        self.base_date = min(start for start, _ in windows.values())
+        self.offsets = {
+            name: ((start - self.base_date).days, (end - self.base_date).days)
+            for name, (start, end) in windows.items()
+        }
+        self.n_days = max(end for _, end in self.offsets.values()) + 1
+        if self.n_days > 64:
+            raise ValueError(f"Window span too long for day bitmask: {self.n_days} days (max 64)")
+
+        self.index = UserIndex()
+        self.n_rows = 0
+        self._capacity = 0
+        self.count = {name: np.zeros(0, dtype=np.int64) for name in windows}
+        self.sums = {name: np.zeros((0, len(SUM_COLUMNS)), dtype=np.float64) for name in windows}
+        self.sumsq = {name: np.zeros(0, dtype=np.float64) for name in windows}
+        self.day_mask = np.zeros(0, dtype=np.uint64)
+
+    def _grow(self, n_users: int) -> None:
+        """사용자 수 증가에 맞춰 누적 배열 확장 (2배씩)"""
+        if n_users <= self._capacity:
+            return
+        capacity = max(n_users, 2 * self._capacity, 1024)
+        pad = capacity - self._capacity
+        for name in self.windows:
+            self.count[name] = np.concatenate([self.count[name], np.zeros(pad, dtype=np.int64)])
+            self.sums[name] = np.vstack([self.sums[name], np.zeros((pad, len(SUM_COLUMNS)))])
+            self.sumsq[name] = np.concatenate([self.sumsq[name], np.zeros(pad)])
+        self.day_mask = np.concatenate([self.day_mask, np.zeros(pad, dtype=np.uint64)])
+        self._capacity = capacity
+
+    def _clip(self, values: np.ndarray) -> np.ndarray:
+        """학습 시점 경계로 이상치 클리핑 (handle_outliers와 동일한 규칙)"""
+        for j, col in enumerate(SUM_COLUMNS):
+            if col in self.clip_bounds:
+                lower, upper = self.clip_bounds[col]
+                np.clip(values[:, j], lower, upper, out=values[:, j])
+        return values
+
+    def update(self, chunk: pd.DataFrame) -> None:
+        """청크 하나를 누적값에 반영"""
+        uid = self.index.encode(chunk['msno'])
+        self._grow(len(self.index))
+        n = self._capacity
+
+        day = to_day(chunk['date']) - day_of(self.base_date)
+        values = self._clip(chunk[SUM_COLUMNS].to_numpy(dtype=np.float64))
+
+        # 활동일 비트마스크
+        in_span = (day >= 0) & (day < self.n_days)
+        bits = np.left_shift(np.uint64(1), day[in_span].astype(np.uint64))
+        np.bitwise_or.at(self.day_mask, uid[in_span], bits)
+
+        # 윈도우별 행 수 / 합계 / 제곱합
+        for name, (start, end) in self.offsets.items():
+            mask = (day >= start) & (day <= end)
+            if not mask.any():
+                continue
+            u = uid[mask]
+            v = values[mask]
+            self.count[name] += np.bincount(u, minlength=n)
+            for j in range(len(SUM_COLUMNS)):
+                self.sums[name][:, j] += np.bincount(u, weights=v[:, j], minlength=n)
+            self.sumsq[name] += np.bincount(u, weights=v[:, 0] ** 2, minlength=n)
+
+        self.n_rows += len(chunk)
+
+    def merge(self, other: 'WindowAccumulator') -> 'WindowAccumulator':
+        """
+        다른 누적기(예: 병렬 워커의 부분 결과)를 병합
+
+        두 누적기는 같은 windows / clip_bounds로 만들어져야 합니다.
+        """
+        if other.offsets != self.offsets or other.base_date != self.base_date:
+            raise ValueError("Cannot merge WindowAccumulators with different windows")
+        m = len(other.index)
+        if m == 0:
+            return self
+        uid = self.index.encode(pd.Series(other.index.msno))
+        self._grow(len(self.index))
+
+        # other의 사용자 id는 서로 다르므로 fancy index 누적이 안전함
+        for name in self.windows:
+            self.count[name][uid] += other.count[name][:m]
+            self.sums[name][uid] += other.sums[name][:m]
+            self.sumsq[name][uid] += other.sumsq[name][:m]
+        self.day_mask[uid] |= other.day_mask[:m]
+        self.n_rows += other.n_rows
+        return self
+
+    def window_base_frame(self, name: str, msno: np.ndarray, rows: np.ndarray) -> pd.DataFrame:
+        """aggregate_single_window()의 groupby 결과와 같은 형태의 기본 집계 프레임"""
+        start, end = self.offsets[name]
+        window_bits = np.uint64(((1 << (end - start + 1)) - 1) << start)
+        active = np.bitwise_count(self.day_mask[rows] & window_bits)
+        return base_frame_from_state(msno, self.count[name][rows], self.sums[name][rows],
+                                     self.sumsq[name][rows], active)
+
+    def to_frame(self) -> pd.DataFrame:
+        """누적값을 aggregate_all_windows()와 동일한 컬럼의 데이터프레임으로 변환"""
+        n_users = len(self.index)
+        msno = self.index.msno
+
+        # 어느 윈도우에도 활동이 없는 사용자는 제외 (outer merge 결과와 동일)
+        seen = np.zeros(n_users, dtype=bool)
+        for name in self.windows:
+            seen |= self.count[name][:n_users] > 0
+
+        # msno 기준 정렬 (outer merge 결과 순서와 동일)
+        rows = np.flatnonzero(seen)
+        rows = rows[np.argsort(msno[rows], kind='stable')]
+        msno = msno[rows]
+
+        result = None
+        for name in self.windows:
+            window_agg = derive_window_features(self.window_base_frame(name, msno, rows), name)
+            result = window_agg if result is None else pd.concat(
+                [result, window_agg.drop(columns='msno')], axis=1
+            )
+
+        # 마지막 31일 uint32 마스크로 최근성 피처 (aggregate_all_windows()와 같은 컬럼)
+        mask, n_days = truncate_mask(self.day_mask[rows], self.n_days)
+        result = pd.concat([result, activity_features(msno, mask, n_days).drop(columns='msno')], axis=1)
+
+        return cast_count_columns(result.fillna(0))
+
+
+# ============================================================
+# 스트리밍 집계 진입점
+# ============================================================
+def aggregate_all_windows_streaming(csv_path: Path,
+                                    chunksize: int = DEFAULT_CHUNKSIZE,
+                                    clip_bounds: Optional[Dict[str, Tuple[float, float]]] = None,
+                                    windows: Dict[str, Tuple[pd.Timestamp, pd.Timestamp]] = WINDOWS,
+                                    quantile_method: str = 'sketch') -> pd.DataFrame:
+    """
+    user_logs CSV를 청크 단위로 한 번 읽어 모든 윈도우를 동시에 집계
+
+    Args:
+        csv_path: user_logs_v2.csv 경로
+        chunksize: 청크당 행 수
+        clip_bounds: {컬럼: (하한, 상한)} 학습 시점 이상치 클리핑 경계
+                     (None이면 별도 패스로 분위수 경계를 계산)
+        windows: 윈도우 정의 (기본 WINDOWS)
+        quantile_method: clip_bounds가 None일 때 경계 계산 방식 ('sketch' 또는 'exact')
+
+    Returns:
+        aggregate_all_windows()와 동일한 컬럼의 집계 데이터프레임
+        (적용된 경계는 result.attrs['clip_bounds']에 기록)
+    """
+    if clip_bounds is None:
+        print(f"  Computing outlier clip bounds (streaming, {quantile_method})...")
+        clip_bounds = compute_clip_bounds(csv_path, chunksize=chunksize, method=quantile_method)
+    for col, (lower, upper) in clip_bounds.items():
+        print(f"  {col}: clip to [{lower:.2f}, {upper:.2f}]")
+
+    acc = WindowAccumulator(windows=windows, clip_bounds=clip_bounds)
+
+    for i, chunk in enumerate(iter_user_log_chunks(csv_path, chunksize)):
+        acc.update(chunk)
+        if i % 10 == 0:
+            print(f"  Processed chunk {i} ({acc.n_rows:,} rows, {len(acc.index):,} users)")
+
+    result = acc.to_frame()
+    result.attrs['clip_bounds'] = clip_bounds
+    print(f"  Combined shape: {result.shape}")
+
+    return result